@@ -5,12 +5,13 @@ from fastapi.templating import Jinja2Templates
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import datetime
 from linebot.v3.messaging import (
-    AsyncApiClient, AsyncMessagingApi, Configuration, 
+    AsyncMessagingApi,
     TextMessage, PushMessageRequest
     # ShowLoadingAnimationRequest removed for compatibility  
 )
 
 from app.utils.timezone import convert_to_thai_time, get_thai_time
+from app.utils.line_api import create_line_api_client
 
 from app.core.config import settings
 from app.db.database import get_db
@@ -38,9 +39,7 @@ templates = Jinja2Templates(directory="templates")
 
 def get_line_bot_api():
     """สร้าง LINE Bot API client"""
-    configuration = Configuration(access_token=settings.LINE_CHANNEL_ACCESS_TOKEN)
-    async_api_client = AsyncApiClient(configuration)
-    return AsyncMessagingApi(async_api_client)
+    return AsyncMessagingApi(create_line_api_client())
 
 router = APIRouter()
 
@@ -60,9 +59,13 @@ async def websocket_endpoint(websocket: WebSocket):
     await manager.connect(websocket)
     try:
         while True:
-            # รอรับข้อมูล (แต่ในเคสนี้เราใช้สำหรับส่งออกอย่างเดียว)
+            # รับคำสั่ง subscribe/unsubscribe topic และ pong จาก browser
             data = await websocket.receive_text()
-    except WebSocketDisconnect:
+            await manager.handle_client_message(websocket, data)
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: socket ถูกปิดไปแล้วโดย heartbeat reaper
+        pass
+    finally:
         manager.disconnect(websocket)
 
 @router.post("/admin/reply", summary="API สำหรับแอดมินส่งข้อความตอบกลับ")
@@ -210,35 +213,11 @@ async def get_user_messages(user_id: str, db: AsyncSession = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/admin/status", summary="API สำหรับตรวจสอบสถานะระบบ")
-async def get_system_status(db: AsyncSession = Depends(get_db)):
-    """ตรวจสอบสถานะระบบและการเชื่อมต่อ"""
+async def get_system_status():
+    """ตรวจสอบสถานะระบบและการเชื่อมต่อ (snapshot จาก status monitor; อัปเดตแบบ push ผ่าน WebSocket topic 'status')"""
     try:
-        from app.services.gemini_service import check_gemini_availability
-        
-        # Check Gemini AI availability
-        ai_available = await check_gemini_availability()
-        
-        # Check database connection
-        db_available = True
-        try:
-            await db.execute("SELECT 1")
-        except Exception:
-            db_available = False
-        
-        # Check Telegram configuration
-        telegram_configured = bool(settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_CHAT_ID)
-        
-        # Thai timezone for system status
-        thai_time = get_thai_time()
-        
-        return {
-            "status": "ok",
-            "ai_available": ai_available,
-            "database_available": db_available,
-            "telegram_configured": telegram_configured,
-            "line_configured": bool(settings.LINE_CHANNEL_ACCESS_TOKEN),
-            "timestamp": thai_time.isoformat()
-        }
+        from app.services.status_monitor import status_monitor
+        return await status_monitor.status()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
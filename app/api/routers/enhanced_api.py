@@ -1,19 +1,33 @@
 # Enhanced API Endpoints for History and Analytics
+import logging
 from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional, List, Dict, Any
 from datetime import datetime, timedelta
 
-from app.db.database import get_db
+from app.db.database import get_db, async_engine, AsyncSessionLocal
+from app.auth.auth import require_admin
+from app.utils.profiler import SamplingProfiler, profiler_lock
+from app.utils.slow_queries import slow_query_log
 from app.services.history_service import history_service
+from app.services.status_monitor import status_monitor
+from app.services.dashboard_summary import dashboard_summary
+from app.services.columnar_export import (
+    columnar_exporter, ColumnarExportBusy, ColumnarExportUnavailable, EXPORT_TABLES
+)
 from app.services.telegram_service import telegram_service
 from app.services.gemini_service import get_gemini_status, gemini_service
+from app.services.knowledge_index import knowledge_index
+from app.services.intent_engine import intent_engine
 from app.db.crud_enhanced import (
     get_chat_history, get_friend_activities, get_telegram_setting,
-    get_system_logs, log_system_event
+    get_system_logs, log_system_event, get_gemini_usage_rollup,
+    count_ai_fallbacks, LATENCY_BUCKETS_MS
 )
 
 router = APIRouter(prefix="/api/enhanced", tags=["Enhanced Analytics"])
+logger = logging.getLogger(__name__)
 
 # ========================================
 # Chat Analytics Endpoints
@@ -69,27 +83,68 @@ async def export_chat_history(
     user_id: Optional[str] = None,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
+    gzip: bool = Query(False, description="ส่งออกเป็น chat_history.csv.gz"),
+    batch_size: int = Query(1000, ge=100, le=10000)
 ):
-    """Export ประวัติการแชทเป็น CSV"""
+    """Export ประวัติการแชทเป็น CSV (stream ทีละชุด หน่วยความจำคงที่ตามจำนวนแถว)"""
     try:
         # Parse dates
         start_dt = datetime.fromisoformat(start_date) if start_date else None
         end_dt = datetime.fromisoformat(end_date) if end_date else None
-        
-        csv_data = await history_service.export_chat_history_csv(
-            db, user_id, start_dt, end_dt
-        )
-        
-        from fastapi.responses import Response
-        return Response(
-            content=csv_data,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=chat_history.csv"}
-        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    async def body():
+        # Own session: the stream outlives the request handler
+        async with AsyncSessionLocal() as db:
+            try:
+                async for chunk in history_service.stream_chat_history_csv(
+                    db, user_id, start_dt, end_dt, batch_size=batch_size, compress=gzip
+                ):
+                    yield chunk
+            except Exception as e:
+                # Headers are already sent; the client sees a truncated file
+                logger.error("Chat history export failed mid-stream: %s", e)
+                raise
+    
+    filename = "chat_history.csv.gz" if gzip else "chat_history.csv"
+    return StreamingResponse(
+        body(),
+        media_type="application/gzip" if gzip else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@router.post("/export/columnar")
+async def export_columnar(
+    tables: Optional[List[str]] = Query(None, description="chat_history, friend_activity, system_logs"),
+    admin = Depends(require_admin)
+):
+    """Export แถวใหม่ตั้งแต่ watermark ล่าสุดเป็นไฟล์ Parquet/Arrow แบ่งตามวัน (สำหรับงานวิเคราะห์)"""
+    try:
+        results = await columnar_exporter.export(tables)
+        return {"success": True, "data": {"format": columnar_exporter.format, "tables": results}}
+    except ColumnarExportBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ColumnarExportUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/export/columnar")
+async def get_columnar_export_status(admin = Depends(require_admin)):
+    """Watermark ของแต่ละตารางจากการ export ครั้งล่าสุด"""
+    return {
+        "success": True,
+        "data": {
+            "export_dir": str(columnar_exporter.export_dir),
+            "format": columnar_exporter.format,
+            "tables": list(EXPORT_TABLES),
+            "watermarks": columnar_exporter.watermarks()
+        }
+    }
+
 # ========================================
 # Friend Analytics Endpoints
 # ========================================
@@ -194,7 +249,10 @@ async def get_system_health(
     """สุขภาพระบบ"""
     try:
         try:
-            health = await history_service.get_system_health(db, hours)
+            # The default window is served from the status monitor's cached report
+            health = await status_monitor.health(hours)
+            if health is None:
+                health = await history_service.get_system_health(db, hours)
             return {"success": True, "data": health}
         except Exception as e:
             # Fallback to mock health data
@@ -257,6 +315,56 @@ async def get_system_logs_api(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/system/profile")
+async def profile_system(
+    seconds: float = Query(10, ge=0.5, le=60),
+    interval_ms: float = Query(10, ge=1, le=100),
+    block_threshold_ms: float = Query(100, ge=20, le=10000),
+    format: str = Query("json", regex="^(json|collapsed)$"),
+    include_idle: bool = False,
+    admin = Depends(require_admin)
+):
+    """Sampling profile of every thread (event loop, executors) - collapsed stacks or summary"""
+    if profiler_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    
+    async with profiler_lock:
+        profiler = SamplingProfiler(
+            interval=interval_ms / 1000,
+            include_idle=include_idle,
+            block_threshold=block_threshold_ms / 1000
+        )
+        await profiler.run(seconds)
+    
+    if format == "collapsed":
+        return PlainTextResponse(profiler.collapsed())
+    return {"success": True, "data": {**profiler.summary(), "collapsed": profiler.collapsed()}}
+
+@router.get("/system/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=200),
+    sort: str = Query("total_ms", regex="^(total_ms|max_ms|count)$"),
+    explain: bool = True,
+    admin = Depends(require_admin)
+):
+    """Statements over the slow-query threshold, worst first, with EXPLAIN plans"""
+    try:
+        if explain:
+            statements = [entry["statement"] for entry in slow_query_log.top(limit, sort)]
+            await slow_query_log.capture_plans(async_engine, statements)
+        return {
+            "success": True,
+            "data": {**slow_query_log.stats(), "queries": slow_query_log.top(limit, sort)}
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/system/slow-queries")
+async def reset_slow_queries(admin = Depends(require_admin)):
+    """Clear the slow-query log"""
+    slow_query_log.reset()
+    return {"success": True, "message": "Slow-query log cleared"}
+
 # ========================================
 # Dashboard Summary Endpoint
 # ========================================
@@ -265,35 +373,9 @@ async def get_system_logs_api(
 async def get_dashboard_summary(db: AsyncSession = Depends(get_db)):
     """สรุปข้อมูลสำหรับ Dashboard"""
     try:
-        # Try to get real data, fallback to mock data if services fail
+        # Cached snapshot (stale-while-revalidate); fallback to mock data if it cannot be built
         try:
-            chat_overview = await history_service.get_chat_overview(db, 7)
-            friend_analytics = await history_service.get_friend_analytics(db, 7)
-            telegram_analytics = await history_service.get_telegram_analytics(db, 7)
-            system_health = await history_service.get_system_health(db, 24)
-            
-            summary = {
-                "chat": {
-                    "total_messages_7d": chat_overview["total_messages"],
-                    "active_users_7d": chat_overview["active_users"],
-                    "avg_messages_per_user": chat_overview["avg_messages_per_user"]
-                },
-                "friends": {
-                    "new_followers_7d": friend_analytics["activities_summary"].get("follow", 0),
-                    "unfollowers_7d": friend_analytics["activities_summary"].get("unfollow", 0),
-                    "net_growth_7d": friend_analytics["net_followers"]
-                },
-                "telegram": {
-                    "notifications_sent_7d": telegram_analytics["notifications_by_status"].get("sent", 0),
-                    "success_rate": telegram_analytics["success_rate"],
-                    "total_notifications_7d": telegram_analytics["total_notifications"]
-                },
-                "system": {
-                    "error_rate_24h": system_health["error_rate"],
-                    "total_logs_24h": system_health["total_logs"],
-                    "avg_response_time": system_health["performance"]["avg_response_time_ms"]
-                }
-            }
+            summary = await dashboard_summary.get()
         except Exception as e:
             # Fallback to mock data if analytics services fail
             await log_system_event(
@@ -363,51 +445,54 @@ async def get_gemini_analytics(
     hours: int = Query(24, ge=1, le=168),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get Gemini AI usage analytics"""
+    """Get Gemini AI usage analytics (read from the hourly usage rollup)"""
     try:
-        # Get AI-related logs from system_logs
-        end_time = datetime.now()
-        start_time = end_time - timedelta(hours=hours)
-        
-        # Get Gemini-related system logs
-        logs_result = await get_system_logs(
-            db=db,
-            level=None,
-            category="gemini",
-            start_time=start_time,
-            end_time=end_time,
-            limit=1000
-        )
-        
-        ai_logs = logs_result if logs_result else []
-        
-        # Analyze logs for metrics
-        total_requests = len([log for log in ai_logs if log.subcategory == "ai_response"])
-        successful_requests = len([log for log in ai_logs if log.subcategory == "ai_response" and "success" in str(log.metadata) and log.metadata.get("success")])
-        failed_requests = total_requests - successful_requests
-        
-        # Calculate success rate
+        rows = await get_gemini_usage_rollup(db, hours=hours)
+        
+        total_requests = 0
+        failed_requests = 0
+        prompt_tokens = 0
+        completion_tokens = 0
+        latency_ms_sum = 0
+        latency_ms_max = 0
+        models_used: Dict[str, int] = {}
+        operations: Dict[str, int] = {}
+        errors_by_model: Dict[str, int] = {}
+        hourly: Dict[str, Dict[str, int]] = {}
+        latency_histogram = {f"le_{bound}ms": 0 for bound in LATENCY_BUCKETS_MS}
+        latency_histogram[f"gt_{LATENCY_BUCKETS_MS[-1]}ms"] = 0
+        # FAQ answers from the local index cost no Gemini quota or latency - reported separately
+        knowledge_base = {"answers": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        
+        for row in rows:
+            if row.model == "knowledge_base":
+                knowledge_base["answers"] += row.calls
+                knowledge_base["prompt_tokens"] += row.prompt_tokens
+                knowledge_base["completion_tokens"] += row.completion_tokens
+                continue
+            total_requests += row.calls
+            failed_requests += row.errors
+            prompt_tokens += row.prompt_tokens
+            completion_tokens += row.completion_tokens
+            latency_ms_sum += row.latency_ms_sum
+            latency_ms_max = max(latency_ms_max, row.latency_ms_max or 0)
+            models_used[row.model] = models_used.get(row.model, 0) + row.calls
+            operations[row.operation] = operations.get(row.operation, 0) + row.calls
+            if row.errors:
+                errors_by_model[row.model] = errors_by_model.get(row.model, 0) + row.errors
+            for bucket in latency_histogram:
+                latency_histogram[bucket] += getattr(row, f"latency_{bucket}") or 0
+            
+            hour_key = row.hour.isoformat() + "Z"
+            hour_stats = hourly.setdefault(hour_key, {"calls": 0, "errors": 0, "tokens": 0})
+            hour_stats["calls"] += row.calls
+            hour_stats["errors"] += row.errors
+            hour_stats["tokens"] += row.total_tokens
+        
+        successful_requests = total_requests - failed_requests
+        total_tokens_used = prompt_tokens + completion_tokens
         success_rate = (successful_requests / total_requests * 100) if total_requests > 0 else 0
-        
-        # Get conversation metrics from metadata
-        total_tokens_used = 0
-        avg_response_time = 0
-        models_used = {}
-        
-        for log in ai_logs:
-            if log.metadata and isinstance(log.metadata, dict):
-                # Token usage
-                usage = log.metadata.get("usage")
-                if usage and isinstance(usage, dict):
-                    total_tokens_used += usage.get("total_tokens", 0)
-                
-                # Models used
-                model = log.metadata.get("ai_model")
-                if model:
-                    models_used[model] = models_used.get(model, 0) + 1
-        
-        # Get fallback statistics
-        fallback_events = len([log for log in ai_logs if log.subcategory == "ai_fallback"])
+        peak_usage_hour = max(hourly, key=lambda h: hourly[h]["calls"]) if hourly else None
         
         analytics = {
             "period_hours": hours,
@@ -416,20 +501,22 @@ async def get_gemini_analytics(
             "failed_requests": failed_requests,
             "success_rate": round(success_rate, 2),
             "total_tokens_used": total_tokens_used,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
             "avg_tokens_per_request": round(total_tokens_used / total_requests, 2) if total_requests > 0 else 0,
+            "avg_latency_ms": round(latency_ms_sum / total_requests, 2) if total_requests > 0 else 0,
+            "max_latency_ms": latency_ms_max,
+            "latency_histogram": latency_histogram,
             "models_used": models_used,
-            "fallback_events": fallback_events,
+            "operations": operations,
+            "fallback_events": await count_ai_fallbacks(db, hours),
+            "knowledge_base": knowledge_base,
             "service_status": get_gemini_status(),
-            "peak_usage_hour": None,  # Could be calculated from timestamps
-            "error_types": {}
+            "peak_usage_hour": peak_usage_hour,
+            "hourly": hourly,
+            "error_types": errors_by_model
         }
         
-        # Analyze error types
-        error_logs = [log for log in ai_logs if log.level == "error" or log.level == "warning"]
-        for log in error_logs:
-            error_type = log.subcategory or "unknown"
-            analytics["error_types"][error_type] = analytics["error_types"].get(error_type, 0) + 1
-        
         return {"success": True, "data": analytics}
         
     except Exception as e:
@@ -585,5 +672,70 @@ async def chat_with_gemini(
             "error": str(e)
         }
 
+# ========================================
+# Knowledge Index Endpoints
+# ========================================
+
+@router.get("/knowledge/status")
+async def get_knowledge_status(admin = Depends(require_admin)):
+    """สถานะของดัชนีฐานความรู้ HR"""
+    return {"success": True, "data": knowledge_index.get_status()}
+
+@router.get("/knowledge/search")
+async def search_knowledge(
+    q: str = Query(..., min_length=1),
+    top_k: int = Query(5, ge=1, le=20),
+    admin = Depends(require_admin)
+):
+    """ค้นหาข้อความจากฐานความรู้ HR (ใช้ทดสอบผลการค้นหา)"""
+    try:
+        import asyncio
+        loop = asyncio.get_event_loop()
+        results = await loop.run_in_executor(None, lambda: knowledge_index.search(q, top_k=top_k))
+        faq_answer = await loop.run_in_executor(None, knowledge_index.answer_faq, q)
+        return {
+            "success": True,
+            "data": {
+                "results": results,
+                "faq_answer": faq_answer
+            }
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/knowledge/reload")
+async def reload_knowledge(
+    db: AsyncSession = Depends(get_db),
+    admin = Depends(require_admin)
+):
+    """สร้างดัชนีฐานความรู้ใหม่จากโฟลเดอร์เอกสาร (ไม่ต้อง restart)"""
+    try:
+        import asyncio
+        loop = asyncio.get_event_loop()
+        stats = await loop.run_in_executor(None, knowledge_index.build)
+        
+        await log_system_event(
+            db=db,
+            level="info",
+            category="knowledge",
+            subcategory="index_rebuilt",
+            message=f"Knowledge index rebuilt: {stats['passages']} passages",
+            details=stats
+        )
+        return {"success": True, "data": stats}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/intents/status")
+async def get_intent_status():
+    """สถานะของตารางคำสำคัญที่ใช้ตรวจจับเจตนา (intent)"""
+    return {"success": True, "data": intent_engine.get_status()}
+
+@router.get("/intents/match")
+async def match_intents(q: str = Query(..., min_length=1)):
+    """ทดสอบว่าข้อความตรงกับ intent ใดบ้าง"""
+    match = intent_engine.match(q)
+    return {"success": True, "data": {"intents": sorted(match.intents), "keywords": match.keywords}}
+
 # Export router
 __all__ = ["router"]
@@ -0,0 +1,37 @@
+# Prometheus metrics endpoint
+import asyncio
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.db.database import get_db
+from app.db.crud_enhanced import count_pending_notifications
+from app.utils.metrics import add_gauge_sample, render_prometheus, snapshot_store
+
+router = APIRouter(tags=["Monitoring"])
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+@router.get("/metrics", response_class=PlainTextResponse, summary="Prometheus metrics")
+async def prometheus_metrics(request: Request, db: AsyncSession = Depends(get_db)):
+    """Counters and histograms merged over every gunicorn worker"""
+    if settings.METRICS_TOKEN:
+        if request.headers.get("Authorization") != f"Bearer {settings.METRICS_TOKEN}":
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+
+    # Reads every worker's snapshot file under a file lock - keep it off the event loop
+    loop = asyncio.get_running_loop()
+    merged = await loop.run_in_executor(None, snapshot_store.collect)
+    
+    # Shared state lives in the database, so it is read once per scrape instead of per worker
+    try:
+        pending = await count_pending_notifications(db)
+        add_gauge_sample(merged, "telegram_queue_depth", "Telegram notifications waiting to be sent", pending)
+    except Exception as e:
+        logger.warning("Failed to read Telegram queue depth: %s", e)
+
+    return PlainTextResponse(render_prometheus(merged), media_type=PROMETHEUS_CONTENT_TYPE)
@@ -1,8 +1,9 @@
 # app/api/routers/webhook.py - Fixed version
+import logging
 from fastapi import APIRouter, Request, HTTPException, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from linebot.v3.webhook import WebhookParser
-from linebot.v3.messaging import AsyncApiClient, AsyncMessagingApi, Configuration
+from linebot.v3.messaging import AsyncMessagingApi
 from linebot.v3.exceptions import InvalidSignatureError
 from linebot.v3.webhooks import (
     MessageEvent, TextMessageContent, ImageMessageContent, FileMessageContent,
@@ -10,21 +11,24 @@ from linebot.v3.webhooks import (
 )
 
 from app.core.config import settings
+from app.utils.line_api import create_line_api_client
 from app.db.database import get_db
 from app.services.line_handler_enhanced import (
     handle_follow_event, handle_unfollow_event
 )
 from app.services.message_handler import process_line_message
 from app.db.crud_enhanced import log_system_event
+from app.utils.metrics import HANDLER_OUTCOMES, WEBHOOK_EVENTS
+from app.utils.timing import begin_request, stage, stage_timer
+
+logger = logging.getLogger(__name__)
 
 # ตั้งค่า LINE SDK - สร้างเมื่อต้องใช้
 parser = WebhookParser(settings.LINE_CHANNEL_SECRET)
 
 def get_line_bot_api():
     """สร้าง LINE Bot API client"""
-    configuration = Configuration(access_token=settings.LINE_CHANNEL_ACCESS_TOKEN)
-    async_api_client = AsyncApiClient(configuration)
-    return AsyncMessagingApi(async_api_client)
+    return AsyncMessagingApi(create_line_api_client())
 
 router = APIRouter()
 
@@ -41,20 +45,20 @@ async def webhook_health():
 @router.post("/webhook", summary="รับ Events จาก LINE Platform - Fixed")
 async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
     """LINE webhook endpoint with proper error handling"""
+    # Every stage timer and log line of this request shares one request id
+    timing = begin_request()
+    request_id = timing.request_id
     try:
         # Validate LINE configuration first
         try:
             settings.validate_required_settings()
         except ValueError as e:
-            print(f"Configuration error: {e}")
+            logger.error("Configuration error: %s", e)
             return {"status": "error", "message": "LINE Bot not configured properly"}
         
         signature = request.headers.get('X-Line-Signature')
         body = await request.body()
         
-        # บันทึก request info สำหรับ debugging
-        request_id = f"req_{id(request)}"
-        
         # ตรวจสอบว่ามี signature และ body ไหม
         if not signature:
             await log_system_event(
@@ -81,11 +85,12 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
         try:
             # Decode body เป็น string
             body_str = body.decode('utf-8')
-            print(f"Received webhook body: {body_str[:200]}...")  # Log first 200 chars
+            logger.debug("Received webhook body (%d bytes): %.200s", len(body_str), body_str)
             
-            # Parse events
-            events = parser.parse(body_str, signature)
-            print(f"Parsed {len(events)} events")
+            # Parse events (includes signature verification)
+            with stage("webhook_parse"):
+                events = parser.parse(body_str, signature)
+            logger.info("Parsed %d events", len(events))
             
             await log_system_event(
                 db=db,
@@ -98,7 +103,7 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
             )
             
         except InvalidSignatureError as e:
-            print(f"Invalid signature error: {e}")
+            logger.warning("Invalid signature error: %s", e)
             await log_system_event(
                 db=db,
                 level="error",
@@ -110,7 +115,7 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
             raise HTTPException(status_code=400, detail="Invalid signature.")
             
         except Exception as e:
-            print(f"Parser error: {type(e).__name__}: {e}")
+            logger.error("Parser error: %s: %s", type(e).__name__, e)
             await log_system_event(
                 db=db,
                 level="error",
@@ -130,7 +135,8 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
         for event in events:
             try:
                 event_type = type(event).__name__
-                print(f"Processing event type: {event_type}")
+                logger.debug("Processing event type: %s", event_type)
+                WEBHOOK_EVENTS.inc(event_type=event_type)
                 
                 if isinstance(event, MessageEvent):
                     # Use the new comprehensive message handler for ALL message types
@@ -139,16 +145,19 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
                         processed_events += 1
                     else:
                         failed_events += 1
+                    HANDLER_OUTCOMES.inc(event_type=event_type, outcome="ok" if success else "failed")
                     
                 elif isinstance(event, FollowEvent):
                     # Friend follow events
                     await handle_follow_event(event, db, line_bot_api)
                     processed_events += 1
+                    HANDLER_OUTCOMES.inc(event_type=event_type, outcome="ok")
                     
                 elif isinstance(event, UnfollowEvent):
                     # Friend unfollow events
                     await handle_unfollow_event(event, db, line_bot_api)
                     processed_events += 1
+                    HANDLER_OUTCOMES.inc(event_type=event_type, outcome="ok")
                     
                 elif isinstance(event, JoinEvent):
                     # Bot joined group/room
@@ -162,6 +171,7 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
                         request_id=request_id
                     )
                     processed_events += 1
+                    HANDLER_OUTCOMES.inc(event_type=event_type, outcome="ok")
                     
                 elif isinstance(event, LeaveEvent):
                     # Bot left group/room
@@ -175,6 +185,7 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
                         request_id=request_id
                     )
                     processed_events += 1
+                    HANDLER_OUTCOMES.inc(event_type=event_type, outcome="ok")
                     
                 elif isinstance(event, PostbackEvent):
                     # Postback events (buttons, quick replies)
@@ -188,6 +199,7 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
                         request_id=request_id
                     )
                     processed_events += 1
+                    HANDLER_OUTCOMES.inc(event_type=event_type, outcome="ok")
                     
                 else:
                     # Unknown event types
@@ -200,10 +212,12 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
                         details={"event_type": event_type},
                         request_id=request_id
                     )
+                    HANDLER_OUTCOMES.inc(event_type=event_type, outcome="ignored")
                     
             except Exception as e:
-                print(f"Error handling event: {type(e).__name__}: {e}")
+                logger.exception("Error handling event: %s: %s", type(e).__name__, e)
                 failed_events += 1
+                HANDLER_OUTCOMES.inc(event_type=type(event).__name__, outcome="error")
                 
                 await log_system_event(
                     db=db,
@@ -215,7 +229,8 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
                     request_id=request_id
                 )
         
-        # สรุปผลการประมวลผล
+        # สรุปผลการประมวลผล (พร้อมเวลาที่ใช้ในแต่ละ stage)
+        stage_timer.record("webhook_request", timing.elapsed_ms())
         await log_system_event(
             db=db,
             level="info",
@@ -225,9 +240,11 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
             details={
                 "total_events": len(events),
                 "processed_events": processed_events,
-                "failed_events": failed_events
+                "failed_events": failed_events,
+                "stages": timing.summary()
             },
-            request_id=request_id
+            request_id=request_id,
+            execution_time=timing.elapsed_ms()
         )
         
         return {
@@ -239,7 +256,7 @@ async def line_webhook(request: Request, db: AsyncSession = Depends(get_db)):
         
     except Exception as e:
         # Catch any unhandled errors to prevent 500 status
-        print(f"Webhook error: {type(e).__name__}: {e}")
+        logger.exception("Webhook error: %s: %s", type(e).__name__, e)
         try:
             await log_system_event(
                 db=db,
@@ -13,6 +13,11 @@ class Settings:
     # Telegram Configuration (Optional)
     TELEGRAM_BOT_TOKEN: str = os.getenv('TELEGRAM_BOT_TOKEN', '')
     TELEGRAM_CHAT_ID: str = os.getenv('TELEGRAM_CHAT_ID', '')
+
+    # External API hosts (override to point at local stub servers for load tests)
+    LINE_API_BASE_URL: str = os.getenv('LINE_API_BASE_URL', 'https://api.line.me')
+    LINE_DATA_API_BASE_URL: str = os.getenv('LINE_DATA_API_BASE_URL', 'https://api-data.line.me')
+    TELEGRAM_API_BASE_URL: str = os.getenv('TELEGRAM_API_BASE_URL', 'https://api.telegram.org')
     
     # Gemini AI Configuration
     GEMINI_API_KEY: str = os.getenv('GEMINI_API_KEY', '')
@@ -20,9 +25,106 @@ class Settings:
     GEMINI_TEMPERATURE: float = float(os.getenv('GEMINI_TEMPERATURE', '0.7'))
     GEMINI_MAX_TOKENS: int = int(os.getenv('GEMINI_MAX_TOKENS', '1000'))
     GEMINI_ENABLE_SAFETY: bool = os.getenv('GEMINI_ENABLE_SAFETY', 'true').lower() == 'true'
-    
+
+    # Model backend: 'google' (real API) or 'fake' (offline stand-in for benchmarks)
+    GEMINI_BACKEND: str = os.getenv('GEMINI_BACKEND', 'google')
+    GEMINI_FAKE_LATENCY_MS: float = float(os.getenv('GEMINI_FAKE_LATENCY_MS', '800'))
+    GEMINI_FAKE_LATENCY_DISTRIBUTION: str = os.getenv('GEMINI_FAKE_LATENCY_DISTRIBUTION', 'lognormal')
+    GEMINI_FAKE_LATENCY_SIGMA: float = float(os.getenv('GEMINI_FAKE_LATENCY_SIGMA', '0.5'))
+    GEMINI_FAKE_ERROR_RATE: float = float(os.getenv('GEMINI_FAKE_ERROR_RATE', '0.0'))
+    GEMINI_FAKE_SAFETY_RATE: float = float(os.getenv('GEMINI_FAKE_SAFETY_RATE', '0.0'))
+    GEMINI_FAKE_RECITATION_RATE: float = float(os.getenv('GEMINI_FAKE_RECITATION_RATE', '0.0'))
+    GEMINI_FAKE_SEED: int = int(os.getenv('GEMINI_FAKE_SEED', '42'))
+
+    # Gemini media pipeline (image pre-processing and result cache)
+    GEMINI_IMAGE_MAX_DIMENSION: int = int(os.getenv('GEMINI_IMAGE_MAX_DIMENSION', '1536'))
+    GEMINI_IMAGE_JPEG_QUALITY: int = int(os.getenv('GEMINI_IMAGE_JPEG_QUALITY', '85'))
+    GEMINI_MEDIA_CACHE_SIZE: int = int(os.getenv('GEMINI_MEDIA_CACHE_SIZE', '256'))
+    GEMINI_MEDIA_CACHE_TTL: int = int(os.getenv('GEMINI_MEDIA_CACHE_TTL', '3600'))
+    GEMINI_UPLOAD_CACHE_TTL: int = int(os.getenv('GEMINI_UPLOAD_CACHE_TTL', '3600'))
+
+    # Local HR knowledge index (BM25 over documents and FAQs)
+    KNOWLEDGE_DIR: str = os.getenv('KNOWLEDGE_DIR', 'knowledge')
+    KNOWLEDGE_INDEX_DIR: str = os.getenv('KNOWLEDGE_INDEX_DIR', 'data/knowledge_index')
+    KNOWLEDGE_TOP_K: int = int(os.getenv('KNOWLEDGE_TOP_K', '3'))
+    KNOWLEDGE_MIN_SCORE: float = float(os.getenv('KNOWLEDGE_MIN_SCORE', '1.0'))
+    KNOWLEDGE_FAQ_THRESHOLD: float = float(os.getenv('KNOWLEDGE_FAQ_THRESHOLD', '0.8'))
+    KNOWLEDGE_RELOAD_INTERVAL: float = float(os.getenv('KNOWLEDGE_RELOAD_INTERVAL', '5'))
+
+    # Keyword intent detection (handoff, question and help requests)
+    INTENT_KEYWORDS_FILE: str = os.getenv('INTENT_KEYWORDS_FILE', 'data/intent_keywords.json')
+    INTENT_RELOAD_INTERVAL: float = float(os.getenv('INTENT_RELOAD_INTERVAL', '5'))
+
+    # AI admission control (token buckets in front of Gemini generation)
+    AI_RATE_LIMIT_ENABLED: bool = os.getenv('AI_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    AI_USER_RATE_PER_MINUTE: float = float(os.getenv('AI_USER_RATE_PER_MINUTE', '6'))
+    AI_USER_BURST: int = int(os.getenv('AI_USER_BURST', '3'))
+    AI_GLOBAL_RATE_PER_MINUTE: float = float(os.getenv('AI_GLOBAL_RATE_PER_MINUTE', '120'))
+    AI_GLOBAL_BURST: int = int(os.getenv('AI_GLOBAL_BURST', '20'))
+    AI_QUEUE_MAX_WAIT: float = float(os.getenv('AI_QUEUE_MAX_WAIT', '5'))
+    AI_USER_MAX_QUEUED: int = int(os.getenv('AI_USER_MAX_QUEUED', '2'))
+    # Gunicorn worker count (gunicorn reads the same variable); each worker has its own
+    # limiter, so the global rate and burst above are split evenly between workers
+    WEB_CONCURRENCY: int = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+    # Per-stage hot-path timing (aggregated and written to system_logs)
+    STAGE_TIMING_ENABLED: bool = os.getenv('STAGE_TIMING_ENABLED', 'true').lower() == 'true'
+    STAGE_TIMING_FLUSH_INTERVAL: float = float(os.getenv('STAGE_TIMING_FLUSH_INTERVAL', '60'))
+
+    # Chat / friend activity rollups (buffered per worker and merged into the rollup tables)
+    ACTIVITY_ROLLUP_FLUSH_INTERVAL: float = float(os.getenv('ACTIVITY_ROLLUP_FLUSH_INTERVAL', '5'))
+    ACTIVITY_ROLLUP_BACKFILL_ON_STARTUP: bool = os.getenv('ACTIVITY_ROLLUP_BACKFILL_ON_STARTUP', 'true').lower() == 'true'
+
+    # Prometheus /metrics (per-worker snapshots are merged from METRICS_DIR; empty = this process only)
+    METRICS_DIR: str = os.getenv('METRICS_DIR', 'data/metrics')
+    METRICS_SNAPSHOT_INTERVAL: float = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', '5'))
+    METRICS_TOKEN: str = os.getenv('METRICS_TOKEN', '')
+
+    # Admin WebSocket fan-out (per-connection outbound queue; policy: drop_oldest or disconnect)
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv('WS_SEND_QUEUE_SIZE', '256'))
+    WS_SLOW_CONSUMER_POLICY: str = os.getenv('WS_SLOW_CONSUMER_POLICY', 'drop_oldest')
+    WS_SEND_TIMEOUT: float = float(os.getenv('WS_SEND_TIMEOUT', '10'))
+    WS_RESUME_BUFFER: int = int(os.getenv('WS_RESUME_BUFFER', '1000'))  # events kept for resume-on-reconnect
+    WS_BATCH_WINDOW_MS: float = float(os.getenv('WS_BATCH_WINDOW_MS', '5'))  # events flushed together as one frame; 0 = no batching
+    # Heartbeat: protocol pings (uvicorn) and app-level ping frames every WS_PING_INTERVAL seconds;
+    # connections silent for WS_IDLE_TIMEOUT are reaped
+    WS_PING_INTERVAL: float = float(os.getenv('WS_PING_INTERVAL', '20'))
+    WS_PING_TIMEOUT: float = float(os.getenv('WS_PING_TIMEOUT', '20'))
+    WS_IDLE_TIMEOUT: float = float(os.getenv('WS_IDLE_TIMEOUT', '60'))
+    # Cross-worker event bus: auto, local, unix (same host) or postgres (LISTEN/NOTIFY)
+    WS_EVENT_BUS: str = os.getenv('WS_EVENT_BUS', 'auto')
+    WS_BUS_DIR: str = os.getenv('WS_BUS_DIR', 'data/ws_bus')
+    WS_BUS_CHANNEL: str = os.getenv('WS_BUS_CHANNEL', 'admin_ws_events')
+    # Server-side status monitor: pushes system_status / system_health on the status topic when they change
+    STATUS_MONITOR_INTERVAL: float = float(os.getenv('STATUS_MONITOR_INTERVAL', '15'))
+    STATUS_HEALTH_INTERVAL: float = float(os.getenv('STATUS_HEALTH_INTERVAL', '60'))
+
+    # Dashboard summary snapshot (stale-while-revalidate): fresh for TTL seconds, served stale up to MAX_STALE
+    DASHBOARD_SUMMARY_TTL: float = float(os.getenv('DASHBOARD_SUMMARY_TTL', '30'))
+    DASHBOARD_SUMMARY_MAX_STALE: float = float(os.getenv('DASHBOARD_SUMMARY_MAX_STALE', '300'))
+
+    # Columnar analytics export (chat_history / friend_activity / system_logs, partitioned by date, incremental)
+    ANALYTICS_EXPORT_DIR: str = os.getenv('ANALYTICS_EXPORT_DIR', 'data/exports')
+    ANALYTICS_EXPORT_FORMAT: str = os.getenv('ANALYTICS_EXPORT_FORMAT', 'parquet')  # 'parquet' or 'arrow' (IPC file)
+    ANALYTICS_EXPORT_COMPRESSION: str = os.getenv('ANALYTICS_EXPORT_COMPRESSION', 'zstd')
+    ANALYTICS_EXPORT_BATCH_SIZE: int = int(os.getenv('ANALYTICS_EXPORT_BATCH_SIZE', '5000'))
+
+    # Slow-query log (statements over the threshold, with lazily captured EXPLAIN plans)
+    SLOW_QUERY_ENABLED: bool = os.getenv('SLOW_QUERY_ENABLED', 'true').lower() == 'true'
+    SLOW_QUERY_THRESHOLD_MS: float = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '100'))
+    SLOW_QUERY_MAX_ENTRIES: int = int(os.getenv('SLOW_QUERY_MAX_ENTRIES', '200'))
+
+    # Logging (queue-based; see app/core/logger.py)
+    LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
+    LOG_LEVELS: str = os.getenv('LOG_LEVELS', '')  # e.g. "app.services.ws_manager=WARNING,sqlalchemy.engine=INFO"
+    LOG_FORMAT: str = os.getenv('LOG_FORMAT', 'text')  # 'text' or 'json'
+    LOG_RATE_LIMIT: int = int(os.getenv('LOG_RATE_LIMIT', '20'))
+    LOG_RATE_LIMIT_WINDOW: float = float(os.getenv('LOG_RATE_LIMIT_WINDOW', '60'))
+    LOG_QUEUE_SIZE: int = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+
     # Database Configuration
     DATABASE_URL: str = os.getenv('DATABASE_URL', 'sqlite+aiosqlite:///./chatbot.db')
+    DB_ECHO: bool = os.getenv('DB_ECHO', 'false').lower() == 'true'
     
     # Application Configuration
     APP_TITLE: str = "LINE Bot with Full Live Chat System"
@@ -0,0 +1,185 @@
+# app/core/logger.py
+"""
+Structured, non-blocking application logging
+
+``setup_logging()`` puts a single ``QueueHandler`` on the root logger. Records
+are enqueued as-is (message formatting, JSON encoding and the actual write
+happen on a ``QueueListener`` thread), so a log call on the event loop costs a
+level check and a queue put. Disabled levels cost only the level check.
+
+* ``LOG_LEVEL`` sets the default level; ``LOG_LEVELS`` overrides it per module,
+  e.g. ``app.services.ws_manager=WARNING,sqlalchemy.engine=INFO``.
+* ``LOG_FORMAT=json`` writes one JSON object per line; ``text`` is the default.
+* Each call site (logger + message template) may log ``LOG_RATE_LIMIT``
+  records per ``LOG_RATE_LIMIT_WINDOW`` seconds; the rest are dropped and the
+  next record that gets through carries a ``suppressed`` count.
+* The current webhook request id is attached to every record.
+
+Modules log through ``logging.getLogger(__name__)``. Use ``%s`` arguments
+instead of f-strings so identical messages share a rate-limit key and are only
+formatted when they are actually written.
+"""
+
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.timing import current_request_id
+
+# Attributes every LogRecord has; anything else came in through ``extra=``
+_RESERVED_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+def parse_levels(spec: str) -> Dict[str, int]:
+    """Parse ``module=LEVEL,module=LEVEL`` into a logger-name -> level map"""
+    levels = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, level = (part.strip() for part in item.split("=", 1))
+        level_value = logging.getLevelName(level.upper())
+        if name and isinstance(level_value, int):
+            levels[name] = level_value
+    return levels
+
+class RateLimitFilter(logging.Filter):
+    """Allow at most ``limit`` records per call site per ``window`` seconds"""
+
+    def __init__(self, limit: int, window: float):
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self._lock = threading.Lock()
+        # (logger, template) -> [window start, emitted in window, suppressed]
+        self._sites: Dict[Tuple[str, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.limit <= 0:
+            return True
+        key = (record.name, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None:
+                if len(self._sites) > 10000:
+                    self._sites.clear()
+                site = self._sites[key] = [now, 0, 0]
+            elif now - site[0] >= self.window:
+                site[0], site[1] = now, 0
+            if site[1] >= self.limit:
+                site[2] += 1
+                return False
+            site[1] += 1
+            if site[2]:
+                record.suppressed = site[2]
+                site[2] = 0
+        return True
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener and never blocks"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        # Capture caller context now - the listener thread has no contextvars
+        if not hasattr(record, "request_id"):
+            record.request_id = current_request_id()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with ``extra=`` fields at the top level"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED_ATTRS and value is not None:
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    """``time level logger [request] message key=value ...``"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            line = line.replace(f" {record.name} ", f" {record.name} [{request_id}] ", 1)
+        extras = " ".join(
+            f"{key}={value}" for key, value in vars(record).items()
+            if key not in _RESERVED_ATTRS and key != "request_id" and value is not None
+        )
+        return f"{line} {extras}" if extras else line
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+
+def setup_logging(stream=None, force: bool = False) -> NonBlockingQueueHandler:
+    """Install the queue-based root handler (idempotent unless ``force``)"""
+    global _listener, _queue_handler
+    if _queue_handler is not None and not force:
+        return _queue_handler
+    shutdown_logging()
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if settings.LOG_FORMAT.lower() == "json" else TextFormatter())
+
+    _queue_handler = NonBlockingQueueHandler(queue.Queue(maxsize=settings.LOG_QUEUE_SIZE))
+    _queue_handler.addFilter(RateLimitFilter(settings.LOG_RATE_LIMIT, settings.LOG_RATE_LIMIT_WINDOW))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, NonBlockingQueueHandler):
+            root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(logging.getLevelName(settings.LOG_LEVEL.upper()))
+
+    levels = {"sqlalchemy.engine": logging.WARNING, "httpx": logging.WARNING}
+    levels.update(parse_levels(settings.LOG_LEVELS))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+
+    _listener = logging.handlers.QueueListener(_queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    return _queue_handler
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener, _queue_handler
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+
+__all__ = ['setup_logging', 'shutdown_logging', 'parse_levels', 'RateLimitFilter',
+           'NonBlockingQueueHandler', 'JsonFormatter', 'TextFormatter']
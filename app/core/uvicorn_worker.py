@@ -0,0 +1,22 @@
+# app/core/uvicorn_worker.py
+"""
+gunicorn worker class with WebSocket protocol-level heartbeats
+
+uvicorn sends WebSocket ping frames every ``ws_ping_interval`` seconds and
+closes connections whose pong does not arrive within ``ws_ping_timeout``.
+gunicorn cannot pass these options through, so this worker sets them from
+``WS_PING_INTERVAL`` / ``WS_PING_TIMEOUT``::
+
+    gunicorn app.main:app --worker-class app.core.uvicorn_worker.UvicornWorker
+"""
+
+from uvicorn.workers import UvicornWorker as _UvicornWorker
+
+from app.core.config import settings
+
+class UvicornWorker(_UvicornWorker):
+    CONFIG_KWARGS = {
+        **_UvicornWorker.CONFIG_KWARGS,
+        "ws_ping_interval": settings.WS_PING_INTERVAL,
+        "ws_ping_timeout": settings.WS_PING_TIMEOUT,
+    }
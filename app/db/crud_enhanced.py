@@ -1,16 +1,20 @@
 # Enhanced CRUD operations for new tracking tables
 import uuid
 import json
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from typing import List, Optional, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, or_
+from sqlalchemy import select, delete, func, and_, or_
 from sqlalchemy.orm import selectinload
 
 from app.db.models import (
     ChatHistory, FriendActivity, TelegramNotification, 
-    TelegramSettings, SystemLogs, UserStatus  # <-- เพิ่ม UserStatus สำหรับ join
+    TelegramSettings, SystemLogs, UserStatus,  # <-- เพิ่ม UserStatus สำหรับ join
+    GeminiUsageHourly, ChatActivityHourly, ChatReachDaily, FriendActivityHourly
 )
+from app.services.activity_rollups import PendingRollups, activity_rollups
+from app.utils.hll import HyperLogLog
+from app.utils.timing import PERFORMANCE_CATEGORY, current_request_id
 
 # ========================================
 # Chat History CRUD (ปรับปรุงสำหรับ Admin Panel)
@@ -46,6 +50,8 @@ async def save_chat_to_history(
     db.add(chat_history)
     await db.commit()
     await db.refresh(chat_history)
+    # Rollups are buffered and written by a background flush, off the message transaction
+    activity_rollups.add_chat(db.bind, message_type, user_id, chat_history.session_id)
     return chat_history
 
 async def get_all_chat_history_by_user(
@@ -177,6 +183,7 @@ async def save_friend_activity(
     db.add(activity)
     await db.commit()
     await db.refresh(activity)
+    activity_rollups.add_friend(db.bind, activity_type)
     return activity
 
 async def get_friend_activities(
@@ -239,6 +246,13 @@ async def get_pending_notifications(
     result = await db.execute(query)
     return result.scalars().all()
 
+async def count_pending_notifications(db: AsyncSession) -> int:
+    """จำนวนการแจ้งเตือนที่ยังรอส่ง (ความยาวคิว Telegram)"""
+    result = await db.execute(
+        select(func.count(TelegramNotification.id)).where(TelegramNotification.status == 'pending')
+    )
+    return result.scalar() or 0
+
 async def update_notification_status(
     db: AsyncSession,
     notification_id: str,
@@ -321,7 +335,7 @@ async def log_system_event(
         message=message,
         details=json.dumps(details) if details else None,
         user_id=user_id,
-        request_id=request_id,
+        request_id=request_id or current_request_id(),
         execution_time=execution_time
     )
     db.add(log_entry)
@@ -329,6 +343,27 @@ async def log_system_event(
     await db.refresh(log_entry)
     return log_entry
 
+async def log_stage_timings(
+    db: AsyncSession,
+    stages: Dict[str, Dict[str, float]],
+    memory_usage: Optional[int] = None
+) -> int:
+    """บันทึกเวลาเฉลี่ยต่อ stage (หนึ่งแถวต่อ stage ต่อรอบการ flush)"""
+    for name, stats in stages.items():
+        db.add(SystemLogs(
+            id=str(uuid.uuid4()),
+            log_level="info",
+            category=PERFORMANCE_CATEGORY,
+            subcategory=name,
+            module="stage_timing",
+            message=f"{name}: {stats['count']} calls, avg {stats['avg_ms']} ms",
+            details=json.dumps(stats),
+            execution_time=int(round(stats["avg_ms"])),
+            memory_usage=memory_usage
+        ))
+    await db.commit()
+    return len(stages)
+
 async def get_system_logs(
     db: AsyncSession,
     level: Optional[str] = None,
@@ -349,3 +384,289 @@ async def get_system_logs(
     query = query.order_by(SystemLogs.timestamp.desc()).limit(limit).offset(offset)
     result = await db.execute(query)
     return result.scalars().all()
+
+# ========================================
+# Gemini Usage Rollup CRUD
+# ========================================
+
+# Upper bounds (ms) of the latency histogram columns on GeminiUsageHourly
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2000, 5000, 10000)
+
+def _latency_bucket_column(latency_ms: int) -> str:
+    for bound in LATENCY_BUCKETS_MS:
+        if latency_ms <= bound:
+            return f"latency_le_{bound}ms"
+    return f"latency_gt_{LATENCY_BUCKETS_MS[-1]}ms"
+
+async def record_gemini_usage(
+    db: AsyncSession,
+    model: str,
+    operation: str = "text",
+    success: bool = True,
+    prompt_tokens: int = 0,
+    completion_tokens: int = 0,
+    latency_ms: int = 0,
+    timestamp: Optional[datetime] = None
+):
+    """
+    เพิ่มยอดการใช้งาน Gemini ลงในแถวของชั่วโมงนั้น (upsert แบบ increment)
+
+    ใช้ INSERT ... ON CONFLICT DO UPDATE บน SQLite/PostgreSQL เพื่อให้หลาย worker
+    เขียนแถวเดียวกันได้โดยไม่ต้องอ่านก่อน
+    """
+    hour = (timestamp or datetime.utcnow()).replace(minute=0, second=0, microsecond=0)
+    latency_ms = max(0, int(latency_ms))
+    prompt_tokens = int(prompt_tokens or 0)
+    completion_tokens = int(completion_tokens or 0)
+    bucket = _latency_bucket_column(latency_ms)
+
+    increments = {
+        "calls": 1,
+        "errors": 0 if success else 1,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "latency_ms_sum": latency_ms,
+        bucket: 1
+    }
+
+    dialect = db.bind.dialect.name if db.bind is not None else ""
+    if dialect in ("sqlite", "postgresql"):
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+
+        table = GeminiUsageHourly.__table__
+        stmt = dialect_insert(table).values(
+            hour=hour, model=model, operation=operation,
+            latency_ms_max=latency_ms, **increments
+        )
+        update_values = {name: table.c[name] + value for name, value in increments.items()}
+        update_values["latency_ms_max"] = func.max(table.c.latency_ms_max, latency_ms) \
+            if dialect == "sqlite" else func.greatest(table.c.latency_ms_max, latency_ms)
+        update_values["updated_at"] = func.now()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["hour", "model", "operation"],
+            set_=update_values
+        )
+        await db.execute(stmt)
+    else:
+        # Generic fallback: read-modify-write
+        result = await db.execute(
+            select(GeminiUsageHourly).where(and_(
+                GeminiUsageHourly.hour == hour,
+                GeminiUsageHourly.model == model,
+                GeminiUsageHourly.operation == operation
+            ))
+        )
+        row = result.scalar_one_or_none()
+        if row is None:
+            db.add(GeminiUsageHourly(
+                hour=hour, model=model, operation=operation,
+                latency_ms_max=latency_ms, **increments
+            ))
+        else:
+            for name, value in increments.items():
+                setattr(row, name, (getattr(row, name) or 0) + value)
+            row.latency_ms_max = max(row.latency_ms_max or 0, latency_ms)
+
+    await db.commit()
+
+async def get_gemini_usage_rollup(
+    db: AsyncSession,
+    hours: int = 24,
+    model: Optional[str] = None
+) -> List[GeminiUsageHourly]:
+    """ดึงแถวสรุปการใช้งาน Gemini รายชั่วโมงย้อนหลัง ``hours`` ชั่วโมง"""
+    since = datetime.utcnow().replace(minute=0, second=0, microsecond=0) - timedelta(hours=hours - 1)
+    query = select(GeminiUsageHourly).where(GeminiUsageHourly.hour >= since)
+    if model:
+        query = query.where(GeminiUsageHourly.model == model)
+
+    result = await db.execute(query.order_by(GeminiUsageHourly.hour))
+    return result.scalars().all()
+
+AI_FALLBACK_SUBCATEGORIES = ("ai_fallback", "live_chat_ai_fallback")
+
+async def count_ai_fallbacks(db: AsyncSession, hours: int = 24) -> int:
+    """จำนวนครั้งที่ตอบด้วยข้อความสำรองแทน AI (system_logs หมวด gemini) ย้อนหลัง ``hours`` ชั่วโมง"""
+    since = datetime.utcnow() - timedelta(hours=hours)
+    result = await db.execute(
+        select(func.count(SystemLogs.id)).where(
+            SystemLogs.category == "gemini",
+            SystemLogs.subcategory.in_(AI_FALLBACK_SUBCATEGORIES),
+            SystemLogs.timestamp >= since
+        )
+    )
+    return result.scalar() or 0
+
+# ========================================
+# Activity Rollups (chat_history / friend_activity)
+# ========================================
+
+def hour_bucket(moment: datetime) -> datetime:
+    """ต้นชั่วโมงของเวลา (UTC) ที่ใช้เป็น key ของตาราง rollup"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def _dialect_insert(db: AsyncSession):
+    dialect = db.bind.dialect.name if db.bind is not None else ""
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    elif dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+async def _increment_rollup(db: AsyncSession, model, key: Dict[str, Any], column: str, amount: int = 1):
+    """เพิ่มค่า ``column`` ของแถว ``key`` (upsert แบบ increment เหมือน gemini_usage_hourly; ไม่ commit)"""
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is not None:
+        table = model.__table__
+        stmt = dialect_insert(table).values(**key, **{column: amount})
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(key),
+            set_={column: table.c[column] + amount, "updated_at": func.now()}
+        )
+        await db.execute(stmt)
+        return
+    # Generic fallback: read-modify-write
+    result = await db.execute(select(model).filter_by(**key))
+    row = result.scalar_one_or_none()
+    if row is None:
+        db.add(model(**key, **{column: amount}))
+    else:
+        setattr(row, column, (getattr(row, column) or 0) + amount)
+
+async def _merge_chat_reach(db: AsyncSession, day, users: HyperLogLog, sessions: HyperLogLog):
+    """รวม sketch ผู้ใช้/เซสชันเข้ากับแถวของวัน (เขียนกลับเฉพาะเมื่อ sketch เปลี่ยน)"""
+    dialect_insert = _dialect_insert(db)
+    if dialect_insert is not None:
+        await db.execute(
+            dialect_insert(ChatReachDaily.__table__).values(day=day).on_conflict_do_nothing(index_elements=["day"])
+        )
+    # FOR UPDATE (PostgreSQL): flushes from several workers merge one after another
+    result = await db.execute(
+        select(ChatReachDaily).where(ChatReachDaily.day == day)
+        .with_for_update().execution_options(populate_existing=True)
+    )
+    row = result.scalar_one_or_none()
+    if row is None:
+        row = ChatReachDaily(day=day)
+        db.add(row)
+    for column, sketch in (("users_sketch", users), ("sessions_sketch", sessions)):
+        stored = getattr(row, column)
+        merged = HyperLogLog(stored).merge(sketch).to_bytes()
+        if merged != stored:
+            setattr(row, column, merged)
+
+async def apply_activity_rollups(db: AsyncSession, pending: PendingRollups):
+    """
+    เขียนยอดที่สะสมไว้ (จาก activity_rollups) ลงตาราง rollup ใน transaction เดียวแล้ว commit
+
+    เรียงลำดับ key ก่อนเขียน เพื่อให้หลาย worker ล็อกแถวตามลำดับเดียวกัน (ไม่เกิด deadlock)
+    """
+    for (hour, message_type), count in sorted(pending.chat.items()):
+        await _increment_rollup(
+            db, ChatActivityHourly, {"hour": hour, "message_type": message_type}, "messages", count
+        )
+    for day, (users, sessions) in sorted(pending.reach.items()):
+        await _merge_chat_reach(db, day, users, sessions)
+    for (hour, activity_type), count in sorted(pending.friends.items()):
+        await _increment_rollup(
+            db, FriendActivityHourly, {"hour": hour, "activity_type": activity_type}, "activities", count
+        )
+    await db.commit()
+
+async def activity_rollups_need_backfill(db: AsyncSession) -> bool:
+    """ตาราง rollup ยังว่างแต่มีข้อมูลดิบแล้ว (เช่น หลังอัปเกรดครั้งแรก)"""
+    for model in (ChatActivityHourly, FriendActivityHourly):
+        if (await db.execute(select(model.id).limit(1))).first() is not None:
+            return False
+    for model in (ChatHistory, FriendActivity):
+        if (await db.execute(select(model.id).limit(1))).first() is not None:
+            return True
+    return False
+
+def _utc_naive(moment: datetime) -> datetime:
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+async def rebuild_activity_rollups(
+    db: AsyncSession,
+    since: Optional[datetime] = None,
+    batch_size: int = 5000
+) -> Dict[str, int]:
+    """
+    สร้างตาราง rollup ใหม่จาก chat_history / friend_activity (backfill)
+
+    ลบแถว rollup ตั้งแต่ ``since`` (ปัดเป็นต้นวัน UTC; None = ทั้งหมด) แล้วรวมจากข้อมูลดิบ
+    แบบ stream ทีละ ``batch_size`` แถว - ควรรันตอนที่ webhook ไม่ได้รับข้อความ
+    หรือรันเฉพาะช่วงเวลาในอดีต เพราะการเขียนระหว่าง rebuild จะถูกนับซ้ำ/หายได้
+    """
+    if since is not None:
+        since = _utc_naive(since).replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _window(query, column):
+        return query.where(column >= since) if since is not None else query
+
+    await db.execute(_window(delete(ChatActivityHourly), ChatActivityHourly.hour))
+    await db.execute(_window(delete(FriendActivityHourly), FriendActivityHourly.hour))
+    await db.execute(
+        delete(ChatReachDaily).where(ChatReachDaily.day >= since.date()) if since is not None
+        else delete(ChatReachDaily)
+    )
+
+    chat_counts: Dict[tuple, int] = {}
+    reach: Dict[Any, tuple] = {}
+    chat_rows = 0
+    chat_query = _window(select(
+        ChatHistory.timestamp, ChatHistory.message_type, ChatHistory.user_id, ChatHistory.session_id
+    ), ChatHistory.timestamp).execution_options(yield_per=batch_size)
+    async for moment, message_type, user_id, session_id in await db.stream(chat_query):
+        if moment is None:
+            continue
+        moment = _utc_naive(moment)
+        key = (hour_bucket(moment), message_type)
+        chat_counts[key] = chat_counts.get(key, 0) + 1
+        users, sessions = reach.setdefault(moment.date(), (HyperLogLog(), HyperLogLog()))
+        users.add(user_id)
+        if session_id:
+            sessions.add(session_id)
+        chat_rows += 1
+
+    friend_counts: Dict[tuple, int] = {}
+    friend_rows = 0
+    friend_query = _window(
+        select(FriendActivity.timestamp, FriendActivity.activity_type), FriendActivity.timestamp
+    ).execution_options(yield_per=batch_size)
+    async for moment, activity_type in await db.stream(friend_query):
+        if moment is None:
+            continue
+        key = (hour_bucket(_utc_naive(moment)), activity_type)
+        friend_counts[key] = friend_counts.get(key, 0) + 1
+        friend_rows += 1
+
+    db.add_all(
+        ChatActivityHourly(hour=hour, message_type=message_type, messages=count)
+        for (hour, message_type), count in chat_counts.items()
+    )
+    db.add_all(
+        ChatReachDaily(day=day, users_sketch=users.to_bytes(), sessions_sketch=sessions.to_bytes())
+        for day, (users, sessions) in reach.items()
+    )
+    db.add_all(
+        FriendActivityHourly(hour=hour, activity_type=activity_type, activities=count)
+        for (hour, activity_type), count in friend_counts.items()
+    )
+    await db.commit()
+
+    return {
+        "chat_rows": chat_rows,
+        "friend_rows": friend_rows,
+        "chat_hourly_rows": len(chat_counts),
+        "reach_days": len(reach),
+        "friend_hourly_rows": len(friend_counts)
+    }
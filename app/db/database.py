@@ -1,4 +1,5 @@
 # app/db/database.py
+import logging
 import os
 from pathlib import Path
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
@@ -6,6 +7,11 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
 from app.core.config import settings
 from app.db.models import Base
+from app.utils import metrics
+from app.utils.timing import stage_timer
+from app.utils.slow_queries import slow_query_log
+
+logger = logging.getLogger(__name__)
 
 # สร้างโฟลเดอร์สำหรับ database ถ้ายังไม่มี
 def ensure_database_directory():
@@ -17,7 +23,7 @@ def ensure_database_directory():
         
         # สร้างโฟลเดอร์ถ้ายังไม่มี
         db_dir.mkdir(parents=True, exist_ok=True)
-        print(f"Ensured database directory exists: {db_dir}")
+        logger.debug("Ensured database directory exists: %s", db_dir)
 
 # เรียกใช้ฟังก์ชันสร้างโฟลเดอร์
 ensure_database_directory()
@@ -25,10 +31,17 @@ ensure_database_directory()
 # สร้าง async engine
 async_engine = create_async_engine(
     settings.DATABASE_URL,
-    echo=True,
+    echo=settings.DB_ECHO,
     future=True
 )
 
+# จับเวลา INSERT/UPDATE/DELETE ทุกคำสั่งเป็น stage "db_write"
+stage_timer.instrument_engine(async_engine.sync_engine)
+# เวลาของแต่ละ transaction (BEGIN -> COMMIT/ROLLBACK) สำหรับ /metrics
+metrics.instrument_engine(async_engine.sync_engine)
+# บันทึก statement ที่ช้ากว่า SLOW_QUERY_THRESHOLD_MS พร้อม EXPLAIN plan
+slow_query_log.instrument_engine(async_engine.sync_engine)
+
 # สร้าง async session
 AsyncSessionLocal = sessionmaker(
     async_engine,
@@ -41,27 +54,27 @@ async def create_db_and_tables():
     async with async_engine.begin() as conn:
         # สร้างตารางทั้งหมด (รวมตารางใหม่สำหรับ Forms System)
         await conn.run_sync(Base.metadata.create_all)
-        print("All database tables created successfully")
+        logger.info("All database tables created successfully")
         
         # เพิ่ม column chat_mode ถ้ายังไม่มี (สำหรับ database เก่า)
         try:
             await conn.execute(text("ALTER TABLE user_status ADD COLUMN chat_mode VARCHAR DEFAULT 'manual'"))
-            print("Added chat_mode column to user_status table")
+            logger.info("Added chat_mode column to user_status table")
         except Exception as e:
             # Column อาจมีอยู่แล้วหรือเกิด error อื่น
-            print(f"Note: chat_mode column already exists or error: {e}")
+            logger.debug("chat_mode column already exists or error: %s", e)
             pass
         
         # เพิ่ม column picture_url ถ้ายังไม่มี (สำหรับ avatar feature)
         try:
             await conn.execute(text("ALTER TABLE user_status ADD COLUMN picture_url TEXT NULL"))
-            print("Added picture_url column to user_status table")
+            logger.info("Added picture_url column to user_status table")
         except Exception as e:
             # Column อาจมีอยู่แล้วหรือเกิด error อื่น
-            print(f"Note: picture_url column already exists or error: {e}")
+            logger.debug("picture_url column already exists or error: %s", e)
             pass
             
-        print("Database migration completed successfully!")
+        logger.info("Database migration completed successfully")
 
 async def get_db():
     """Dependency สำหรับรับ database session"""
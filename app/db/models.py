@@ -1,5 +1,5 @@
 # app/db/models.py
-from sqlalchemy import Column, String, Boolean, DateTime, Text, Integer, ForeignKey
+from sqlalchemy import Column, String, Boolean, Date, DateTime, Text, Integer, LargeBinary, ForeignKey, UniqueConstraint
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -182,6 +182,70 @@ class SystemLogs(Base):
     memory_usage = Column(Integer)  # การใช้ memory (bytes)
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
 
+class GeminiUsageHourly(Base):
+    """ตารางสรุปการใช้งาน Gemini รายชั่วโมง (อัปเดตแบบ increment ทุกครั้งที่เรียก API)"""
+    __tablename__ = "gemini_usage_hourly"
+    __table_args__ = (
+        UniqueConstraint('hour', 'model', 'operation', name='uq_gemini_usage_hourly_bucket'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    hour = Column(DateTime, nullable=False, index=True)  # ต้นชั่วโมง (UTC)
+    model = Column(String, nullable=False)  # 'gemini-1.5-flash', 'knowledge_base'
+    operation = Column(String, nullable=False, default='text')  # 'text', 'image', 'document'
+    calls = Column(Integer, nullable=False, default=0)
+    errors = Column(Integer, nullable=False, default=0)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms_sum = Column(Integer, nullable=False, default=0)
+    latency_ms_max = Column(Integer, nullable=False, default=0)
+    # Latency histogram (จำนวนครั้งในแต่ละช่วงเวลา)
+    latency_le_250ms = Column(Integer, nullable=False, default=0)
+    latency_le_500ms = Column(Integer, nullable=False, default=0)
+    latency_le_1000ms = Column(Integer, nullable=False, default=0)
+    latency_le_2000ms = Column(Integer, nullable=False, default=0)
+    latency_le_5000ms = Column(Integer, nullable=False, default=0)
+    latency_le_10000ms = Column(Integer, nullable=False, default=0)
+    latency_gt_10000ms = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ChatActivityHourly(Base):
+    """ตารางสรุปจำนวนข้อความรายชั่วโมงตามประเภทผู้ส่ง (อัปเดตแบบ increment พร้อมกับการบันทึก chat_history)"""
+    __tablename__ = "chat_activity_hourly"
+    __table_args__ = (
+        UniqueConstraint('hour', 'message_type', name='uq_chat_activity_hourly_bucket'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    hour = Column(DateTime, nullable=False, index=True)  # ต้นชั่วโมง (UTC)
+    message_type = Column(String, nullable=False)  # 'user', 'admin', 'bot'
+    messages = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ChatReachDaily(Base):
+    """ตารางผู้ใช้/เซสชันที่ไม่ซ้ำกันรายวัน เก็บเป็น HyperLogLog sketch (รวมหลายวันได้ด้วยการ merge)"""
+    __tablename__ = "chat_reach_daily"
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    day = Column(Date, nullable=False, unique=True, index=True)  # วันที่ (UTC)
+    users_sketch = Column(LargeBinary)  # app/utils/hll.py
+    sessions_sketch = Column(LargeBinary)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class FriendActivityHourly(Base):
+    """ตารางสรุปกิจกรรมเพื่อนรายชั่วโมงตามประเภท (อัปเดตแบบ increment พร้อมกับการบันทึก friend_activity)"""
+    __tablename__ = "friend_activity_hourly"
+    __table_args__ = (
+        UniqueConstraint('hour', 'activity_type', name='uq_friend_activity_hourly_bucket'),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    hour = Column(DateTime, nullable=False, index=True)  # ต้นชั่วโมง (UTC)
+    activity_type = Column(String, nullable=False)  # 'follow', 'unfollow', 'block', 'unblock'
+    activities = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 # === Shared System Models (ปรับปรุง) ===
 
 class SharedNotification(Base):
@@ -1,12 +1,18 @@
 # app/main.py
+import logging
 import uvicorn
 from datetime import datetime
 from fastapi import FastAPI
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from app.core.config import settings
+from app.core.logger import setup_logging, shutdown_logging
 from app.db.database import create_db_and_tables
-from app.api.routers import webhook, admin, form_admin
+from app.api.routers import webhook, admin, form_admin, metrics
+
+# Queue-based logging before anything else logs
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI(
     title=settings.APP_TITLE,
@@ -27,24 +33,93 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 
 @app.on_event("startup")
 async def on_startup():
-    print("Application startup: Initializing database...")
+    logger.info("Application startup: Initializing database...")
     try:
         await create_db_and_tables()
-        print("Database and tables created successfully.")
+        logger.info("Database and tables created successfully.")
+    except Exception as e:
+        logger.warning("Database initialization failed: %s - application will start anyway, database will be created on first request.", e)
+    
+    # Build the HR knowledge index (incremental - only changed files are re-segmented)
+    try:
+        import asyncio
+        from app.services.knowledge_index import knowledge_index
+        loop = asyncio.get_event_loop()
+        stats = await loop.run_in_executor(None, knowledge_index.build)
+        logger.info("Knowledge index ready: %s passages from %s files", stats['passages'], stats['files'])
+    except Exception as e:
+        logger.warning("Knowledge index build failed: %s", e)
+    # Pick up rebuilds made by other workers (checked in the background, not per lookup)
+    from app.services.knowledge_index import knowledge_index
+    knowledge_index.start()
+    
+    # Chat / friend activity rollups: fill them from the raw history the first time
+    # (before this worker writes any), then merge buffered writes periodically
+    from app.services.activity_rollups import activity_rollups
+    if settings.ACTIVITY_ROLLUP_BACKFILL_ON_STARTUP:
+        try:
+            from app.db.database import AsyncSessionLocal
+            from app.db.crud_enhanced import activity_rollups_need_backfill, rebuild_activity_rollups
+            async with AsyncSessionLocal() as db:
+                if await activity_rollups_need_backfill(db):
+                    stats = await rebuild_activity_rollups(db)
+                    logger.info("Activity rollups backfilled from %s messages and %s friend events",
+                                stats['chat_rows'], stats['friend_rows'])
+        except Exception as e:
+            logger.warning("Activity rollup backfill failed (run scripts/database/backfill_activity_rollups.py): %s", e)
+    activity_rollups.start()
+    
+    # Periodic flush of per-stage hot-path timings to system_logs
+    from app.utils.timing import stage_timer
+    stage_timer.start()
+    
+    # Per-worker metrics snapshots so /metrics can merge every gunicorn worker
+    from app.utils.metrics import snapshot_store
+    snapshot_store.start()
+    
+    # Cross-worker event bus so admins on every gunicorn worker see every event
+    from app.services.ws_manager import manager
+    from app.services.event_bus import event_bus
+    try:
+        await event_bus.start(manager.deliver)
+        manager.attach_bus(event_bus)
+        logger.info("WebSocket event bus started: %s", event_bus.name)
     except Exception as e:
-        print(f"Warning: Database initialization failed: {e}")
-        print("Application will start anyway, database will be created on first request.")
+        logger.warning("WebSocket event bus (%s) failed to start, events stay on this worker: %s", event_bus.name, e)
+    
+    # Ping admin sockets and reap the ones that stopped answering
+    manager.start_heartbeat()
+    
+    # System status computed once per interval and pushed on the 'status' topic
+    from app.services.status_monitor import status_monitor
+    status_monitor.start()
 
 @app.on_event("shutdown")
 async def on_shutdown():
-    print("Application shutdown: Cleaning up resources...")
+    logger.info("Application shutdown: Cleaning up resources...")
+    from app.utils.timing import stage_timer
+    await stage_timer.stop()
+    from app.services.activity_rollups import activity_rollups
+    await activity_rollups.stop()
+    from app.utils.metrics import snapshot_store
+    await snapshot_store.stop()
+    from app.services.knowledge_index import knowledge_index
+    await knowledge_index.stop()
+    from app.services.status_monitor import status_monitor
+    await status_monitor.stop()
+    from app.services.event_bus import event_bus
+    await event_bus.stop()
+    from app.services.ws_manager import manager
+    await manager.close_all()
     # ปิด database connections และ cleanup resources อื่นๆ
-    print("Application shutdown complete.")
+    logger.info("Application shutdown complete.")
+    shutdown_logging()
 
 # Include routers
 app.include_router(admin.router)
 app.include_router(form_admin.router)
 app.include_router(webhook.router)
+app.include_router(metrics.router)
 
 # Import enhanced API and UI
 from app.api.routers import enhanced_api, ui_router
@@ -76,7 +151,8 @@ async def root():
             "analytics": "/ui/analytics",
             "api": "/api/enhanced",
             "docs": "/docs",
-            "health": "/health"
+            "health": "/health",
+            "metrics": "/metrics"
         }
     }
 
@@ -103,5 +179,7 @@ if __name__ == "__main__":
         "app.main:app", 
         host=settings.HOST, 
         port=settings.PORT, 
-        reload=settings.RELOAD
+        reload=settings.RELOAD,
+        ws_ping_interval=settings.WS_PING_INTERVAL,
+        ws_ping_timeout=settings.WS_PING_TIMEOUT
     )
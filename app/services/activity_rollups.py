@@ -0,0 +1,164 @@
+# Deferred chat / friend activity rollups
+"""
+Per-worker buffer in front of ``chat_activity_hourly``, ``chat_reach_daily``
+and ``friend_activity_hourly``.
+
+``save_chat_to_history`` and ``save_friend_activity`` commit the raw row on its
+own and then add the event here. A background task merges the buffered counts
+and HyperLogLog sketches into the rollup tables every
+``ACTIVITY_ROLLUP_FLUSH_INTERVAL`` seconds in one short transaction, so on
+PostgreSQL the day's ``chat_reach_daily`` row is locked once per flush instead
+of once per message, and a rollup error can no longer roll back a message.
+
+Events are kept per database engine, so tests with their own engine flush to
+their own database. A failed flush keeps its events for the next one; events
+still buffered when a worker is killed are lost until the rollups are rebuilt
+(``rebuild_activity_rollups``, run on startup when the tables are empty).
+"""
+
+import asyncio
+import logging
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.utils.hll import HyperLogLog
+
+logger = logging.getLogger(__name__)
+
+class PendingRollups:
+    """Counts and sketches not yet written for one database"""
+
+    def __init__(self):
+        self.chat: Dict[Tuple[datetime, str], int] = {}
+        self.reach: Dict[date, Tuple[HyperLogLog, HyperLogLog]] = {}
+        self.friends: Dict[Tuple[datetime, str], int] = {}
+        self.events = 0
+
+    def absorb(self, other: "PendingRollups"):
+        """Add another window's events (used to keep a failed flush for the next one)"""
+        for key, count in other.chat.items():
+            self.chat[key] = self.chat.get(key, 0) + count
+        for day, (users, sessions) in other.reach.items():
+            own_users, own_sessions = self.reach.setdefault(day, (HyperLogLog(), HyperLogLog()))
+            own_users.merge(users)
+            own_sessions.merge(sessions)
+        for key, count in other.friends.items():
+            self.friends[key] = self.friends.get(key, 0) + count
+        self.events += other.events
+
+class ActivityRollupBuffer:
+    """In-process rollup deltas with a periodic flush to the rollup tables"""
+
+    def __init__(self, flush_interval: Optional[float] = None):
+        self.flush_interval = flush_interval or settings.ACTIVITY_ROLLUP_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._pending: Dict[Any, PendingRollups] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self.flushed_events = 0
+
+    def _window(self, engine) -> PendingRollups:
+        if engine is None:
+            from app.db.database import async_engine
+            engine = async_engine
+        return self._pending.setdefault(engine, PendingRollups())
+
+    def add_chat(
+        self,
+        engine,
+        message_type: str,
+        user_id: str,
+        session_id: Optional[str] = None,
+        moment: Optional[datetime] = None
+    ):
+        """Count one chat_history row (``engine`` is the session's bind)"""
+        from app.db.crud_enhanced import hour_bucket
+
+        moment = moment or datetime.utcnow()
+        with self._lock:
+            window = self._window(engine)
+            key = (hour_bucket(moment), message_type)
+            window.chat[key] = window.chat.get(key, 0) + 1
+            users, sessions = window.reach.setdefault(moment.date(), (HyperLogLog(), HyperLogLog()))
+            users.add(user_id)
+            if session_id:
+                sessions.add(session_id)
+            window.events += 1
+
+    def add_friend(self, engine, activity_type: str, moment: Optional[datetime] = None):
+        """Count one friend_activity row"""
+        from app.db.crud_enhanced import hour_bucket
+
+        moment = moment or datetime.utcnow()
+        with self._lock:
+            window = self._window(engine)
+            key = (hour_bucket(moment), activity_type)
+            window.friends[key] = window.friends.get(key, 0) + 1
+            window.events += 1
+
+    async def flush(self, engine=None) -> int:
+        """
+        Write the buffered events; returns how many were written
+
+        Args:
+            engine: Only flush this database (default: every database with events)
+        """
+        from app.db.crud_enhanced import apply_activity_rollups
+
+        with self._lock:
+            if engine is None:
+                pending, self._pending = self._pending, {}
+            else:
+                window = self._pending.pop(engine, None)
+                pending = {engine: window} if window is not None else {}
+
+        written = 0
+        failure: Optional[Exception] = None
+        for target, window in pending.items():
+            try:
+                async with AsyncSession(target, expire_on_commit=False) as db:
+                    await apply_activity_rollups(db, window)
+                written += window.events
+            except Exception as e:
+                failure = e
+                with self._lock:
+                    self._pending.setdefault(target, PendingRollups()).absorb(window)
+        self.flushed_events += written
+        if failure is not None:
+            raise failure
+        return written
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Activity rollup flush failed, events kept for the next one: %s", e)
+
+    def start(self):
+        """Start the periodic flush (call from the running event loop)"""
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the periodic flush and write whatever is left"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning("Activity rollup flush failed: %s", e)
+
+# Global buffer used by the chat / friend activity writers
+activity_rollups = ActivityRollupBuffer()
+
+__all__ = ['ActivityRollupBuffer', 'PendingRollups', 'activity_rollups']
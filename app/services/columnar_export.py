@@ -0,0 +1,302 @@
+# Columnar analytics export
+"""
+Incremental export of ``chat_history``, ``friend_activity`` and
+``system_logs`` to compressed columnar files for notebook analysis.
+
+Layout (hive-style, readable with ``pyarrow.dataset`` / pandas / DuckDB)::
+
+    ANALYTICS_EXPORT_DIR/
+        _watermarks.json
+        chat_history/date=2026-10-01/part-initial.parquet
+        chat_history/date=2026-10-02/part-3f9c2a1b7d4e8f60.parquet
+        ...
+
+Each run streams only the rows after the table's watermark (the last exported
+``timestamp`` plus the ids exported at exactly that timestamp, since server
+default timestamps are only second-precise on SQLite), ordered by
+``(timestamp, id)`` in ``yield_per`` batches, and appends one new part file per
+date it touches. Files are written under a temporary name and renamed when the
+table is complete; the watermark is advanced only after that, so a failed run
+leaves no partial files behind and is simply retried by the next one. Part
+names are derived from the watermark the run started from, so a retry after a
+crash between the rename and the watermark update overwrites those parts
+(with a superset of their rows) instead of duplicating them. A run
+holds an exclusive lock on ``.lock`` in the export directory, so the API (on
+any worker) and the nightly script never export at the same time; a second run
+fails fast with ``ColumnarExportBusy``.
+
+pyarrow is optional: without it ``export`` raises ``ColumnarExportUnavailable``.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from sqlalchemy import Boolean, DateTime, Integer, select
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.models import ChatHistory, FriendActivity, SystemLogs
+from app.utils.file_lock import FileLockBusy, file_lock
+
+# Arrow / Parquet writer (optional - the export is unavailable without it)
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pa = None
+    pq = None
+    PYARROW_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+EXPORT_TABLES = {
+    "chat_history": ChatHistory,
+    "friend_activity": FriendActivity,
+    "system_logs": SystemLogs,
+}
+FORMAT_EXTENSIONS = {"parquet": "parquet", "arrow": "arrow"}
+WATERMARK_FILE = "_watermarks.json"
+
+class ColumnarExportUnavailable(RuntimeError):
+    """pyarrow is not installed"""
+
+class ColumnarExportBusy(RuntimeError):
+    """Another export (API worker or script) holds the export directory lock"""
+
+def _arrow_type(column):
+    if isinstance(column.type, DateTime):
+        return pa.timestamp("us")
+    if isinstance(column.type, Boolean):
+        return pa.bool_()
+    if isinstance(column.type, Integer):
+        return pa.int64()
+    return pa.string()
+
+def table_schema(model):
+    """Arrow schema mirroring the model's columns"""
+    return pa.schema([pa.field(column.name, _arrow_type(column)) for column in model.__table__.columns])
+
+class _PartitionWriter:
+    """One part file for one date partition, written under a temporary name"""
+
+    def __init__(self, path: Path, schema, fmt: str, compression: str):
+        self.path = path
+        self.tmp_path = path.with_name(f".{path.name}.tmp")
+        self.schema = schema
+        self.rows = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if fmt == "arrow":
+            self._sink = pa.OSFile(str(self.tmp_path), "wb")
+            self._writer = pa.ipc.new_file(
+                self._sink, schema, options=pa.ipc.IpcWriteOptions(compression=compression)
+            )
+        else:
+            self._sink = None
+            self._writer = pq.ParquetWriter(str(self.tmp_path), schema, compression=compression)
+
+    def write_rows(self, rows, names: List[str]):
+        """Append result rows (tuples in ``names`` order)"""
+        table = pa.Table.from_pydict(
+            {name: [row[i] for row in rows] for i, name in enumerate(names)},
+            schema=self.schema
+        )
+        self._writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        self._writer.close()
+        if self._sink is not None:
+            self._sink.close()
+
+    def discard(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+        self.tmp_path.unlink(missing_ok=True)
+
+class ColumnarExporter:
+    """Append new rows of the analytics tables to date-partitioned columnar files"""
+
+    def __init__(
+        self,
+        export_dir: Optional[str] = None,
+        fmt: Optional[str] = None,
+        compression: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        session_factory=None
+    ):
+        self.export_dir = Path(export_dir or settings.ANALYTICS_EXPORT_DIR)
+        self.format = (fmt or settings.ANALYTICS_EXPORT_FORMAT).lower()
+        if self.format not in FORMAT_EXTENSIONS:
+            raise ValueError(f"Unknown export format: {self.format}")
+        self.compression = compression or settings.ANALYTICS_EXPORT_COMPRESSION
+        self.batch_size = batch_size or settings.ANALYTICS_EXPORT_BATCH_SIZE
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.lock = asyncio.Lock()
+
+    @contextmanager
+    def _exclusive(self):
+        """Non-blocking cross-process lock over the export directory (no-op where fcntl is missing)"""
+        self.export_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with file_lock(self.export_dir / ".lock", blocking=False):
+                yield
+        except FileLockBusy:
+            raise ColumnarExportBusy(f"An export is already running in {self.export_dir}")
+
+    # ------------------------------------------------------------------
+    # Watermarks
+    # ------------------------------------------------------------------
+
+    def watermarks(self) -> Dict[str, Any]:
+        path = self.export_dir / WATERMARK_FILE
+        if not path.exists():
+            return {}
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def _save_watermark(self, table_name: str, watermark: Dict[str, Any]):
+        watermarks = self.watermarks()
+        watermarks[table_name] = watermark
+        path = self.export_dir / WATERMARK_FILE
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(watermarks, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _part_name(since: Optional[datetime], seen_ids: set) -> str:
+        """Same name for every run that starts from the same watermark"""
+        if since is None:
+            return "part-initial"
+        key = "\n".join([since.isoformat()] + sorted(seen_ids))
+        return f"part-{hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]}"
+
+    @staticmethod
+    def _is_new(timestamp: datetime, row_id: str, since: Optional[datetime], seen_ids: set) -> bool:
+        if since is None or timestamp > since:
+            return True
+        return timestamp == since and row_id not in seen_ids
+
+    # ------------------------------------------------------------------
+    # Export
+    # ------------------------------------------------------------------
+
+    async def export(self, tables: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """Export the rows added since the last run; returns per-table stats"""
+        if not PYARROW_AVAILABLE:
+            raise ColumnarExportUnavailable("pyarrow is not installed")
+        tables = list(tables or EXPORT_TABLES)
+        unknown = [name for name in tables if name not in EXPORT_TABLES]
+        if unknown:
+            raise ValueError(f"Unknown tables: {', '.join(unknown)}")
+
+        if self.lock.locked():
+            raise ColumnarExportBusy(f"An export is already running in {self.export_dir}")
+        async with self.lock:
+            with self._exclusive():
+                results = {}
+                for table_name in tables:
+                    results[table_name] = await self._export_table(table_name)
+                return results
+
+    async def _export_table(self, table_name: str) -> Dict[str, Any]:
+        model = EXPORT_TABLES[table_name]
+        schema = table_schema(model)
+        columns = list(model.__table__.columns)
+        names = [column.name for column in columns]
+        ts_index, id_index = names.index("timestamp"), names.index("id")
+
+        previous = self.watermarks().get(table_name) or {}
+        since = datetime.fromisoformat(previous["timestamp"]) if previous.get("timestamp") else None
+        seen_ids = set(previous.get("ids", []))
+
+        stmt = select(*columns).where(model.timestamp.isnot(None)).order_by(model.timestamp, model.id)
+        if since is not None:
+            # One second of overlap: SQLite compares the stored text, where
+            # "…:05" sorts before "…:05.000000"; _is_new drops the repeats
+            stmt = stmt.where(model.timestamp > since - timedelta(seconds=1))
+
+        loop = asyncio.get_running_loop()
+        part_name = f"{self._part_name(since, seen_ids)}.{FORMAT_EXTENSIONS[self.format]}"
+        writer: Optional[_PartitionWriter] = None
+        finished: List[_PartitionWriter] = []
+        last_ts, last_ids, exported = since, set(seen_ids), 0
+
+        async def close_writer():
+            await loop.run_in_executor(None, writer.close)
+            finished.append(writer)
+
+        try:
+            async with self.session_factory() as db:
+                result = await db.stream(stmt.execution_options(yield_per=self.batch_size))
+                async for partition in result.partitions():
+                    rows = [
+                        row for row in partition
+                        if self._is_new(row[ts_index], row[id_index], since, seen_ids)
+                    ]
+                    # Rows are ordered by timestamp, so each date is one contiguous run
+                    start = 0
+                    while start < len(rows):
+                        day = rows[start][ts_index].date()
+                        end = start
+                        while end < len(rows) and rows[end][ts_index].date() == day:
+                            end += 1
+                        path = self.export_dir / table_name / f"date={day.isoformat()}" / part_name
+                        if writer is None or writer.path != path:
+                            if writer is not None:
+                                await close_writer()
+                            writer = await loop.run_in_executor(
+                                None, _PartitionWriter, path, schema, self.format, self.compression
+                            )
+                        # Arrow conversion and compression both run off the event loop
+                        await loop.run_in_executor(None, writer.write_rows, rows[start:end], names)
+                        start = end
+
+                    for row in rows:
+                        if row[ts_index] != last_ts:
+                            last_ts, last_ids = row[ts_index], set()
+                        last_ids.add(row[id_index])
+                    exported += len(rows)
+            if writer is not None:
+                await close_writer()
+                writer = None
+        except Exception:
+            if writer is not None:
+                writer.discard()
+            for part in finished:
+                part.tmp_path.unlink(missing_ok=True)
+            logger.error("Columnar export of %s failed; watermark left at %s", table_name, since)
+            raise
+
+        for part in finished:
+            os.replace(part.tmp_path, part.path)
+        if exported:
+            self._save_watermark(table_name, {
+                "timestamp": last_ts.isoformat(),
+                "ids": sorted(last_ids),
+                "rows": previous.get("rows", 0) + exported,
+                "exported_at": datetime.utcnow().isoformat()
+            })
+
+        files = [str(part.path.relative_to(self.export_dir)) for part in finished]
+        logger.info("Columnar export of %s: %d new rows in %d files", table_name, exported, len(files))
+        return {
+            "rows": exported,
+            "files": files,
+            "watermark": last_ts.isoformat() if last_ts else None
+        }
+
+columnar_exporter = ColumnarExporter()
+
+__all__ = [
+    'ColumnarExporter', 'ColumnarExportBusy', 'ColumnarExportUnavailable', 'columnar_exporter',
+    'EXPORT_TABLES', 'PYARROW_AVAILABLE', 'table_schema'
+]
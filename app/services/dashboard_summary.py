@@ -0,0 +1,74 @@
+# Dashboard summary snapshot
+"""
+Cached ``/api/enhanced/dashboard/summary``.
+
+The summary combines four reports (chat overview, friend analytics, Telegram
+analytics, system health). They run concurrently, each on its own read
+session, and the combined snapshot is kept in a ``StaleWhileRevalidate``
+cache: requests within ``DASHBOARD_SUMMARY_TTL`` are served from memory, later
+ones get the cached snapshot immediately while one background task rebuilds
+it. Only a cold cache (or one older than ``DASHBOARD_SUMMARY_MAX_STALE``)
+makes a request wait for the queries.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.utils.cache import StaleWhileRevalidate
+from app.utils.metrics import register_cache
+from app.utils.timezone import get_thai_time
+
+logger = logging.getLogger(__name__)
+
+async def _report(session_factory, method: str, *args):
+    from app.services.history_service import history_service
+
+    async with session_factory() as db:
+        return await getattr(history_service, method)(db, *args)
+
+async def build_dashboard_summary(session_factory=None) -> Dict[str, Any]:
+    """Run the four sub-reports concurrently on separate sessions and combine them"""
+    session_factory = session_factory or AsyncSessionLocal
+    chat_overview, friend_analytics, telegram_analytics, system_health = await asyncio.gather(
+        _report(session_factory, "get_chat_overview", 7),
+        _report(session_factory, "get_friend_analytics", 7),
+        _report(session_factory, "get_telegram_analytics", 7),
+        _report(session_factory, "get_system_health", 24),
+    )
+    return {
+        "chat": {
+            "total_messages_7d": chat_overview["total_messages"],
+            "active_users_7d": chat_overview["active_users"],
+            "avg_messages_per_user": chat_overview["avg_messages_per_user"],
+            "approximate": ["active_users_7d", "avg_messages_per_user"]
+        },
+        "friends": {
+            "new_followers_7d": friend_analytics["activities_summary"].get("follow", 0),
+            "unfollowers_7d": friend_analytics["activities_summary"].get("unfollow", 0),
+            "net_growth_7d": friend_analytics["net_followers"]
+        },
+        "telegram": {
+            "notifications_sent_7d": telegram_analytics["notifications_by_status"].get("sent", 0),
+            "success_rate": telegram_analytics["success_rate"],
+            "total_notifications_7d": telegram_analytics["total_notifications"]
+        },
+        "system": {
+            "error_rate_24h": system_health["error_rate"],
+            "total_logs_24h": system_health["total_logs"],
+            "avg_response_time": system_health["performance"]["avg_response_time_ms"]
+        },
+        "generated_at": get_thai_time().isoformat()
+    }
+
+dashboard_summary = StaleWhileRevalidate(
+    build_dashboard_summary,
+    ttl=settings.DASHBOARD_SUMMARY_TTL,
+    max_stale=settings.DASHBOARD_SUMMARY_MAX_STALE,
+    name="dashboard_summary"
+)
+register_cache("dashboard_summary", dashboard_summary)
+
+__all__ = ['build_dashboard_summary', 'dashboard_summary']
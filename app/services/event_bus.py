@@ -0,0 +1,251 @@
+# Cross-worker event bus for admin WebSocket events
+"""
+Pluggable pub/sub under ``manager.broadcast``, selected by ``settings.WS_EVENT_BUS``.
+
+gunicorn runs several UvicornWorkers, each with its own ``ConnectionManager``.
+Every event is delivered to the local manager immediately and sent once to
+every other worker, which hands it to its own manager:
+
+- ``local``: single process, no IPC
+- ``unix``: one Unix datagram socket per worker in ``WS_BUS_DIR``; events are
+  sent to every peer socket found there (workers on the same host)
+- ``postgres``: ``LISTEN``/``NOTIFY`` on ``WS_BUS_CHANNEL`` through asyncpg
+  (workers on different hosts sharing the database)
+- ``auto`` (default): ``unix`` where available, else ``local``
+
+Events carry the publishing worker's id (so a worker never delivers its own
+event twice) and the publish time; the publish-to-deliver latency of events
+from other workers is exported as ``ws_event_bus_delivery_seconds``.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.ws_frames import dumps_json, loads_json
+from app.utils.metrics import WS_BUS_LATENCY, WS_BUS_MESSAGES
+
+logger = logging.getLogger(__name__)
+
+Deliver = Callable[[Optional[str], Dict[str, Any]], None]
+
+class EventBus:
+    """Local delivery only; base class of the cross-worker transports"""
+
+    name = "local"
+
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._deliver: Optional[Deliver] = None
+
+    async def start(self, deliver: Deliver):
+        self._deliver = deliver
+
+    async def stop(self):
+        self._deliver = None
+
+    def publish(self, topic: Optional[str], data: Dict[str, Any]):
+        """Deliver locally now and hand the event to the other workers"""
+        if self._deliver is not None:
+            self._deliver(topic, data)
+        payload = self._encode(topic, data)
+        if payload is not None:
+            self._send(payload)
+
+    def _encode(self, topic: Optional[str], data: Dict[str, Any]) -> Optional[bytes]:
+        return None
+
+    def _send(self, payload: bytes):
+        pass
+
+    def _envelope(self, topic: Optional[str], data: Dict[str, Any]) -> bytes:
+        return dumps_json({"o": self.origin, "t": time.time(), "topic": topic, "data": data}).encode("utf-8")
+
+    def _receive(self, payload):
+        """Deliver an event published by another worker"""
+        try:
+            envelope = loads_json(payload)
+        except ValueError:
+            logger.warning("Dropping malformed event bus message")
+            return
+        if envelope.get("o") == self.origin or self._deliver is None:
+            return
+        WS_BUS_MESSAGES.inc(transport=self.name, direction="received")
+        WS_BUS_LATENCY.observe(max(time.time() - envelope.get("t", time.time()), 0.0), transport=self.name)
+        self._deliver(envelope.get("topic"), envelope.get("data") or {})
+
+    def describe(self) -> Dict[str, Any]:
+        return {"transport": self.name, "origin": self.origin}
+
+class UnixSocketEventBus(EventBus):
+    """Datagram fan-out to every worker socket in a shared directory"""
+
+    name = "unix"
+    MAX_DATAGRAM = 262144
+    PEER_REFRESH_SECONDS = 1.0
+
+    def __init__(self, directory: Optional[str] = None, socket_name: Optional[str] = None):
+        super().__init__()
+        self.directory = os.path.abspath(directory or settings.WS_BUS_DIR)
+        self.path = os.path.join(self.directory, socket_name or f"worker-{os.getpid()}.sock")
+        self._sock: Optional[socket.socket] = None
+        self._peers: List[str] = []
+        self._peers_at = 0.0
+
+    async def start(self, deliver: Deliver):
+        await super().start(deliver)
+        os.makedirs(self.directory, exist_ok=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, self.MAX_DATAGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.MAX_DATAGRAM * 4)
+        sock.bind(self.path)
+        sock.setblocking(False)
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._on_readable)
+
+    async def stop(self):
+        if self._sock is not None:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        await super().stop()
+
+    def _encode(self, topic: Optional[str], data: Dict[str, Any]) -> Optional[bytes]:
+        return self._envelope(topic, data) if self._sock is not None else None
+
+    def _peer_paths(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_at > self.PEER_REFRESH_SECONDS:
+            try:
+                names = os.listdir(self.directory)
+            except OSError:
+                names = []
+            self._peers = [
+                os.path.join(self.directory, name) for name in names
+                if name.endswith(".sock") and os.path.join(self.directory, name) != self.path
+            ]
+            self._peers_at = now
+        return self._peers
+
+    def _send(self, payload: bytes):
+        for peer in list(self._peer_paths()):
+            try:
+                self._sock.sendto(payload, peer)
+                WS_BUS_MESSAGES.inc(transport=self.name, direction="sent")
+            except (ConnectionRefusedError, FileNotFoundError):
+                # The worker that owned this socket has exited
+                self._peers.remove(peer)
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except (BlockingIOError, OSError) as e:
+                WS_BUS_MESSAGES.inc(transport=self.name, direction="dropped")
+                logger.warning("Event bus send to %s failed: %s", os.path.basename(peer), e)
+
+    def _on_readable(self):
+        while self._sock is not None:
+            try:
+                payload = self._sock.recv(self.MAX_DATAGRAM)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                logger.warning("Event bus receive failed: %s", e)
+                return
+            self._receive(payload)
+
+    def describe(self) -> Dict[str, Any]:
+        return {**super().describe(), "socket": self.path, "peers": len(self._peer_paths())}
+
+class PostgresEventBus(EventBus):
+    """LISTEN/NOTIFY through a dedicated asyncpg connection"""
+
+    name = "postgres"
+    # NOTIFY payloads are limited to 8000 bytes
+    MAX_PAYLOAD = 7900
+
+    def __init__(self, dsn: Optional[str] = None, channel: Optional[str] = None):
+        super().__init__()
+        self.dsn = (dsn or settings.DATABASE_URL).replace("postgresql+asyncpg://", "postgresql://")
+        self.channel = channel or settings.WS_BUS_CHANNEL
+        self._conn = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._sender: Optional[asyncio.Task] = None
+
+    async def start(self, deliver: Deliver):
+        import asyncpg
+
+        await super().start(deliver)
+        self._conn = await asyncpg.connect(self.dsn)
+        await self._conn.add_listener(self.channel, self._on_notify)
+        self._outbox = asyncio.Queue(maxsize=1000)
+        self._sender = asyncio.create_task(self._send_loop())
+
+    async def stop(self):
+        if self._sender is not None:
+            self._sender.cancel()
+            try:
+                await self._sender
+            except asyncio.CancelledError:
+                pass
+            self._sender = None
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+        await super().stop()
+
+    def _encode(self, topic: Optional[str], data: Dict[str, Any]) -> Optional[bytes]:
+        return self._envelope(topic, data) if self._outbox is not None else None
+
+    def _send(self, payload: bytes):
+        if len(payload) > self.MAX_PAYLOAD:
+            WS_BUS_MESSAGES.inc(transport=self.name, direction="dropped")
+            logger.warning("Event bus payload of %d bytes exceeds the NOTIFY limit; delivered locally only", len(payload))
+            return
+        try:
+            # NOTIFY is sent by a background task so broadcast never waits for the DB
+            self._outbox.put_nowait(payload.decode("utf-8"))
+        except asyncio.QueueFull:
+            WS_BUS_MESSAGES.inc(transport=self.name, direction="dropped")
+
+    async def _send_loop(self):
+        while True:
+            payload = await self._outbox.get()
+            try:
+                await self._conn.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+                WS_BUS_MESSAGES.inc(transport=self.name, direction="sent")
+            except Exception as e:
+                WS_BUS_MESSAGES.inc(transport=self.name, direction="dropped")
+                logger.warning("Event bus NOTIFY failed: %s", e)
+
+    def _on_notify(self, connection, pid, channel, payload):
+        self._receive(payload)
+
+def create_event_bus(name: Optional[str] = None) -> EventBus:
+    """Build the transport named in settings.WS_EVENT_BUS"""
+    name = (name or settings.WS_EVENT_BUS or "auto").lower()
+    if name == "auto":
+        name = "unix" if hasattr(socket, "AF_UNIX") else "local"
+    if name == "unix":
+        return UnixSocketEventBus()
+    if name == "postgres":
+        return PostgresEventBus()
+    if name != "local":
+        logger.warning("Unknown WS_EVENT_BUS %r - using local", name)
+    return EventBus()
+
+# Global bus started by the application and attached to ``manager``
+event_bus = create_event_bus()
+
+__all__ = ['EventBus', 'UnixSocketEventBus', 'PostgresEventBus', 'create_event_bus', 'event_bus']
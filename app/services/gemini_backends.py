@@ -0,0 +1,371 @@
+# Gemini Model Backends
+"""
+Pluggable model backends for GeminiService, selected by ``settings.GEMINI_BACKEND``.
+
+- ``google``: the real ``google.generativeai`` client (default)
+- ``fake``: a deterministic local stand-in for offline benchmarks and tests
+
+Both backends expose the same small surface the service uses:
+``create_model()`` returning an object with ``generate_content(contents, stream=False)``,
+plus ``upload_file()`` and ``delete_file()`` for PDF handling.
+
+The fake backend never touches the network. Each call sleeps for a latency
+drawn from a configurable distribution (in the executor thread, like the real
+blocking client), and can raise errors or return safety/recitation blocks
+(``finish_reason`` 2/3) at configurable rates. Randomness is seeded from
+``GEMINI_FAKE_SEED`` and the prompt content, so the same prompts produce the
+same latencies and outcomes on every run regardless of scheduling order.
+"""
+
+import hashlib
+import logging
+import math
+import random
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Google AI imports (using existing stable API)
+try:
+    import google.generativeai as genai
+    from google.generativeai.types import HarmCategory, HarmBlockThreshold
+    GOOGLE_AI_AVAILABLE = True
+except ImportError:
+    genai = None
+    GOOGLE_AI_AVAILABLE = False
+    logger.warning("Google AI not available - Gemini features disabled")
+
+from app.core.config import settings
+
+class GeminiBackend(ABC):
+    """Interface shared by the real and fake backends"""
+
+    name = "base"
+
+    @property
+    @abstractmethod
+    def available(self) -> bool:
+        """Whether the backend can serve requests"""
+
+    @abstractmethod
+    def create_model(self, model_name: str, temperature: float, max_tokens: int, enable_safety: bool):
+        """Model object with ``generate_content(contents, stream=False)``"""
+
+    @abstractmethod
+    def upload_file(self, path, mime_type: str, display_name: str):
+        """Upload a file and return a handle with a ``name``"""
+
+    @abstractmethod
+    def delete_file(self, name: str):
+        """Delete an uploaded file by name"""
+
+    def describe(self) -> Dict[str, Any]:
+        return {"backend": self.name}
+
+class GoogleGeminiBackend(GeminiBackend):
+    """Real Gemini API through google.generativeai"""
+
+    name = "google"
+
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+
+    @property
+    def available(self) -> bool:
+        return GOOGLE_AI_AVAILABLE and bool(self.api_key)
+
+    def create_model(self, model_name: str, temperature: float, max_tokens: int, enable_safety: bool):
+        # Configure the API
+        genai.configure(api_key=self.api_key)
+
+        # Safety settings - disabled for testing HR/Government chatbot
+        safety_settings = {
+            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+        } if enable_safety else None
+
+        # Generation configuration
+        generation_config = genai.types.GenerationConfig(
+            temperature=temperature,
+            max_output_tokens=max_tokens,
+            top_p=0.8,
+            top_k=40
+        )
+
+        return genai.GenerativeModel(
+            model_name=model_name,
+            generation_config=generation_config,
+            safety_settings=safety_settings
+        )
+
+    def upload_file(self, path, mime_type: str, display_name: str):
+        return genai.upload_file(path=path, mime_type=mime_type, display_name=display_name)
+
+    def delete_file(self, name: str):
+        genai.delete_file(name)
+
+# ========================================
+# Fake backend
+# ========================================
+
+FINISH_REASON_STOP = 1
+FINISH_REASON_SAFETY = 2
+FINISH_REASON_RECITATION = 3
+
+class FakeGeminiError(Exception):
+    """Simulated API failure (message mimics the real status codes)"""
+
+class _Part:
+    def __init__(self, text: str):
+        self.text = text
+
+class _Content:
+    def __init__(self, parts: List[_Part]):
+        self.parts = parts
+
+class _Candidate:
+    def __init__(self, text: Optional[str], finish_reason: int):
+        self.finish_reason = finish_reason
+        self.content = _Content([_Part(text)] if text else [])
+
+class _UsageMetadata:
+    def __init__(self, prompt_tokens: int, completion_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = completion_tokens
+        self.total_token_count = prompt_tokens + completion_tokens
+
+class FakeResponse:
+    """Mimics GenerateContentResponse: ``text``, ``candidates`` and ``usage_metadata``"""
+
+    def __init__(self, text: Optional[str], finish_reason: int, prompt_tokens: int, completion_tokens: int):
+        self._text = text
+        self.candidates = [_Candidate(text, finish_reason)]
+        self.usage_metadata = _UsageMetadata(prompt_tokens, completion_tokens)
+
+    @property
+    def text(self) -> str:
+        if not self._text:
+            # Same behaviour as the real client when the candidate has no parts
+            raise ValueError(
+                f"Response has no text: finish_reason={self.candidates[0].finish_reason}"
+            )
+        return self._text
+
+class FakeStreamingResponse:
+    """Iterable of chunks delivered with a per-chunk delay (``stream=True``)"""
+
+    def __init__(self, response: FakeResponse, chunks: List[str], chunk_delay: float):
+        self._response = response
+        self._chunks = chunks
+        self._chunk_delay = chunk_delay
+        self.candidates = response.candidates
+        self.usage_metadata = response.usage_metadata
+
+    def __iter__(self) -> Iterator[FakeResponse]:
+        for index, chunk in enumerate(self._chunks):
+            if index:
+                time.sleep(self._chunk_delay)
+            usage = self._response.usage_metadata
+            yield FakeResponse(chunk, self._response.candidates[0].finish_reason,
+                               usage.prompt_token_count, 0)
+
+    def resolve(self):
+        for _ in self:
+            pass
+
+    @property
+    def text(self) -> str:
+        return self._response.text
+
+def _estimate_tokens(text: str) -> int:
+    # Roughly 3 characters per token for mixed Thai/English text
+    return max(1, math.ceil(len(text) / 3))
+
+def _contents_to_text(contents: Any) -> str:
+    if isinstance(contents, str):
+        return contents
+    parts = []
+    for item in contents if isinstance(contents, (list, tuple)) else [contents]:
+        if isinstance(item, str):
+            parts.append(item)
+        elif isinstance(item, dict) and "data" in item:
+            parts.append(f"<{item.get('mime_type', 'blob')}:{hashlib.sha1(item['data']).hexdigest()}>")
+        else:
+            parts.append(f"<{getattr(item, 'name', type(item).__name__)}>")
+    return "\n".join(parts)
+
+class FakeGenerativeModel:
+    """Offline stand-in for genai.GenerativeModel"""
+
+    REPLIES = [
+        "รับทราบค่ะ นี่คือคำตอบจำลองจากระบบทดสอบ หากต้องการข้อมูลเพิ่มเติมสามารถสอบถามได้เลยนะคะ",
+        "สวัสดีค่ะ ระบบกำลังทำงานในโหมดทดสอบ คำตอบนี้สร้างขึ้นเพื่อวัดประสิทธิภาพของระบบค่ะ",
+        "ขอบคุณที่สอบถามค่ะ สามารถยื่นเอกสารผ่านกองบริหารทรัพยากรบุคคลได้ตามขั้นตอนปกตินะคะ",
+    ]
+
+    def __init__(self, backend: "FakeGeminiBackend", model_name: str, max_tokens: int):
+        self.backend = backend
+        self.model_name = model_name
+        self.max_tokens = max_tokens
+
+    def generate_content(self, contents: Any, stream: bool = False, **kwargs):
+        prompt = _contents_to_text(contents)
+        rng = self.backend.rng_for(prompt)
+        latency = self.backend.sample_latency(rng)
+        self.backend.calls += 1
+
+        roll = rng.random()
+        if roll < self.backend.error_rate:
+            time.sleep(latency * rng.uniform(0.1, 1.0))
+            self.backend.errors += 1
+            raise FakeGeminiError(rng.choice([
+                "429 Resource has been exhausted (e.g. check quota).",
+                "500 An internal error has occurred.",
+                "503 The model is overloaded. Please try again later.",
+            ]))
+        roll -= self.backend.error_rate
+
+        prompt_tokens = _estimate_tokens(prompt)
+        if roll < self.backend.safety_rate:
+            time.sleep(latency)
+            return FakeResponse(None, FINISH_REASON_SAFETY, prompt_tokens, 0)
+        roll -= self.backend.safety_rate
+
+        if roll < self.backend.recitation_rate:
+            time.sleep(latency)
+            return FakeResponse(None, FINISH_REASON_RECITATION, prompt_tokens, 0)
+
+        reply = rng.choice(self.REPLIES)
+        repeat = rng.randint(1, 3)
+        text = " ".join([reply] * repeat)
+        completion_tokens = min(_estimate_tokens(text), self.max_tokens)
+        response = FakeResponse(text, FINISH_REASON_STOP, prompt_tokens, completion_tokens)
+
+        if not stream:
+            time.sleep(latency)
+            return response
+
+        # Streaming: first chunk after ~40% of the latency, the rest spread evenly
+        words = text.split(" ")
+        chunk_size = max(1, len(words) // 4)
+        chunks = [" ".join(words[i:i + chunk_size]) for i in range(0, len(words), chunk_size)]
+        time.sleep(latency * 0.4)
+        return FakeStreamingResponse(response, chunks, latency * 0.6 / max(1, len(chunks) - 1))
+
+class _FakeFile:
+    def __init__(self, name: str, display_name: str, mime_type: str, size: int):
+        self.name = name
+        self.display_name = display_name
+        self.mime_type = mime_type
+        self.size_bytes = size
+
+class FakeGeminiBackend(GeminiBackend):
+    """Deterministic local stand-in for benchmarks (no network, no API key)"""
+
+    name = "fake"
+    DISTRIBUTIONS = ("fixed", "uniform", "exponential", "lognormal")
+
+    def __init__(
+        self,
+        latency_ms: Optional[float] = None,
+        latency_distribution: Optional[str] = None,
+        latency_sigma: Optional[float] = None,
+        error_rate: Optional[float] = None,
+        safety_rate: Optional[float] = None,
+        recitation_rate: Optional[float] = None,
+        seed: Optional[int] = None
+    ):
+        self.latency_ms = settings.GEMINI_FAKE_LATENCY_MS if latency_ms is None else latency_ms
+        self.latency_distribution = (latency_distribution or settings.GEMINI_FAKE_LATENCY_DISTRIBUTION).lower()
+        if self.latency_distribution not in self.DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{self.latency_distribution}' "
+                             f"(expected one of {', '.join(self.DISTRIBUTIONS)})")
+        self.latency_sigma = settings.GEMINI_FAKE_LATENCY_SIGMA if latency_sigma is None else latency_sigma
+        self.error_rate = settings.GEMINI_FAKE_ERROR_RATE if error_rate is None else error_rate
+        self.safety_rate = settings.GEMINI_FAKE_SAFETY_RATE if safety_rate is None else safety_rate
+        self.recitation_rate = settings.GEMINI_FAKE_RECITATION_RATE if recitation_rate is None else recitation_rate
+        self.seed = settings.GEMINI_FAKE_SEED if seed is None else seed
+
+        self._lock = threading.Lock()
+        self._prompt_counts: Dict[str, int] = {}
+        self._files: Dict[str, _FakeFile] = {}
+        self.calls = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def rng_for(self, prompt: str) -> random.Random:
+        """RNG seeded by the prompt and how many times it was seen (order independent)"""
+        digest = hashlib.sha256(prompt.encode("utf-8", errors="ignore")).hexdigest()
+        with self._lock:
+            occurrence = self._prompt_counts.get(digest, 0)
+            self._prompt_counts[digest] = occurrence + 1
+            if len(self._prompt_counts) > 100000:
+                self._prompt_counts.clear()
+        return random.Random(f"{self.seed}:{digest}:{occurrence}")
+
+    def sample_latency(self, rng: random.Random) -> float:
+        """Latency in seconds drawn from the configured distribution (median = latency_ms)"""
+        base = max(0.0, self.latency_ms) / 1000.0
+        if base == 0:
+            return 0.0
+        if self.latency_distribution == "fixed":
+            return base
+        if self.latency_distribution == "uniform":
+            spread = base * min(self.latency_sigma, 1.0)
+            return rng.uniform(base - spread, base + spread)
+        if self.latency_distribution == "exponential":
+            return rng.expovariate(1.0 / base)
+        # lognormal: heavy right tail, median = base
+        return rng.lognormvariate(math.log(base), self.latency_sigma)
+
+    def create_model(self, model_name: str, temperature: float, max_tokens: int, enable_safety: bool):
+        return FakeGenerativeModel(self, model_name, max_tokens)
+
+    def upload_file(self, path, mime_type: str, display_name: str):
+        data = path.getvalue() if hasattr(path, "getvalue") else b""
+        time.sleep(self.sample_latency(self.rng_for(display_name)) * 0.5)
+        uploaded = _FakeFile(f"files/fake-{hashlib.sha1(data).hexdigest()[:12]}", display_name, mime_type, len(data))
+        with self._lock:
+            self._files[uploaded.name] = uploaded
+        return uploaded
+
+    def delete_file(self, name: str):
+        with self._lock:
+            self._files.pop(name, None)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "latency_ms": self.latency_ms,
+            "latency_distribution": self.latency_distribution,
+            "latency_sigma": self.latency_sigma,
+            "error_rate": self.error_rate,
+            "safety_rate": self.safety_rate,
+            "recitation_rate": self.recitation_rate,
+            "seed": self.seed,
+            "calls": self.calls,
+            "errors": self.errors,
+            "uploaded_files": len(self._files)
+        }
+
+def create_backend(name: Optional[str] = None, api_key: Optional[str] = None) -> GeminiBackend:
+    """Build the backend named in settings.GEMINI_BACKEND ('google' or 'fake')"""
+    name = (name or settings.GEMINI_BACKEND or "google").lower()
+    if name == "fake":
+        return FakeGeminiBackend()
+    if name != "google":
+        logger.warning("Unknown GEMINI_BACKEND '%s' - using google", name)
+    return GoogleGeminiBackend(api_key)
+
+__all__ = [
+    'GeminiBackend', 'GoogleGeminiBackend', 'FakeGeminiBackend', 'FakeGeminiError',
+    'create_backend', 'GOOGLE_AI_AVAILABLE'
+]
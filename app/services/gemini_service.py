@@ -1,35 +1,32 @@
 # Gemini AI Service Integration
 import json
 import asyncio
+import io
+import logging
 import os
-from typing import Dict, List, Optional, Any, Union
+import time
+from typing import Dict, List, Optional, Any, Tuple, Union
 from datetime import datetime
 
-# Google AI imports (using existing stable API)
-try:
-    import google.generativeai as genai
-    from google.generativeai.types import HarmCategory, HarmBlockThreshold
-    GOOGLE_AI_AVAILABLE = True
-except ImportError:
-    GOOGLE_AI_AVAILABLE = False
-    print("Warning: Google AI not available - Gemini features disabled")
-
-import io
-try:
-    from PIL import Image as PILImage
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
-
 from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 
 from app.core.config import settings
-from app.db.crud_enhanced import log_system_event, save_chat_to_history
+from app.services.gemini_backends import GOOGLE_AI_AVAILABLE, create_backend
+from app.db.crud_enhanced import log_system_event, save_chat_to_history, record_gemini_usage
+from app.db.database import AsyncSessionLocal
+from app.services.image_pipeline import PIL_AVAILABLE, prepare_image, to_gemini_blob
+from app.services.knowledge_index import knowledge_index
+from app.services.rate_limiter import ai_rate_limiter
+from app.utils.cache import TTLCache, content_hash
+from app.utils.metrics import GEMINI_ERRORS, GEMINI_LATENCY, register_cache
+from app.utils.timing import stage
 
 # Load environment variables
 load_dotenv(".env")
 
+logger = logging.getLogger(__name__)
+
 class GeminiService:
     """Google Gemini AI Integration Service with new API client"""
     
@@ -41,72 +38,81 @@ class GeminiService:
         self.max_tokens = getattr(settings, 'GEMINI_MAX_TOKENS', 1000)
         self.enable_safety = getattr(settings, 'GEMINI_ENABLE_SAFETY', False)  # Disable safety for testing
         
+        # Analysis results keyed by content hash - users often resend the same screenshot
+        self.image_cache = TTLCache(
+            maxsize=settings.GEMINI_MEDIA_CACHE_SIZE,
+            ttl=settings.GEMINI_MEDIA_CACHE_TTL
+        )
+        
+        # Uploaded PDF handles keyed by SHA-256 so follow-up questions skip the upload.
+        # Gemini keeps uploads for 48 hours; the TTL must stay below that.
+        self.document_cache = TTLCache(
+            maxsize=settings.GEMINI_MEDIA_CACHE_SIZE,
+            ttl=min(settings.GEMINI_UPLOAD_CACHE_TTL, 47 * 3600),
+            on_evict=self._retire_uploaded_file
+        )
+        self._pending_uploads: Dict[str, asyncio.Future] = {}
+        # Handles in use by running analyses; retired ones are deleted by the last user
+        self._upload_refs: Dict[str, int] = {}
+        self._retired_uploads: Dict[str, Any] = {}
+        register_cache("gemini_image", self.image_cache)
+        register_cache("gemini_document", self.document_cache)
+        
+        # Fire-and-forget usage rollup writes (kept referenced until done)
+        self._usage_tasks: set = set()
+        
+        # Chat sessions for different users (manual conversation tracking)
+        self.chat_sessions: Dict[str, Any] = {}
+        self.model = None
+        
+        # Model backend: real Gemini API or the offline stand-in (GEMINI_BACKEND)
+        self.backend = create_backend(api_key=self.api_key)
+        
         # Check if Google AI is available
-        if not GOOGLE_AI_AVAILABLE:
+        if self.backend.name == "google" and not GOOGLE_AI_AVAILABLE:
             self.client = None
             self.chat = None
-            print("⚠️ Google Genai library not available - Gemini features disabled")
+            logger.warning("Google Genai library not available - Gemini features disabled")
             return
             
         # Configure Gemini API
-        if self.api_key:
+        if self.backend.available:
             self._initialize_service()
         else:
-            self.model = None
-            self.chat_sessions = {}
-            print("Warning: No Gemini API key found - Gemini features disabled")
-            
-        # Chat sessions for different users (manual conversation tracking)
-        self.chat_sessions: Dict[str, Any] = {}
+            logger.warning("No Gemini API key found - Gemini features disabled")
         
     def _initialize_service(self):
-        """Initialize the Gemini service with existing stable API"""
-        if not GOOGLE_AI_AVAILABLE:
+        """Initialize the Gemini model through the configured backend"""
+        if not self.backend.available:
             self.model = None
             return
             
         try:
-            # Configure the API
-            genai.configure(api_key=self.api_key)
-            
-            # Safety settings - disabled for testing HR/Government chatbot
-            safety_settings = {
-                HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-                HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-            } if self.enable_safety else None
-            
-            # Generation configuration
-            generation_config = genai.types.GenerationConfig(
-                temperature=self.temperature,
-                max_output_tokens=self.max_tokens,
-                top_p=0.8,
-                top_k=40
-            )
-            
             # Initialize model
-            self.model = genai.GenerativeModel(
+            self.model = self.backend.create_model(
                 model_name=self.model_name,
-                generation_config=generation_config,
-                safety_settings=safety_settings
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                enable_safety=self.enable_safety
             )
             
-            print(f"Success: Gemini service initialized with model {self.model_name}")
+            logger.info("Gemini service initialized with model %s (%s backend)", self.model_name, self.backend.name)
             
         except Exception as e:
-            print(f"Failed to initialize Gemini service: {e}")
+            logger.error("Failed to initialize Gemini service: %s", e)
             self.model = None
     
     def is_available(self) -> bool:
         """Check if Gemini service is available"""
-        return GOOGLE_AI_AVAILABLE and self.model is not None and bool(self.api_key)
+        return self.backend.available and self.model is not None
     
     async def generate_response(
         self, 
         user_message: str, 
         user_id: str, 
-        use_session: bool = True
+        use_session: bool = True,
+        retrieval_query: Optional[str] = None,
+        rate_limit: bool = False
     ) -> Dict[str, Any]:
         """
         Generate AI response using Gemini with chat session
@@ -115,10 +121,20 @@ class GeminiService:
             user_message: User's input message
             user_id: LINE user ID for session tracking
             use_session: Whether to use chat session for continuity
+            retrieval_query: Text used for knowledge lookup (defaults to user_message)
+            rate_limit: Apply admission control before calling Gemini (FAQ answers are never limited)
             
         Returns:
             Dict containing response, metadata, and status
         """
+        query = retrieval_query or user_message
+        
+        # High-confidence FAQ matches are answered straight from the local index
+        faq_result = await self._answer_from_knowledge(user_id, query, use_session)
+        if faq_result:
+            self._record_usage("knowledge_base", "text", True, faq_result["usage"], 0)
+            return faq_result
+        
         if not self.is_available():
             return {
                 "success": False,
@@ -127,29 +143,40 @@ class GeminiService:
                 "usage": None
             }
         
+        # Per-user / global admission control - only requests that reach Gemini use tokens
+        if rate_limit:
+            rejected = await self._admit(user_id)
+            if rejected:
+                return rejected
+        
+        started = time.perf_counter()
+        usage = None
         try:
             # Generate response with conversation context
             if use_session:
-                response = await self._generate_with_context_async(user_id, user_message)
+                knowledge_context = await self._get_knowledge_context(query)
+                response, usage = await self._generate_with_context_async(user_id, user_message, knowledge_context)
             else:
                 # Simple generation without context
                 loop = asyncio.get_event_loop()
-                result = await loop.run_in_executor(
-                    None, 
-                    lambda: self.model.generate_content(user_message)
-                )
+                with stage("gemini"):
+                    result = await loop.run_in_executor(
+                        None, 
+                        lambda: self.model.generate_content(user_message)
+                    )
                 response = self._extract_response_text(result)
+                usage = self._extract_usage(result)
+            
+            latency_ms = int((time.perf_counter() - started) * 1000)
+            self._record_usage(self.model_name, "text", bool(response), usage, latency_ms)
             
             if response:
                 return {
                     "success": True,
                     "response": response,
                     "model": self.model_name,
-                    "usage": {
-                        "prompt_tokens": len(user_message.split()),
-                        "completion_tokens": len(response.split()),
-                        "total_tokens": len(user_message.split()) + len(response.split())
-                    },
+                    "usage": usage,
+                    "latency_ms": latency_ms,
                     "timestamp": datetime.now().isoformat()
                 }
             else:
@@ -157,12 +184,14 @@ class GeminiService:
                     "success": False,
                     "response": "ขออภัย ไม่สามารถสร้างคำตอบได้ในขณะนี้",
                     "error": "Empty response from Gemini",
-                    "usage": None
+                    "usage": usage
                 }
                 
         except Exception as e:
             error_msg = str(e)
-            print(f"Gemini generation error: {error_msg}")
+            logger.error("Gemini generation error: %s", error_msg)
+            self._record_usage(self.model_name, "text", False, usage,
+                               int((time.perf_counter() - started) * 1000))
             return {
                 "success": False,
                 "response": "ขออภัย เกิดข้อผิดพลาดในการประมวลผล",
@@ -170,6 +199,49 @@ class GeminiService:
                 "usage": None
             }
     
+    async def _answer_from_knowledge(self, user_id: str, query: str, use_session: bool) -> Optional[Dict[str, Any]]:
+        """Return an FAQ answer from the knowledge index when the match is confident"""
+        try:
+            # Tokenizing (pythainlp) and BM25 scoring are CPU work - keep them off the event loop
+            loop = asyncio.get_event_loop()
+            match = await loop.run_in_executor(None, knowledge_index.answer_faq, query)
+        except Exception as e:
+            logger.error("Knowledge FAQ lookup failed: %s", e)
+            return None
+        
+        if not match:
+            return None
+        
+        if use_session:
+            # Keep the exchange in context so follow-up questions still make sense
+            context = self._get_or_create_conversation_context(user_id)
+            context.append({"user": query, "assistant": match["answer"]})
+            if len(context) > 10:
+                self.chat_sessions[user_id]["conversation_history"] = context[-10:]
+        
+        return {
+            "success": True,
+            "response": match["answer"],
+            "model": "knowledge_base",
+            "source": "faq",
+            "knowledge": {
+                "question": match["question"],
+                "source": match["source"],
+                "confidence": match["confidence"]
+            },
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            "timestamp": datetime.now().isoformat()
+        }
+    
+    async def _get_knowledge_context(self, query: str) -> str:
+        """Top passages from the knowledge index formatted for the prompt"""
+        try:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, knowledge_index.build_prompt_context, query)
+        except Exception as e:
+            logger.error("Knowledge search failed: %s", e)
+            return ""
+    
     def _extract_response_text(self, response) -> Optional[str]:
         """Extract text from Gemini response with better error handling"""
         if not response:
@@ -180,41 +252,93 @@ class GeminiService:
             if hasattr(response, 'text') and response.text:
                 return response.text.strip()
         except Exception as e:
-            print(f"Quick accessor failed: {e}")
+            logger.error("Quick accessor failed: %s", e)
             
         try:
             # Check finish reason for safety filtering
             if hasattr(response, 'candidates') and response.candidates:
                 candidate = response.candidates[0]
                 if hasattr(candidate, 'finish_reason'):
-                    print(f"Finish reason: {candidate.finish_reason}")
+                    logger.debug("Finish reason: %s", candidate.finish_reason)
                     
                     # Try to extract content even if finish_reason indicates issues
                     if hasattr(candidate, 'content') and candidate.content and candidate.content.parts:
                         try:
                             extracted_text = candidate.content.parts[0].text.strip()
                             if extracted_text:
-                                print(f"Extracted text despite finish_reason {candidate.finish_reason}: {len(extracted_text)} chars")
+                                logger.debug("Extracted text despite finish_reason %s: %s chars", candidate.finish_reason, len(extracted_text))
                                 return extracted_text
                         except Exception as e:
-                            print(f"Failed to extract text: {e}")
+                            logger.error("Failed to extract text: %s", e)
                     
                     # Handle specific finish reasons only if no content was extracted
                     if candidate.finish_reason == 2:  # SAFETY
-                        print("Response blocked by safety filter - no content extracted")
+                        logger.warning("Response blocked by safety filter - no content extracted")
                         return "ขออภัย ไม่สามารถตอบคำถามนี้ได้ เนื่องจากระบบความปลอดภัย กรุณาลองใช้คำถามอื่น"
                     elif candidate.finish_reason == 3:  # RECITATION  
-                        print("Response blocked due to recitation - no content extracted")
+                        logger.warning("Response blocked due to recitation - no content extracted")
                         return "ขออภัย ไม่สามารถตอบคำถามนี้ได้ กรุณาลองใช้คำอื่น"
                 
                 # Try to extract from parts
                 if hasattr(candidate, 'content') and candidate.content and candidate.content.parts:
                     return candidate.content.parts[0].text.strip()
         except Exception as e:
-            print(f"Candidate extraction failed: {e}")
+            logger.error("Candidate extraction failed: %s", e)
             
         return None
     
+    def _extract_usage(self, response) -> Optional[Dict[str, int]]:
+        """Token counts reported by Gemini in ``response.usage_metadata``"""
+        metadata = getattr(response, "usage_metadata", None)
+        if not metadata:
+            return None
+        
+        prompt_tokens = int(getattr(metadata, "prompt_token_count", 0) or 0)
+        completion_tokens = int(getattr(metadata, "candidates_token_count", 0) or 0)
+        total_tokens = int(getattr(metadata, "total_token_count", 0) or 0)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": total_tokens or prompt_tokens + completion_tokens
+        }
+    
+    def _record_usage(
+        self,
+        model: str,
+        operation: str,
+        success: bool,
+        usage: Optional[Dict[str, int]],
+        latency_ms: int
+    ):
+        """Add one call to the hourly usage rollup without delaying the reply"""
+        usage = usage or {}
+        if model != "knowledge_base":
+            GEMINI_LATENCY.observe(latency_ms / 1000, operation=operation)
+            if not success:
+                GEMINI_ERRORS.inc(operation=operation)
+        
+        async def _write():
+            try:
+                async with AsyncSessionLocal() as db:
+                    await record_gemini_usage(
+                        db=db,
+                        model=model,
+                        operation=operation,
+                        success=success,
+                        prompt_tokens=usage.get("prompt_tokens", 0),
+                        completion_tokens=usage.get("completion_tokens", 0),
+                        latency_ms=latency_ms
+                    )
+            except Exception as e:
+                logger.error("Failed to record Gemini usage: %s", e)
+        
+        try:
+            task = asyncio.get_running_loop().create_task(_write())
+        except RuntimeError:
+            return
+        self._usage_tasks.add(task)
+        task.add_done_callback(self._usage_tasks.discard)
+    
     def _get_or_create_conversation_context(self, user_id: str) -> List[Dict]:
         """Get or create conversation context for user (manual session management)"""
         if user_id not in self.chat_sessions:
@@ -252,8 +376,10 @@ class GeminiService:
 - ใช้คำสุภาพบุรุษ เช่น "ครับ"
 - ใช้คำ "น่ะค่ะ", "นะค่ะ" """
 
-    async def _generate_with_context_async(self, user_id: str, message: str) -> Optional[str]:
-        """Generate response with conversation context"""
+    async def _generate_with_context_async(
+        self, user_id: str, message: str, knowledge_context: str = ""
+    ) -> Tuple[Optional[str], Optional[Dict[str, int]]]:
+        """Generate response with conversation context (returns text and token usage)"""
         try:
             # Get conversation context
             context = self._get_or_create_conversation_context(user_id)
@@ -262,6 +388,10 @@ class GeminiService:
             # Build full prompt with context
             prompt_parts = [system_prompt]
             
+            # Reference passages retrieved from the local HR knowledge index
+            if knowledge_context:
+                prompt_parts.append(knowledge_context)
+            
             # Add conversation history
             for exchange in context[-5:]:  # Last 5 exchanges for context
                 prompt_parts.append(f"User: {exchange['user']}")
@@ -275,19 +405,21 @@ class GeminiService:
             
             # Generate response
             loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None, 
-                lambda: self.model.generate_content(full_prompt)
-            )
+            with stage("gemini"):
+                response = await loop.run_in_executor(
+                    None, 
+                    lambda: self.model.generate_content(full_prompt)
+                )
             
             response_text = self._extract_response_text(response)
+            usage = self._extract_usage(response)
             
             if response_text:
                 # Safely print response without Unicode issues
                 try:
-                    print(f"Gemini response length: {len(response_text)} characters")
+                    logger.debug("Gemini response length: %s characters", len(response_text))
                 except UnicodeEncodeError:
-                    print(f"Gemini response generated (length: {len(response_text)})")
+                    logger.debug("Gemini response generated (length: %s)", len(response_text))
                 
                 # Update conversation context
                 context.append({
@@ -304,16 +436,16 @@ class GeminiService:
                 try:
                     clean_response = response_text.strip()
                     # Ensure proper UTF-8 encoding
-                    return clean_response.encode('utf-8', errors='ignore').decode('utf-8')
+                    return clean_response.encode('utf-8', errors='ignore').decode('utf-8'), usage
                 except UnicodeDecodeError:
                     # Fallback for encoding issues
-                    return response_text.encode('utf-8', errors='replace').decode('utf-8')
+                    return response_text.encode('utf-8', errors='replace').decode('utf-8'), usage
             
-            return None
+            return None, usage
             
         except Exception as e:
-            print(f"Gemini generation error: {e}")
-            return None
+            logger.error("Gemini generation error: %s", e)
+            return None, None
     
     def clear_chat_session(self, user_id: str):
         """Clear chat session for user"""
@@ -339,11 +471,12 @@ class GeminiService:
         # Get user ID for session management
         user_id = user_profile.get("user_id", "")
         
-        # Generate response using session
+        # Generate response using session (over-limit messages get a fast reply)
         result = await self.generate_response(
             user_message=user_message,
             user_id=user_id,
-            use_session=True
+            use_session=True,
+            rate_limit=True
         )
         
         # Log to database
@@ -351,6 +484,22 @@ class GeminiService:
         
         return result
     
+    async def _admit(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return a "please wait" result if the request is over the rate limit"""
+        admission = await ai_rate_limiter.acquire(user_id)
+        if admission.allowed:
+            return None
+        
+        logger.warning("AI request rate limited for %s: %s", user_id, admission.reason)
+        return {
+            "success": False,
+            "rate_limited": True,
+            "response": "ขออภัยค่ะ ตอนนี้มีข้อความเข้ามาจำนวนมาก กรุณารอสักครู่แล้วส่งข้อความอีกครั้งนะคะ 🙏",
+            "error": f"Rate limited: {admission.reason}",
+            "retry_after": admission.retry_after,
+            "usage": None
+        }
+    
     def clear_all_sessions(self):
         """Clear all chat sessions"""
         self.chat_sessions.clear()
@@ -395,7 +544,7 @@ class GeminiService:
                 )
                 
         except Exception as e:
-            print(f"Failed to log AI interaction: {e}")
+            logger.error("Failed to log AI interaction: %s", e)
     
     async def analyze_image(self, image_content: bytes, prompt: str = None) -> Dict[str, Any]:
         """
@@ -427,27 +576,50 @@ class GeminiService:
             if not prompt:
                 prompt = "กรุณาอธิบายภาพนี้เป็นภาษาไทย บอกว่าเห็นอะไรในภาพนะคะ"
             
-            # Convert image content to PIL Image
-            image_data = PILImage.open(io.BytesIO(image_content))
+            # Identical image + prompt returns the stored analysis without another model call
+            cache_key = content_hash(image_content, prompt, self.model_name)
+            cached = self.image_cache.get(cache_key)
+            if cached is not None:
+                return {**cached, "cached": True}
+            
+            # Downscale and recompress off the event loop
+            prepared = await prepare_image(image_content)
+            image_blob = to_gemini_blob(prepared)
             
             # Use existing stable API for image generation
             loop = asyncio.get_event_loop()
-            response = await loop.run_in_executor(
-                None,
-                lambda: self.model.generate_content([prompt, image_data])
-            )
+            started = time.perf_counter()
+            try:
+                with stage("gemini"):
+                    response = await loop.run_in_executor(
+                        None,
+                        lambda: self.model.generate_content([prompt, image_blob])
+                    )
+            except Exception:
+                self._record_usage(self.model_name, "image", False, None,
+                                   int((time.perf_counter() - started) * 1000))
+                raise
+            
+            usage = self._extract_usage(response)
+            self._record_usage(self.model_name, "image", bool(response and response.text), usage,
+                               int((time.perf_counter() - started) * 1000))
             
             if response and response.text:
                 # Ensure proper UTF-8 encoding
                 text = response.text.strip()
-                print(f"Gemini image analysis completed (length: {len(text)})")
+                logger.debug("Gemini image analysis completed (length: %s)", len(text))
                 clean_text = text.encode('utf-8').decode('utf-8')
-                return {
+                result = {
                     "success": True,
                     "response": clean_text,
                     "model": self.model_name,
-                    "type": "image_analysis"
+                    "type": "image_analysis",
+                    "usage": usage,
+                    "image_size": list(prepared["size"]),
+                    "image_bytes": len(prepared["data"])
                 }
+                self.image_cache.set(cache_key, result)
+                return {**result, "cached": False}
             else:
                 return {
                     "success": False,
@@ -456,7 +628,7 @@ class GeminiService:
                 }
                 
         except Exception as e:
-            print(f"Error analyzing image: {e}")
+            logger.error("Error analyzing image: %s", e)
             return {
                 "success": False,
                 "response": "ขออภัย เกิดข้อผิดพลาดในการวิเคราะห์ภาพ",
@@ -486,42 +658,48 @@ class GeminiService:
             if not prompt:
                 prompt = "สรุปเอกสารนี้เป็นภาษาไทย บอกจุดเด่นสำคัญของเนื้อหานะคะ"
             
-            # For PDF documents, use file upload approach with stable API
-            import tempfile
-            import os as os_module
-            
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(document_content)
-                temp_file_path = temp_file.name
+            # Upload from memory (reused for follow-up questions about the same file)
+            document_hash = content_hash(document_content)
+            uploaded_file = await self._get_or_upload_document(document_hash, document_content)
+            self._acquire_upload(uploaded_file)
             
+            # Generate response using model
+            loop = asyncio.get_event_loop()
+            started = time.perf_counter()
             try:
-                # Upload file to Gemini
-                uploaded_file = genai.upload_file(path=temp_file_path, mime_type="application/pdf")
-                
-                # Generate response using model
-                loop = asyncio.get_event_loop()
-                response = await loop.run_in_executor(
-                    None,
-                    lambda: self.model.generate_content([prompt, uploaded_file])
-                )
-                
-                # Clean up uploaded file
-                genai.delete_file(uploaded_file.name)
-                
+                with stage("gemini"):
+                    response = await loop.run_in_executor(
+                        None,
+                        lambda: self.model.generate_content([prompt, uploaded_file])
+                    )
+            except Exception:
+                # The remote handle may have expired - don't hand it out again.
+                # pop() skips on_evict, so retire the upload here; other analyses
+                # still holding it finish first
+                if self.document_cache.pop(document_hash) is not None:
+                    self._retire_uploaded_file(document_hash, uploaded_file)
+                self._record_usage(self.model_name, "document", False, None,
+                                   int((time.perf_counter() - started) * 1000))
+                raise
             finally:
-                # Clean up temporary file
-                os_module.unlink(temp_file_path)
+                self._release_upload(document_hash, uploaded_file)
+            
+            usage = self._extract_usage(response)
+            self._record_usage(self.model_name, "document", bool(response and response.text), usage,
+                               int((time.perf_counter() - started) * 1000))
             
             if response and response.text:
                 # Ensure proper UTF-8 encoding
                 text = response.text.strip()
-                print(f"Gemini document analysis completed (length: {len(text)})")
+                logger.debug("Gemini document analysis completed (length: %s)", len(text))
                 clean_text = text.encode('utf-8').decode('utf-8')
                 return {
                     "success": True,
                     "response": clean_text,
                     "model": self.model_name,
-                    "type": "document_analysis"
+                    "type": "document_analysis",
+                    "usage": usage,
+                    "document_hash": document_hash
                 }
             else:
                 return {
@@ -531,13 +709,87 @@ class GeminiService:
                 }
                 
         except Exception as e:
-            print(f"Error analyzing document: {e}")
+            logger.error("Error analyzing document: %s", e)
             return {
                 "success": False,
                 "response": "ขออภัย เกิดข้อผิดพลาดในการวิเคราะห์เอกสาร",
                 "error": str(e)
             }
 
+    async def _get_or_upload_document(self, document_hash: str, document_content: bytes):
+        """Return a cached Gemini file handle for the document or upload it once"""
+        uploaded_file = self.document_cache.get(document_hash)
+        if uploaded_file is not None:
+            return uploaded_file
+        
+        # Concurrent requests for the same document share one upload
+        pending = self._pending_uploads.get(document_hash)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(
+            None,
+            lambda: self.backend.upload_file(
+                path=io.BytesIO(document_content),
+                mime_type="application/pdf",
+                display_name=f"doc_{document_hash[:16]}.pdf"
+            )
+        )
+        self._pending_uploads[document_hash] = future
+        
+        def _uploaded(done: asyncio.Future):
+            # Runs even if every waiting request was cancelled, so the upload
+            # is cached (and later evicted and deleted) instead of leaking
+            self._pending_uploads.pop(document_hash, None)
+            if not done.cancelled() and done.exception() is None:
+                self.document_cache.set(document_hash, done.result())
+        
+        future.add_done_callback(_uploaded)
+        return await asyncio.shield(future)
+    
+    def _acquire_upload(self, uploaded_file):
+        name = getattr(uploaded_file, "name", None)
+        if name:
+            self._upload_refs[name] = self._upload_refs.get(name, 0) + 1
+    
+    def _release_upload(self, document_hash: str, uploaded_file):
+        name = getattr(uploaded_file, "name", None)
+        if not name or name not in self._upload_refs:
+            return
+        self._upload_refs[name] -= 1
+        if self._upload_refs[name] <= 0:
+            del self._upload_refs[name]
+            retired = self._retired_uploads.pop(name, None)
+            if retired is not None:
+                self._delete_uploaded_file(document_hash, retired)
+    
+    def _retire_uploaded_file(self, document_hash: str, uploaded_file):
+        """Delete an upload that left the cache, once no running analysis uses it"""
+        name = getattr(uploaded_file, "name", None)
+        if name and self._upload_refs.get(name):
+            self._retired_uploads[name] = uploaded_file
+            return
+        self._delete_uploaded_file(document_hash, uploaded_file)
+    
+    def _delete_uploaded_file(self, document_hash: str, uploaded_file):
+        """Remove an evicted upload from Gemini storage without blocking the event loop"""
+        name = getattr(uploaded_file, "name", None)
+        if not name or not self.backend.available:
+            return
+        
+        def _delete():
+            try:
+                self.backend.delete_file(name)
+            except Exception as e:
+                logger.error("Failed to delete uploaded file %s: %s", name, e)
+        
+        try:
+            asyncio.get_running_loop().run_in_executor(None, _delete)
+        except RuntimeError:
+            # Called outside the event loop (e.g. during shutdown)
+            _delete()
+    
     def get_model_info(self) -> Dict[str, Any]:
         """Get current model information"""
         return {
@@ -547,7 +799,11 @@ class GeminiService:
             "max_tokens": self.max_tokens,
             "safety_enabled": self.enable_safety,
             "api_configured": bool(self.api_key),
+            "backend": self.backend.describe(),
             "chat_sessions": len(self.chat_sessions),
+            "image_cache": self.image_cache.stats(),
+            "document_cache": self.document_cache.stats(),
+            "rate_limiter": ai_rate_limiter.stats(),
             "api_type": "google.generativeai"
         }
 
@@ -559,32 +815,34 @@ async def get_ai_response(
     user_message: str, 
     user_id: str, 
     user_profile: Dict[str, Any] = None,
-    db: AsyncSession = None
+    db: AsyncSession = None,
+    retrieval_query: Optional[str] = None
 ) -> str:
     """
     Simple helper to get AI response using session-based approach
     
     Returns the response text or fallback message
     """
-    if not gemini_service.is_available():
-        return "ขออภัย ระบบ AI ไม่พร้อมใช้งานในขณะนี้ กรุณาติดต่อเจ้าหน้าที่เพื่อขอความช่วยเหลือ"
-    
     try:
         # Use session-based generation for better context
         result = await gemini_service.generate_response(
             user_message=user_message,
             user_id=user_id,
-            use_session=True
+            use_session=True,
+            retrieval_query=retrieval_query,
+            rate_limit=True
         )
         
-        if result["success"]:
+        if result["success"] or result.get("rate_limited"):
             return result["response"]
+        elif not gemini_service.is_available():
+            return "ขออภัย ระบบ AI ไม่พร้อมใช้งานในขณะนี้ กรุณาติดต่อเจ้าหน้าที่เพื่อขอความช่วยเหลือ"
         else:
-            print(f"Gemini response failed: {result.get('error')}")
+            logger.error("Gemini response failed: %s", result.get('error'))
             return "ขออภัย ไม่สามารถประมวลผลคำขอได้ในขณะนี้ กรุณาลองใหม่อีกครั้ง"
         
     except Exception as e:
-        print(f"Error getting AI response: {e}")
+        logger.error("Error getting AI response: %s", e)
         return "ขออภัย เกิดข้อผิดพลาดในระบบ AI กรุณาลองใหม่อีกครั้ง หรือติดต่อเจ้าหน้าที่เพื่อขอความช่วยเหลือ"
 
 async def image_understanding(image_content: bytes, prompt: str = None) -> str:
@@ -605,7 +863,7 @@ async def image_understanding(image_content: bytes, prompt: str = None) -> str:
         result = await gemini_service.analyze_image(image_content, prompt)
         return result.get("response", "ขออภัย ไม่สามารถวิเคราะห์ภาพได้ในขณะนี้")
     except Exception as e:
-        print(f"Error analyzing image: {e}")
+        logger.error("Error analyzing image: %s", e)
         return "ขออภัย เกิดข้อผิดพลาดในการวิเคราะห์ภาพ"
 
 async def document_understanding(document_content: bytes, prompt: str = None) -> str:
@@ -626,7 +884,7 @@ async def document_understanding(document_content: bytes, prompt: str = None) ->
         result = await gemini_service.analyze_document(document_content, prompt)
         return result.get("response", "ขออภัย ไม่สามารถวิเคราะห์เอกสารได้ในขณะนี้")
     except Exception as e:
-        print(f"Error analyzing document: {e}")
+        logger.error("Error analyzing document: %s", e)
         return "ขออภัย เกิดข้อผิดพลาดในการวิเคราะห์เอกสาร"
 
 def generate_text(text: str) -> str:
@@ -655,9 +913,9 @@ def generate_text(text: str) -> str:
             response_text = response.text.strip()
             # Safely print response without Unicode issues
             try:
-                print(f"Gemini response length: {len(response_text)} characters")
+                logger.debug("Gemini response length: %s characters", len(response_text))
             except UnicodeEncodeError:
-                print(f"Gemini response generated (length: {len(response_text)})")
+                logger.debug("Gemini response generated (length: %s)", len(response_text))
             
             # Clean and properly encode response
             try:
@@ -669,7 +927,7 @@ def generate_text(text: str) -> str:
             return "ขออภัย ไม่สามารถประมวลผลคำขอได้ในขณะนี้"
         
     except Exception as e:
-        print(f"Error generating text: {e}")
+        logger.error("Error generating text: %s", e)
         return "ขออภัย เกิดข้อผิดพลาดในระบบ"
 
 async def check_gemini_availability() -> bool:
@@ -24,6 +24,7 @@ from app.services.gemini_service import (
     check_gemini_availability, gemini_service
 )
 from app.db.crud_enhanced import log_system_event
+from app.services.intent_engine import intent_engine
 
 class MessageType(Enum):
     """Enumeration of supported message types"""
@@ -441,14 +442,12 @@ class GeminiToolsSelector:
             if len(text) > 100:
                 analysis["complexity"] = "complex"
             
-            # Intent detection
-            question_words = ['อะไร', 'ที่ไหน', 'เมื่อไหร่', 'ทำไม', 'อย่างไร', 'ใคร']
-            if any(word in text for word in question_words):
-                analysis["intent"] = "question"
-            
-            help_words = ['ช่วย', 'ติดต่อ', 'เจ้าหน้าที่', 'admin']
-            if any(word in text.lower() for word in help_words):
+            # Intent detection (help requests take precedence over questions)
+            intents = intent_engine.match(text)
+            if intents.has("help_request"):
                 analysis["intent"] = "help_request"
+            elif intents.has("question"):
+                analysis["intent"] = "question"
         
         elif message_type == MessageType.IMAGE:
             analysis["requires_specialized_tool"] = True
@@ -1,11 +1,20 @@
 # History Service - Analytics and Reporting
+import csv
+import io
+import json
+import zlib
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Any, Tuple
+from typing import AsyncIterator, Dict, List, Optional, Any, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_, desc
 
-from app.db.models import ChatHistory, FriendActivity, TelegramNotification, SystemLogs, UserStatus
-from app.db.crud_enhanced import log_system_event
+from app.db.models import (
+    ChatHistory, FriendActivity, TelegramNotification, SystemLogs, UserStatus,
+    ChatActivityHourly, ChatReachDaily, FriendActivityHourly
+)
+from app.db.crud_enhanced import log_system_event, hour_bucket
+from app.utils.hll import HyperLogLog
+from app.utils.timing import PERFORMANCE_CATEGORY
 
 class HistoryService:
     """Service สำหรับการจัดการประวัติและการวิเคราะห์ข้อมูล"""
@@ -18,41 +27,31 @@ class HistoryService:
     # ========================================
     
     async def get_chat_overview(self, db: AsyncSession, days: int = 30) -> Dict[str, Any]:
-        """ภาพรวมการแชท"""
+        """ภาพรวมการแชท (จากตาราง rollup: chat_activity_hourly และ sketch ใน chat_reach_daily)"""
         
-        start_date = datetime.now() - timedelta(days=days)
-        
-        # Total messages
-        total_query = select(func.count(ChatHistory.id)).where(
-            ChatHistory.timestamp >= start_date
-        )
-        total_result = await db.execute(total_query)
-        total_messages = total_result.scalar() or 0
+        start_hour = hour_bucket(datetime.utcnow() - timedelta(days=days))
         
         # Messages by type
         type_query = select(
-            ChatHistory.message_type,
-            func.count(ChatHistory.id)
+            ChatActivityHourly.message_type,
+            func.sum(ChatActivityHourly.messages)
         ).where(
-            ChatHistory.timestamp >= start_date
-        ).group_by(ChatHistory.message_type)
+            ChatActivityHourly.hour >= start_hour
+        ).group_by(ChatActivityHourly.message_type)
         
         type_result = await db.execute(type_query)
-        messages_by_type = dict(type_result.fetchall())
+        messages_by_type = {msg_type: int(count or 0) for msg_type, count in type_result.fetchall()}
+        total_messages = sum(messages_by_type.values())
         
-        # Active users
-        users_query = select(func.count(func.distinct(ChatHistory.user_id))).where(
-            ChatHistory.timestamp >= start_date
-        )
-        users_result = await db.execute(users_query)
-        active_users = users_result.scalar() or 0
+        # Active users / sessions: merge the daily sketches of the period
+        reach_query = select(
+            ChatReachDaily.users_sketch,
+            ChatReachDaily.sessions_sketch
+        ).where(ChatReachDaily.day >= start_hour.date())
         
-        # Sessions
-        sessions_query = select(func.count(func.distinct(ChatHistory.session_id))).where(
-            ChatHistory.timestamp >= start_date
-        )
-        sessions_result = await db.execute(sessions_query)
-        total_sessions = sessions_result.scalar() or 0
+        reach_rows = (await db.execute(reach_query)).fetchall()
+        active_users = HyperLogLog.union(row[0] for row in reach_rows).count()
+        total_sessions = HyperLogLog.union(row[1] for row in reach_rows).count()
         
         return {
             "period_days": days,
@@ -60,36 +59,33 @@ class HistoryService:
             "messages_by_type": messages_by_type,
             "active_users": active_users,
             "total_sessions": total_sessions,
-            "avg_messages_per_user": round(total_messages / active_users, 2) if active_users > 0 else 0
+            "avg_messages_per_user": round(total_messages / active_users, 2) if active_users > 0 else 0,
+            # HyperLogLog estimates (about 2% error) over whole UTC days, not the exact window
+            "approximate": ["active_users", "total_sessions", "avg_messages_per_user"]
         }
     
     async def get_chat_timeline(self, db: AsyncSession, days: int = 7) -> List[Dict[str, Any]]:
-        """Timeline การแชทรายวัน"""
+        """Timeline การแชทรายวัน (รวมแถวรายชั่วโมงของ chat_activity_hourly)"""
         
-        start_date = datetime.now() - timedelta(days=days)
+        start_hour = hour_bucket(datetime.utcnow() - timedelta(days=days))
         
-        # Messages per day
-        daily_query = select(
-            func.date(ChatHistory.timestamp).label('date'),
-            ChatHistory.message_type,
-            func.count(ChatHistory.id).label('count')
+        hourly_query = select(
+            ChatActivityHourly.hour,
+            ChatActivityHourly.message_type,
+            ChatActivityHourly.messages
         ).where(
-            ChatHistory.timestamp >= start_date
-        ).group_by(
-            func.date(ChatHistory.timestamp),
-            ChatHistory.message_type
-        ).order_by('date')
+            ChatActivityHourly.hour >= start_hour
+        ).order_by(ChatActivityHourly.hour)
         
-        daily_result = await db.execute(daily_query)
-        daily_data = daily_result.fetchall()
+        hourly_result = await db.execute(hourly_query)
         
         # จัดรูปแบบข้อมูล
         timeline = {}
-        for date, msg_type, count in daily_data:
-            date_str = date.strftime('%Y-%m-%d')
+        for hour, msg_type, count in hourly_result.fetchall():
+            date_str = hour.strftime('%Y-%m-%d')
             if date_str not in timeline:
                 timeline[date_str] = {"date": date_str, "user": 0, "bot": 0, "admin": 0}
-            timeline[date_str][msg_type] = count
+            timeline[date_str][msg_type] = timeline[date_str].get(msg_type, 0) + count
         
         return list(timeline.values())
     
@@ -161,43 +157,29 @@ class HistoryService:
     # ========================================
     
     async def get_friend_analytics(self, db: AsyncSession, days: int = 30) -> Dict[str, Any]:
-        """วิเคราะห์ข้อมูลเพื่อน"""
+        """วิเคราะห์ข้อมูลเพื่อน (จากตาราง rollup friend_activity_hourly)"""
         
-        start_date = datetime.now() - timedelta(days=days)
+        start_hour = hour_bucket(datetime.utcnow() - timedelta(days=days))
         
-        # Activities by type
-        activity_query = select(
-            FriendActivity.activity_type,
-            func.count(FriendActivity.id)
+        hourly_query = select(
+            FriendActivityHourly.hour,
+            FriendActivityHourly.activity_type,
+            FriendActivityHourly.activities
         ).where(
-            FriendActivity.timestamp >= start_date
-        ).group_by(FriendActivity.activity_type)
-        
-        activity_result = await db.execute(activity_query)
-        activities = dict(activity_result.fetchall())
+            FriendActivityHourly.hour >= start_hour
+        ).order_by(FriendActivityHourly.hour)
         
-        # Daily activity
-        daily_query = select(
-            func.date(FriendActivity.timestamp).label('date'),
-            FriendActivity.activity_type,
-            func.count(FriendActivity.id).label('count')
-        ).where(
-            FriendActivity.timestamp >= start_date
-        ).group_by(
-            func.date(FriendActivity.timestamp),
-            FriendActivity.activity_type
-        ).order_by('date')
+        hourly_result = await db.execute(hourly_query)
         
-        daily_result = await db.execute(daily_query)
-        daily_activities = daily_result.fetchall()
-        
-        # Format daily data
+        # Activities by type and daily timeline
+        activities = {}
         daily_timeline = {}
-        for date, activity_type, count in daily_activities:
-            date_str = date.strftime('%Y-%m-%d')
+        for hour, activity_type, count in hourly_result.fetchall():
+            activities[activity_type] = activities.get(activity_type, 0) + count
+            date_str = hour.strftime('%Y-%m-%d')
             if date_str not in daily_timeline:
                 daily_timeline[date_str] = {"date": date_str, "follow": 0, "unfollow": 0, "block": 0, "unblock": 0}
-            daily_timeline[date_str][activity_type] = count
+            daily_timeline[date_str][activity_type] = daily_timeline[date_str].get(activity_type, 0) + count
         
         return {
             "period_days": days,
@@ -255,7 +237,7 @@ class HistoryService:
             TelegramNotification.status,
             func.count(TelegramNotification.id)
         ).where(
-            TelegramNotification.timestamp >= start_date
+            TelegramNotification.created_at >= start_date
         ).group_by(TelegramNotification.status)
         
         status_result = await db.execute(status_query)
@@ -266,7 +248,7 @@ class HistoryService:
             TelegramNotification.notification_type,
             func.count(TelegramNotification.id)
         ).where(
-            TelegramNotification.timestamp >= start_date
+            TelegramNotification.created_at >= start_date
         ).group_by(TelegramNotification.notification_type)
         
         type_result = await db.execute(type_query)
@@ -281,9 +263,9 @@ class HistoryService:
         failed_query = select(TelegramNotification).where(
             and_(
                 TelegramNotification.status == 'failed',
-                TelegramNotification.timestamp >= start_date
+                TelegramNotification.created_at >= start_date
             )
-        ).order_by(TelegramNotification.timestamp.desc()).limit(10)
+        ).order_by(TelegramNotification.created_at.desc()).limit(10)
         
         failed_result = await db.execute(failed_query)
         recent_failures = failed_result.scalars().all()
@@ -299,7 +281,7 @@ class HistoryService:
                     "id": f.id,
                     "notification_type": f.notification_type,
                     "error_message": f.error_message,
-                    "timestamp": f.timestamp.isoformat()
+                    "timestamp": f.created_at.isoformat() if f.created_at else None
                 }
                 for f in recent_failures
             ]
@@ -347,7 +329,7 @@ class HistoryService:
         error_result = await db.execute(error_query)
         recent_errors = error_result.scalars().all()
         
-        # Performance metrics
+        # Performance metrics (whole webhook requests; stage rows are reported separately)
         perf_query = select(
             func.avg(SystemLogs.execution_time),
             func.max(SystemLogs.execution_time),
@@ -355,6 +337,7 @@ class HistoryService:
         ).where(
             and_(
                 SystemLogs.execution_time.isnot(None),
+                SystemLogs.category != PERFORMANCE_CATEGORY,
                 SystemLogs.timestamp >= start_time
             )
         )
@@ -362,6 +345,8 @@ class HistoryService:
         perf_result = await db.execute(perf_query)
         avg_perf, max_perf, perf_count = perf_result.fetchone() or (0, 0, 0)
         
+        stage_latencies = await self._get_stage_latencies(db, start_time)
+        
         return {
             "period_hours": hours,
             "logs_by_level": logs_by_level,
@@ -371,7 +356,8 @@ class HistoryService:
             "performance": {
                 "avg_response_time_ms": round(avg_perf or 0, 2),
                 "max_response_time_ms": max_perf or 0,
-                "measured_requests": perf_count
+                "measured_requests": perf_count,
+                "stages": stage_latencies
             },
             "recent_errors": [
                 {
@@ -384,23 +370,70 @@ class HistoryService:
             ]
         }
     
+    async def _get_stage_latencies(self, db: AsyncSession, start_time: datetime) -> Dict[str, Any]:
+        """เวลาเฉลี่ยแยกตาม stage (ถ่วงน้ำหนักตามจำนวนครั้งในแต่ละรอบ flush)"""
+        stage_query = select(
+            SystemLogs.subcategory,
+            SystemLogs.details,
+            SystemLogs.execution_time
+        ).where(
+            and_(
+                SystemLogs.category == PERFORMANCE_CATEGORY,
+                SystemLogs.timestamp >= start_time
+            )
+        )
+        
+        stage_result = await db.execute(stage_query)
+        totals: Dict[str, Dict[str, float]] = {}
+        for name, details, avg_ms in stage_result.fetchall():
+            try:
+                stats = json.loads(details) if details else {}
+            except (TypeError, ValueError):
+                stats = {}
+            count = stats.get("count", 1)
+            entry = totals.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += count
+            entry["total_ms"] += stats.get("total_ms", (avg_ms or 0) * count)
+            entry["max_ms"] = max(entry["max_ms"], stats.get("max_ms", avg_ms or 0))
+        
+        return {
+            name: {
+                "count": entry["count"],
+                "avg_ms": round(entry["total_ms"] / entry["count"], 2) if entry["count"] else 0,
+                "max_ms": round(entry["max_ms"], 2)
+            }
+            for name, entry in sorted(totals.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+        }
+    
     # ========================================
     # Export Functions
     # ========================================
     
-    async def export_chat_history_csv(
-        self, 
-        db: AsyncSession, 
+    CSV_HEADER = [
+        'ID', 'User ID', 'Message Type', 'Message Content',
+        'Admin User ID', 'Is Read', 'Session ID', 'Timestamp'
+    ]
+    
+    async def stream_chat_history_csv(
+        self,
+        db: AsyncSession,
         user_id: Optional[str] = None,
         start_date: Optional[datetime] = None,
-        end_date: Optional[datetime] = None
-    ) -> str:
-        """Export chat history เป็น CSV"""
-        
-        import csv
-        import io
-        
-        query = select(ChatHistory)
+        end_date: Optional[datetime] = None,
+        batch_size: int = 1000,
+        compress: bool = False
+    ) -> AsyncIterator[bytes]:
+        """
+        Export chat history เป็น CSV แบบ stream (UTF-8, หรือ gzip เมื่อ ``compress``)
+        
+        อ่านเป็นชุดละ ``batch_size`` แถวผ่าน server-side cursor (yield_per) และส่งออกทีละชุด
+        หน่วยความจำจึงคงที่ไม่ว่าประวัติจะมีกี่แถว
+        """
+        
+        query = select(
+            ChatHistory.id, ChatHistory.user_id, ChatHistory.message_type, ChatHistory.message_content,
+            ChatHistory.admin_user_id, ChatHistory.is_read, ChatHistory.session_id, ChatHistory.timestamp
+        )
         
         if user_id:
             query = query.where(ChatHistory.user_id == user_id)
@@ -409,30 +442,45 @@ class HistoryService:
         if end_date:
             query = query.where(ChatHistory.timestamp <= end_date)
         
-        query = query.order_by(ChatHistory.timestamp)
-        
-        result = await db.execute(query)
-        messages = result.scalars().all()
+        query = query.order_by(ChatHistory.timestamp).execution_options(yield_per=batch_size)
         
-        # Create CSV
+        # gzip container (wbits=31) so the output is a regular .gz file
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
         output = io.StringIO()
         writer = csv.writer(output)
         
-        # Header
-        writer.writerow([
-            'ID', 'User ID', 'Message Type', 'Message Content', 
-            'Admin User ID', 'Is Read', 'Session ID', 'Timestamp'
-        ])
-        
-        # Data
-        for msg in messages:
-            writer.writerow([
-                msg.id, msg.user_id, msg.message_type, msg.message_content,
-                msg.admin_user_id, msg.is_read, msg.session_id, 
-                msg.timestamp.isoformat()
-            ])
+        def drain() -> bytes:
+            data = output.getvalue().encode('utf-8')
+            output.seek(0)
+            output.truncate()
+            return compressor.compress(data) if compressor else data
+        
+        writer.writerow(self.CSV_HEADER)
+        yield drain()
+        
+        result = await db.stream(query)
+        async for rows in result.partitions():
+            for row in rows:
+                timestamp = row[7]
+                writer.writerow([*row[:7], timestamp.isoformat() if timestamp else ''])
+            chunk = drain()
+            if chunk:
+                yield chunk
+        
+        if compressor:
+            yield compressor.flush()
+    
+    async def export_chat_history_csv(
+        self, 
+        db: AsyncSession, 
+        user_id: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None
+    ) -> str:
+        """Export chat history เป็น CSV ทั้งก้อน (สำหรับข้อมูลขนาดเล็ก; ส่งออกไฟล์ใหญ่ใช้ stream_chat_history_csv)"""
         
-        return output.getvalue()
+        chunks = [chunk async for chunk in self.stream_chat_history_csv(db, user_id, start_date, end_date)]
+        return b"".join(chunks).decode('utf-8')
 
 # ========================================
 # Global Instance
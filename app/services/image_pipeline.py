@@ -0,0 +1,109 @@
+# Image pre-processing for Gemini Vision
+"""
+Downscale and recompress images before they are sent to Gemini.
+
+LINE delivers full-resolution photos and screenshots, which are much larger
+than the model needs. Decoding and re-encoding is CPU bound, so the public
+coroutine runs the PIL work in the default executor instead of on the event loop.
+"""
+
+import asyncio
+import io
+from typing import Any, Dict, Optional
+
+try:
+    from PIL import Image as PILImage, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+from app.core.config import settings
+
+# Formats Gemini accepts directly; anything else is re-encoded as JPEG
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+def _prepare_image_sync(image_content: bytes, max_dimension: int, quality: int) -> Dict[str, Any]:
+    """Decode, downscale and recompress an image (blocking)"""
+    image = PILImage.open(io.BytesIO(image_content))
+    source_format = (image.format or "").upper()
+    width, height = image.size
+
+    # Already small enough and in a supported format: send the original bytes
+    if max(width, height) <= max_dimension and source_format in PASSTHROUGH_FORMATS:
+        return {
+            "mime_type": PASSTHROUGH_FORMATS[source_format],
+            "data": image_content,
+            "original_size": (width, height),
+            "size": (width, height),
+            "resized": False
+        }
+
+    # Respect camera orientation before resizing
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # JPEG has no alpha channel - flatten onto white so text stays readable
+        image = image.convert("RGBA")
+        background = PILImage.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.split()[-1])
+        image = background
+    elif image.mode != "RGB":
+        image = image.convert("RGB")
+
+    image.thumbnail((max_dimension, max_dimension), PILImage.LANCZOS)
+
+    output = io.BytesIO()
+    image.save(output, format="JPEG", quality=quality, optimize=True)
+    data = output.getvalue()
+
+    # Recompressing a small image can make it bigger - keep whichever is smaller
+    if len(data) >= len(image_content) and source_format in PASSTHROUGH_FORMATS \
+            and max(width, height) <= max_dimension:
+        return {
+            "mime_type": PASSTHROUGH_FORMATS[source_format],
+            "data": image_content,
+            "original_size": (width, height),
+            "size": (width, height),
+            "resized": False
+        }
+
+    return {
+        "mime_type": "image/jpeg",
+        "data": data,
+        "original_size": (width, height),
+        "size": image.size,
+        "resized": True
+    }
+
+async def prepare_image(
+    image_content: bytes,
+    max_dimension: Optional[int] = None,
+    quality: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Prepare an image for Gemini off the event loop
+
+    Args:
+        image_content: Raw image bytes as downloaded from LINE
+        max_dimension: Longest side in pixels (defaults to settings)
+        quality: JPEG quality 1-95 (defaults to settings)
+
+    Returns:
+        Dict with ``mime_type`` and ``data`` (usable directly as a Gemini blob)
+        plus ``original_size``, ``size`` and ``resized`` for logging
+    """
+    if not PIL_AVAILABLE:
+        raise RuntimeError("PIL not available")
+
+    max_dimension = max_dimension or settings.GEMINI_IMAGE_MAX_DIMENSION
+    quality = quality or settings.GEMINI_IMAGE_JPEG_QUALITY
+
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        None,
+        lambda: _prepare_image_sync(image_content, max_dimension, quality)
+    )
+
+def to_gemini_blob(prepared: Dict[str, Any]) -> Dict[str, Any]:
+    """Strip the bookkeeping fields so the dict can be passed to generate_content"""
+    return {"mime_type": prepared["mime_type"], "data": prepared["data"]}
@@ -0,0 +1,215 @@
+# Keyword Intent Engine
+"""
+One-pass keyword intent detection shared by every message handler.
+
+The keyword table maps an intent name to the phrases that trigger it. All
+phrases are compiled into a single Aho-Corasick automaton, so a message is
+scanned once no matter how many intents or keywords are configured, instead of
+one ``keyword in text`` scan per keyword.
+
+The built-in table can be extended or overridden with a JSON file at
+``settings.INTENT_KEYWORDS_FILE``::
+
+    {
+      "handoff": ["คุยกับแอดมิน", "ติดต่อเจ้าหน้าที่", "admin"],
+      "question": ["อะไร", "ทำไม"]
+    }
+
+The file is re-read when its modification time changes (checked at most every
+``settings.INTENT_RELOAD_INTERVAL`` seconds), so keywords can be tuned without
+a restart. Matching is case-insensitive and, like the scans it replaces, finds
+keywords anywhere in the message.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Default keyword table (used when no override file exists)
+DEFAULT_INTENT_KEYWORDS: Dict[str, List[str]] = {
+    # Requests to talk to a human - switches the user to live chat
+    "handoff": ["คุยกับแอดมิน", "ติดต่อเจ้าหน้าที่", "admin", "help", "คุยกับคน"],
+    # Question words - boosts the question answering tool
+    "question": ["อะไร", "ที่ไหน", "เมื่อไหร่", "ทำไม", "อย่างไร", "ใคร"],
+    # General requests for assistance - boosts the conversation tool
+    "help_request": ["ช่วย", "ติดต่อ", "เจ้าหน้าที่", "admin"],
+}
+
+@dataclass
+class IntentMatch:
+    """Result of scanning one message"""
+    intents: FrozenSet[str] = frozenset()
+    keywords: Dict[str, List[str]] = field(default_factory=dict)
+
+    def has(self, intent: str) -> bool:
+        return intent in self.intents
+
+    def __bool__(self) -> bool:
+        return bool(self.intents)
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over lower-cased keywords
+
+    States are stored as parallel lists: ``_goto[state]`` maps a character to
+    the next state, ``_fail[state]`` is the failure link and ``_output[state]``
+    holds the (intent, keyword) pairs that end at that state, including the
+    ones inherited through failure links.
+
+    Failure links are folded into ``_delta`` at compile time, so scanning is a
+    single dict lookup per character with no backtracking.
+    """
+
+    def __init__(self, table: Dict[str, Iterable[str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Tuple[Tuple[str, str], ...]] = [()]
+        self.keyword_count = 0
+
+        pending: List[List[Tuple[str, str]]] = [[]]
+        for intent, keywords in table.items():
+            for keyword in keywords:
+                keyword = str(keyword).strip().lower()
+                if not keyword:
+                    continue
+                state = 0
+                for char in keyword:
+                    next_state = self._goto[state].get(char)
+                    if next_state is None:
+                        next_state = len(self._goto)
+                        self._goto[state][char] = next_state
+                        self._goto.append({})
+                        self._fail.append(0)
+                        pending.append([])
+                    state = next_state
+                pending[state].append((intent, keyword))
+                self.keyword_count += 1
+
+        # Breadth-first pass to set failure links, merge outputs and build
+        # the full transition table (unknown characters go back to the root)
+        self._output = [tuple(items) for items in pending]
+        self._delta: List[Dict[str, int]] = [dict() for _ in self._goto]
+        self._delta[0] = dict(self._goto[0])
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            self._delta[state] = {**self._delta[self._fail[state]], **self._goto[state]}
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                if state:
+                    self._fail[child] = self._delta[self._fail[state]].get(char, 0)
+                if self._output[self._fail[child]]:
+                    self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    @property
+    def state_count(self) -> int:
+        return len(self._goto)
+
+    def scan(self, text: str) -> IntentMatch:
+        """Find every configured keyword in ``text`` in a single pass"""
+        delta = self._delta
+        output = self._output
+        found: Dict[str, List[str]] = {}
+
+        state = 0
+        for char in text.lower():
+            state = delta[state].get(char, 0)
+            if output[state]:
+                for intent, keyword in output[state]:
+                    keywords = found.setdefault(intent, [])
+                    if keyword not in keywords:
+                        keywords.append(keyword)
+
+        return IntentMatch(intents=frozenset(found), keywords=found)
+
+class IntentEngine:
+    """Shared intent detector with a hot-reloadable keyword table"""
+
+    def __init__(self, keywords_file: Optional[str] = None):
+        self.keywords_file = Path(keywords_file or settings.INTENT_KEYWORDS_FILE)
+        self._lock = threading.Lock()
+        self._file_mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._table: Dict[str, List[str]] = {}
+        self._automaton = self._compile(self._load_table())
+
+    def _load_table(self) -> Dict[str, List[str]]:
+        """Merge the override file (if any) on top of the built-in table"""
+        table = {intent: list(words) for intent, words in DEFAULT_INTENT_KEYWORDS.items()}
+        try:
+            self._file_mtime = self.keywords_file.stat().st_mtime
+        except FileNotFoundError:
+            self._file_mtime = None
+            return table
+
+        try:
+            data = json.loads(self.keywords_file.read_text(encoding="utf-8"))
+            for intent, words in data.items():
+                if isinstance(words, str):
+                    words = [words]
+                table[str(intent)] = [str(word) for word in words]
+        except Exception as e:
+            logger.error("Failed to read intent keywords from %s: %s", self.keywords_file, e)
+        return table
+
+    def _compile(self, table: Dict[str, List[str]]) -> KeywordAutomaton:
+        self._table = table
+        return KeywordAutomaton(table)
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        """Recompile the automaton if the keyword file changed"""
+        now = time.monotonic()
+        if not force and now - self._last_check < settings.INTENT_RELOAD_INTERVAL:
+            return False
+        self._last_check = now
+
+        try:
+            mtime = self.keywords_file.stat().st_mtime
+        except FileNotFoundError:
+            mtime = None
+
+        if not force and mtime == self._file_mtime:
+            return False
+
+        with self._lock:
+            automaton = self._compile(self._load_table())
+            # Swap the reference - scans already running keep the old automaton
+            self._automaton = automaton
+        logger.info("Intent keywords reloaded: %s keywords", automaton.keyword_count)
+        return True
+
+    def match(self, text: Optional[str]) -> IntentMatch:
+        """Scan a message and return every intent it triggers"""
+        if not text:
+            return IntentMatch()
+        self.maybe_reload()
+        return self._automaton.scan(text)
+
+    def detect(self, text: Optional[str], intent: str) -> bool:
+        """Shortcut for ``match(text).has(intent)``"""
+        return self.match(text).has(intent)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Keyword table summary for admin endpoints"""
+        automaton = self._automaton
+        return {
+            "keywords_file": str(self.keywords_file),
+            "file_loaded": self._file_mtime is not None,
+            "intents": {intent: len(words) for intent, words in self._table.items()},
+            "keyword_count": automaton.keyword_count,
+            "states": automaton.state_count
+        }
+
+# Global intent engine instance
+intent_engine = IntentEngine()
+
+__all__ = ['IntentEngine', 'IntentMatch', 'KeywordAutomaton', 'intent_engine', 'DEFAULT_INTENT_KEYWORDS']
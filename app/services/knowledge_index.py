@@ -0,0 +1,568 @@
+# Local HR Knowledge Retrieval Index
+"""
+BM25 retrieval over a folder of HR documents and FAQs.
+
+Source files live in ``settings.KNOWLEDGE_DIR``:
+- ``*.md`` / ``*.txt``: split into passages on blank lines
+- ``*.json``: FAQ entries ``[{"question": ..., "answer": ..., "keywords": [...]}]``
+
+The index is built incrementally: every source file is segmented once and its
+term frequencies are cached under ``segments/`` keyed by the file's SHA-1, so a
+rebuild only re-tokenizes files that changed. Postings are written to a flat
+uint32 file that is memory-mapped on load. Each build goes into a new version
+directory and ``CURRENT`` is swapped atomically, so every worker picks up the
+new index from its background reload check without a restart. Builds, pruning and loads
+take a file lock in the index directory, so gunicorn workers starting together
+don't build over each other: the first one builds, the rest find a version
+with the same source fingerprint and just load it.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Thai word segmentation (optional - falls back to character bigrams)
+try:
+    from pythainlp.tokenize import word_tokenize as thai_word_tokenize
+    PYTHAINLP_AVAILABLE = True
+except ImportError:
+    PYTHAINLP_AVAILABLE = False
+
+from app.core.config import settings
+from app.utils.file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+SUPPORTED_EXTENSIONS = {".md", ".txt", ".json"}
+IGNORED_FILES = {"readme.md"}
+MAX_PASSAGE_CHARS = 800
+
+THAI_RUN = re.compile(r"[฀-๿]+")
+TOKEN_RUN = re.compile(r"[฀-๿]+|[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+# Particles and fillers that carry no retrieval signal
+STOPWORDS = {
+    "ค่ะ", "คะ", "ครับ", "นะ", "จ้า", "จ๊ะ", "ไหม", "มั้ย", "หรือ", "และ", "ที่", "ของ",
+    "the", "a", "an", "is", "are", "to", "of", "and", "or", "in", "on", "for"
+}
+
+def tokenizer_name() -> str:
+    """Identifier stored with the index so a tokenizer change forces re-segmentation"""
+    return "pythainlp-newmm" if PYTHAINLP_AVAILABLE else "thai-bigram"
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split Thai/English text into index terms
+
+    Thai runs are segmented with pythainlp (newmm) when available, otherwise
+    they are indexed as overlapping character bigrams. Latin words and numbers
+    are lower-cased as-is.
+    """
+    tokens: List[str] = []
+    for run in TOKEN_RUN.findall(text.lower()):
+        if THAI_RUN.fullmatch(run):
+            if PYTHAINLP_AVAILABLE:
+                words = thai_word_tokenize(run, engine="newmm", keep_whitespace=False)
+            elif len(run) == 1:
+                words = [run]
+            else:
+                words = [run[i:i + 2] for i in range(len(run) - 1)]
+            tokens.extend(w for w in words if w.strip() and w not in STOPWORDS)
+        elif run not in STOPWORDS:
+            tokens.append(run)
+    return tokens
+
+# ========================================
+# Source parsing
+# ========================================
+
+def _split_passages(text: str) -> List[str]:
+    """Split a document on blank lines, merging short paragraphs"""
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+    passages: List[str] = []
+    buffer = ""
+    for paragraph in paragraphs:
+        if buffer and len(buffer) + len(paragraph) > MAX_PASSAGE_CHARS:
+            passages.append(buffer)
+            buffer = ""
+        buffer = f"{buffer}\n\n{paragraph}" if buffer else paragraph
+    if buffer:
+        passages.append(buffer)
+    return passages
+
+def _parse_source(path: Path, relative: str) -> List[Dict[str, Any]]:
+    """Turn one source file into tokenized passages"""
+    raw = path.read_text(encoding="utf-8")
+    passages: List[Dict[str, Any]] = []
+
+    if path.suffix.lower() == ".json":
+        entries = json.loads(raw)
+        if isinstance(entries, dict):
+            entries = entries.get("faqs", [])
+        for entry in entries:
+            question = (entry.get("question") or "").strip()
+            answer = (entry.get("answer") or "").strip()
+            if not question or not answer:
+                continue
+            keywords = " ".join(entry.get("keywords", []))
+            question_terms = tokenize(f"{question} {keywords}")
+            passages.append({
+                "source": relative,
+                "title": question,
+                "kind": "faq",
+                "text": f"ถาม: {question}\nตอบ: {answer}",
+                "answer": answer,
+                "question_terms": sorted(set(question_terms)),
+                "tf": dict(Counter(question_terms + tokenize(answer)))
+            })
+    else:
+        title = path.stem
+        for chunk in _split_passages(raw):
+            heading = chunk.splitlines()[0].lstrip("# ").strip()
+            if chunk.startswith("#"):
+                title = heading
+            passages.append({
+                "source": relative,
+                "title": title,
+                "kind": "document",
+                "text": chunk,
+                "tf": dict(Counter(tokenize(chunk)))
+            })
+
+    return passages
+
+# ========================================
+# Index
+# ========================================
+
+class _LoadedIndex:
+    """Read-only view over one built version of the index"""
+
+    def __init__(self, version_dir: Path):
+        self.version_dir = version_dir
+        self.meta = json.loads((version_dir / "meta.json").read_text(encoding="utf-8"))
+        self.vocab: Dict[str, List[float]] = json.loads((version_dir / "vocab.json").read_text(encoding="utf-8"))
+        self.passages: List[Dict[str, Any]] = json.loads((version_dir / "passages.json").read_text(encoding="utf-8"))
+        self.lengths = [p["length"] for p in self.passages]
+        self.avg_length = self.meta.get("avg_length") or 1.0
+
+        self._file = open(version_dir / "postings.bin", "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        if size:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.postings = memoryview(self._mmap).cast("I")
+        else:
+            self._mmap = None
+            self.postings = memoryview(array("I"))
+        # Lookups in flight; a replaced index is closed when the last one ends
+        self.users = 0
+        self.retired = False
+
+    def close(self):
+        self.postings.release()
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+    def idf(self, term: str) -> float:
+        entry = self.vocab.get(term)
+        return entry[2] if entry else 0.0
+
+    def score(self, query_terms: Counter) -> Dict[int, float]:
+        """BM25 score for every passage containing at least one query term"""
+        scores: Dict[int, float] = defaultdict(float)
+        for term in query_terms:
+            entry = self.vocab.get(term)
+            if not entry:
+                continue
+            offset, count, idf = int(entry[0]), int(entry[1]), entry[2]
+            for i in range(offset, offset + count * 2, 2):
+                passage_id = self.postings[i]
+                tf = self.postings[i + 1]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[passage_id] / self.avg_length)
+                scores[passage_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+class KnowledgeIndex:
+    """BM25 index over local HR documents and FAQs"""
+
+    def __init__(self, source_dir: Optional[str] = None, index_dir: Optional[str] = None):
+        self.source_dir = Path(source_dir or settings.KNOWLEDGE_DIR)
+        self.index_dir = Path(index_dir or settings.KNOWLEDGE_INDEX_DIR)
+        self._index: Optional[_LoadedIndex] = None
+        self._current_version: Optional[str] = None
+        self._last_check = 0.0
+        self._build_lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._reload_task: Optional[asyncio.Task] = None
+
+    # ---------- building ----------
+
+    def build(self) -> Dict[str, Any]:
+        """
+        Rebuild the index from the source folder (blocking - run in an executor)
+
+        Only files whose content changed since the last build are re-segmented.
+        """
+        with self._build_lock, self._locked():
+            started = time.perf_counter()
+            segments_dir = self.index_dir / "segments"
+            segments_dir.mkdir(parents=True, exist_ok=True)
+
+            passages: List[Dict[str, Any]] = []
+            used_segments = set()
+            reused = segmented = 0
+
+            files = sorted(
+                p for p in self.source_dir.rglob("*")
+                if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
+                and p.name.lower() not in IGNORED_FILES
+            ) if self.source_dir.exists() else []
+
+            for path in files:
+                relative = path.relative_to(self.source_dir).as_posix()
+                file_hash = hashlib.sha1(path.read_bytes() + relative.encode("utf-8")).hexdigest()
+                segment_path = segments_dir / f"{file_hash}.json"
+                used_segments.add(segment_path.name)
+
+                cached = None
+                if segment_path.exists():
+                    try:
+                        cached = json.loads(segment_path.read_text(encoding="utf-8"))
+                        if cached.get("tokenizer") != tokenizer_name():
+                            cached = None
+                    except Exception:
+                        cached = None
+
+                if cached is None:
+                    try:
+                        file_passages = _parse_source(path, relative)
+                    except Exception as e:
+                        logger.warning("Knowledge index: skipping %s: %s", relative, e)
+                        continue
+                    cached = {"tokenizer": tokenizer_name(), "passages": file_passages}
+                    _write_atomic(segment_path, json.dumps(cached, ensure_ascii=False))
+                    segmented += 1
+                else:
+                    reused += 1
+
+                passages.extend(cached["passages"])
+
+            # Another worker may already have built these exact sources
+            fingerprint = hashlib.sha1(
+                "\n".join([tokenizer_name()] + sorted(used_segments)).encode("utf-8")
+            ).hexdigest()
+            version = self._built_version(fingerprint) or self._write_version(passages, fingerprint)
+
+            # Drop segment caches for files that no longer exist
+            for stale in segments_dir.glob("*.json"):
+                if stale.name not in used_segments:
+                    stale.unlink(missing_ok=True)
+
+            self._load_version(version)
+            return {
+                "version": version,
+                "files": len(files),
+                "files_segmented": segmented,
+                "files_reused": reused,
+                "passages": len(passages),
+                "terms": len(self._index.vocab) if self._index else 0,
+                "tokenizer": tokenizer_name(),
+                "build_ms": round((time.perf_counter() - started) * 1000, 2)
+            }
+
+    def _locked(self, shared: bool = False):
+        """Cross-process lock over the index directory"""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        return file_lock(self.index_dir / ".lock", shared=shared)
+
+    def _read_current(self) -> Optional[str]:
+        try:
+            return (self.index_dir / "CURRENT").read_text(encoding="utf-8").strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _built_version(self, fingerprint: str) -> Optional[str]:
+        """The CURRENT version if it was built from the same sources"""
+        version = self._read_current()
+        if not version:
+            return None
+        try:
+            meta = json.loads((self.index_dir / version / "meta.json").read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return version if meta.get("fingerprint") == fingerprint else None
+
+    def _write_version(self, passages: List[Dict[str, Any]], fingerprint: str) -> str:
+        """Write postings/vocab/passages into a new version dir and swap CURRENT"""
+        postings_by_term: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        stored_passages = []
+        for passage_id, passage in enumerate(passages):
+            tf = passage["tf"]
+            for term, count in tf.items():
+                postings_by_term[term].append((passage_id, count))
+            stored = {k: v for k, v in passage.items() if k != "tf"}
+            stored["length"] = sum(tf.values())
+            stored_passages.append(stored)
+
+        total = len(stored_passages)
+        avg_length = (sum(p["length"] for p in stored_passages) / total) if total else 1.0
+
+        flat = array("I")
+        vocab = {}
+        for term in sorted(postings_by_term):
+            entries = postings_by_term[term]
+            df = len(entries)
+            idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+            vocab[term] = [len(flat), df, round(idf, 6)]
+            for passage_id, count in entries:
+                flat.append(passage_id)
+                flat.append(min(count, 0xFFFFFFFF))
+
+        version = f"v{int(time.time() * 1000)}"
+        version_dir = self.index_dir / version
+        version_dir.mkdir(parents=True, exist_ok=True)
+        with open(version_dir / "postings.bin", "wb") as f:
+            flat.tofile(f)
+        (version_dir / "vocab.json").write_text(json.dumps(vocab, ensure_ascii=False), encoding="utf-8")
+        (version_dir / "passages.json").write_text(json.dumps(stored_passages, ensure_ascii=False), encoding="utf-8")
+        (version_dir / "meta.json").write_text(json.dumps({
+            "version": version,
+            "tokenizer": tokenizer_name(),
+            "passages": total,
+            "avg_length": avg_length,
+            "fingerprint": fingerprint,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")
+        }), encoding="utf-8")
+
+        # Keep the version being replaced: other workers load it until their next check
+        previous = self._read_current()
+        _write_atomic(self.index_dir / "CURRENT", version)
+        self._remove_old_versions(keep={version, previous, self._current_version})
+        return version
+
+    def _remove_old_versions(self, keep):
+        for path in self.index_dir.glob("v*"):
+            if path.is_dir() and path.name not in keep:
+                # Another worker may still have it mapped (fails on Windows) - retry next build
+                shutil.rmtree(path, ignore_errors=True)
+
+    # ---------- loading ----------
+
+    def _load_version(self, version: str):
+        loaded = _LoadedIndex(self.index_dir / version)
+        with self._index_lock:
+            previous, self._index = self._index, loaded
+            self._current_version = version
+            # A lookup still running on the old index closes it when it ends
+            if previous is not None:
+                previous.retired = True
+                if previous.users == 0:
+                    previous.close()
+
+    @contextmanager
+    def _using_index(self):
+        """The loaded index, kept open until the block ends (None if not built)"""
+        with self._index_lock:
+            index = self._index
+            if index is not None:
+                index.users += 1
+        try:
+            yield index
+        finally:
+            if index is not None:
+                with self._index_lock:
+                    index.users -= 1
+                    if index.retired and index.users == 0:
+                        index.close()
+
+    def maybe_reload(self, force: bool = False) -> bool:
+        """Load a newer build if ``CURRENT`` changed (checked at most every few seconds)"""
+        now = time.monotonic()
+        if not force and now - self._last_check < settings.KNOWLEDGE_RELOAD_INTERVAL:
+            return False
+        self._last_check = now
+
+        version = self._read_current()
+        if version and version != self._current_version:
+            try:
+                # Shared lock: a build in another worker can't prune the version mid-load
+                with self._locked(shared=True):
+                    version = self._read_current()
+                    self._load_version(version)
+                logger.info("Knowledge index loaded: %s (%s passages)", version, len(self._index.passages))
+                return True
+            except Exception as e:
+                logger.error("Failed to load knowledge index %s: %s", version, e)
+        return False
+
+    async def _reload_loop(self, interval: float):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await loop.run_in_executor(None, self.maybe_reload, True)
+            except Exception as e:
+                logger.warning("Knowledge index reload check failed: %s", e)
+
+    def start(self, interval: Optional[float] = None):
+        """Check for builds from other workers periodically, off the lookup path"""
+        if self._reload_task is None or self._reload_task.done():
+            interval = interval or settings.KNOWLEDGE_RELOAD_INTERVAL
+            self._reload_task = asyncio.get_running_loop().create_task(self._reload_loop(interval))
+
+    async def stop(self):
+        if self._reload_task is not None:
+            self._reload_task.cancel()
+            try:
+                await self._reload_task
+            except asyncio.CancelledError:
+                pass
+            self._reload_task = None
+
+    # ---------- querying ----------
+
+    def search(self, query: str, top_k: Optional[int] = None, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Return the top passages for a query
+
+        Args:
+            query: User question
+            top_k: Number of passages (defaults to settings.KNOWLEDGE_TOP_K)
+            kind: Restrict to 'faq' or 'document'
+
+        Returns:
+            List of passages with ``score``, ``text``, ``source``, ``title`` and ``kind``
+        """
+        with self._using_index() as index:
+            return self._search(index, query, top_k, kind)
+
+    def _search(self, index: Optional[_LoadedIndex], query: str, top_k: Optional[int],
+                kind: Optional[str]) -> List[Dict[str, Any]]:
+        if index is None or not query:
+            return []
+
+        query_terms = Counter(tokenize(query))
+        scores = index.score(query_terms)
+        if kind:
+            scores = {pid: s for pid, s in scores.items() if index.passages[pid]["kind"] == kind}
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k or settings.KNOWLEDGE_TOP_K]
+        results = []
+        for passage_id, score in ranked:
+            passage = index.passages[passage_id]
+            results.append({
+                "id": passage_id,
+                "score": round(score, 4),
+                "kind": passage["kind"],
+                "title": passage["title"],
+                "source": passage["source"],
+                "text": passage["text"]
+            })
+        return results
+
+    def answer_faq(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        Answer directly from the FAQ when the best match is unambiguous
+
+        Confidence is the harmonic mean of how much of the FAQ question's IDF
+        weight the query covers and how much of the query's (known-term) IDF
+        weight the FAQ question covers.
+        """
+        with self._using_index() as index:
+            return self._answer_faq(index, query)
+
+    def _answer_faq(self, index: Optional[_LoadedIndex], query: str) -> Optional[Dict[str, Any]]:
+        if index is None or not query:
+            return None
+
+        candidates = self._search(index, query, 3, "faq")
+        if not candidates:
+            return None
+
+        query_terms = {t for t in tokenize(query) if t in index.vocab}
+        query_weight = sum(index.idf(t) for t in query_terms)
+        if query_weight <= 0:
+            return None
+
+        best = None
+        for candidate in candidates:
+            passage = index.passages[candidate["id"]]
+            question_terms = set(passage.get("question_terms", []))
+            question_weight = sum(index.idf(t) for t in question_terms)
+            if question_weight <= 0:
+                continue
+            shared = sum(index.idf(t) for t in question_terms & query_terms)
+            recall = shared / question_weight
+            precision = shared / query_weight
+            confidence = 2 * recall * precision / (recall + precision) if shared else 0.0
+            if best is None or confidence > best[0]:
+                best = (confidence, candidate, passage)
+
+        if best is None or best[0] < settings.KNOWLEDGE_FAQ_THRESHOLD:
+            return None
+
+        confidence, candidate, passage = best
+        return {
+            "answer": passage["answer"],
+            "question": passage["title"],
+            "source": passage["source"],
+            "confidence": round(confidence, 4),
+            "score": candidate["score"]
+        }
+
+    def build_prompt_context(self, query: str) -> str:
+        """Format the top passages as a reference block for the Gemini prompt"""
+        passages = [
+            p for p in self.search(query)
+            if p["score"] >= settings.KNOWLEDGE_MIN_SCORE
+        ]
+        if not passages:
+            return ""
+
+        lines = ["ข้อมูลอ้างอิงจากฐานความรู้ของกองบริหารทรัพยากรบุคคล (ใช้ตอบเมื่อเกี่ยวข้อง):"]
+        for passage in passages:
+            lines.append(f"[{passage['source']}] {passage['text']}")
+        return "\n\n".join(lines)
+
+    def get_status(self) -> Dict[str, Any]:
+        """Information about the loaded index"""
+        with self._index_lock:
+            index = self._index
+        return {
+            "loaded": index is not None,
+            "version": self._current_version,
+            "passages": len(index.passages) if index else 0,
+            "terms": len(index.vocab) if index else 0,
+            "tokenizer": tokenizer_name(),
+            "source_dir": str(self.source_dir),
+            "built_at": index.meta.get("built_at") if index else None
+        }
+
+def _write_atomic(path: Path, content: str):
+    """Write a file via rename so readers never see a partial write"""
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(content, encoding="utf-8")
+    os.replace(tmp_path, path)
+
+# Global knowledge index instance
+knowledge_index = KnowledgeIndex()
+
+__all__ = ['KnowledgeIndex', 'knowledge_index', 'tokenize']
@@ -1,5 +1,6 @@
 # Enhanced LINE Handler with Comprehensive Tracking
 import json
+import logging
 import uuid
 import httpx
 from datetime import datetime
@@ -21,7 +22,9 @@ from app.db.crud_enhanced import (
     update_notification_status # <-- เพิ่ม import นี้เข้ามา
 )
 from app.services.ws_manager import manager
+from app.services.intent_engine import intent_engine
 from app.utils.timezone import get_thai_time
+from app.utils.timing import stage
 
 # --- Gemini AI Integration ---
 from app.services.gemini_service import get_ai_response, check_gemini_availability, image_understanding, document_understanding
@@ -29,6 +32,8 @@ from app.services.gemini_service import get_ai_response, check_gemini_availabili
 # Import AsyncMessagingApiBlob for handling multimedia content
 from linebot.v3.messaging import AsyncMessagingApiBlob
 
+logger = logging.getLogger(__name__)
+
 # ========================================
 # Enhanced User Profile Functions
 # ========================================
@@ -62,7 +67,7 @@ async def get_user_profile_enhanced(line_bot_api: AsyncMessagingApi, user_id: st
         try:
             return await get_user_profile_direct_enhanced(user_id, profile_data)
         except Exception as e:
-            print(f"Direct API failed: {e}")
+            logger.warning("Direct profile API failed: %s", e)
             return profile_data # คืนค่า fallback สุดท้าย
     return profile_data # คืนค่า fallback หาก SDK ไม่ผ่านและไม่มีการเรียก direct
 
@@ -74,11 +79,12 @@ async def get_user_profile_direct_enhanced(user_id: str, fallback_data: Dict) ->
     }
     
     async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f'https://api.line.me/v2/bot/profile/{user_id}',
-            headers=headers,
-            timeout=10.0
-        )
+        with stage("line_profile"):
+            response = await client.get(
+                f'{settings.LINE_API_BASE_URL}/v2/bot/profile/{user_id}',
+                headers=headers,
+                timeout=10.0
+            )
         
         if response.status_code == 200:
             data = response.json()
@@ -136,7 +142,7 @@ async def send_to_telegram_actual(
     data: Optional[Dict]
 ) -> bool:
     """ส่งข้อความไป Telegram จริงๆ"""
-    api_url = f"https://api.telegram.org/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
+    api_url = f"{settings.TELEGRAM_API_BASE_URL}/bot{settings.TELEGRAM_BOT_TOKEN}/sendMessage"
     
     formatted_message = f"*{title}*\n\n{message}"
     if data and 'timestamp' in data:
@@ -146,7 +152,8 @@ async def send_to_telegram_actual(
     
     try:
         async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(api_url, params=params)
+            with stage("telegram_send"):
+                response = await client.get(api_url, params=params)
             response.raise_for_status()
             
             await update_notification_status(
@@ -198,48 +205,37 @@ async def show_loading_animation(line_bot_api: AsyncMessagingApi, user_id: str,
         
         # Validate user ID format (LINE user IDs start with 'U' and are 33 chars long)
         if not user_id.startswith('U') or len(user_id) != 33:
-            print(f"Invalid user ID format: {user_id} (must be U + 32 hex chars)")
+            logger.warning("Invalid user ID format for loading animation: %s", user_id)
             return False
             
-        print(f"Sending loading animation API call for user {user_id[-6:]}")
-        print(f"URL: https://api.line.me/v2/bot/chat/loading/start")
-        print(f"Payload: {payload}")
+        logger.debug("Sending loading animation for user %s: %s", user_id[-6:], payload)
         
         async with httpx.AsyncClient(timeout=15.0) as client:
-            response = await client.post(
-                'https://api.line.me/v2/bot/chat/loading/start',
-                headers=headers,
-                json=payload
-            )
-            
-            print(f"Loading API response status: {response.status_code}")
+            with stage("line_loading"):
+                response = await client.post(
+                    f'{settings.LINE_API_BASE_URL}/v2/bot/chat/loading/start',
+                    headers=headers,
+                    json=payload
+                )
             
-            if response.status_code == 200:
-                print(f"SUCCESS: Loading animation started for user {user_id[-6:]} ({loading_seconds}s)")
-                return True
-            elif response.status_code == 202:
-                print(f"SUCCESS: Loading animation accepted for user {user_id[-6:]} ({loading_seconds}s)")
+            if response.status_code in (200, 202):
+                logger.debug("Loading animation started for user %s (%ss)", user_id[-6:], loading_seconds)
                 return True
             elif response.status_code == 400:
-                print(f"BAD REQUEST: Invalid parameters or user not in active chat")
-                print(f"Response: {response.text}")
+                logger.warning("Loading animation rejected - invalid parameters or user not in active chat: %s", response.text)
                 return False
             elif response.status_code == 401:
-                print(f"UNAUTHORIZED: Invalid access token")
-                print(f"Response: {response.text}")
+                logger.error("Loading animation unauthorized - invalid access token: %s", response.text)
                 return False
             elif response.status_code == 403:
-                print(f"FORBIDDEN: User not in one-on-one chat or not viewing chat")
-                print(f"Response: {response.text}")
+                logger.warning("Loading animation forbidden - user not in one-on-one chat: %s", response.text)
                 return False
             else:
-                print(f"FAILED: Loading animation API returned {response.status_code}")
-                print(f"Response: {response.text}")
+                logger.warning("Loading animation API returned %s: %s", response.status_code, response.text)
                 return False
                 
     except Exception as e:
-        print(f"ERROR: Could not show loading animation: {e}")
-        print(f"User ID: {user_id}, Seconds: {seconds}")
+        logger.warning("Could not show loading animation for user %s (%ss): %s", user_id, seconds, e)
         return False
 
 async def handle_image_message_enhanced(line_bot_api: AsyncMessagingApi, line_bot_blob_api: AsyncMessagingApiBlob, event: MessageEvent, db: AsyncSession):
@@ -274,7 +270,7 @@ async def handle_image_message_enhanced(line_bot_api: AsyncMessagingApi, line_bo
             prompt="วิเคราะห์รูปภาพนี้เป็นภาษาไทย บอกรายละเอียดที่เห็นในภาพ และถ้าเป็นเอกสารหรือข้อความ ให้อ่านออกมาด้วยนะคะ"
         )
         
-        print(f"Gemini image analysis: {gemini_response}")
+        logger.debug("Gemini image analysis: %s", gemini_response)
         
         # Save AI response to history
         await save_chat_to_history(
@@ -314,7 +310,7 @@ async def handle_image_message_enhanced(line_bot_api: AsyncMessagingApi, line_bo
         )
         
     except Exception as e:
-        print(f"Error handling image message: {e}")
+        logger.error("Error handling image message: %s", e)
         
         # Save error to history
         await save_chat_to_history(
@@ -378,7 +374,7 @@ async def handle_file_message_enhanced(line_bot_api: AsyncMessagingApi, line_bot
             prompt="สรุปเนื้อหาของเอกสาร PDF นี้เป็นภาษาไทย โดยเน้นประเด็นสำคัญและข้อมูลที่เป็นประโยชน์"
         )
         
-        print(f"Gemini document analysis: {gemini_response}")
+        logger.debug("Gemini document analysis: %s", gemini_response)
         
         # Save AI response to history
         await save_chat_to_history(
@@ -418,7 +414,7 @@ async def handle_file_message_enhanced(line_bot_api: AsyncMessagingApi, line_bot
         )
         
     except Exception as e:
-        print(f"Error handling file message: {e}")
+        logger.error("Error handling file message: %s", e)
         
         # Save error to history
         await save_chat_to_history(
@@ -457,15 +453,15 @@ async def handle_message_enhanced(event: MessageEvent, db: AsyncSession, line_bo
             message_id=message_id, reply_token=reply_token, session_id=session_id,
             extra_data={"profile_data": profile_data, "timestamp": thai_time.isoformat()}
         )
-        print(f"✅ User message saved to chat_history: {user_id}")
+        logger.debug("User message saved to chat_history: %s", user_id)
     except Exception as e:
-        print(f"❌ Failed to save user message to chat_history: {e}")
+        logger.warning("Failed to save user message to chat_history: %s", e)
         # Fallback: try saving to old table
         try:
             await save_chat_message(db, user_id, 'user', message_text)
-            print(f"✅ User message saved to chat_messages (fallback): {user_id}")
+            logger.debug("User message saved to chat_messages (fallback): %s", user_id)
         except Exception as e2:
-            print(f"❌ Failed to save user message to any table: {e2}")
+            logger.error("Failed to save user message to any table: %s", e2)
     
     user_status = await get_or_create_user_status(
         db, user_id, profile_data['display_name'], profile_data['picture_url']
@@ -539,6 +535,16 @@ async def handle_live_chat_message(
                         "usage": result.get("usage"),
                         "original_message": message_text
                     }
+                elif result.get("rate_limited"):
+                    # Over the AI rate limit - short "please wait" reply
+                    bot_response = result["response"]
+                    message_type = 'bot'
+                    extra_data = {
+                        "auto_reply": True,
+                        "rate_limited": True,
+                        "retry_after": result.get("retry_after"),
+                        "original_message": message_text
+                    }
                 else:
                     # Fallback response for AI failure
                     bot_response = f"ขออภัย เกิดข้อผิดพลาดในระบบ AI กรุณาลองใหม่อีกครั้ง หรือรอให้เจ้าหน้าที่ตอบกลับค่ะ"
@@ -579,29 +585,29 @@ async def handle_live_chat_message(
                 db=db, user_id=user_id, message_type=message_type, message_content=bot_response,
                 session_id=session_id, extra_data=extra_data
             )
-            print(f"✅ Bot response saved to chat_history: {user_id}")
+            logger.debug("Bot response saved to chat_history: %s", user_id)
         except Exception as e:
-            print(f"❌ Failed to save bot response to chat_history: {e}")
+            logger.warning("Failed to save bot response to chat_history: %s", e)
             # Fallback: try saving to old table
             try:
                 await save_chat_message(db, user_id, message_type, bot_response)
-                print(f"✅ Bot response saved to chat_messages (fallback): {user_id}")
+                logger.debug("Bot response saved to chat_messages (fallback): %s", user_id)
             except Exception as e2:
-                print(f"❌ Failed to save bot response to any table: {e2}")
+                logger.error("Failed to save bot response to any table: %s", e2)
         
         try:
             # Ensure bot_response is clean and not empty
             if bot_response and bot_response.strip():
                 reply_request = ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=bot_response)])
                 await line_bot_api.reply_message(reply_request)
-                print(f"Reply sent successfully to user {user_id}")
+                logger.debug("Reply sent successfully to user %s", user_id)
             else:
-                print(f"Empty bot response for user {user_id}")
+                logger.warning("Empty bot response for user %s", user_id)
                 bot_response = "ขออภัย เกิดข้อผิดพลาดในการสร้างคำตอบ"
                 reply_request = ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=bot_response)])
                 await line_bot_api.reply_message(reply_request)
         except Exception as e:
-            print(f"Failed to send reply to user {user_id}: {e}")
+            logger.error("Failed to send reply to user %s: %s", user_id, e)
             await log_system_event(
                 db=db, level="error", category="line_webhook", subcategory="reply_failed",
                 message=f"Failed to send auto reply: {str(e)}", user_id=user_id
@@ -633,9 +639,7 @@ async def handle_bot_mode_message(
     thai_time = get_thai_time()
     
     # Check for live chat request keywords
-    live_chat_keywords = ["คุยกับแอดมิน", "ติดต่อเจ้าหน้าที่", "admin", "help", "คุยกับคน"]
-    
-    if any(keyword in message_text.lower() for keyword in live_chat_keywords):
+    if intent_engine.detect(message_text, "handoff"):
         await show_loading_animation(line_bot_api, user_id)
         await set_live_chat_status(db, user_id, True, profile_data['display_name'], profile_data['picture_url'])
         response_text = "รับทราบค่ะ! กำลังโอนสายไปยังเจ้าหน้าที่ให้นะคะ รอแป๊บนึงเดี๋ยวจะมีเจ้าหน้าที่มาคุยกับคุณค่ะ 💕"
@@ -645,14 +649,14 @@ async def handle_bot_mode_message(
                 db=db, user_id=user_id, message_type='bot', message_content=response_text,
                 session_id=session_id, extra_data={"handoff_request": True, "trigger_message": message_text}
             )
-            print(f"✅ Handoff message saved to chat_history: {user_id}")
+            logger.debug("Handoff message saved to chat_history: %s", user_id)
         except Exception as e:
-            print(f"❌ Failed to save handoff message to chat_history: {e}")
+            logger.warning("Failed to save handoff message to chat_history: %s", e)
             try:
                 await save_chat_message(db, user_id, 'bot', response_text)
-                print(f"✅ Handoff message saved to chat_messages (fallback): {user_id}")
+                logger.debug("Handoff message saved to chat_messages (fallback): %s", user_id)
             except Exception as e2:
-                print(f"❌ Failed to save handoff message to any table: {e2}")
+                logger.error("Failed to save handoff message to any table: %s", e2)
         
         try:
             reply_request = ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=response_text)])
@@ -708,6 +712,11 @@ async def handle_bot_mode_message(
                         "model": result.get("model"),
                         "usage": result.get("usage")
                     }
+                elif result.get("rate_limited"):
+                    # Over the AI rate limit - short "please wait" reply, not an error
+                    response_text = result["response"]
+                    message_type = 'bot'
+                    extra_data = {"standard_reply": True, "rate_limited": True, "retry_after": result.get("retry_after")}
                 else:
                     # Log AI failure and use fallback
                     await log_system_event(
@@ -738,28 +747,28 @@ async def handle_bot_mode_message(
                 db=db, user_id=user_id, message_type=message_type, message_content=response_text,
                 session_id=session_id, extra_data=extra_data
             )
-            print(f"✅ Standard response saved to chat_history: {user_id}")
+            logger.debug("Standard response saved to chat_history: %s", user_id)
         except Exception as e:
-            print(f"❌ Failed to save standard response to chat_history: {e}")
+            logger.warning("Failed to save standard response to chat_history: %s", e)
             try:
                 await save_chat_message(db, user_id, message_type, response_text)
-                print(f"✅ Standard response saved to chat_messages (fallback): {user_id}")
+                logger.debug("Standard response saved to chat_messages (fallback): %s", user_id)
             except Exception as e2:
-                print(f"❌ Failed to save standard response to any table: {e2}")
+                logger.error("Failed to save standard response to any table: %s", e2)
         
         try:
             # Ensure response_text is clean and not empty
             if response_text and response_text.strip():
                 reply_request = ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=response_text)])
                 await line_bot_api.reply_message(reply_request)
-                print(f"Bot reply sent successfully to user {user_id}")
+                logger.debug("Bot reply sent successfully to user %s", user_id)
             else:
-                print(f"Empty response_text for user {user_id}")
+                logger.warning("Empty response_text for user %s", user_id)
                 response_text = "ขออภัย เกิดข้อผิดพลาดในการสร้างคำตอบ"
                 reply_request = ReplyMessageRequest(reply_token=reply_token, messages=[TextMessage(text=response_text)])
                 await line_bot_api.reply_message(reply_request)
         except Exception as e:
-            print(f"Failed to send bot reply to user {user_id}: {e}")
+            logger.error("Failed to send bot reply to user %s: %s", user_id, e)
             await log_system_event(
                 db=db, level="error", category="line_webhook", subcategory="bot_reply_failed",
                 message=f"Failed to send bot reply: {str(e)}", user_id=user_id
@@ -44,6 +44,7 @@ from app.services.gemini_service import (
 from app.services.line_handler_enhanced import (
     get_user_profile_enhanced, send_telegram_notification_enhanced
 )
+from app.services.intent_engine import intent_engine
 
 class MessageHandler:
     """Advanced message handler with Gemini AI integration"""
@@ -189,7 +190,8 @@ class MessageHandler:
                         user_message=enhanced_prompt,
                         user_id=user_id,
                         user_profile=profile_data,
-                        db=db
+                        db=db,
+                        retrieval_query=message_text
                     )
                     
                     # Reply with AI response
@@ -741,10 +743,8 @@ class MessageHandler:
     
     async def _get_blob_api(self) -> AsyncMessagingApiBlob:
         """Get blob API client for downloading content"""
-        from linebot.v3.messaging import AsyncApiClient, Configuration
-        configuration = Configuration(access_token=settings.LINE_CHANNEL_ACCESS_TOKEN)
-        async_api_client = AsyncApiClient(configuration)
-        return AsyncMessagingApiBlob(async_api_client)
+        from app.utils.line_api import create_line_api_client
+        return AsyncMessagingApiBlob(create_line_api_client())
     
     def _enhance_text_prompt(self, message: str, profile_data: Dict) -> str:
         """Enhance text prompt with user context"""
@@ -756,7 +756,7 @@ class MessageHandler:
                                      db: AsyncSession, line_bot_api: AsyncMessagingApi, 
                                      profile_data: Dict) -> bool:
         """Handle special commands like admin request"""
-        if any(keyword in message.lower() for keyword in ['ติดต่อเจ้าหน้าที่', 'คุยกับแอดมิน', 'admin', 'help']):
+        if intent_engine.detect(message, "handoff"):
             user_id = event.source.user_id
             reply_token = event.reply_token
             
@@ -0,0 +1,250 @@
+# AI Admission Control
+"""
+Per-user and global token buckets in front of Gemini generation.
+
+Every user has a small bucket (burst + refill rate) so one person sending a
+stream of messages cannot use up the shared Gemini quota. Behind that, a global
+bucket caps the total request rate. When the global bucket is empty, requests
+wait in per-user queues that are served round-robin, so a busy user gets at
+most one turn before every other waiting user has had one. Requests that cannot
+be admitted within ``AI_QUEUE_MAX_WAIT`` seconds are rejected right away so the
+handler can send a short "please wait" reply instead of holding the webhook.
+
+Limiters live in each gunicorn worker. ``AI_GLOBAL_RATE_PER_MINUTE`` and
+``AI_GLOBAL_BURST`` are totals for the deployment and are divided by
+``WEB_CONCURRENCY``; per-user limits apply per worker.
+"""
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Optional
+
+from app.core.config import settings
+from app.utils.metrics import register_rate_limiter
+
+# Idle per-user buckets beyond this are forgotten, least recently used first
+MAX_TRACKED_USERS = 10000
+
+class TokenBucket:
+    """Classic token bucket: ``capacity`` tokens, refilled at ``rate`` tokens/second"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = max(rate, 1e-9)
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now: Optional[float] = None) -> bool:
+        self._refill(now or time.monotonic())
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1.0)
+
+    def seconds_until_token(self, now: Optional[float] = None) -> float:
+        self._refill(now or time.monotonic())
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.rate
+
+    def is_full(self, now: Optional[float] = None) -> bool:
+        self._refill(now or time.monotonic())
+        return self.tokens >= self.capacity
+
+@dataclass
+class Admission:
+    """Outcome of an admission request"""
+    allowed: bool
+    reason: Optional[str] = None  # 'user_rate', 'user_queue', 'global_rate'
+    retry_after: float = 0.0
+    waited_ms: int = 0
+
+class AIRateLimiter:
+    """Fair admission control for AI generation requests"""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        user_rate_per_minute: Optional[float] = None,
+        user_burst: Optional[int] = None,
+        global_rate_per_minute: Optional[float] = None,
+        global_burst: Optional[int] = None,
+        max_wait: Optional[float] = None,
+        user_max_queued: Optional[int] = None,
+        workers: Optional[int] = None
+    ):
+        self.enabled = settings.AI_RATE_LIMIT_ENABLED if enabled is None else enabled
+        self.user_rate = (user_rate_per_minute or settings.AI_USER_RATE_PER_MINUTE) / 60.0
+        self.user_burst = user_burst or settings.AI_USER_BURST
+        # This worker's share of the deployment-wide limit
+        self.workers = max(1, workers or settings.WEB_CONCURRENCY)
+        self.global_bucket = TokenBucket(
+            (global_rate_per_minute or settings.AI_GLOBAL_RATE_PER_MINUTE) / 60.0 / self.workers,
+            math.ceil((global_burst or settings.AI_GLOBAL_BURST) / self.workers)
+        )
+        self.max_wait = settings.AI_QUEUE_MAX_WAIT if max_wait is None else max_wait
+        self.user_max_queued = user_max_queued or settings.AI_USER_MAX_QUEUED
+
+        # Least recently used first
+        self._user_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        # user_id -> waiting futures; dict order is the round-robin order
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._dispatcher: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected: Dict[str, int] = {"user_rate": 0, "user_queue": 0, "global_rate": 0}
+        self.total_wait_ms = 0
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        bucket = self._user_buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._user_buckets[user_id] = bucket
+            self._evict_idle_buckets()
+        else:
+            self._user_buckets.move_to_end(user_id)
+        return bucket
+
+    def _evict_idle_buckets(self):
+        """Forget the least recently used users once their bucket has refilled - they behave like new users"""
+        now = time.monotonic()
+        while len(self._user_buckets) > MAX_TRACKED_USERS:
+            user_id, bucket = next(iter(self._user_buckets.items()))
+            if not bucket.is_full(now) or user_id in self._waiting:
+                # Still limiting someone; try again on the next new user
+                break
+            del self._user_buckets[user_id]
+
+    def _reject(self, reason: str, retry_after: float) -> Admission:
+        self.rejected[reason] += 1
+        return Admission(allowed=False, reason=reason, retry_after=round(retry_after, 2))
+
+    async def acquire(self, user_id: str) -> Admission:
+        """
+        Ask to run one AI generation for ``user_id``
+
+        Returns immediately when the user is over their own limit; otherwise
+        waits (fairly, up to ``max_wait`` seconds) for global capacity.
+        """
+        if not self.enabled:
+            return Admission(allowed=True)
+
+        user_bucket = self._user_bucket(user_id)
+        if not user_bucket.try_acquire():
+            return self._reject("user_rate", user_bucket.seconds_until_token())
+
+        # Fast path: nobody is waiting and global capacity is available
+        if not self._waiting and self.global_bucket.try_acquire():
+            self.admitted += 1
+            return Admission(allowed=True)
+
+        queue = self._waiting.get(user_id)
+        if queue is not None and len(queue) >= self.user_max_queued:
+            user_bucket.refund()
+            return self._reject("user_queue", self.global_bucket.seconds_until_token())
+
+        if self.max_wait <= 0:
+            user_bucket.refund()
+            return self._reject("global_rate", self.global_bucket.seconds_until_token())
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._waiting.setdefault(user_id, deque()).append(future)
+        self.queued += 1
+        self._ensure_dispatcher()
+
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self._discard(user_id, future)
+            user_bucket.refund()
+            return self._reject("global_rate", self.global_bucket.seconds_until_token())
+        except asyncio.CancelledError:
+            self._discard(user_id, future)
+            raise
+
+        waited_ms = int((time.monotonic() - started) * 1000)
+        self.total_wait_ms += waited_ms
+        self.admitted += 1
+        return Admission(allowed=True, waited_ms=waited_ms)
+
+    def _discard(self, user_id: str, future: asyncio.Future):
+        if future.done() and not future.cancelled():
+            # Admitted at the same moment the wait timed out - give the token back
+            self.global_bucket.refund()
+        future.cancel()
+        queue = self._waiting.get(user_id)
+        if queue is not None:
+            try:
+                queue.remove(future)
+            except ValueError:
+                pass
+            if not queue:
+                self._waiting.pop(user_id, None)
+
+    def _ensure_dispatcher(self):
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def _dispatch(self):
+        """Hand out global tokens to waiting users in round-robin order"""
+        while self._waiting:
+            delay = self.global_bucket.seconds_until_token()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            user_id, queue = next(iter(self._waiting.items()))
+            future = queue.popleft()
+            if queue:
+                # More requests from this user go to the back of the line
+                self._waiting.move_to_end(user_id)
+            else:
+                del self._waiting[user_id]
+
+            if not future.done():
+                self.global_bucket.try_acquire()
+                future.set_result(True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and configuration for monitoring endpoints"""
+        return {
+            "enabled": self.enabled,
+            "user_rate_per_minute": round(self.user_rate * 60, 2),
+            "user_burst": self.user_burst,
+            "global_rate_per_minute": round(self.global_bucket.rate * 60, 2),
+            "global_burst": self.global_bucket.capacity,
+            "workers": self.workers,
+            "max_wait_seconds": self.max_wait,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "waiting_users": len(self._waiting),
+            "waiting_requests": sum(len(q) for q in self._waiting.values()),
+            "tracked_users": len(self._user_buckets),
+            "avg_wait_ms": round(self.total_wait_ms / self.queued, 2) if self.queued else 0
+        }
+
+# Global limiter shared by every AI entry point
+ai_rate_limiter = AIRateLimiter()
+register_rate_limiter(ai_rate_limiter)
+
+__all__ = ['AIRateLimiter', 'Admission', 'TokenBucket', 'ai_rate_limiter']
@@ -0,0 +1,158 @@
+# Server-side system status monitor
+"""
+Computes system status once per interval and pushes changes to admins.
+
+``/admin/status`` used to check Gemini and the database on every call, and
+every open admin tab polled it (and the dashboard polled the health report).
+The monitor does that work once per worker:
+
+- ``system_status`` (AI, database, LINE/Telegram configuration) every
+  ``STATUS_MONITOR_INTERVAL`` seconds
+- ``system_health`` (``history_service.get_system_health`` over 24 hours)
+  every ``STATUS_HEALTH_INTERVAL`` seconds
+
+Each snapshot is published on the ``status`` WebSocket topic only when it
+differs from the previous one (timestamps aside), and is retained so a
+client that subscribes later gets the current state immediately. Snapshots
+are delivered on this worker only: every worker runs its own monitor, so
+going through the event bus would push each change once per worker.
+
+The polling endpoints serve the cached snapshots (``status()``/``health()``).
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.services.ws_manager import manager, TOPIC_STATUS
+from app.utils.timezone import get_thai_time
+
+logger = logging.getLogger(__name__)
+
+HEALTH_HOURS = 24
+
+def _without_timestamp(data: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if data is None:
+        return None
+    return {key: value for key, value in data.items() if key not in ("timestamp", "generated_at")}
+
+class StatusMonitor:
+    """Periodic status/health snapshots, pushed on the status topic when they change"""
+
+    def __init__(self, interval: Optional[float] = None, health_interval: Optional[float] = None,
+                 session_factory=None, connection_manager=None):
+        self.interval = interval or settings.STATUS_MONITOR_INTERVAL
+        self.health_interval = health_interval or settings.STATUS_HEALTH_INTERVAL
+        self.session_factory = session_factory or AsyncSessionLocal
+        self.manager = connection_manager or manager
+        self._status: Optional[Dict[str, Any]] = None
+        self._status_at = 0.0
+        self._health: Optional[Dict[str, Any]] = None
+        self._health_at = 0.0
+        self.pushed = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def check_status(self) -> Dict[str, Any]:
+        """Check AI, database and configuration once"""
+        from app.services.gemini_service import check_gemini_availability
+
+        try:
+            ai_available = await check_gemini_availability()
+        except Exception:
+            ai_available = False
+
+        db_available = True
+        try:
+            async with self.session_factory() as db:
+                await db.execute(text("SELECT 1"))
+        except Exception:
+            db_available = False
+
+        return {
+            "status": "ok",
+            "ai_available": ai_available,
+            "database_available": db_available,
+            "telegram_configured": bool(settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_CHAT_ID),
+            "line_configured": bool(settings.LINE_CHANNEL_ACCESS_TOKEN),
+            "timestamp": get_thai_time().isoformat()
+        }
+
+    async def check_health(self) -> Dict[str, Any]:
+        from app.services.history_service import history_service
+
+        async with self.session_factory() as db:
+            return await history_service.get_system_health(db, HEALTH_HOURS)
+
+    async def refresh_status(self) -> Dict[str, Any]:
+        """Recompute the status snapshot; pushes it when it changed"""
+        status = await self.check_status()
+        changed = _without_timestamp(status) != _without_timestamp(self._status)
+        self._status, self._status_at = status, time.monotonic()
+        if changed:
+            self._push("system_status", status)
+        return status
+
+    async def refresh_health(self) -> Optional[Dict[str, Any]]:
+        """Recompute the health report; pushes it when it changed"""
+        try:
+            health = await self.check_health()
+        except Exception as e:
+            logger.warning("System health check failed: %s", e)
+            return self._health
+        changed = _without_timestamp(health) != _without_timestamp(self._health)
+        self._health, self._health_at = health, time.monotonic()
+        if changed:
+            self._push("system_health", health)
+        return health
+
+    def _push(self, event_type: str, data: Dict[str, Any]):
+        self.pushed += 1
+        self.manager.retain(TOPIC_STATUS, {"type": event_type, "data": data})
+
+    async def status(self) -> Dict[str, Any]:
+        """Cached status snapshot, refreshed when older than the interval"""
+        if self._status is None or time.monotonic() - self._status_at > self.interval:
+            return await self.refresh_status()
+        return self._status
+
+    async def health(self, hours: int = HEALTH_HOURS) -> Optional[Dict[str, Any]]:
+        """Cached health report for the default window; None for other windows"""
+        if hours != HEALTH_HOURS:
+            return None
+        if self._health is None or time.monotonic() - self._health_at > self.health_interval:
+            return await self.refresh_health()
+        return self._health
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh_status()
+                if self._health is None or time.monotonic() - self._health_at >= self.health_interval:
+                    await self.refresh_health()
+            except Exception as e:
+                logger.warning("Status monitor refresh failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start the periodic checks (call from the running event loop)"""
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Global monitor started by the application
+status_monitor = StatusMonitor()
+
+__all__ = ['StatusMonitor', 'status_monitor']
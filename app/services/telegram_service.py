@@ -11,6 +11,7 @@ from app.db.crud_enhanced import (
     get_pending_notifications, update_notification_status,
     get_telegram_setting, log_system_event
 )
+from app.utils.timing import stage
 
 class TelegramService:
     """Advanced Telegram Bot Service"""
@@ -18,7 +19,7 @@ class TelegramService:
     def __init__(self):
         self.bot_token = settings.TELEGRAM_BOT_TOKEN
         self.chat_id = settings.TELEGRAM_CHAT_ID
-        self.api_base = f"https://api.telegram.org/bot{self.bot_token}"
+        self.api_base = f"{settings.TELEGRAM_API_BASE_URL}/bot{self.bot_token}"
         
     async def is_configured(self) -> bool:
         """ตรวจสอบว่า Telegram ตั้งค่าแล้วหรือยัง"""
@@ -43,7 +44,8 @@ class TelegramService:
         }
         
         async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(url, json=data)
+            with stage("telegram_send"):
+                response = await client.post(url, json=data)
             response.raise_for_status()
             return response.json()
     
@@ -0,0 +1,149 @@
+# WebSocket frame encoding for admin connections
+"""
+Serialize-once frames for ``ConnectionManager``.
+
+A ``Frame`` wraps one event and encodes it at most once per wire format
+actually in use - however many admins receive it. Connections negotiate their
+format when they open ``/ws``:
+
+- ``?format=json`` (default): text frames, encoded with orjson when installed
+- ``?format=msgpack``: binary frames (needs the optional ``msgpack`` package;
+  falls back to JSON otherwise)
+- ``?compact=1``: user metadata (``displayName``, ``pictureUrl``,
+  ``sessionId``) is sent in a ``user_meta`` frame only when it changes or the
+  connection has not seen it yet, and the ISO ``timestamp`` becomes ``ts``
+  (epoch milliseconds)
+
+Connections without ``compact`` get the full events, as before.
+
+Events flushed together by the manager's micro-batching reach a connection as
+one ``{"type": "batch", "events": [...]}`` frame, assembled from the already
+encoded events (``encode_batch``) rather than re-serializing them.
+"""
+
+import json
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "json"
+MSGPACK = "msgpack"
+
+META_FIELDS = ("displayName", "pictureUrl", "sessionId")
+MAX_TRACKED_USERS = 10000
+
+Encoded = Union[str, bytes]
+
+def dumps_json(data: Dict[str, Any]) -> str:
+    if orjson is not None:
+        # Non-string keys (e.g. per-hour counts keyed by int) become strings, as with json.dumps
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def loads_json(text: Union[str, bytes]) -> Any:
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+def negotiate_format(requested: Optional[str]) -> str:
+    """Wire format for a connection; msgpack only when the package is installed"""
+    if (requested or "").lower() == MSGPACK and msgpack is not None:
+        return MSGPACK
+    return JSON
+
+def _epoch_ms(timestamp: Any) -> Any:
+    if not isinstance(timestamp, str):
+        return timestamp
+    try:
+        return int(datetime.fromisoformat(timestamp).timestamp() * 1000)
+    except ValueError:
+        return timestamp
+
+def compact_event(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Event without user metadata and with an epoch-ms ``ts`` instead of ``timestamp``"""
+    compact = {key: value for key, value in data.items() if key not in META_FIELDS and key != "timestamp"}
+    if data.get("timestamp") is not None:
+        compact["ts"] = _epoch_ms(data["timestamp"])
+    return compact
+
+class Frame:
+    """One event, encoded lazily and at most once per (format, compact) variant"""
+
+    __slots__ = ("data", "_encoded")
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+        self._encoded: Dict[Tuple[str, bool], Encoded] = {}
+
+    def encode(self, codec: str = JSON, compact: bool = False) -> Encoded:
+        key = (codec, compact)
+        encoded = self._encoded.get(key)
+        if encoded is None:
+            data = compact_event(self.data) if compact else self.data
+            if codec == MSGPACK:
+                encoded = msgpack.packb(data, use_bin_type=True)
+            else:
+                encoded = dumps_json(data)
+            self._encoded[key] = encoded
+        return encoded
+
+def _msgpack_array_header(length: int) -> bytes:
+    if length < 16:
+        return bytes((0x90 | length,))
+    if length < 0x10000:
+        return b"\xdc" + length.to_bytes(2, "big")
+    return b"\xdd" + length.to_bytes(4, "big")
+
+def encode_batch(items: List[Encoded], codec: str = JSON) -> Encoded:
+    """One ``batch`` frame from events encoded with ``codec``"""
+    if codec == MSGPACK:
+        head = msgpack.packb({"type": "batch", "events": []}, use_bin_type=True)
+        # Packed map prefix up to the (empty) events array, whose one-byte header is replaced
+        return head[:-1] + _msgpack_array_header(len(items)) + b"".join(items)
+    return '{"type":"batch","events":[' + ",".join(items) + "]}"
+
+class UserMetaTracker:
+    """Latest metadata per user, versioned so connections can tell what they have seen"""
+
+    def __init__(self, max_users: int = MAX_TRACKED_USERS):
+        self.max_users = max_users
+        self._users: "OrderedDict[str, Tuple[int, Frame]]" = OrderedDict()
+        self._version = 0
+
+    def update(self, data: Dict[str, Any]) -> Optional[Tuple[int, Frame]]:
+        """Merge the event's metadata; returns the user's (version, user_meta frame)"""
+        user_id = data.get("userId")
+        if not user_id:
+            return None
+        current = self._users.get(user_id)
+        changes = {field: data[field] for field in META_FIELDS if data.get(field) is not None}
+        if current is not None:
+            self._users.move_to_end(user_id)
+            if all(current[1].data.get(field) == value for field, value in changes.items()):
+                return current
+            merged = {**current[1].data, **changes}
+        elif changes:
+            merged = {"type": "user_meta", "userId": user_id, **changes}
+        else:
+            return None
+        self._version += 1
+        entry = self._users[user_id] = (self._version, Frame(merged))
+        if len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+        return entry
+
+    def get(self, user_id: str) -> Optional[Tuple[int, Frame]]:
+        return self._users.get(user_id)
+
+__all__ = [
+    'Frame', 'UserMetaTracker', 'compact_event', 'encode_batch', 'dumps_json', 'loads_json', 'negotiate_format',
+    'JSON', 'MSGPACK', 'META_FIELDS'
+]
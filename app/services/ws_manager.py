@@ -1,62 +1,549 @@
 # app/services/ws_manager.py
-from typing import List
-from fastapi import WebSocket, WebSocketDisconnect
+"""
+Admin WebSocket connections
+
+Each connection has its own bounded outbound queue drained by a writer task,
+so ``broadcast`` only serializes the event once and enqueues it - one slow or
+half-dead browser never delays the other admins or the webhook handler that
+broadcast the event. When a queue is full the slow-consumer policy applies:
+``drop_oldest`` discards the oldest queued frame, ``disconnect`` closes the
+connection. A send that takes longer than ``WS_SEND_TIMEOUT`` also closes it.
+
+Clients choose what they receive by subscribing to topics over the socket::
+
+    {"action": "subscribe", "topics": ["users", "status", "conversation:U123"]}
+    {"action": "unsubscribe", "topics": ["conversation:U123"]}
+
+``conversation:<userId>`` gets the full events of that user (messages, typing,
+bot replies), ``users`` gets a compact ``user_summary`` per list-relevant event
+and ``status`` gets system status. A connection that never subscribes keeps
+receiving every full event, as before topics existed.
+
+State topics can keep their latest event (``retain``): a client subscribing to
+the topic is sent that event straight away, without waiting for the next
+change - the status monitor (app/services/status_monitor.py) retains
+``system_status`` and ``system_health`` this way.
+
+With an event bus attached (``attach_bus``), ``broadcast``/``publish`` go
+through it so admins connected to any gunicorn worker get the event; the bus
+calls ``deliver`` on every worker.
+
+Each event is wrapped in a ``Frame`` (app/services/ws_frames.py) and encoded
+once per wire format in use; ``?format=msgpack`` and ``?compact=1`` on ``/ws``
+select binary frames and user-metadata deltas per connection.
+
+Events are micro-batched: everything delivered within ``WS_BATCH_WINDOW_MS``
+is flushed together, and a connection with more than one frame in the flush
+gets a single ``{"type": "batch", "events": [...]}`` frame. Within a batch an
+event superseded by a later one of the same family for the same user (a
+``bot_typing_start`` followed by ``bot_typing_stop``, two status snapshots)
+is dropped before it is numbered. Connecting and (un)subscribing flush first,
+so routing is the same as without batching.
+
+Every delivered event carries ``seq``, numbered per worker (``epoch``), and the
+last ``WS_RESUME_BUFFER`` events are kept. A reconnecting client subscribes
+with ``"resume": {"epoch": ..., "last_seq": ...}`` and is sent only the events
+it missed (``resumed``), or ``resync_required`` when the gap is no longer in
+the buffer or it reconnected to a different worker or process.
+
+Liveness: the server (uvicorn) sends protocol-level pings every
+``WS_PING_INTERVAL``. On top of that the heartbeat task queues a ``ping``
+frame every interval that browsers answer with ``{"action": "pong"}``; any
+message from the client counts as activity, and connections silent for longer
+than ``WS_IDLE_TIMEOUT`` are closed and removed in the background - so dead
+browsers are found without waiting for a send to fail.
+"""
+import asyncio
 import json
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from fastapi import WebSocket, WebSocketDisconnect
+
+from app.core.config import settings
+from app.services.ws_frames import Frame, UserMetaTracker, encode_batch, negotiate_format, JSON
+from app.utils.metrics import WEBSOCKET_CONNECTIONS, WEBSOCKET_DROPPED, WS_BATCH_EVENTS, WS_SUPERSEDED
+from app.utils.timing import stage
+
+logger = logging.getLogger(__name__)
+
+DROP_OLDEST = "drop_oldest"
+DISCONNECT = "disconnect"
+
+TOPIC_USERS = "users"
+TOPIC_STATUS = "status"
+CONVERSATION_PREFIX = "conversation:"
+MAX_TOPICS_PER_CONNECTION = 50
+
+# Events that change the user list; typing indicators only matter inside a conversation
+SUMMARY_EVENTS = {"new_message", "new_user_request", "bot_auto_reply", "friend_status_change", "mode_changed"}
+_SUMMARY_FIELDS = ("userId", "displayName", "pictureUrl", "senderType", "mode", "status", "timestamp")
+SUMMARY_PREVIEW_LENGTH = 80
+
+# Within one batch only the last event of a family counts, per topic and user
+SUPERSEDING_FAMILIES = {
+    "bot_typing_start": "bot_typing", "bot_typing_stop": "bot_typing",
+    "friend_status_change": "friend_status",
+    "system_status": "system_status", "system_health": "system_health",
+}
+
+def conversation_topic(user_id: str) -> str:
+    return f"{CONVERSATION_PREFIX}{user_id}"
+
+def is_valid_topic(topic: Any) -> bool:
+    return isinstance(topic, str) and (
+        topic in (TOPIC_USERS, TOPIC_STATUS)
+        or (topic.startswith(CONVERSATION_PREFIX) and 0 < len(topic) - len(CONVERSATION_PREFIX) <= 64)
+    )
+
+def user_summary(data: dict) -> dict:
+    """Compact user-list update for the ``users`` topic"""
+    summary = {"type": "user_summary", "event": data.get("type")}
+    if "seq" in data:
+        summary["seq"] = data["seq"]
+    for field in _SUMMARY_FIELDS:
+        if data.get(field) is not None:
+            summary[field] = data[field]
+    message = data.get("message")
+    if isinstance(message, str):
+        summary["preview"] = message[:SUMMARY_PREVIEW_LENGTH]
+    return summary
+
+def collapse_superseded(events: List[Tuple[Optional[str], dict]]) -> List[Tuple[Optional[str], dict]]:
+    """Drop events overtaken by a later event of the same family, topic and user"""
+    seen = set()
+    kept = []
+    for topic, data in reversed(events):
+        family = SUPERSEDING_FAMILIES.get(data.get("type"))
+        if family is not None:
+            key = (topic, family, data.get("userId"))
+            if key in seen:
+                WS_SUPERSEDED.inc(type=data.get("type"))
+                continue
+            seen.add(key)
+        kept.append((topic, data))
+    kept.reverse()
+    return kept
+
+class ClientConnection:
+    """One admin socket with its outbound queue and writer task"""
+
+    def __init__(self, websocket: WebSocket, queue_size: int, policy: str, send_timeout: float,
+                 codec: str = JSON, compact: bool = False):
+        self.websocket = websocket
+        self.codec = codec
+        self.compact = compact
+        # userId -> user_meta version this connection has received (compact mode)
+        self.known_meta: Dict[str, int] = {}
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max(queue_size, 1))
+        self.dropped = 0
+        self.sent = 0
+        self.closed = False
+        self.writer: Optional[asyncio.Task] = None
+        # None until the client first subscribes: receives every full event
+        self.topics: Optional[Set[str]] = None
+        self.last_seen = time.monotonic()
+        self.rtt_ms: Optional[float] = None
+
+    def offer(self, message) -> bool:
+        """Enqueue without waiting; False means the connection should be closed"""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            pass
+        if self.policy == DISCONNECT:
+            WEBSOCKET_DROPPED.inc(reason="slow_consumer_disconnect")
+            return False
+        self.queue.get_nowait()
+        self.queue.put_nowait(message)
+        self.dropped += 1
+        WEBSOCKET_DROPPED.inc(reason="queue_full")
+        return True
+
+    async def run_writer(self, on_failure):
+        try:
+            while True:
+                message = await self.queue.get()
+                if isinstance(message, bytes):
+                    send = self.websocket.send_bytes(message)
+                else:
+                    send = self.websocket.send_text(message)
+                await asyncio.wait_for(send, timeout=self.send_timeout)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            logger.warning("WebSocket send timed out after %ss, closing connection", self.send_timeout)
+            WEBSOCKET_DROPPED.inc(reason="send_timeout")
+            await on_failure(self)
+        except Exception as e:
+            logger.warning("Error sending message to WebSocket: %s", e)
+            await on_failure(self)
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+    def __init__(self, queue_size: Optional[int] = None, policy: Optional[str] = None,
+                 send_timeout: Optional[float] = None, resume_buffer: Optional[int] = None,
+                 ping_interval: Optional[float] = None, idle_timeout: Optional[float] = None,
+                 batch_window: Optional[float] = None):
+        self.queue_size = queue_size or settings.WS_SEND_QUEUE_SIZE
+        self.policy = policy or settings.WS_SLOW_CONSUMER_POLICY
+        if self.policy not in (DROP_OLDEST, DISCONNECT):
+            logger.warning("Unknown WS_SLOW_CONSUMER_POLICY %r, using %s", self.policy, DROP_OLDEST)
+            self.policy = DROP_OLDEST
+        self.send_timeout = send_timeout or settings.WS_SEND_TIMEOUT
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        self.subscribers: Dict[str, Set[ClientConnection]] = {}
+        # topic -> latest state event, sent to new subscribers of that topic
+        self.retained: Dict[str, Dict[str, dict]] = {}
+        self.user_meta = UserMetaTracker()
+        self.bus = None
+        # Resume-on-reconnect: per-worker sequence and the recent events
+        self.epoch = uuid.uuid4().hex[:12]
+        self.seq = 0
+        self.history: deque = deque(maxlen=max(resume_buffer or settings.WS_RESUME_BUFFER, 1))
+        # Micro-batching: events waiting for the next flush (seconds; 0 flushes every event)
+        self.batch_window = settings.WS_BATCH_WINDOW_MS / 1000 if batch_window is None else batch_window
+        self._pending: List[Tuple[Optional[str], dict]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.ping_interval = ping_interval or settings.WS_PING_INTERVAL
+        self.idle_timeout = idle_timeout or settings.WS_IDLE_TIMEOUT
+        self.reaped = 0
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.connections)
 
     async def connect(self, websocket: WebSocket):
         """เชื่อมต่อ WebSocket ใหม่"""
         await websocket.accept()
-        self.active_connections.append(websocket)
-        print(f"WebSocket connected. Total connections: {len(self.active_connections)}")
+        # Events from before this connection existed go out to the others first
+        self.flush()
+        params = getattr(websocket, "query_params", None) or {}
+        client = ClientConnection(
+            websocket, self.queue_size, self.policy, self.send_timeout,
+            codec=negotiate_format(params.get("format")),
+            compact=params.get("compact", "").lower() in ("1", "true")
+        )
+        client.writer = asyncio.create_task(client.run_writer(self._close_client))
+        self.connections[websocket] = client
+        self._deliver([client], {
+            "type": "hello", "epoch": self.epoch, "seq": self.seq, "ping_interval": self.ping_interval
+        })
+        logger.info("WebSocket connected. Total connections: %d", len(self.connections))
+        return client
 
     def disconnect(self, websocket: WebSocket):
         """ตัดการเชื่อมต่อ WebSocket"""
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
-        print(f"WebSocket disconnected. Total connections: {len(self.active_connections)}")
+        client = self.connections.pop(websocket, None)
+        if client is not None:
+            client.closed = True
+            self._unsubscribe(client, list(client.topics or ()))
+            if client.writer is not None and client.writer is not asyncio.current_task():
+                client.writer.cancel()
+            logger.info("WebSocket disconnected. Total connections: %d", len(self.connections))
+
+    async def _close_client(self, client: ClientConnection, code: int = 1011):
+        """Drop a failed or slow connection and close its socket"""
+        self.disconnect(client.websocket)
+        try:
+            await asyncio.wait_for(client.websocket.close(code=code), timeout=1)
+        except Exception:
+            pass
 
     async def send_personal_message(self, message: str, websocket: WebSocket):
-        """ส่งข้อความไปยัง WebSocket เฉพาะ"""
-        await websocket.send_text(message)
+        """ส่งข้อความไปยัง WebSocket เฉพาะ (ผ่าน queue ของ connection นั้น)"""
+        client = self.connections.get(websocket)
+        if client is None:
+            await websocket.send_text(message)
+        elif not client.offer(message):
+            await self._close_client(client)
+
+    def subscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        """Add topics to a connection; returns its current topics"""
+        client = self.connections.get(websocket)
+        if client is None:
+            return []
+        self.flush()
+        if client.topics is None:
+            client.topics = set()
+        for topic in topics:
+            if not is_valid_topic(topic) or topic in client.topics:
+                continue
+            if len(client.topics) >= MAX_TOPICS_PER_CONNECTION:
+                break
+            client.topics.add(topic)
+            self.subscribers.setdefault(topic, set()).add(client)
+        return sorted(client.topics)
+
+    def unsubscribe(self, websocket: WebSocket, topics: Iterable[str]) -> List[str]:
+        client = self.connections.get(websocket)
+        if client is None:
+            return []
+        self.flush()
+        self._unsubscribe(client, topics)
+        return sorted(client.topics or ())
+
+    def _unsubscribe(self, client: ClientConnection, topics: Iterable[str]):
+        for topic in topics:
+            if client.topics is not None:
+                client.topics.discard(topic)
+            subscribers = self.subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(client)
+                if not subscribers:
+                    del self.subscribers[topic]
+
+    async def handle_client_message(self, websocket: WebSocket, text: str):
+        """Apply a subscribe/unsubscribe request or pong sent by the browser"""
+        client = self.connections.get(websocket)
+        if client is not None:
+            client.last_seen = time.monotonic()
+        try:
+            request = json.loads(text)
+        except (TypeError, ValueError):
+            return
+        if not isinstance(request, dict):
+            return
+        if request.get("action") == "pong":
+            if client is not None and isinstance(request.get("t"), (int, float)):
+                client.rtt_ms = max(time.time() * 1000 - request["t"], 0.0)
+            return
+        if request.get("action") not in ("subscribe", "unsubscribe"):
+            return
+        topics = request.get("topics")
+        if not isinstance(topics, list):
+            return
+        before = set(client.topics or ()) if client is not None else set()
+        if request["action"] == "subscribe":
+            current = self.subscribe(websocket, topics)
+        else:
+            current = self.unsubscribe(websocket, topics)
+        client = self.connections.get(websocket)
+        if client is not None:
+            self._deliver([client], {"type": "subscribed", "topics": current})
+            for topic in current:
+                if topic not in before:
+                    for data in self.retained.get(topic, {}).values():
+                        self._deliver([client], data)
+            # Same step as the subscribe, so no live event can slip in between
+            if isinstance(request.get("resume"), dict):
+                self.resume(client, request["resume"].get("epoch"), request["resume"].get("last_seq"))
+
+    def resume(self, client: ClientConnection, epoch: Optional[str], last_seq: Any) -> int:
+        """Replay buffered events after ``last_seq``; returns how many were sent, -1 for a resync"""
+        oldest = self.history[0][0] if self.history else self.seq + 1
+        if epoch != self.epoch or not isinstance(last_seq, int) or last_seq > self.seq or last_seq < oldest - 1:
+            self._deliver([client], {"type": "resync_required", "epoch": self.epoch, "seq": self.seq})
+            return -1
+        replayed = 0
+        out: Dict[ClientConnection, list] = {}
+        for seq, topic, frame in self.history:
+            if seq <= last_seq:
+                continue
+            data = self._view(client, topic, frame.data)
+            if data is not None:
+                meta = self.user_meta.get(data.get("userId")) if data.get("userId") else None
+                self._collect(out, [client], data, meta, frame if data is frame.data else None)
+                replayed += 1
+        self._send(out)
+        self._deliver([client], {
+            "type": "resumed", "epoch": self.epoch, "from": last_seq, "to": self.seq, "replayed": replayed
+        })
+        return replayed
+
+    @staticmethod
+    def _view(client: ClientConnection, topic: Optional[str], data: dict) -> Optional[dict]:
+        """What ``client`` receives for an event, following the live routing rules"""
+        if topic is not None:
+            return data if client.topics and topic in client.topics else None
+        if client.topics is None:
+            return data
+        user_id = data.get("userId")
+        if user_id and conversation_topic(user_id) in client.topics:
+            return data
+        if TOPIC_USERS in client.topics and data.get("type") in SUMMARY_EVENTS:
+            return user_summary(data)
+        return None
 
     async def broadcast(self, data: dict):
-        """ส่งข้อความไปยัง WebSocket ทั้งหมด"""
-        message = json.dumps(data, ensure_ascii=False)
-        print(f"Broadcasting to {len(self.active_connections)} WebSocket connections")
-        print(f"Message content: {data}")
-        
-        if not self.active_connections:
-            print("No active WebSocket connections to broadcast to")
-            return
-        
-        disconnected_connections = []
-        successful_sends = 0
-        
-        for connection in self.active_connections:
+        """ส่ง event ไปยังผู้ที่ subscribe ทุก worker (serialize ครั้งเดียวแล้วเข้า queue)"""
+        with stage("ws_broadcast"):
+            if self.bus is not None:
+                self.bus.publish(None, data)
+            else:
+                self.deliver(None, data)
+
+    async def publish(self, topic: str, data: dict):
+        """ส่ง event ไปยังผู้ที่ subscribe topic นี้เท่านั้น"""
+        with stage("ws_broadcast"):
+            if self.bus is not None:
+                self.bus.publish(topic, data)
+            else:
+                self.deliver(topic, data)
+
+    def retain(self, topic: str, data: dict):
+        """Deliver a state event on this worker and keep it (per type) for later subscribers"""
+        self.retained.setdefault(topic, {})[data.get("type")] = data
+        self.deliver(topic, data)
+
+    def attach_bus(self, bus):
+        """Route broadcasts through a cross-worker event bus"""
+        self.bus = bus
+
+    def deliver(self, topic: Optional[str], data: dict):
+        """Queue an event for this worker's next flush (called by the event bus)"""
+        self._pending.append((topic, data))
+        if self.batch_window <= 0:
+            self.flush()
+        elif self._flush_handle is None:
             try:
-                # ตรวจสอบสถานะการเชื่อมต่อก่อนส่ง
-                if connection.client_state.value == 1:  # CONNECTED
-                    await connection.send_text(message)
-                    successful_sends += 1
-                    print(f"Message sent successfully to WebSocket connection")
-                else:
-                    print(f"WebSocket connection is not active (state: {connection.client_state.value})")
-                    disconnected_connections.append(connection)
+                self._flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self.flush)
+            except RuntimeError:
+                # No running loop (called from synchronous code): nothing to batch with
+                self.flush()
+
+    def flush(self):
+        """Number, buffer and send the pending events - at most one frame per connection"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        events = collapse_superseded(self._pending)
+        self._pending = []
+        out: Dict[ClientConnection, list] = {}
+        for topic, data in events:
+            self.seq += 1
+            frame = Frame({**data, "seq": self.seq})
+            self.history.append((self.seq, topic, frame))
+            if topic is None:
+                self._broadcast(frame, out)
+            else:
+                self._collect(out, self.subscribers.get(topic, ()), frame.data, frame=frame)
+        self.batches += 1
+        WS_BATCH_EVENTS.observe(len(events))
+        self._send(out)
+
+    def _broadcast(self, frame: Frame, out: Dict[ClientConnection, list]):
+        data = frame.data
+        # Track user metadata even with nobody connected so later deltas stay correct
+        meta = self.user_meta.update(data)
+        if not self.connections:
+            logger.debug("No active WebSocket connections to broadcast to")
+            return
+
+        # Full event: legacy (unsubscribed) connections and the user's conversation
+        targets = {client for client in self.connections.values() if client.topics is None}
+        user_id = data.get("userId")
+        if user_id:
+            targets.update(self.subscribers.get(conversation_topic(user_id), ()))
+        self._collect(out, targets, data, meta, frame)
+
+        if data.get("type") in SUMMARY_EVENTS:
+            list_targets = [client for client in self.subscribers.get(TOPIC_USERS, ()) if client not in targets]
+            self._collect(out, list_targets, user_summary(data), meta)
+
+    def _deliver(self, clients: Iterable[ClientConnection], data: dict, meta=None, frame: Optional[Frame] = None):
+        """Send one event now, outside the batch (control frames)"""
+        out: Dict[ClientConnection, list] = {}
+        self._collect(out, clients, data, meta, frame)
+        self._send(out)
+
+    def _collect(self, out: Dict[ClientConnection, list], clients: Iterable[ClientConnection], data: dict,
+                 meta=None, frame: Optional[Frame] = None):
+        """Append the encoded event (and any user_meta it needs) to each client's outgoing frames"""
+        clients = list(clients)
+        if not clients:
+            return
+        frame = frame or Frame(data)
+        for client in clients:
+            items = out.setdefault(client, [])
+            if client.compact and meta is not None:
+                version, meta_frame = meta
+                user_id = meta_frame.data["userId"]
+                if client.known_meta.get(user_id) != version:
+                    if len(client.known_meta) >= self.user_meta.max_users:
+                        client.known_meta.clear()
+                    client.known_meta[user_id] = version
+                    items.append(meta_frame.encode(client.codec))
+            items.append(frame.encode(client.codec, client.compact))
+
+    def _send(self, out: Dict[ClientConnection, list]):
+        """Queue one frame per connection; several events become one batch frame"""
+        if not out:
+            return
+        # Connections with the same events share one encoded batch
+        batches: Dict[tuple, Any] = {}
+        slow_consumers = []
+        for client, items in out.items():
+            if len(items) == 1:
+                message = items[0]
+            else:
+                key = (client.codec, tuple(map(id, items)))
+                message = batches.get(key)
+                if message is None:
+                    message = batches[key] = encode_batch(items, client.codec)
+            if not client.offer(message):
+                slow_consumers.append(client)
+        for client in slow_consumers:
+            logger.warning("Disconnecting slow WebSocket consumer (%d frames queued)", client.queue.qsize())
+            self.disconnect(client.websocket)
+            asyncio.create_task(self._close_client(client))
+
+        logger.debug("Frames queued for %d connections (%d distinct batches)", len(out), len(batches))
+
+    async def reap_idle(self) -> int:
+        """Close connections that have been silent for longer than the idle timeout"""
+        deadline = time.monotonic() - self.idle_timeout
+        stale = [client for client in self.connections.values() if client.last_seen < deadline]
+        for client in stale:
+            logger.info("Reaping idle WebSocket (silent for %.0fs)", time.monotonic() - client.last_seen)
+            WEBSOCKET_DROPPED.inc(reason="idle_timeout")
+            await self._close_client(client, code=1001)
+        self.reaped += len(stale)
+        return len(stale)
+
+    def ping_all(self):
+        """Queue one ping frame (encoded once) on every connection"""
+        if self.connections:
+            self._deliver(self.connections.values(), {"type": "ping", "t": int(time.time() * 1000)})
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            try:
+                await self.reap_idle()
+                self.ping_all()
             except Exception as e:
-                print(f"Error sending message to WebSocket: {e}")
-                disconnected_connections.append(connection)
-        
-        # ลบ connection ที่มีปัญหา
-        for connection in disconnected_connections:
-            if connection in self.active_connections:
-                self.active_connections.remove(connection)
-                print(f"Removed failed WebSocket connection")
-        
-        print(f"Broadcast result: {successful_sends}/{len(self.active_connections + disconnected_connections)} successful")
+                logger.warning("WebSocket heartbeat failed: %s", e)
+
+    def start_heartbeat(self):
+        """Start pinging and reaping (call from the running event loop)"""
+        if self.ping_interval > 0 and (self._heartbeat_task is None or self._heartbeat_task.done()):
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat_loop())
+
+    async def close_all(self):
+        """Flush pending events, stop the heartbeat and cancel every writer task (application shutdown)"""
+        self.flush()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat_task = None
+        for client in list(self.connections.values()):
+            await self._close_client(client, code=1001)
 
 # สร้าง instance สำหรับใช้งาน
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()
+WEBSOCKET_CONNECTIONS.set_function(lambda: len(manager.connections))
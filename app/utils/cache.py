@@ -0,0 +1,246 @@
+"""
+Small in-process caches with TTL and LRU eviction, plus a single-value
+stale-while-revalidate cache for expensive async reports
+"""
+
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+def content_hash(*parts: Union[bytes, str, None]) -> str:
+    """
+    Build a SHA-256 hex digest from binary content and optional text parts
+
+    Args:
+        parts: bytes or strings to feed into the hash (None is skipped)
+
+    Returns:
+        Hex digest string suitable for use as a cache key
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            continue
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(part)
+        # Separator so ("ab", "c") and ("a", "bc") produce different keys
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+class TTLCache:
+    """
+    Thread-safe LRU cache where every entry expires after a fixed TTL
+
+    Values are evicted when the cache is full (least recently used first)
+    or when they are read after expiring. An optional ``on_evict`` callback
+    receives ``(key, value)`` for every entry that leaves the cache so callers
+    can release remote resources.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 256,
+        ttl: float = 3600,
+        on_evict: Optional[Callable[[str, Any], None]] = None
+    ):
+        self.maxsize = max(1, int(maxsize))
+        self.ttl = float(ttl)
+        self.on_evict = on_evict
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Return the cached value or ``default`` if missing/expired"""
+        evicted = None
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                evicted = (key, value)
+                self.misses += 1
+            else:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+
+        self._notify_evicted([evicted])
+        return default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """Store a value, evicting the least recently used entries if full"""
+        evicted = []
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if key in self._data:
+                old_value = self._data.pop(key)[1]
+                if old_value is not value:
+                    evicted.append((key, old_value))
+            self._data[key] = (expires_at, value)
+            while len(self._data) > self.maxsize:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+
+        self._notify_evicted(evicted)
+
+    def pop(self, key: str, default: Any = None) -> Any:
+        """Remove an entry without calling ``on_evict``"""
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return entry[1] if entry else default
+
+    def purge_expired(self) -> int:
+        """Drop every expired entry and return how many were removed"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [(k, v) for k, (exp, v) in self._data.items() if exp < now]
+            for key, _ in expired:
+                del self._data[key]
+
+        self._notify_evicted(expired)
+        return len(expired)
+
+    def clear(self):
+        """Remove every entry (``on_evict`` is called for each one)"""
+        with self._lock:
+            evicted = [(k, v) for k, (_, v) in self._data.items()]
+            self._data.clear()
+
+        self._notify_evicted(evicted)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups * 100, 2) if lookups > 0 else 0
+        }
+
+    def _notify_evicted(self, entries):
+        if not self.on_evict:
+            return
+        for entry in entries:
+            if entry is None:
+                continue
+            try:
+                self.on_evict(*entry)
+            except Exception as e:
+                logger.warning("Cache eviction callback failed: %s", e)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: str) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+class StaleWhileRevalidate:
+    """
+    One async-computed value served from memory, refreshed in the background
+
+    - never loaded (or older than ``max_stale``): the caller waits for a load
+    - older than ``ttl``: the cached value is returned at once and a single
+      background task recomputes it
+    - a failed refresh keeps the previous value (logged); with no value at all
+      the error is raised to the caller
+
+    Concurrent callers share one in-flight load, so a burst of requests after
+    expiry costs one computation.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[Any]], ttl: float = 30, max_stale: float = 300,
+                 name: str = "swr"):
+        self.loader = loader
+        self.ttl = float(ttl)
+        self.max_stale = max(float(max_stale), self.ttl)
+        self.name = name
+        self._value: Any = None
+        self._loaded_at: Optional[float] = None
+        self._inflight: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.failures = 0
+        self.last_error: Optional[str] = None
+
+    def age(self) -> Optional[float]:
+        return None if self._loaded_at is None else time.monotonic() - self._loaded_at
+
+    async def get(self) -> Any:
+        age = self.age()
+        if age is None or age > self.max_stale:
+            self.misses += 1
+            return await self.refresh()
+        if age > self.ttl:
+            self.stale_hits += 1
+            self._revalidate()
+        else:
+            self.hits += 1
+        return self._value
+
+    async def refresh(self) -> Any:
+        """Recompute now (joining a refresh already in flight)"""
+        task = self._revalidate()
+        # shield: a cancelled request must not cancel the shared load
+        return await asyncio.shield(task)
+
+    def _revalidate(self) -> asyncio.Task:
+        if self._inflight is None or self._inflight.done():
+            self._inflight = asyncio.get_running_loop().create_task(self._load())
+        return self._inflight
+
+    async def _load(self) -> Any:
+        started = time.perf_counter()
+        try:
+            value = await self.loader()
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            if self._loaded_at is None:
+                raise
+            logger.warning("Refreshing %s failed, serving the previous value: %s", self.name, e)
+            return self._value
+        self._value, self._loaded_at = value, time.monotonic()
+        self.refreshes += 1
+        self.last_error = None
+        logger.debug("Refreshed %s in %.1f ms", self.name, (time.perf_counter() - started) * 1000)
+        return value
+
+    def invalidate(self):
+        """Force the next ``get`` to wait for a fresh value"""
+        self._loaded_at = None
+
+    def stats(self) -> Dict[str, Any]:
+        age = self.age()
+        return {
+            "ttl_seconds": self.ttl,
+            "max_stale_seconds": self.max_stale,
+            "age_seconds": round(age, 2) if age is not None else None,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "last_error": self.last_error
+        }
+
+    def __len__(self) -> int:
+        return 0 if self._loaded_at is None else 1
@@ -0,0 +1,41 @@
+# Cross-process file locks
+"""
+Advisory ``flock`` locks for state that gunicorn workers and scripts share on
+one host: the metrics snapshot directory, the knowledge index and the columnar
+export directory. fcntl is POSIX-only; elsewhere the lock is a no-op.
+"""
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Union
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+class FileLockBusy(RuntimeError):
+    """A non-blocking lock is held by another process"""
+
+@contextmanager
+def file_lock(path: Union[str, Path], shared: bool = False, blocking: bool = True):
+    """
+    Hold a lock on ``path`` (created if missing) for the duration of the block
+
+    Args:
+        path: Lock file; its directory must exist
+        shared: Take a shared (reader) lock instead of an exclusive one
+        blocking: Wait for the lock; when False, raise ``FileLockBusy`` instead
+    """
+    with open(path, "a") as lock_file:
+        if fcntl is not None:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            if not blocking:
+                flags |= fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock_file, flags)
+            except BlockingIOError:
+                raise FileLockBusy(f"{path} is locked by another process")
+        yield
+
+__all__ = ['FileLockBusy', 'file_lock']
@@ -0,0 +1,70 @@
+# HyperLogLog sketches for distinct counts in rollup tables
+"""
+Distinct users/sessions cannot be summed across hourly or daily rollup rows,
+but HyperLogLog sketches can be merged: the union of any number of days is
+the register-wise maximum. ``PRECISION = 11`` gives 2048 one-byte registers
+(2 KB per sketch) and a standard error of about 2.3%; small counts use linear
+counting and are exact in practice.
+
+Adding a value that is already represented never changes the registers, so
+callers only need to write a sketch back when ``add`` returns True.
+"""
+
+import hashlib
+import math
+from typing import Iterable, Optional
+
+PRECISION = 11
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch stored as ``2 ** precision`` bytes"""
+
+    __slots__ = ("precision", "registers")
+
+    def __init__(self, data: Optional[bytes] = None, precision: int = PRECISION):
+        self.precision = precision
+        size = 1 << precision
+        if data is not None and len(data) == size:
+            self.registers = bytearray(data)
+        else:
+            self.registers = bytearray(size)
+
+    def add(self, value: str) -> bool:
+        """Add a value; True when a register changed (the sketch must be saved)"""
+        digest = int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+        bits = 64 - self.precision
+        index = digest >> bits
+        rank = bits - (digest & ((1 << bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+        return self
+
+    def count(self) -> int:
+        size = len(self.registers)
+        zeros = self.registers.count(0)
+        if zeros == size:
+            return 0
+        alpha = 0.7213 / (1 + 1.079 / size)
+        estimate = alpha * size * size / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * size and zeros:
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
+
+    def to_bytes(self) -> bytes:
+        return bytes(self.registers)
+
+    @classmethod
+    def union(cls, sketches: Iterable[Optional[bytes]], precision: int = PRECISION) -> "HyperLogLog":
+        """Merge stored sketches (None entries are skipped)"""
+        merged = cls(precision=precision)
+        for data in sketches:
+            if data:
+                merged.merge(cls(data, precision))
+        return merged
+
+__all__ = ['HyperLogLog', 'PRECISION']
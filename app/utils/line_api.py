@@ -0,0 +1,59 @@
+"""
+LINE Messaging API client factory
+
+Every LINE client in the app is created here so the API hosts can be pointed
+at a local stub server (``LINE_API_BASE_URL`` / ``LINE_DATA_API_BASE_URL``) for
+load tests. The SDK hard-codes ``https://api-data.line.me`` for content
+downloads, so that host is rewritten per request.
+
+Calls made through these clients are timed as hot-path stages (``line_reply``,
+``line_push``, ``line_profile``, ``line_content`` or ``line_api``).
+"""
+
+import asyncio
+
+from linebot.v3.messaging import AsyncApiClient, Configuration
+
+from app.core.config import settings
+from app.utils.timing import stage
+
+DEFAULT_LINE_API_BASE_URL = "https://api.line.me"
+DEFAULT_LINE_DATA_API_BASE_URL = "https://api-data.line.me"
+
+_STAGE_BY_RESOURCE_PREFIX = (
+    ("/v2/bot/message/reply", "line_reply"),
+    ("/v2/bot/message/push", "line_push"),
+    ("/v2/bot/profile/", "line_profile"),
+    ("/v2/bot/message/{messageId}/content", "line_content"),
+)
+
+def stage_for_resource(resource_path: str) -> str:
+    """Stage name used to time a LINE API call"""
+    for prefix, name in _STAGE_BY_RESOURCE_PREFIX:
+        if resource_path.startswith(prefix):
+            return name
+    return "line_api"
+
+async def _timed(name: str, call):
+    with stage(name):
+        return await call
+
+class LineAsyncApiClient(AsyncApiClient):
+    """AsyncApiClient that honours LINE_DATA_API_BASE_URL for content endpoints"""
+
+    def call_api(self, *args, _host=None, **kwargs):
+        data_host = settings.LINE_DATA_API_BASE_URL.rstrip('/')
+        if _host and _host.rstrip('/') == DEFAULT_LINE_DATA_API_BASE_URL and data_host != DEFAULT_LINE_DATA_API_BASE_URL:
+            _host = data_host
+        result = super().call_api(*args, _host=_host, **kwargs)
+        if asyncio.iscoroutine(result):
+            return _timed(stage_for_resource(args[0] if args else kwargs.get('resource_path', '')), result)
+        return result
+
+def create_line_api_client() -> AsyncApiClient:
+    """Create an API client for AsyncMessagingApi / AsyncMessagingApiBlob"""
+    configuration = Configuration(
+        access_token=settings.LINE_CHANNEL_ACCESS_TOKEN,
+        host=settings.LINE_API_BASE_URL.rstrip('/')
+    )
+    return LineAsyncApiClient(configuration)
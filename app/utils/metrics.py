@@ -0,0 +1,483 @@
+"""
+In-process metrics with Prometheus text exposition
+
+Counters, gauges and histograms are plain dict updates under a lock, cheap
+enough to record on every webhook event. Under gunicorn every worker has its
+own registry, so each worker periodically writes a JSON snapshot to
+``METRICS_DIR`` (``worker-<pid>.json``) and ``/metrics`` merges all snapshots:
+
+* counters and histograms are summed over every snapshot. Snapshots of workers
+  that have exited are folded into ``archive.json`` so totals never go back.
+* gauges are summed over live workers only.
+
+With ``METRICS_DIR`` empty only the current process is reported.
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import settings
+from app.utils.file_lock import file_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[str, ...]
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: "MetricsRegistry" = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels: Dict[str, Any]) -> LabelKey:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+class Counter(_Metric):
+    """Monotonic counter"""
+    type_name = "counter"
+
+    def __init__(self, *args, **kwargs):
+        self._values: Dict[LabelKey, float] = {}
+        super().__init__(*args, **kwargs)
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_total(self, value: float, **labels):
+        """Mirror a cumulative count kept by another object (e.g. cache hits)"""
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+class Gauge(_Metric):
+    """Value that goes up and down; ``set_function`` reads it at collection time"""
+    type_name = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        self._values: Dict[LabelKey, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+        super().__init__(*args, **kwargs)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        self._function = function
+
+    def samples(self) -> Dict[LabelKey, float]:
+        if self._function is not None:
+            try:
+                return {(): float(self._function())}
+            except Exception:
+                return {}
+        with self._lock:
+            return dict(self._values)
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram (Prometheus semantics)"""
+    type_name = "histogram"
+
+    def __init__(self, *args, buckets: Iterable[float] = DEFAULT_LATENCY_BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(buckets))
+        # key -> [count per bucket..., count above the last bucket, sum]
+        self._values: Dict[LabelKey, List[float]] = {}
+        super().__init__(*args, **kwargs)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    def count(self, **labels) -> int:
+        row = self._values.get(self._key(labels))
+        return int(sum(row[:-1])) if row else 0
+
+    def samples(self) -> Dict[LabelKey, List[float]]:
+        with self._lock:
+            return {key: list(row) for key, row in self._values.items()}
+
+class MetricsRegistry:
+    """All metrics of this process plus collectors evaluated at snapshot time"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """``collector()`` runs before every snapshot to refresh derived metrics"""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serializable state of every metric"""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning("Metrics collector failed: %s", e)
+
+        metrics = {}
+        for name, metric in self._metrics.items():
+            metrics[name] = {
+                "type": metric.type_name,
+                "help": metric.documentation,
+                "labels": list(metric.labelnames),
+                "buckets": list(getattr(metric, "buckets", ())),
+                "samples": [[list(key), value] for key, value in metric.samples().items()]
+            }
+        return {"pid": os.getpid(), "updated": time.time(), "metrics": metrics}
+
+# Default registry used by the whole app
+REGISTRY = MetricsRegistry()
+
+# ========================================
+# Multi-worker snapshots
+# ========================================
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]], live_pids: Optional[set] = None) -> Dict[str, Any]:
+    """
+    Combine worker snapshots into one
+
+    Counters and histograms are summed over every snapshot; gauges only over
+    snapshots whose pid is in ``live_pids`` (all of them when ``None``).
+    """
+    merged: Dict[str, Any] = {}
+    for snapshot in snapshots:
+        pid = snapshot.get("pid")
+        for name, metric in snapshot.get("metrics", {}).items():
+            if metric["type"] == "gauge" and live_pids is not None and pid not in live_pids:
+                continue
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            if target["type"] == "histogram" and target.get("buckets") != metric.get("buckets"):
+                continue
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if isinstance(value, list):
+                    current = target["samples"].get(key)
+                    target["samples"][key] = value if current is None else [a + b for a, b in zip(current, value)]
+                else:
+                    target["samples"][key] = target["samples"].get(key, 0) + value
+
+    for metric in merged.values():
+        metric["samples"] = [[list(key), value] for key, value in metric["samples"].items()]
+    return {"metrics": merged}
+
+class SnapshotStore:
+    """Per-worker snapshot files in METRICS_DIR"""
+
+    ARCHIVE_NAME = "archive.json"
+
+    def __init__(self, directory: Optional[str] = None, registry: MetricsRegistry = None):
+        self.directory = settings.METRICS_DIR if directory is None else directory
+        self.registry = registry if registry is not None else REGISTRY
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.directory)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _write_json(self, name: str, data: Dict[str, Any]):
+        tmp_path = self._path(f".{name}.{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path(name))
+
+    def _read_json(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(name), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self) -> Dict[str, Any]:
+        """Write this worker's snapshot and return it"""
+        snapshot = self.registry.snapshot()
+        if self.enabled:
+            os.makedirs(self.directory, exist_ok=True)
+            self._write_json(f"worker-{snapshot['pid']}.json", snapshot)
+        return snapshot
+
+    def collect(self) -> Dict[str, Any]:
+        """Merged view over every worker (just this process when disabled)"""
+        own = self.write()
+        if not self.enabled:
+            return merge_snapshots([own])
+
+        with self._locked():
+            snapshots, live_pids, dead = [own], {own["pid"]}, []
+            for name in sorted(os.listdir(self.directory)):
+                if not (name.startswith("worker-") and name.endswith(".json")) or name == f"worker-{own['pid']}.json":
+                    continue
+                snapshot = self._read_json(name)
+                if not snapshot:
+                    continue
+                if _pid_alive(snapshot.get("pid", -1)):
+                    live_pids.add(snapshot["pid"])
+                    snapshots.append(snapshot)
+                else:
+                    dead.append(name)
+            archive = self._fold_into_archive(dead)
+            if archive:
+                snapshots.append(archive)
+        return merge_snapshots(snapshots, live_pids)
+
+    def _locked(self):
+        """Exclusive lock over the snapshot directory"""
+        return file_lock(self._path(".lock"))
+
+    def _fold_into_archive(self, names: List[str]) -> Optional[Dict[str, Any]]:
+        """Add the counters/histograms of finished workers to archive.json and remove their files"""
+        archive = self._read_json(self.ARCHIVE_NAME)
+        snapshots = [snapshot for snapshot in map(self._read_json, names) if snapshot]
+        if snapshots:
+            merged = merge_snapshots(([archive] if archive else []) + snapshots, live_pids=set())
+            archive = {"pid": None, "updated": time.time(), **merged}
+            self._write_json(self.ARCHIVE_NAME, archive)
+        for name in names:
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                pass
+        return archive
+
+    async def _snapshot_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                self.write()
+            except Exception as e:
+                logger.warning("Metrics snapshot failed: %s", e)
+
+    def start(self, interval: Optional[float] = None):
+        """Write snapshots periodically so other workers can report this one"""
+        if self.enabled and (self._task is None or self._task.done()):
+            os.makedirs(self.directory, exist_ok=True)
+            with self._locked():
+                # A file with our pid belongs to an earlier process (pid reuse after a restart)
+                own_name = f"worker-{os.getpid()}.json"
+                if os.path.exists(self._path(own_name)):
+                    self._fold_into_archive([own_name])
+            interval = interval or settings.METRICS_SNAPSHOT_INTERVAL
+            self._task = asyncio.get_running_loop().create_task(self._snapshot_loop(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.enabled:
+            self.write()
+
+snapshot_store = SnapshotStore()
+
+# ========================================
+# Prometheus text format
+# ========================================
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+def add_gauge_sample(merged: Dict[str, Any], name: str, documentation: str, value: float):
+    """Add a gauge that is read once per scrape (e.g. from the database), not per worker"""
+    merged["metrics"][name] = {
+        "type": "gauge", "help": documentation, "labels": [], "buckets": [],
+        "samples": [[[], value]]
+    }
+
+def render_prometheus(merged: Dict[str, Any]) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name, metric in sorted(merged["metrics"].items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        labelnames = metric.get("labels", [])
+        for labels, value in metric["samples"]:
+            if metric["type"] == "histogram":
+                cumulative = 0
+                for bound, count in zip(metric["buckets"] + [float("inf")], value[:-1]):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labelnames, labels, ('le', le))} {_format_value(cumulative)}")
+                lines.append(f"{name}_sum{_format_labels(labelnames, labels)} {_format_value(value[-1])}")
+                lines.append(f"{name}_count{_format_labels(labelnames, labels)} {_format_value(cumulative)}")
+            else:
+                lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+# ========================================
+# Application metrics
+# ========================================
+
+WEBHOOK_EVENTS = Counter(
+    "line_webhook_events_total", "LINE webhook events received", ["event_type"]
+)
+HANDLER_OUTCOMES = Counter(
+    "line_handler_outcomes_total", "Webhook event handler results", ["event_type", "outcome"]
+)
+GEMINI_LATENCY = Histogram(
+    "gemini_request_duration_seconds", "Gemini API call latency", ["operation"],
+    buckets=(0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0)
+)
+GEMINI_ERRORS = Counter(
+    "gemini_errors_total", "Failed Gemini API calls", ["operation"]
+)
+DB_TRANSACTION_LATENCY = Histogram(
+    "db_transaction_duration_seconds", "Database transaction time from BEGIN to COMMIT/ROLLBACK", ["outcome"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+STAGE_LATENCY = Histogram(
+    "hot_path_stage_duration_seconds", "Webhook hot-path stage latency (ws_broadcast, line_reply, ...)", ["stage"]
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "websocket_connections", "Open admin WebSocket connections"
+)
+WEBSOCKET_DROPPED = Counter(
+    "websocket_dropped_frames_total", "Admin WebSocket frames dropped or connections closed for slow consumers", ["reason"]
+)
+WS_BUS_MESSAGES = Counter(
+    "ws_event_bus_messages_total", "Cross-worker WebSocket event bus messages", ["transport", "direction"]
+)
+WS_BUS_LATENCY = Histogram(
+    "ws_event_bus_delivery_seconds", "Publish-to-deliver latency of events from other workers", ["transport"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+WS_BATCH_EVENTS = Histogram(
+    "ws_batch_events", "Events per micro-batch flushed to admin WebSockets",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+WS_SUPERSEDED = Counter(
+    "ws_superseded_events_total", "Admin WebSocket events collapsed into a later event of the same batch", ["type"]
+)
+CACHE_HITS = Counter("cache_hits_total", "In-process cache hits", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "In-process cache misses", ["cache"])
+CACHE_ENTRIES = Gauge("cache_entries", "Entries held in an in-process cache", ["cache"])
+
+_caches: Dict[str, Any] = {}
+
+def register_cache(name: str, cache: Any):
+    """Export ``cache.hits`` / ``cache.misses`` / ``len(cache)`` under ``cache=name``"""
+    _caches[name] = cache
+
+def _collect_caches():
+    for name, cache in _caches.items():
+        CACHE_HITS.set_total(cache.hits, cache=name)
+        CACHE_MISSES.set_total(cache.misses, cache=name)
+        CACHE_ENTRIES.set(len(cache), cache=name)
+
+REGISTRY.add_collector(_collect_caches)
+
+AI_ADMITTED = Counter("ai_admission_admitted_total", "AI generation requests admitted by the rate limiter")
+AI_QUEUED = Counter("ai_admission_queued_total", "AI generation requests that waited for global capacity")
+AI_REJECTED = Counter(
+    "ai_admission_rejected_total", "AI generation requests rejected by the rate limiter", ["reason"]
+)
+AI_WAITING = Gauge("ai_admission_waiting_requests", "AI generation requests waiting for global capacity")
+
+_rate_limiter: Optional[Any] = None
+
+def register_rate_limiter(limiter: Any):
+    """Export the admitted / queued / rejected counters and queue depth of ``limiter``"""
+    global _rate_limiter
+    _rate_limiter = limiter
+
+def _collect_rate_limiter():
+    if _rate_limiter is None:
+        return
+    stats = _rate_limiter.stats()
+    AI_ADMITTED.set_total(stats["admitted"])
+    AI_QUEUED.set_total(stats["queued"])
+    for reason, count in stats["rejected"].items():
+        AI_REJECTED.set_total(count, reason=reason)
+    AI_WAITING.set(stats["waiting_requests"])
+
+REGISTRY.add_collector(_collect_rate_limiter)
+
+def instrument_engine(sync_engine):
+    """Record BEGIN -> COMMIT/ROLLBACK time of every transaction on ``sync_engine``"""
+    from sqlalchemy import event
+
+    @event.listens_for(sync_engine, "begin")
+    def _begin(conn):
+        conn.info["metrics_tx_started"] = time.perf_counter()
+
+    def _finish(conn, outcome):
+        started = conn.info.pop("metrics_tx_started", None)
+        if started is not None:
+            DB_TRANSACTION_LATENCY.observe(time.perf_counter() - started, outcome=outcome)
+
+    event.listen(sync_engine, "commit", lambda conn: _finish(conn, "commit"))
+    event.listen(sync_engine, "rollback", lambda conn: _finish(conn, "rollback"))
+
+__all__ = [
+    'Counter', 'Gauge', 'Histogram', 'MetricsRegistry', 'REGISTRY', 'SnapshotStore',
+    'add_gauge_sample', 'merge_snapshots', 'render_prometheus', 'snapshot_store', 'register_cache', 'register_rate_limiter', 'instrument_engine',
+    'WEBHOOK_EVENTS', 'HANDLER_OUTCOMES', 'GEMINI_LATENCY', 'GEMINI_ERRORS',
+    'DB_TRANSACTION_LATENCY', 'STAGE_LATENCY', 'WEBSOCKET_CONNECTIONS', 'WEBSOCKET_DROPPED',
+    'WS_BUS_MESSAGES', 'WS_BUS_LATENCY',
+    'CACHE_HITS', 'CACHE_MISSES', 'CACHE_ENTRIES',
+    'AI_ADMITTED', 'AI_QUEUED', 'AI_REJECTED', 'AI_WAITING'
+]
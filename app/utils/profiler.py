@@ -0,0 +1,199 @@
+"""
+On-demand statistical sampling profiler
+
+A background thread takes ``sys._current_frames()`` every ``interval`` seconds
+and counts the stack of every thread - the event loop, executor threads running
+Gemini calls, aiosqlite workers - in collapsed ("folded") form:
+
+    MainThread;main (app/main.py:1);handler (app/x.py:10) 42
+
+which ``flamegraph.pl``, speedscope or inferno read directly. Threads that are
+just waiting (selector poll, idle executor workers) are left out by default.
+
+While sampling, the event loop also gets a heartbeat callback. When the
+heartbeat is late by more than ``block_threshold`` the sampler records the loop
+thread's current stack, so blocking calls on the loop are reported together
+with where they happened.
+"""
+
+import asyncio
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+# Leaf frames of threads that are parked, not working
+_IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+_WORKER_SUFFIX = re.compile(r"_\d+$")
+
+_PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _short_path(filename: str) -> str:
+    marker = "site-packages" + os.sep
+    index = filename.rfind(marker)
+    if index >= 0:
+        return filename[index + len(marker):]
+    if filename.startswith(_PROJECT_ROOT):
+        return os.path.relpath(filename, _PROJECT_ROOT)
+    return os.path.basename(filename)
+
+def _thread_label(name: str) -> str:
+    """Fold executor worker numbers so asyncio_N / ThreadPoolExecutor-0_N share a root"""
+    return _WORKER_SUFFIX.sub("", name)
+
+class SamplingProfiler:
+    """Collect collapsed stacks of all threads for a fixed time window"""
+
+    def __init__(self, interval: float = 0.01, include_idle: bool = False,
+                 block_threshold: float = 0.1, max_depth: int = 128):
+        self.interval = max(interval, 0.001)
+        self.include_idle = include_idle
+        self.block_threshold = block_threshold
+        self.max_depth = max_depth
+
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.blocking: List[Dict[str, Any]] = []
+
+        self._labels: Dict[Tuple[str, str, int], str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._heartbeat = 0.0
+        self._heartbeat_handle: Optional[asyncio.TimerHandle] = None
+        self._started = 0.0
+        self._elapsed = 0.0
+
+    def _label(self, code) -> str:
+        key = (code.co_filename, code.co_name, code.co_firstlineno)
+        label = self._labels.get(key)
+        if label is None:
+            # ';' separates frames in the collapsed format
+            label = f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[key] = label
+        return label
+
+    def _stack(self, frame) -> Tuple[List[str], Optional[Tuple[str, str]]]:
+        frames = []
+        leaf = (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) if frame else None
+        while frame is not None and len(frames) < self.max_depth:
+            frames.append(self._label(frame.f_code))
+            frame = frame.f_back
+        frames.reverse()
+        return frames, leaf
+
+    def _sample_once(self, own_id: int, names: Dict[int, str]):
+        now = time.perf_counter()
+        # Lag = how late the next heartbeat is, not the time since the last one
+        # (which normally grows to ``interval`` between beats)
+        loop_lag = max(0.0, now - self._heartbeat - self.interval) if self._loop is not None else 0.0
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            frames, leaf = self._stack(frame)
+            if not self.include_idle and leaf in _IDLE_LEAVES:
+                continue
+            thread_name = _thread_label(names.get(thread_id, f"thread-{thread_id}"))
+            self.stacks[";".join([thread_name] + frames)] += 1
+
+            if thread_id == self._loop_thread_id and loop_lag > self.block_threshold:
+                self._record_blocking(loop_lag, frames)
+        self.samples += 1
+
+    def _record_blocking(self, lag: float, frames: List[str]):
+        """Keep one entry per blocking episode, updated while the loop stays blocked"""
+        started_at = round(time.perf_counter() - lag - self._started, 3)
+        if self.blocking and abs(self.blocking[-1]["started_at_s"] - started_at) < self.interval * 2:
+            self.blocking[-1]["blocked_ms"] = round(lag * 1000, 1)
+            return
+        self.blocking.append({
+            "started_at_s": started_at,
+            "blocked_ms": round(lag * 1000, 1),
+            "stack": frames[-12:]
+        })
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.is_set():
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            self._sample_once(own_id, names)
+            self._stop.wait(self.interval)
+
+    def _beat(self):
+        self._heartbeat = time.perf_counter()
+        if not self._stop.is_set():
+            self._heartbeat_handle = self._loop.call_later(self.interval, self._beat)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Start sampling; pass the running loop to also watch for blocking calls"""
+        self._started = time.perf_counter()
+        if loop is not None:
+            self._loop = loop
+            self._loop_thread_id = threading.get_ident()
+            self._heartbeat = self._started
+            self._heartbeat_handle = loop.call_later(self.interval, self._beat)
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat_handle is not None:
+            self._heartbeat_handle.cancel()
+        if self._thread is not None:
+            self._thread.join()
+        self._elapsed = time.perf_counter() - self._started
+
+    async def run(self, duration: float) -> "SamplingProfiler":
+        """Profile every thread for ``duration`` seconds without blocking the loop"""
+        self.start(asyncio.get_running_loop())
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            await asyncio.get_running_loop().run_in_executor(None, self.stop)
+        return self
+
+    def collapsed(self) -> str:
+        """Folded stacks, one ``frame;frame;... count`` line per distinct stack"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def summary(self, top: int = 25) -> Dict[str, Any]:
+        """Self/total sample counts per function and per thread"""
+        self_counts: Counter = Counter()
+        total_counts: Counter = Counter()
+        thread_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            thread_counts[frames[0]] += count
+            if len(frames) > 1:
+                self_counts[frames[-1]] += count
+            for frame in set(frames[1:]):
+                total_counts[frame] += count
+
+        def _rows(counter):
+            return [{"function": name, "samples": count} for name, count in counter.most_common(top)]
+
+        return {
+            "duration_s": round(self._elapsed, 3),
+            "interval_ms": round(self.interval * 1000, 2),
+            "samples": self.samples,
+            "threads": dict(thread_counts.most_common()),
+            "top_self": _rows(self_counts),
+            "top_total": _rows(total_counts),
+            "loop_blocking": self.blocking,
+            "block_threshold_ms": round(self.block_threshold * 1000, 1)
+        }
+
+# Only one profile at a time - concurrent samplers would skew each other
+profiler_lock = asyncio.Lock()
+
+__all__ = ['SamplingProfiler', 'profiler_lock']
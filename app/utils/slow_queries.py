@@ -0,0 +1,201 @@
+"""
+Slow-query log
+
+Engine event hooks time every statement. Executions slower than
+``SLOW_QUERY_THRESHOLD_MS`` are folded into a bounded in-process store keyed by
+the normalized statement text (SQLAlchemy already binds parameters, and long
+``IN (?, ?, ...)`` lists are collapsed so they share one entry). Each entry
+keeps count/total/max time and the shape of the parameters - their types, never
+their values.
+
+The EXPLAIN plan is captured lazily: the last parameters of an entry are held
+only until its plan has been taken (``capture_plans``, called by the admin
+endpoint), then dropped. EXPLAIN runs on its own connection outside the hot
+path, as ``EXPLAIN QUERY PLAN`` on SQLite and ``EXPLAIN`` on PostgreSQL.
+"""
+
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+
+_PLACEHOLDER = r"(?:\?|%s|%\(\w+\)s|\$\d+|:\w+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+def normalize_statement(statement: str) -> str:
+    """Single-line statement with expanded placeholder lists collapsed to ``(...)``"""
+    return _PLACEHOLDER_LIST.sub("(...)", _WHITESPACE.sub(" ", statement).strip())
+
+def _value_shape(parameters: Any) -> str:
+    if parameters is None:
+        return "()"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {type(value).__name__}" for key, value in parameters.items()) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return "(" + ", ".join(type(value).__name__ for value in parameters) + ")"
+    return type(parameters).__name__
+
+def parameter_shape(parameters: Any, executemany: bool = False) -> str:
+    """Types of the bound parameters, e.g. ``(str, int)`` or ``25 x {id: int}``"""
+    if executemany and isinstance(parameters, (list, tuple)) and parameters:
+        return f"{len(parameters)} x {_value_shape(parameters[0])}"
+    return _value_shape(parameters)
+
+def explain_prefix(dialect_name: str) -> str:
+    return "EXPLAIN QUERY PLAN " if dialect_name == "sqlite" else "EXPLAIN "
+
+class SlowQueryLog:
+    """Bounded per-statement aggregate of executions over the threshold"""
+
+    def __init__(self, threshold_ms: Optional[float] = None, max_entries: Optional[int] = None,
+                 enabled: Optional[bool] = None):
+        self.enabled = settings.SLOW_QUERY_ENABLED if enabled is None else enabled
+        self.threshold_ms = settings.SLOW_QUERY_THRESHOLD_MS if threshold_ms is None else threshold_ms
+        self.max_entries = max_entries or settings.SLOW_QUERY_MAX_ENTRIES
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.statements_seen = 0
+        self.slow_executions = 0
+        self.evicted = 0
+
+    def record(self, statement: str, parameters: Any, elapsed_ms: float,
+               executemany: bool = False, dialect: str = ""):
+        """Count one execution; only those over the threshold are kept"""
+        self.statements_seen += 1
+        if elapsed_ms < self.threshold_ms:
+            return
+        key = normalize_statement(statement)
+        now = datetime.now().isoformat()
+        with self._lock:
+            self.slow_executions += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                if len(self._entries) >= self.max_entries:
+                    # Drop the entry that has cost the least so far
+                    cheapest = min(self._entries, key=lambda k: self._entries[k]["total_ms"])
+                    del self._entries[cheapest]
+                    self.evicted += 1
+                entry = self._entries[key] = {
+                    "statement": key,
+                    "operation": key.split(" ", 1)[0].upper(),
+                    "dialect": dialect,
+                    "count": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "last_ms": 0.0,
+                    "first_seen": now,
+                    "param_shape": parameter_shape(parameters, executemany),
+                    "plan": None,
+                    "plan_error": None,
+                    "_statement": statement,
+                    "_parameters": None
+                }
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["last_ms"] = elapsed_ms
+            entry["last_seen"] = now
+            if elapsed_ms > entry["max_ms"]:
+                entry["max_ms"] = elapsed_ms
+            if entry["plan"] is None and entry["plan_error"] is None:
+                # Held for the lazy EXPLAIN only
+                entry["_statement"] = statement
+                entry["_parameters"] = parameters[0] if executemany and parameters else parameters
+
+    def top(self, limit: int = 20, sort: str = "total_ms") -> List[Dict[str, Any]]:
+        """Worst statements first (``total_ms``, ``max_ms`` or ``count``)"""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda e: e[sort], reverse=True)[:limit]
+            return [self._public(entry) for entry in entries]
+
+    @staticmethod
+    def _public(entry: Dict[str, Any]) -> Dict[str, Any]:
+        result = {key: value for key, value in entry.items() if not key.startswith("_")}
+        result["avg_ms"] = round(entry["total_ms"] / entry["count"], 2) if entry["count"] else 0
+        for key in ("total_ms", "max_ms", "last_ms"):
+            result[key] = round(entry[key], 2)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold_ms": self.threshold_ms,
+                "statements_seen": self.statements_seen,
+                "slow_executions": self.slow_executions,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "evicted": self.evicted
+            }
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self.statements_seen = self.slow_executions = self.evicted = 0
+
+    async def capture_plans(self, async_engine, statements: Optional[List[str]] = None) -> int:
+        """EXPLAIN entries that have no plan yet (optionally only ``statements``); returns how many"""
+        with self._lock:
+            pending = [
+                (key, entry["_statement"], entry["_parameters"])
+                for key, entry in self._entries.items()
+                if entry["plan"] is None and entry["plan_error"] is None
+                and (statements is None or key in statements)
+            ]
+        if not pending:
+            return 0
+
+        prefix = explain_prefix(async_engine.dialect.name)
+        captured = 0
+        async with async_engine.connect() as conn:
+            for key, statement, parameters in pending:
+                plan, error = None, None
+                if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+                    error = "not explainable"
+                else:
+                    try:
+                        result = await conn.exec_driver_sql(prefix + statement, parameters or ())
+                        plan = [str(row[-1]) for row in result.fetchall()]
+                    except Exception as e:
+                        error = str(e)
+                        await conn.rollback()
+                with self._lock:
+                    entry = self._entries.get(key)
+                    if entry is not None:
+                        entry["plan"], entry["plan_error"] = plan, error
+                        entry["plan_captured_at"] = datetime.now().isoformat()
+                        entry["_parameters"] = None
+                captured += plan is not None
+            await conn.rollback()
+        return captured
+
+    def instrument_engine(self, sync_engine):
+        """Time every statement executed on ``sync_engine``"""
+        from sqlalchemy import event
+
+        if not self.enabled:
+            return
+        dialect = sync_engine.dialect.name
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            # Kept on the execution context so failed statements leave nothing behind
+            if context is not None:
+                context._slow_query_started = time.perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, "_slow_query_started", None)
+            if started is None or statement.startswith("EXPLAIN"):
+                return
+            self.record(statement, parameters, (time.perf_counter() - started) * 1000,
+                        executemany=executemany, dialect=dialect)
+
+# Global log shared by the application engine and the admin endpoint
+slow_query_log = SlowQueryLog()
+
+__all__ = ['SlowQueryLog', 'slow_query_log', 'normalize_statement', 'parameter_shape', 'explain_prefix']
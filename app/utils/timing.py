@@ -0,0 +1,226 @@
+"""
+Per-stage hot-path timing
+
+The webhook pipeline is split into named stages (signature/parse, profile
+fetch, DB writes, Gemini, LINE reply, Telegram, WebSocket broadcast). Each
+stage is wrapped in ``stage(name)``; durations are added to the current request
+(carried in a contextvar together with the request id) and to an in-process
+aggregate per stage. The aggregate is written to ``system_logs`` once per
+``STAGE_TIMING_FLUSH_INTERVAL`` seconds - one row per stage with category
+``performance``, the stage name as subcategory, the mean latency in
+``execution_time`` and the process RSS in ``memory_usage`` - so the hot path
+never pays for an extra DB write.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.utils.metrics import STAGE_LATENCY
+
+logger = logging.getLogger(__name__)
+
+# Request id shared by every log line and stage of one webhook request
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_request_timing_var: ContextVar[Optional["RequestTiming"]] = ContextVar("request_timing", default=None)
+# Set while the aggregate itself is being written so those inserts are not timed
+_timing_suppressed: ContextVar[bool] = ContextVar("timing_suppressed", default=False)
+
+PERFORMANCE_CATEGORY = "performance"
+_WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+class RequestTiming:
+    """Stage durations collected for a single request"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.started = time.perf_counter()
+        self.stages: Dict[str, Dict[str, float]] = {}
+
+    def add(self, name: str, elapsed_ms: float):
+        entry = self.stages.get(name)
+        if entry is None:
+            self.stages[name] = {"count": 1, "total_ms": elapsed_ms}
+        else:
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+
+    def elapsed_ms(self) -> int:
+        return int((time.perf_counter() - self.started) * 1000)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per-stage count and total milliseconds (rounded for logging)"""
+        return {
+            name: {"count": int(entry["count"]), "total_ms": round(entry["total_ms"], 2)}
+            for name, entry in self.stages.items()
+        }
+
+class StageStats:
+    """Running count/sum/max for one stage within a flush window"""
+
+    __slots__ = ("count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0,
+            "max_ms": round(self.max_ms, 2),
+            "total_ms": round(self.total_ms, 2)
+        }
+
+def _current_rss_bytes() -> Optional[int]:
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+class StageTimer:
+    """In-process per-stage aggregate with a periodic flush to system_logs"""
+
+    def __init__(self, enabled: Optional[bool] = None, flush_interval: Optional[float] = None):
+        self.enabled = settings.STAGE_TIMING_ENABLED if enabled is None else enabled
+        self.flush_interval = flush_interval or settings.STAGE_TIMING_FLUSH_INTERVAL
+        self._lock = threading.Lock()
+        self._window: Dict[str, StageStats] = {}
+        self._window_started = time.time()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.flushed_rows = 0
+
+    def record(self, name: str, elapsed_ms: float):
+        """Add one measurement to the current request and the aggregate"""
+        if not self.enabled or _timing_suppressed.get():
+            return
+        STAGE_LATENCY.observe(elapsed_ms / 1000, stage=name)
+        request = _request_timing_var.get()
+        if request is not None:
+            request.add(name, elapsed_ms)
+        with self._lock:
+            stats = self._window.get(name)
+            if stats is None:
+                stats = self._window[name] = StageStats()
+            stats.add(elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Aggregate of the current (not yet flushed) window"""
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in self._window.items()}
+
+    def drain(self) -> Dict[str, Dict[str, float]]:
+        """Return the current window and start a new one"""
+        with self._lock:
+            window, self._window = self._window, {}
+            self._window_started = time.time()
+        return {name: stats.as_dict() for name, stats in window.items() if stats.count}
+
+    async def flush(self) -> int:
+        """Write the current window to system_logs; returns the number of rows"""
+        window = self.drain()
+        if not window:
+            return 0
+
+        from app.db.database import AsyncSessionLocal
+        from app.db.crud_enhanced import log_stage_timings
+
+        token = _timing_suppressed.set(True)
+        try:
+            async with AsyncSessionLocal() as db:
+                rows = await log_stage_timings(db, window, memory_usage=_current_rss_bytes())
+        finally:
+            _timing_suppressed.reset(token)
+        self.flushed_rows += rows
+        return rows
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("Stage timing flush failed: %s", e)
+
+    def start(self):
+        """Start the periodic flush (call from the running event loop)"""
+        if self.enabled and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the periodic flush and write whatever is left"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning("Stage timing flush failed: %s", e)
+
+    def instrument_engine(self, sync_engine):
+        """Time every INSERT/UPDATE/DELETE on ``sync_engine`` as the ``db_write`` stage"""
+        from sqlalchemy import event
+
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if statement.lstrip()[:6].upper() in _WRITE_PREFIXES:
+                conn.info["stage_write_started"] = time.perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            started = conn.info.pop("stage_write_started", None)
+            if started is not None:
+                self.record("db_write", (time.perf_counter() - started) * 1000)
+
+# Global timer used by every instrumented stage
+stage_timer = StageTimer()
+
+def begin_request(request_id: Optional[str] = None) -> RequestTiming:
+    """Start timing a request in the current context and return its collector"""
+    request = RequestTiming(request_id or f"req_{uuid.uuid4().hex[:12]}")
+    request_id_var.set(request.request_id)
+    _request_timing_var.set(request)
+    return request
+
+def current_request_id() -> Optional[str]:
+    """Request id of the webhook request being processed, if any"""
+    return request_id_var.get()
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as stage ``name`` (works around ``await`` too)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_timer.record(name, (time.perf_counter() - started) * 1000)
+
+__all__ = [
+    'PERFORMANCE_CATEGORY', 'RequestTiming', 'StageStats', 'StageTimer',
+    'begin_request', 'current_request_id', 'request_id_var', 'stage', 'stage_timer'
+]
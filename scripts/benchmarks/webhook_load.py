@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Signed LINE webhook load generator
+
+Generates realistic webhook bodies (text, image, follow/unfollow events from a
+pool of users), signs them with a test channel secret so ``WebhookParser``
+accepts them, and replays them against the app at a fixed request rate (open
+loop) or concurrency (closed loop). LINE and Telegram are served by a local
+stub server, and Gemini runs on the offline fake backend, so nothing leaves
+the machine.
+
+Reports per scenario: p50/p95/p99 latency, requests/s, events/s, DB writes
+(INSERT/UPDATE/DELETE statements by table) and stub API calls.
+
+Usage:
+    # In-process (httpx ASGI transport, temporary SQLite DB)
+    python scripts/benchmarks/webhook_load.py --scenario mixed --requests 500 --concurrency 20
+    python scripts/benchmarks/webhook_load.py --scenario text,image --rps 40 --duration 15
+
+    # Against a running server (start it with the env printed by --print-env)
+    python scripts/benchmarks/webhook_load.py --print-env --stub-port 9900
+    python scripts/benchmarks/webhook_load.py --url http://127.0.0.1:8000 --stub-port 9900 --scenario mixed
+
+In open-loop mode latency is measured from the scheduled send time, so a slow
+server shows up as queueing delay instead of a lower request rate.
+"""
+
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import hmac
+import io
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+import httpx
+from aiohttp import web
+
+BENCH_CHANNEL_SECRET = "bench-channel-secret"
+BENCH_ACCESS_TOKEN = "bench-access-token"
+BENCH_TELEGRAM_TOKEN = "bench-telegram-token"
+
+SCENARIOS = {
+    "text": {"text": 1.0},
+    "image": {"image": 1.0},
+    "follow": {"follow": 1.0},
+    "unfollow": {"unfollow": 1.0},
+    "mixed": {"text": 0.75, "image": 0.1, "follow": 0.1, "unfollow": 0.05},
+}
+
+SAMPLE_TEXTS = [
+    "สวัสดีค่ะ",
+    "ลาพักผ่อนประจำปีได้กี่วันคะ",
+    "ขอสำเนา ก.พ.7 ต้องทำอย่างไร",
+    "ทำบัตรประจำตัวเจ้าหน้าที่ของรัฐใช้เอกสารอะไรบ้าง",
+    "เบิกค่ารักษาพยาบาลต้องยื่นภายในกี่วัน",
+    "ขอบคุณมากค่ะ",
+    "สอบถามเรื่องการเลื่อนเงินเดือนรอบนี้ครับ",
+    "ลาป่วยเกิน 30 วันต้องใช้ใบรับรองแพทย์ไหม",
+]
+
+# ========================================
+# Webhook bodies
+# ========================================
+
+def sign_body(body: bytes, channel_secret: str) -> str:
+    """X-Line-Signature: base64(HMAC-SHA256(channel_secret, body))"""
+    digest = hmac.new(channel_secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+class WebhookBodyGenerator:
+    """Deterministic stream of LINE webhook bodies for one scenario"""
+
+    def __init__(self, mix: Dict[str, float], users: int, events_per_request: int, seed: int):
+        self.rng = random.Random(seed)
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.user_ids = ["U" + hashlib.md5(f"bench-user-{i}".encode()).hexdigest() for i in range(users)]
+        self.events_per_request = events_per_request
+
+    def _base_event(self, event_type: str, user_id: str) -> Dict[str, Any]:
+        return {
+            "type": event_type,
+            "mode": "active",
+            "timestamp": int(time.time() * 1000),
+            "source": {"type": "user", "userId": user_id},
+            "webhookEventId": uuid.UUID(int=self.rng.getrandbits(128)).hex.upper()[:26],
+            "deliveryContext": {"isRedelivery": False},
+        }
+
+    def _event(self, kind: str) -> Dict[str, Any]:
+        user_id = self.rng.choice(self.user_ids)
+        message_id = str(self.rng.randint(10 ** 17, 10 ** 18 - 1))
+        if kind == "text":
+            event = self._base_event("message", user_id)
+            event["replyToken"] = uuid.UUID(int=self.rng.getrandbits(128)).hex
+            event["message"] = {
+                "type": "text", "id": message_id, "quoteToken": f"q{message_id}",
+                "text": self.rng.choice(SAMPLE_TEXTS)
+            }
+        elif kind == "image":
+            event = self._base_event("message", user_id)
+            event["replyToken"] = uuid.UUID(int=self.rng.getrandbits(128)).hex
+            event["message"] = {
+                "type": "image", "id": message_id, "quoteToken": f"q{message_id}",
+                "contentProvider": {"type": "line"}
+            }
+        elif kind == "follow":
+            event = self._base_event("follow", user_id)
+            event["replyToken"] = uuid.UUID(int=self.rng.getrandbits(128)).hex
+            event["follow"] = {"isUnblocked": False}
+        else:
+            event = self._base_event("unfollow", user_id)
+        return event
+
+    def bodies(self) -> Iterator[Dict[str, Any]]:
+        while True:
+            kinds = self.rng.choices(self.kinds, weights=self.weights, k=self.events_per_request)
+            yield {
+                "destination": "U" + "0" * 32,
+                "events": [self._event(kind) for kind in kinds]
+            }
+
+# ========================================
+# LINE / Telegram stub server
+# ========================================
+
+def _make_test_image() -> bytes:
+    try:
+        from PIL import Image
+        output = io.BytesIO()
+        Image.new("RGB", (1280, 960), (40, 120, 200)).save(output, format="JPEG", quality=90)
+        return output.getvalue()
+    except ImportError:
+        # 1x1 PNG
+        return base64.b64decode(
+            "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg=="
+        )
+
+class StubServer:
+    """Minimal LINE Messaging API + Telegram Bot API that counts every call"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency = latency_ms / 1000.0
+        self.calls: Counter = Counter()
+        self.image = _make_test_image()
+        self.runner: Optional[web.AppRunner] = None
+        self.port: Optional[int] = None
+
+    async def _delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def profile(self, request):
+        self.calls["line_profile"] += 1
+        await self._delay()
+        user_id = request.match_info["user_id"]
+        return web.json_response({
+            "userId": user_id,
+            "displayName": f"ผู้ทดสอบ {user_id[-4:]}",
+            "pictureUrl": f"https://example.invalid/{user_id}.jpg",
+            "statusMessage": "benchmark",
+            "language": "th"
+        })
+
+    async def loading(self, request):
+        self.calls["line_loading"] += 1
+        await self._delay()
+        return web.json_response({}, status=202)
+
+    async def send(self, request):
+        kind = "line_reply" if request.path.endswith("/reply") else "line_push"
+        self.calls[kind] += 1
+        await self._delay()
+        return web.json_response({"sentMessages": [{"id": str(uuid.uuid4().int)[:18], "quoteToken": "q"}]})
+
+    async def content(self, request):
+        self.calls["line_content"] += 1
+        await self._delay()
+        return web.Response(body=self.image, content_type="image/jpeg")
+
+    async def telegram(self, request):
+        self.calls["telegram_send"] += 1
+        await self._delay()
+        return web.json_response({
+            "ok": True,
+            "result": {"message_id": self.calls["telegram_send"], "chat": {"id": 1}, "date": int(time.time())}
+        })
+
+    async def other(self, request):
+        self.calls[f"unhandled {request.method} {request.path}"] += 1
+        return web.json_response({})
+
+    async def start(self, port: int = 0) -> int:
+        app = web.Application()
+        app.router.add_get("/v2/bot/profile/{user_id}", self.profile)
+        app.router.add_post("/v2/bot/chat/loading/start", self.loading)
+        app.router.add_post("/v2/bot/message/reply", self.send)
+        app.router.add_post("/v2/bot/message/push", self.send)
+        app.router.add_get("/v2/bot/message/{message_id}/content", self.content)
+        app.router.add_route("*", "/bot{token}/sendMessage", self.telegram)
+        app.router.add_route("*", "/{tail:.*}", self.other)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self.port
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+
+def bench_environment(stub_url: str, args) -> Dict[str, str]:
+    """Environment the app needs to talk to the stubs and the fake Gemini backend"""
+    env = {
+        "LINE_CHANNEL_SECRET": args.secret,
+        "LINE_CHANNEL_ACCESS_TOKEN": BENCH_ACCESS_TOKEN,
+        "TELEGRAM_BOT_TOKEN": BENCH_TELEGRAM_TOKEN,
+        "TELEGRAM_CHAT_ID": "1",
+        "LINE_API_BASE_URL": stub_url,
+        "LINE_DATA_API_BASE_URL": stub_url,
+        "TELEGRAM_API_BASE_URL": stub_url,
+    }
+    if not args.real_gemini:
+        env.update({
+            "GEMINI_BACKEND": "fake",
+            "GEMINI_API_KEY": os.environ.get("GEMINI_API_KEY", ""),
+            "GEMINI_FAKE_LATENCY_MS": str(args.gemini_latency_ms),
+            "GEMINI_FAKE_ERROR_RATE": str(args.gemini_error_rate),
+            "GEMINI_FAKE_SEED": str(args.seed),
+        })
+    if args.no_rate_limit:
+        env["AI_RATE_LIMIT_ENABLED"] = "false"
+    return env
+
+# ========================================
+# DB write counting (in-process mode)
+# ========================================
+
+WRITE_STATEMENT = re.compile(r"^\s*(INSERT\s+(?:OR\s+\w+\s+)?INTO|UPDATE|DELETE\s+FROM)\s+\"?(\w+)", re.IGNORECASE)
+
+class DbWriteCounter:
+    """Counts INSERT/UPDATE/DELETE statements per table on the app's engine"""
+
+    def __init__(self):
+        self.writes: Counter = Counter()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        match = WRITE_STATEMENT.match(statement)
+        if match:
+            verb = match.group(1).split()[0].upper()
+            self.writes[f"{verb} {match.group(2)}"] += 1
+
+    def attach(self, async_engine):
+        from sqlalchemy import event
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self)
+
+# ========================================
+# Load drivers
+# ========================================
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+async def _send(client: httpx.AsyncClient, payload: Dict[str, Any], secret: str) -> int:
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    response = await client.post(
+        "/webhook",
+        content=body,
+        headers={"Content-Type": "application/json", "X-Line-Signature": sign_body(body, secret)}
+    )
+    if response.status_code != 200:
+        return response.status_code
+    try:
+        data = response.json()
+    except ValueError:
+        return 200
+    # The webhook reports handler failures in the body with HTTP 200
+    return 500 if isinstance(data, dict) and data.get("status") == "error" else 200
+
+async def run_closed_loop(client, bodies, secret, requests, concurrency, duration):
+    latencies, statuses = [], Counter()
+    deadline = time.perf_counter() + duration if duration else None
+    remaining = [requests]
+
+    async def worker():
+        while True:
+            if deadline and time.perf_counter() >= deadline:
+                return
+            if not deadline:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            payload = next(bodies)
+            started = time.perf_counter()
+            try:
+                status = await _send(client, payload, secret)
+            except Exception as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += len(payload["events"])
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, statuses
+
+async def run_open_loop(client, bodies, secret, requests, rps, duration):
+    latencies, statuses = [], Counter()
+    total = int(rps * duration) if duration else requests
+    start = time.perf_counter()
+
+    async def fire(scheduled: float, payload):
+        try:
+            status = await _send(client, payload, secret)
+        except Exception as e:
+            status = type(e).__name__
+        latencies.append(time.perf_counter() - scheduled)
+        statuses[status] += len(payload["events"])
+
+    tasks = []
+    for i in range(total):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(fire(scheduled, next(bodies))))
+    await asyncio.gather(*tasks)
+    return latencies, statuses
+
+# ========================================
+# Main
+# ========================================
+
+_DEVNULL = None
+
+@contextlib.contextmanager
+def quiet(enabled: bool):
+    """Silence the app's logging and stray print() output while measuring"""
+    global _DEVNULL
+    if not enabled:
+        yield
+        return
+    # Kept open for the whole run: loggers created while silenced keep a reference to it
+    if _DEVNULL is None:
+        _DEVNULL = open(os.devnull, "w")
+    logging.disable(logging.CRITICAL)
+    try:
+        with contextlib.redirect_stdout(_DEVNULL):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+async def run_scenario(name, args, client, stubs, db_counter):
+    generator = WebhookBodyGenerator(SCENARIOS[name], args.users, args.events_per_request, args.seed)
+    bodies = generator.bodies()
+    stub_before = Counter(stubs.calls)
+    writes_before = Counter(db_counter.writes) if db_counter else Counter()
+
+    started = time.perf_counter()
+    with quiet(not args.verbose):
+        if args.rps:
+            latencies, statuses = await run_open_loop(client, bodies, args.secret, args.requests, args.rps, args.duration)
+        else:
+            latencies, statuses = await run_closed_loop(client, bodies, args.secret, args.requests,
+                                                        args.concurrency, args.duration)
+        if args.drain:
+            # Let background work (usage rollups, notifications) finish before counting writes
+            await asyncio.sleep(args.drain)
+    elapsed = time.perf_counter() - started
+
+    events = sum(statuses.values())
+    writes = (Counter(db_counter.writes) - writes_before) if db_counter else None
+    return {
+        "scenario": name,
+        "mode": f"rps={args.rps}" if args.rps else f"concurrency={args.concurrency}",
+        "requests": len(latencies),
+        "events": events,
+        "errors": events - statuses.get(200, 0),
+        "status": {str(k): v for k, v in statuses.items()},
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0,
+        "events_per_s": round(events / elapsed, 2) if elapsed else 0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(max(latencies) * 1000, 2) if latencies else 0,
+        },
+        "db_writes": None if writes is None else {
+            "total": sum(writes.values()),
+            "per_event": round(sum(writes.values()) / events, 2) if events else 0,
+            "by_statement": dict(writes.most_common())
+        },
+        "stub_calls": dict(Counter(stubs.calls) - stub_before)
+    }
+
+def print_report(result: Dict[str, Any]):
+    latency = result["latency_ms"]
+    print(f"\n=== {result['scenario']} ({result['mode']}) ===")
+    print(f"requests: {result['requests']}  events: {result['events']}  errors: {result['errors']}  "
+          f"elapsed: {result['elapsed_s']}s")
+    print(f"throughput: {result['requests_per_s']} req/s, {result['events_per_s']} events/s")
+    print(f"latency ms: p50={latency['p50']}  p95={latency['p95']}  p99={latency['p99']}  max={latency['max']}")
+    if result["db_writes"] is not None:
+        writes = result["db_writes"]
+        print(f"db writes: {writes['total']} ({writes['per_event']}/event)")
+        for statement, count in writes["by_statement"].items():
+            print(f"    {statement:<40} {count}")
+    print(f"stub calls: {json.dumps(result['stub_calls'], ensure_ascii=False)}")
+    if result["errors"]:
+        print(f"status breakdown: {result['status']}")
+
+async def main_async(args) -> List[Dict[str, Any]]:
+    stubs = StubServer(latency_ms=args.stub_latency_ms)
+    port = await stubs.start(args.stub_port)
+    stub_url = f"http://127.0.0.1:{port}"
+    env = bench_environment(stub_url, args)
+
+    if args.print_env:
+        for key, value in env.items():
+            print(f"export {key}='{value}'")
+        await stubs.stop()
+        return []
+
+    db_counter = None
+    app = None
+    tmpdir = None
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        print(f"Target: {args.url} (stubs on {stub_url})")
+    else:
+        # Configure the app before it is imported - settings are read at import time
+        tmpdir = tempfile.TemporaryDirectory(prefix="webhook_bench_")
+        env.setdefault("DATABASE_URL", args.database_url or f"sqlite+aiosqlite:///{tmpdir.name}/bench.db")
+        env.setdefault("KNOWLEDGE_INDEX_DIR", os.path.join(tmpdir.name, "knowledge_index"))
+        os.environ.update(env)
+
+        with quiet(not args.verbose):
+            from app.main import app
+            from app.db.database import async_engine
+            await app.router.startup()
+
+        db_counter = DbWriteCounter()
+        db_counter.attach(async_engine)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                   timeout=args.timeout)
+        print(f"Target: in-process ASGI app (DB {env['DATABASE_URL']}, stubs on {stub_url})")
+
+    results = []
+    try:
+        for name in args.scenario.split(","):
+            name = name.strip()
+            if name not in SCENARIOS:
+                raise SystemExit(f"Unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})")
+            result = await run_scenario(name, args, client, stubs, db_counter)
+            print_report(result)
+            results.append(result)
+    finally:
+        await client.aclose()
+        if app is not None:
+            with quiet(not args.verbose):
+                await app.router.shutdown()
+                await async_engine.dispose()
+        await stubs.stop()
+        if tmpdir is not None:
+            tmpdir.cleanup()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Signed LINE webhook load generator")
+    parser.add_argument("--scenario", default="mixed", help=f"comma separated: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario (ignored with --duration)")
+    parser.add_argument("--duration", type=float, default=0, help="run each scenario for N seconds instead")
+    parser.add_argument("--concurrency", type=int, default=10, help="closed-loop workers")
+    parser.add_argument("--rps", type=float, default=0, help="open-loop request rate (overrides --concurrency)")
+    parser.add_argument("--users", type=int, default=50, help="distinct LINE users in the pool")
+    parser.add_argument("--events-per-request", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--url", help="target a running server instead of the in-process app")
+    parser.add_argument("--secret", default=BENCH_CHANNEL_SECRET, help="channel secret used for signing")
+    parser.add_argument("--database-url", help="in-process DB (default: temporary SQLite file)")
+    parser.add_argument("--stub-port", type=int, default=0, help="port for the LINE/Telegram stub server")
+    parser.add_argument("--stub-latency-ms", type=float, default=20)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800)
+    parser.add_argument("--gemini-error-rate", type=float, default=0.0)
+    parser.add_argument("--real-gemini", action="store_true", help="do not switch to the fake Gemini backend")
+    parser.add_argument("--no-rate-limit", action="store_true", help="disable AI admission control")
+    parser.add_argument("--drain", type=float, default=0.5, help="seconds to wait for background writes")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--print-env", action="store_true", help="print env for an external server and exit")
+    parser.add_argument("--verbose", action="store_true", help="keep the app's console output")
+    args = parser.parse_args()
+
+    if args.rps <= 0 and args.concurrency <= 0:
+        parser.error("--concurrency or --rps must be positive")
+    if args.rps and args.duration <= 0 and args.requests <= 0:
+        parser.error("--requests or --duration must be positive")
+
+    results = asyncio.run(main_async(args))
+    if args.json and results:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"\nResults written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Backfill the chat / friend activity rollup tables from the raw history
+
+chat_activity_hourly, chat_reach_daily and friend_activity_hourly are kept up
+to date from a per-worker buffer (app/services/activity_rollups.py), and the
+app fills them on startup while they are still empty. Run this to rebuild
+them from chat_history and friend_activity, e.g. to repair a period whose
+events were lost when a worker was killed before its flush. Rows from the
+start of the first day in the window are replaced; run it while the webhook
+is idle (or only for past days).
+
+Usage:
+    python scripts/database/backfill_activity_rollups.py            # everything
+    python scripts/database/backfill_activity_rollups.py --days 30  # last 30 days
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.database import AsyncSessionLocal, create_db_and_tables
+from app.db.crud_enhanced import rebuild_activity_rollups
+
+async def backfill(days=None, batch_size=5000):
+    await create_db_and_tables()
+    since = datetime.utcnow() - timedelta(days=days) if days else None
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        stats = await rebuild_activity_rollups(db, since=since, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ Rebuilt rollups {'for the last %d days' % days if days else 'for all history'} in {elapsed:.1f}s")
+    print(f"   chat_history rows:      {stats['chat_rows']}")
+    print(f"   friend_activity rows:   {stats['friend_rows']}")
+    print(f"   chat_activity_hourly:   {stats['chat_hourly_rows']} rows")
+    print(f"   chat_reach_daily:       {stats['reach_days']} rows")
+    print(f"   friend_activity_hourly: {stats['friend_hourly_rows']} rows")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild chat/friend activity rollup tables")
+    parser.add_argument("--days", type=int, default=None, help="Only rebuild the last N days (default: all)")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Raw rows fetched per round trip")
+    args = parser.parse_args()
+    asyncio.run(backfill(args.days, args.batch_size))
+
+if __name__ == "__main__":
+    main()
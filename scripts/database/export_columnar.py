@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Incremental columnar export of chat_history, friend_activity and system_logs
+
+Writes date-partitioned Parquet (or Arrow IPC) files under
+ANALYTICS_EXPORT_DIR (default data/exports) for notebook analysis. Each run
+only reads the rows added since the previous one (see _watermarks.json), so it
+is cheap to schedule nightly. Delete the export directory to start over.
+Requires pyarrow.
+
+Usage:
+    python scripts/database/export_columnar.py                       # all tables, parquet
+    python scripts/database/export_columnar.py --format arrow
+    python scripts/database/export_columnar.py --tables chat_history --output /srv/analytics
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.database import create_db_and_tables
+from app.services.columnar_export import ColumnarExporter, ColumnarExportBusy, EXPORT_TABLES
+
+async def export(tables=None, output=None, fmt=None, compression=None, batch_size=None):
+    await create_db_and_tables()
+    exporter = ColumnarExporter(output, fmt, compression, batch_size)
+    started = time.perf_counter()
+    results = await exporter.export(tables)
+    elapsed = time.perf_counter() - started
+
+    print(f"✅ Exported to {exporter.export_dir} ({exporter.format}, {exporter.compression}) in {elapsed:.1f}s")
+    for table_name, stats in results.items():
+        print(f"   {table_name:<16} {stats['rows']:>8} new rows, {len(stats['files'])} files, "
+              f"watermark {stats['watermark']}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Export analytics tables to date-partitioned columnar files")
+    parser.add_argument("--tables", nargs="+", choices=list(EXPORT_TABLES), default=None,
+                        help="Tables to export (default: all)")
+    parser.add_argument("--output", default=None, help="Export directory (default: ANALYTICS_EXPORT_DIR)")
+    parser.add_argument("--format", choices=["parquet", "arrow"], default=None,
+                        help="File format (default: ANALYTICS_EXPORT_FORMAT)")
+    parser.add_argument("--compression", default=None, help="Codec, e.g. zstd, snappy, lz4 (default: zstd)")
+    parser.add_argument("--batch-size", type=int, default=None, help="Rows fetched per round trip")
+    args = parser.parse_args()
+    try:
+        asyncio.run(export(args.tables, args.output, args.format, args.compression, args.batch_size))
+    except ColumnarExportBusy as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Build (or incrementally update) the local HR knowledge index
+
+Running workers pick up the new version automatically - no restart needed.
+"""
+
+import json
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+
+from app.services.knowledge_index import knowledge_index
+
+def main():
+    print(f"Building knowledge index from: {knowledge_index.source_dir}")
+    stats = knowledge_index.build()
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+if __name__ == "__main__":
+    main()
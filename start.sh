@@ -1,3 +1,3 @@
 #!/bin/bash
 # start.sh
-exec gunicorn app.main:app --worker-class uvicorn.workers.UvicornWorker --host 0.0.0.0 --port $PORT
+exec gunicorn app.main:app --worker-class app.core.uvicorn_worker.UvicornWorker --host 0.0.0.0 --port $PORT
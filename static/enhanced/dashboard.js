@@ -1,8 +1,12 @@
 class EnhancedDashboard {
     constructor() {
         this.charts = {};
-        this.refreshInterval = 30000; // 30 seconds
+        this.refreshInterval = 30000; // 30 seconds (polling fallback while the WebSocket is down)
         this.isLoading = false;
+        this.ws = null;
+        this.wsConnected = false;
+        this.activityDebounce = 5000; // coalesce pushed activity into one reload
+        this.activityTimer = null;
         
         this.init();
     }
@@ -12,6 +16,7 @@ class EnhancedDashboard {
         await this.loadRecentActivities();
         await this.loadSystemHealth();
         this.initializeTooltips();
+        this.connectStatusSocket();
         this.startAutoRefresh();
     }
 
@@ -433,10 +438,53 @@ class EnhancedDashboard {
         });
     }
 
-    // Auto refresh management
+    // Push updates: system health and user activity arrive over the admin WebSocket
+    connectStatusSocket() {
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        this.ws = new WebSocket(`${protocol}//${window.location.host}/ws?compact=1`);
+
+        this.ws.onopen = () => {
+            this.wsConnected = true;
+            this.ws.send(JSON.stringify({ action: 'subscribe', topics: ['status', 'users'] }));
+        };
+
+        this.ws.onmessage = (event) => {
+            const data = JSON.parse(event.data);
+            const events = data.type === 'batch' ? data.events : [data];
+            events.forEach(item => this.handleServerEvent(item));
+        };
+
+        this.ws.onclose = () => {
+            this.wsConnected = false;
+            setTimeout(() => this.connectStatusSocket(), 5000);
+        };
+    }
+
+    handleServerEvent(data) {
+        if (data.type === 'ping') {
+            this.ws.send(JSON.stringify({ action: 'pong', t: data.t }));
+        } else if (data.type === 'system_health') {
+            this.updateSystemHealth(data.data);
+        } else if (data.type === 'user_summary') {
+            this.scheduleActivityRefresh();
+        }
+    }
+
+    scheduleActivityRefresh() {
+        if (this.activityTimer) return;
+        this.activityTimer = setTimeout(() => {
+            this.activityTimer = null;
+            if (document.visibilityState === 'visible') {
+                this.loadDashboardData();
+                this.loadRecentActivities();
+            }
+        }, this.activityDebounce);
+    }
+
+    // Auto refresh management (only while push updates are unavailable)
     startAutoRefresh() {
         setInterval(() => {
-            if (document.visibilityState === 'visible') {
+            if (document.visibilityState === 'visible' && !this.wsConnected) {
                 this.refreshAllData();
             }
         }, this.refreshInterval);
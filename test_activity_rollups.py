@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Test the incrementally maintained chat/friend activity rollups
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import select, func
+
+from app.db.models import ChatActivityHourly, ChatHistory, ChatReachDaily
+from app.db.crud_enhanced import (
+    activity_rollups_need_backfill, save_chat_to_history, save_friend_activity, rebuild_activity_rollups
+)
+from app.services import activity_rollups as activity_rollups_module
+from app.services.activity_rollups import activity_rollups
+from app.services.history_service import history_service
+from app.utils.hll import HyperLogLog
+from tests.database import with_session
+
+async def _analytics(db):
+    return (
+        await history_service.get_chat_overview(db, 30),
+        await history_service.get_chat_timeline(db, 7),
+        await history_service.get_friend_analytics(db, 30),
+    )
+
+def test_writes_update_rollups_and_backfill_matches():
+    """Dashboard numbers come from the rollups and equal a rebuild from raw rows"""
+    async def scenario(db):
+        for i in range(12):
+            user_id = f"U{i % 4}"
+            await save_chat_to_history(db, user_id, "user", f"ข้อความ {i}")
+            await save_chat_to_history(db, user_id, "bot", "ตอบกลับ")
+        await save_chat_to_history(db, "U0", "admin", "แอดมินตอบ", session_id="live-1")
+        for activity in ("follow", "follow", "follow", "unfollow"):
+            await save_friend_activity(db, "U9", activity)
+        before_flush = (await history_service.get_chat_overview(db, 30))["total_messages"]
+        flushed = await activity_rollups.flush(db.bind)
+
+        live = await _analytics(db)
+        rows = (await db.execute(select(func.count(ChatActivityHourly.id)))).scalar()
+        days = (await db.execute(select(func.count(ChatReachDaily.id)))).scalar()
+        stats = await rebuild_activity_rollups(db)
+        rebuilt = await _analytics(db)
+        return live, rebuilt, rows, days, stats, before_flush, flushed
+
+    live, rebuilt, rows, days, stats, before_flush, flushed = asyncio.run(with_session(scenario))
+    overview, timeline, friends = live
+
+    # Rollups are written by the flush, not by the message transaction
+    assert before_flush == 0 and flushed == 29
+
+    assert overview["total_messages"] == 25
+    assert overview["messages_by_type"] == {"user": 12, "bot": 12, "admin": 1}
+    assert overview["active_users"] == 4 and overview["total_sessions"] == 5
+    assert "active_users" in overview["approximate"]
+    assert sum(day["user"] + day["bot"] + day["admin"] for day in timeline) == 25
+    assert friends["activities_summary"] == {"follow": 3, "unfollow": 1} and friends["net_followers"] == 2
+    # 25 messages in at most two hours (a run across midnight/the hour) fold into a handful of rows
+    assert rows <= 6 and days <= 2
+    assert stats["chat_rows"] == 25 and stats["friend_rows"] == 4
+    assert rebuilt == live
+    print(f"✅ 25 messages -> {rows} hourly rows; overview {overview['active_users']} users, "
+          f"{overview['total_sessions']} sessions")
+
+def test_failed_flush_keeps_messages_and_retries():
+    """A rollup error never loses the message; the events are written by the next flush"""
+    async def scenario(db):
+        needs_backfill = [await activity_rollups_need_backfill(db)]
+        await save_chat_to_history(db, "U1", "user", "สวัสดีค่ะ")
+        needs_backfill.append(await activity_rollups_need_backfill(db))
+
+        original = activity_rollups_module.AsyncSession
+
+        def broken_session(*args, **kwargs):
+            raise RuntimeError("rollup table locked")
+
+        activity_rollups_module.AsyncSession = broken_session
+        try:
+            await activity_rollups.flush(db.bind)
+            error = None
+        except RuntimeError as e:
+            error = e
+        finally:
+            activity_rollups_module.AsyncSession = original
+        messages = (await db.execute(select(func.count(ChatHistory.id)))).scalar()
+
+        await save_chat_to_history(db, "U2", "user", "ขอบคุณครับ")
+        flushed = await activity_rollups.flush(db.bind)
+        overview = await history_service.get_chat_overview(db, 30)
+        needs_backfill.append(await activity_rollups_need_backfill(db))
+        return error, messages, flushed, overview, needs_backfill
+
+    error, messages, flushed, overview, needs_backfill = asyncio.run(with_session(scenario))
+
+    assert error is not None and messages == 1
+    assert flushed == 2 and overview["total_messages"] == 2 and overview["active_users"] == 2
+    assert needs_backfill == [False, True, False]
+    print(f"✅ Flush failed ({error}); message kept and counted on retry")
+
+def test_sketch_estimates_and_merges():
+    """Distinct counts stay within a few percent and days merge into a union"""
+    monday, tuesday = HyperLogLog(), HyperLogLog()
+    for i in range(6000):
+        monday.add(f"user-{i}")
+    for i in range(3000, 9000):
+        tuesday.add(f"user-{i}")
+    assert not monday.add("user-1")  # already represented: nothing to write back
+
+    union = HyperLogLog.union([monday.to_bytes(), tuesday.to_bytes(), None])
+    assert abs(monday.count() - 6000) / 6000 < 0.06
+    assert abs(union.count() - 9000) / 9000 < 0.06
+    print(f"✅ HLL: 6000 -> {monday.count()}, union 9000 -> {union.count()}")
+
+if __name__ == "__main__":
+    print("Testing Activity Rollups")
+    print("=" * 50)
+    test_writes_update_rollups_and_backfill_matches()
+    test_failed_flush_keeps_messages_and_retries()
+    test_sketch_estimates_and_merges()
+    print("\nAll activity rollup tests passed!")
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test the streaming (optionally gzip-compressed) chat history export
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+from sqlalchemy import insert
+
+from app.db.models import ChatHistory
+from app.services.history_service import history_service
+from tests.database import temp_database
+
+ROWS = 5000
+
+async def _seed(Session):
+    started = datetime(2026, 10, 1, 8, 0, 0)
+    async with Session() as db:
+        await db.execute(insert(ChatHistory), [{
+            "id": f"m{i:05d}", "user_id": f"U{i % 7}", "message_type": "user" if i % 2 else "bot",
+            "message_content": f'ข้อความ "{i}", บรรทัด\nสอง', "session_id": f"s{i % 7}",
+            "timestamp": started + timedelta(seconds=i)
+        } for i in range(ROWS)])
+        await db.commit()
+
+def test_stream_is_chunked_per_batch():
+    """One chunk per yield_per batch; gzip output decompresses to the same CSV"""
+    async def scenario(path):
+        async with temp_database(path) as Session:
+            await _seed(Session)
+            async with Session() as db:
+                plain = [chunk async for chunk in history_service.stream_chat_history_csv(db, batch_size=1000)]
+            async with Session() as db:
+                packed = [chunk async for chunk in history_service.stream_chat_history_csv(
+                    db, batch_size=1000, compress=True)]
+            async with Session() as db:
+                legacy = await history_service.export_chat_history_csv(db, user_id="U3")
+        return plain, packed, legacy
+
+    with tempfile.TemporaryDirectory() as directory:
+        plain, packed, legacy = asyncio.run(scenario(os.path.join(directory, "export.db")))
+
+    assert len(plain) == 1 + ROWS // 1000
+    # Each chunk holds one batch, so memory does not grow with the number of rows
+    assert max(len(chunk) for chunk in plain) < 1000 * 120
+    text = b"".join(plain).decode("utf-8")
+    rows = list(csv.reader(io.StringIO(text)))
+    assert rows[0] == history_service.CSV_HEADER and len(rows) == ROWS + 1
+    assert rows[1][:3] == ["m00000", "U0", "bot"] and rows[-1][0] == f"m{ROWS - 1:05d}"
+    assert rows[2][3] == 'ข้อความ "1", บรรทัด\nสอง'
+    assert gzip.decompress(b"".join(packed)) == b"".join(plain)
+    assert len(b"".join(packed)) < len(text.encode("utf-8")) / 4
+    assert len(list(csv.reader(io.StringIO(legacy)))) == 1 + len(range(3, ROWS, 7))
+    print(f"✅ {ROWS} rows in {len(plain)} chunks; gzip {len(b''.join(packed))} bytes")
+
+def test_endpoint_streams_gzip_attachment():
+    """/api/enhanced/chat/export streams CSV or .csv.gz and rejects bad dates"""
+    from app.main import app
+    from app.api.routers import enhanced_api
+
+    async def scenario(path):
+        async with temp_database(path) as Session:
+            await _seed(Session)
+            original = enhanced_api.AsyncSessionLocal
+            enhanced_api.AsyncSessionLocal = Session
+            try:
+                async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                    packed = await client.get("/api/enhanced/chat/export", params={
+                        "gzip": "true", "start_date": "2026-10-01T09:00:00"})
+                    bad = await client.get("/api/enhanced/chat/export", params={"start_date": "yesterday"})
+            finally:
+                enhanced_api.AsyncSessionLocal = original
+        return packed, bad
+
+    with tempfile.TemporaryDirectory() as directory:
+        packed, bad = asyncio.run(scenario(os.path.join(directory, "export.db")))
+
+    assert packed.status_code == 200 and packed.headers["content-type"] == "application/gzip"
+    assert "chat_history.csv.gz" in packed.headers["content-disposition"]
+    rows = list(csv.reader(io.StringIO(gzip.decompress(packed.content).decode("utf-8"))))
+    assert len(rows) == 1 + ROWS - 3600
+    assert bad.status_code == 400
+    print(f"✅ Endpoint: {len(rows) - 1} rows since 09:00, {len(packed.content)} bytes gzip")
+
+if __name__ == "__main__":
+    print("Testing Chat History Export")
+    print("=" * 50)
+    test_stream_is_chunked_per_batch()
+    test_endpoint_streams_gzip_attachment()
+    print("\nAll chat export tests passed!")
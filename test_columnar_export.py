@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Test the incremental, date-partitioned columnar export
+"""
+
+import asyncio
+import fcntl
+import sys
+import os
+import tempfile
+from datetime import datetime, timedelta
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+from sqlalchemy import insert
+
+from app.db.models import ChatHistory, FriendActivity
+from app.db.crud_enhanced import save_chat_to_history
+from app.services.columnar_export import ColumnarExporter, ColumnarExportBusy
+from tests.database import temp_database
+
+pa = pytest.importorskip("pyarrow")
+import pyarrow.dataset as ds
+
+STARTED = datetime(2026, 10, 1, 22, 0, 0)
+
+def _chat_rows(first, count):
+    return [{
+        "id": f"m{i:05d}", "user_id": f"U{i % 5}", "message_type": "user" if i % 2 else "bot",
+        "message_content": f"สวัสดีครับ ข้อความที่ {i}", "session_id": f"s{i % 5}",
+        "timestamp": STARTED + timedelta(minutes=i)
+    } for i in range(first, first + count)]
+
+def _read(directory, table_name, fmt="parquet"):
+    dataset = ds.dataset(os.path.join(directory, table_name), format="ipc" if fmt == "arrow" else fmt,
+                         partitioning="hive")
+    return dataset.to_table().sort_by([("timestamp", "ascending"), ("id", "ascending")])
+
+def test_nightly_runs_only_append_new_rows():
+    """Second run writes only rows after the watermark, including same-timestamp rows"""
+    async def scenario(directory):
+        async with temp_database(os.path.join(directory, "export.db")) as Session:
+            exporter = ColumnarExporter(os.path.join(directory, "exports"), batch_size=100,
+                                        session_factory=Session)
+            async with Session() as db:
+                # 22:00 on day one to ~02:00 on day three
+                await db.execute(insert(ChatHistory), _chat_rows(0, 1700))
+                await db.execute(insert(FriendActivity), [
+                    {"id": "f1", "user_id": "U1", "activity_type": "follow", "timestamp": STARTED}])
+                await db.commit()
+            first = await exporter.export()
+
+            async with Session() as db:
+                # Same timestamp as the watermark row but a later id, then newer rows
+                await db.execute(insert(ChatHistory), [
+                    {**_chat_rows(1699, 1)[0], "id": "m01699b"}] + _chat_rows(1700, 300))
+                await db.commit()
+                # Server-default (second-precision) timestamps
+                for i in range(3):
+                    await save_chat_to_history(db, "U9", "user", f"ข้อความใหม่ {i}")
+            second = await exporter.export()
+            third = await exporter.export()
+        return first, second, third, exporter.watermarks()
+
+    with tempfile.TemporaryDirectory() as directory:
+        first, second, third, watermarks = asyncio.run(scenario(directory))
+        exported = _read(os.path.join(directory, "exports"), "chat_history")
+        friends = _read(os.path.join(directory, "exports"), "friend_activity")
+        leftovers = [name for _, _, names in os.walk(directory) for name in names if name.endswith(".tmp")]
+
+    assert first["chat_history"]["rows"] == 1700 and first["friend_activity"]["rows"] == 1
+    assert first["system_logs"] == {"rows": 0, "files": [], "watermark": None}
+    assert [path.split("/")[1] for path in first["chat_history"]["files"]] == [
+        "date=2026-10-01", "date=2026-10-02", "date=2026-10-03"]
+    assert second["chat_history"]["rows"] == 1 + 300 + 3 and second["friend_activity"]["rows"] == 0
+    assert third["chat_history"]["rows"] == 0 and third["chat_history"]["files"] == []
+
+    ids = exported.column("id").to_pylist()
+    assert len(ids) == len(set(ids)) == 2004 and "m01699b" in ids
+    assert exported.column("message_content").to_pylist()[0] == "สวัสดีครับ ข้อความที่ 0"
+    assert str(exported.schema.field("timestamp").type) == "timestamp[us]"
+    assert friends.num_rows == 1 and not leftovers
+    assert watermarks["chat_history"]["rows"] == 2004
+    print(f"✅ {first['chat_history']['rows']} + {second['chat_history']['rows']} rows "
+          f"in {len(first['chat_history']['files']) + len(second['chat_history']['files'])} files")
+
+def test_arrow_ipc_format():
+    """The Arrow IPC mode writes compressed .arrow files with the same layout"""
+    async def scenario(directory):
+        async with temp_database(os.path.join(directory, "export.db")) as Session:
+            exporter = ColumnarExporter(os.path.join(directory, "exports"), fmt="arrow", session_factory=Session)
+            async with Session() as db:
+                await db.execute(insert(ChatHistory), _chat_rows(0, 200))
+                await db.commit()
+            return await exporter.export(["chat_history"])
+
+    with tempfile.TemporaryDirectory() as directory:
+        result = asyncio.run(scenario(directory))
+        table = _read(os.path.join(directory, "exports"), "chat_history", "arrow")
+
+    assert list(result) == ["chat_history"] and result["chat_history"]["rows"] == 200
+    assert all(path.endswith(".arrow") for path in result["chat_history"]["files"])
+    assert table.num_rows == 200 and table.column("is_read").type == pa.bool_()
+    print(f"✅ Arrow IPC: {table.num_rows} rows in {len(result['chat_history']['files'])} files")
+
+def test_rerun_after_crash_overwrites_published_parts():
+    """A crash after the rename but before the watermark update does not duplicate rows"""
+    async def scenario(directory):
+        async with temp_database(os.path.join(directory, "export.db")) as Session:
+            exporter = ColumnarExporter(os.path.join(directory, "exports"), session_factory=Session)
+            async with Session() as db:
+                await db.execute(insert(ChatHistory), _chat_rows(0, 100))
+                await db.commit()
+            await exporter.export(["chat_history"])
+
+            async with Session() as db:
+                await db.execute(insert(ChatHistory), _chat_rows(100, 50))
+                await db.commit()
+            save_watermark = exporter._save_watermark
+
+            def crash(*args):
+                raise OSError("killed before the watermark was saved")
+
+            exporter._save_watermark = crash
+            try:
+                await exporter.export(["chat_history"])
+            except OSError:
+                pass
+            exporter._save_watermark = save_watermark
+
+            async with Session() as db:
+                await db.execute(insert(ChatHistory), _chat_rows(150, 10))
+                await db.commit()
+            retried = await exporter.export(["chat_history"])
+        return retried, exporter.watermarks()
+
+    with tempfile.TemporaryDirectory() as directory:
+        retried, watermarks = asyncio.run(scenario(directory))
+        ids = _read(os.path.join(directory, "exports"), "chat_history").column("id").to_pylist()
+
+    assert retried["chat_history"]["rows"] == 60 and watermarks["chat_history"]["rows"] == 160
+    assert len(ids) == len(set(ids)) == 160
+    print(f"✅ Retry after crash: {len(ids)} unique rows in {retried['chat_history']['files']}")
+
+def test_concurrent_exports_are_rejected():
+    """A second exporter on the same directory (another worker or the script) fails fast"""
+    async def scenario(directory):
+        export_dir = os.path.join(directory, "exports")
+        async with temp_database(os.path.join(directory, "export.db")) as Session:
+            exporter = ColumnarExporter(export_dir, session_factory=Session)
+            async with Session() as db:
+                await db.execute(insert(ChatHistory), _chat_rows(0, 50))
+                await db.commit()
+
+            os.makedirs(export_dir)
+            with open(os.path.join(export_dir, ".lock"), "w") as held:
+                fcntl.flock(held, fcntl.LOCK_EX)  # another process exporting
+                try:
+                    await exporter.export()
+                    busy = None
+                except ColumnarExportBusy as e:
+                    busy = e
+            return busy, await exporter.export(), exporter.watermarks()
+
+    with tempfile.TemporaryDirectory() as directory:
+        busy, result, watermarks = asyncio.run(scenario(directory))
+
+    assert isinstance(busy, ColumnarExportBusy)
+    assert result["chat_history"]["rows"] == 50 and watermarks["chat_history"]["rows"] == 50
+    print(f"✅ Busy while locked: {busy}")
+
+if __name__ == "__main__":
+    print("Testing Columnar Export")
+    print("=" * 50)
+    test_nightly_runs_only_append_new_rows()
+    test_arrow_ipc_format()
+    test_rerun_after_crash_overwrites_published_parts()
+    test_concurrent_exports_are_rejected()
+    print("\nAll columnar export tests passed!")
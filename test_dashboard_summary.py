@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test the stale-while-revalidate dashboard summary
+"""
+
+import asyncio
+import sys
+import os
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.crud_enhanced import save_chat_to_history, save_friend_activity, create_telegram_notification
+from app.services.activity_rollups import activity_rollups
+from app.services.dashboard_summary import build_dashboard_summary
+from app.utils.cache import StaleWhileRevalidate
+from tests.database import temp_database
+
+def test_stale_values_are_served_while_one_refresh_runs():
+    """Bursts share one load; stale reads return at once; failures keep the last value"""
+    async def scenario():
+        loads = []
+
+        async def loader():
+            loads.append(len(loads) + 1)
+            await asyncio.sleep(0.05)
+            if len(loads) == 3:
+                raise RuntimeError("database unavailable")
+            return {"version": len(loads)}
+
+        cache = StaleWhileRevalidate(loader, ttl=0.1, max_stale=10, name="test")
+        cold = await asyncio.gather(*(cache.get() for _ in range(20)))
+        warm = await cache.get()
+
+        await asyncio.sleep(0.15)
+        stale = await asyncio.wait_for(cache.get(), timeout=0.01)  # no waiting for the reload
+        await asyncio.sleep(0.1)
+        refreshed = await cache.get()
+
+        await asyncio.sleep(0.15)
+        await cache.get()
+        await asyncio.sleep(0.1)
+        after_failure = await cache.get()
+        return loads, cold, warm, stale, refreshed, after_failure, cache.stats()
+
+    loads, cold, warm, stale, refreshed, after_failure, stats = asyncio.run(scenario())
+    assert all(value == {"version": 1} for value in cold) and warm == {"version": 1}
+    assert stale == {"version": 1} and refreshed == {"version": 2}
+    assert after_failure == {"version": 2} and stats["failures"] == 1
+    # The failed refresh leaves the value stale, so the next read retries in the background
+    assert loads == [1, 2, 3, 4] and stats["misses"] == 20 and stats["stale_hits"] == 3
+    print(f"✅ 25 reads, {len(loads)} loads: {stats}")
+
+def test_summary_sub_reports_run_on_separate_sessions():
+    """The four reports are built concurrently, each with its own session"""
+    async def scenario(path):
+        opened = []
+        async with temp_database(path) as Session:
+            def session_factory():
+                opened.append(1)
+                return Session()
+
+            async with Session() as db:
+                for user_id in ("U1", "U2", "U2"):
+                    await save_chat_to_history(db, user_id, "user", "สวัสดี")
+                await save_friend_activity(db, "U3", "follow")
+                await create_telegram_notification(db, "chat_request", "ขอคุยกับเจ้าหน้าที่", "U1")
+                await activity_rollups.flush(db.bind)
+            summary = await build_dashboard_summary(session_factory)
+        return summary, len(opened)
+
+    with tempfile.TemporaryDirectory() as directory:
+        summary, sessions = asyncio.run(scenario(os.path.join(directory, "dashboard.db")))
+
+    assert sessions == 4
+    assert summary["chat"] == {"total_messages_7d": 3, "active_users_7d": 2, "avg_messages_per_user": 1.5,
+                               "approximate": ["active_users_7d", "avg_messages_per_user"]}
+    assert summary["friends"]["new_followers_7d"] == 1
+    assert summary["telegram"]["total_notifications_7d"] == 1
+    assert "error_rate_24h" in summary["system"] and summary["generated_at"]
+    print(f"✅ Summary from {sessions} sessions: {summary['chat']}")
+
+if __name__ == "__main__":
+    print("Testing Dashboard Summary")
+    print("=" * 50)
+    test_stale_values_are_served_while_one_refresh_runs()
+    test_summary_sub_reports_run_on_separate_sessions()
+    print("\nAll dashboard summary tests passed!")
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Test the SHA-256 keyed cache of uploaded Gemini PDF handles
+"""
+
+import asyncio
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.gemini_backends import create_backend
+from app.services.gemini_service import GeminiService
+from app.utils.cache import TTLCache
+
+def _service():
+    service = GeminiService()
+    service.backend = create_backend("fake")
+    service.backend.latency_ms = 5
+    service.backend.error_rate = 0.0
+    service.backend.safety_rate = 0.0
+    service.backend.recitation_rate = 0.0
+    service._initialize_service()
+    # One slot, so a second document evicts the first
+    service.document_cache = TTLCache(maxsize=1, ttl=3600, on_evict=service._delete_uploaded_file)
+
+    uploads = []
+    upload_file = service.backend.upload_file
+
+    def counting_upload(**kwargs):
+        uploads.append(kwargs["display_name"])
+        return upload_file(**kwargs)
+
+    service.backend.upload_file = counting_upload
+    return service, uploads
+
+def test_uploads_are_shared_reused_and_deleted():
+    """Concurrent requests share one upload; evicted and failed handles are deleted"""
+    async def scenario():
+        service, uploads = _service()
+        files = service.backend._files
+        first = "%PDF-1.4 ระเบียบการลา".encode("utf-8")
+        second = "%PDF-1.4 สวัสดิการข้าราชการ".encode("utf-8")
+
+        concurrent = await asyncio.gather(*(service.analyze_document(first) for _ in range(3)))
+        shared_uploads = len(uploads)
+        again = await service.analyze_document(first, "ลาพักร้อนได้กี่วัน")
+        after_hit = (len(uploads), service.document_cache.hits)
+
+        await service.analyze_document(second)
+        await asyncio.sleep(0.05)  # deletions run in the executor
+        after_eviction = sorted(files)
+
+        service.backend.error_rate = 1.0
+        failed = await service.analyze_document(second, "คำถามที่ล้มเหลว")
+        await asyncio.sleep(0.05)
+        return concurrent, shared_uploads, again, after_hit, after_eviction, failed, dict(files), service
+
+    concurrent, shared_uploads, again, after_hit, after_eviction, failed, files, service = asyncio.run(scenario())
+
+    assert all(result["success"] for result in concurrent) and shared_uploads == 1
+    assert again["success"] and after_hit[0] == 1 and after_hit[1] >= 1
+    # The first document was evicted by the second and removed from Gemini storage
+    assert len(after_eviction) == 1 and after_eviction[0].startswith("files/fake-")
+    # A failed generate drops the handle and deletes the upload instead of leaking it
+    assert not failed["success"] and files == {} and service.document_cache.stats()["size"] == 0
+    print(f"✅ 4 analyses of one PDF -> {shared_uploads} upload; evicted and failed uploads deleted")
+
+def test_cancelled_upload_is_cached():
+    """An upload whose request was cancelled still lands in the cache instead of leaking"""
+    async def scenario():
+        service, uploads = _service()
+        document = "%PDF-1.4 คู่มือการเบิกจ่าย".encode("utf-8")
+        slow_upload = service.backend.upload_file
+
+        def slow(**kwargs):
+            time.sleep(0.1)
+            return slow_upload(**kwargs)
+
+        service.backend.upload_file = slow
+        task = asyncio.create_task(service.analyze_document(document))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        await asyncio.sleep(0.2)
+        cached = service.document_cache.stats()["size"]
+        result = await service.analyze_document(document)
+        return cached, result, len(uploads), dict(service.backend._files)
+
+    cached, result, uploads, files = asyncio.run(scenario())
+
+    assert cached == 1 and result["success"] and uploads == 1 and len(files) == 1
+    print("✅ Cancelled request's upload cached and reused")
+
+def test_failed_generate_keeps_handle_for_running_analyses():
+    """A failure invalidates the handle but only deletes it once the other analyses finish"""
+    class SplitModel:
+        def __init__(self, model):
+            self.model = model
+
+        def generate_content(self, contents):
+            if contents[0] == "fail":
+                raise RuntimeError("file expired")
+            time.sleep(0.1)
+            return self.model.generate_content(contents)
+
+    async def scenario():
+        service, uploads = _service()
+        service.model = SplitModel(service.model)
+        files = service.backend._files
+        document = "%PDF-1.4 ประกาศรับสมัครงาน".encode("utf-8")
+        await service.analyze_document(document)
+
+        slow = asyncio.create_task(service.analyze_document(document, "สรุปให้หน่อย"))
+        await asyncio.sleep(0.02)
+        failed = await service.analyze_document(document, "fail")
+        during = (len(files), service.document_cache.stats()["size"])
+        succeeded = await slow
+        await asyncio.sleep(0.05)
+        return failed, during, succeeded, len(files)
+
+    failed, during, succeeded, remaining = asyncio.run(scenario())
+
+    assert not failed["success"] and during == (1, 0)
+    assert succeeded["success"] and remaining == 0
+    print("✅ Failed handle invalidated at once, deleted after the last user")
+
+if __name__ == "__main__":
+    print("Testing Gemini Document Cache")
+    print("=" * 50)
+    test_uploads_are_shared_reused_and_deleted()
+    test_cancelled_upload_is_cached()
+    test_failed_generate_keeps_handle_for_running_analyses()
+    print("\nAll document cache tests passed!")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test the cross-worker WebSocket event bus
+"""
+
+import asyncio
+import json
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.event_bus import EventBus, UnixSocketEventBus
+from app.services.ws_manager import ConnectionManager
+from app.utils.metrics import WS_BUS_LATENCY
+from tests.fake_websocket import FakeWebSocket
+
+def test_unix_bus_delivers_once_per_worker():
+    """An event published on one worker reaches admins on every worker exactly once"""
+    async def scenario(directory):
+        workers = []
+        for name in ("worker-a.sock", "worker-b.sock", "worker-c.sock"):
+            manager, bus, admin = ConnectionManager(), UnixSocketEventBus(directory, name), FakeWebSocket()
+            await bus.start(manager.deliver)
+            manager.attach_bus(bus)
+            await manager.connect(admin)
+            workers.append((manager, bus, admin))
+
+        await workers[0][0].broadcast({"type": "new_message", "userId": "U1", "message": "hello"})
+        await workers[2][0].publish("status", {"type": "system_status"})
+        await asyncio.sleep(0.1)
+
+        # A worker that died without cleaning up leaves a stale socket behind
+        await workers[2][1].stop()
+        open(os.path.join(directory, "worker-dead.sock"), "w").close()
+        workers[0][1]._peers_at = 0
+        await workers[0][0].broadcast({"type": "new_message", "userId": "U1", "message": "again"})
+        await asyncio.sleep(0.1)
+
+        for manager, bus, _ in workers:
+            await bus.stop()
+            await manager.close_all()
+        return [admin.frames for _, _, admin in workers], os.listdir(directory)
+
+    before = WS_BUS_LATENCY.count(transport="unix")
+    with tempfile.TemporaryDirectory() as directory:
+        frames, leftover = asyncio.run(scenario(directory))
+
+    messages = [[f["message"] for f in worker if f["type"] == "new_message"] for worker in frames]
+    assert messages == [["hello", "again"], ["hello", "again"], ["hello"]]
+    # Unsubscribed (legacy) connections do not get topic-only events
+    assert all(f["type"] != "system_status" for worker in frames for f in worker)
+    assert "worker-dead.sock" not in leftover
+    # Remote deliveries: hello 2, status 2, again 1 (worker c had stopped)
+    assert WS_BUS_LATENCY.count(transport="unix") - before == 5
+    print(f"✅ Unix bus: {messages}")
+
+def test_local_bus_delivers_in_process():
+    """The local transport is a plain pass-through"""
+    async def scenario():
+        manager, admin = ConnectionManager(), FakeWebSocket()
+        bus = EventBus()
+        await bus.start(manager.deliver)
+        manager.attach_bus(bus)
+        await manager.connect(admin)
+        await manager.handle_client_message(admin, json.dumps({"action": "subscribe", "topics": ["status"]}))
+        await manager.publish("status", {"type": "system_status"})
+        await asyncio.sleep(0.05)
+        await manager.close_all()
+        return admin.frames
+
+    frames = asyncio.run(scenario())
+    assert [f["type"] for f in frames] == ["hello", "subscribed", "system_status"]
+    print("✅ Local bus")
+
+if __name__ == "__main__":
+    print("Testing WebSocket Event Bus")
+    print("=" * 50)
+    test_unix_bus_delivers_once_per_worker()
+    test_local_bus_delivers_in_process()
+    print("\nAll event bus tests passed!")
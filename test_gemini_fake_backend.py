@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Test the offline Gemini stand-in used for benchmarks
+"""
+
+import asyncio
+import io
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.gemini_backends import FakeGeminiBackend, FakeGeminiError, create_backend
+from app.services.gemini_service import GeminiService
+
+def _outcomes(backend, prompts):
+    model = backend.create_model("fake-model", 0.7, 1000, False)
+    results = []
+    for prompt in prompts:
+        try:
+            response = model.generate_content(prompt)
+            results.append((response.candidates[0].finish_reason, response.usage_metadata.total_token_count))
+        except FakeGeminiError as e:
+            results.append(("error", str(e)))
+    return results
+
+def test_fake_backend_is_deterministic():
+    """Same seed and prompts give the same outcomes in any order"""
+    prompts = [f"คำถามที่ {i}" for i in range(40)]
+    options = dict(latency_ms=0, error_rate=0.2, safety_rate=0.1, recitation_rate=0.1, seed=7)
+
+    first = _outcomes(FakeGeminiBackend(**options), prompts)
+    second = _outcomes(FakeGeminiBackend(**options), list(reversed(prompts)))
+
+    assert first == list(reversed(second))
+    kinds = {outcome[0] for outcome in first}
+    assert {"error", 1, 2, 3} <= kinds
+    print(f"✅ Deterministic outcomes: {sorted(map(str, kinds))}")
+
+def test_latency_distribution_median():
+    """Sampled latencies follow the configured median"""
+    backend = FakeGeminiBackend(latency_ms=200, latency_distribution="lognormal", latency_sigma=0.5, seed=1)
+    samples = sorted(backend.sample_latency(backend.rng_for(f"p{i}")) for i in range(2001))
+    median_ms = samples[len(samples) // 2] * 1000
+
+    assert 180 < median_ms < 220
+    assert samples[int(len(samples) * 0.99)] > samples[len(samples) // 2] * 2
+    print(f"✅ Lognormal median {median_ms:.1f} ms, p99 {samples[int(len(samples) * 0.99)] * 1000:.1f} ms")
+
+def test_streaming_and_files():
+    """stream=True yields chunks that add up to the full reply; uploads are local"""
+    backend = FakeGeminiBackend(latency_ms=0, seed=3)
+    model = backend.create_model("fake-model", 0.7, 1000, False)
+    streamed = model.generate_content("สวัสดีค่ะ", stream=True)
+    chunks = [chunk.text for chunk in streamed]
+
+    assert len(chunks) > 1 and " ".join(chunks) == streamed.text
+    uploaded = backend.upload_file(io.BytesIO(b"%PDF-1.4"), "application/pdf", "doc.pdf")
+    assert uploaded.name.startswith("files/fake-")
+    backend.delete_file(uploaded.name)
+    assert backend.describe()["uploaded_files"] == 0
+    print(f"✅ Streamed {len(chunks)} chunks")
+
+def test_service_runs_offline():
+    """GeminiService works end to end on the fake backend without an API key"""
+    service = GeminiService()
+    service.backend = create_backend("fake")
+    service.backend.latency_ms = 1
+    service.backend.safety_rate = 1.0
+    service._initialize_service()
+
+    result = asyncio.run(service.generate_response("ทดสอบ", "U_bench", use_session=False))
+
+    assert service.is_available()
+    # Safety-blocked candidates are turned into the polite refusal message
+    assert result["success"] and "ระบบความปลอดภัย" in result["response"]
+    assert result["usage"]["prompt_tokens"] > 0
+    print(f"✅ Offline response: {result['response'][:40]}...")
+
+if __name__ == "__main__":
+    print("Testing Fake Gemini Backend")
+    print("=" * 50)
+    test_fake_backend_is_deterministic()
+    test_latency_distribution_median()
+    test_streaming_and_files()
+    test_service_runs_offline()
+    print("\nAll fake backend tests passed!")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Test Gemini token accounting and the hourly usage rollup
+"""
+
+import asyncio
+import sys
+import os
+from datetime import datetime
+from types import SimpleNamespace
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.db.crud_enhanced import record_gemini_usage, get_gemini_usage_rollup, log_system_event
+from app.services.gemini_service import gemini_service
+from tests.database import with_session
+
+def test_usage_from_response_metadata():
+    """Token counts come from usage_metadata, not from splitting text"""
+    response = SimpleNamespace(usage_metadata=SimpleNamespace(
+        prompt_token_count=412, candidates_token_count=88, total_token_count=500
+    ))
+    usage = gemini_service._extract_usage(response)
+
+    assert usage == {"prompt_tokens": 412, "completion_tokens": 88, "total_tokens": 500}
+    assert gemini_service._extract_usage(SimpleNamespace()) is None
+    print(f"✅ Usage: {usage}")
+
+def test_rollup_increments_one_row_per_hour():
+    """Calls in the same hour/model/operation are added to a single row"""
+    async def scenario(db):
+        now = datetime.utcnow()
+        await record_gemini_usage(db, "gemini-1.5-flash", "text", True, 100, 20, 300, timestamp=now)
+        await record_gemini_usage(db, "gemini-1.5-flash", "text", True, 50, 10, 1200, timestamp=now)
+        await record_gemini_usage(db, "gemini-1.5-flash", "text", False, 0, 0, 15000, timestamp=now)
+        await record_gemini_usage(db, "gemini-1.5-flash", "image", True, 300, 40, 2500, timestamp=now)
+        return await get_gemini_usage_rollup(db, hours=1)
+
+    rows = asyncio.run(with_session(scenario))
+    text_row = next(row for row in rows if row.operation == "text")
+
+    assert len(rows) == 2
+    assert text_row.calls == 3 and text_row.errors == 1
+    assert text_row.prompt_tokens == 150 and text_row.completion_tokens == 30
+    assert text_row.total_tokens == 180
+    assert text_row.latency_ms_sum == 16500 and text_row.latency_ms_max == 15000
+    assert text_row.latency_le_500ms == 1
+    assert text_row.latency_le_2000ms == 1
+    assert text_row.latency_gt_10000ms == 1
+    print(f"✅ Rollup rows: {len(rows)}, text calls: {text_row.calls}")
+
+def test_analytics_keep_faq_answers_and_fallbacks_apart():
+    """FAQ answers stay out of the Gemini totals; fallback_events counts AI fallbacks"""
+    from app.api.routers.enhanced_api import get_gemini_analytics
+
+    async def scenario(db):
+        now = datetime.utcnow()
+        await record_gemini_usage(db, "gemini-1.5-flash", "text", True, 100, 20, 1000, timestamp=now)
+        await record_gemini_usage(db, "gemini-1.5-flash", "text", False, 0, 0, 3000, timestamp=now)
+        for _ in range(6):
+            await record_gemini_usage(db, "knowledge_base", "text", True, 10, 30, 0, timestamp=now)
+        await log_system_event(db=db, level="warning", category="gemini", subcategory="ai_fallback",
+                               message="AI response failed, using fallback")
+        return (await get_gemini_analytics(hours=1, db=db))["data"]
+
+    data = asyncio.run(with_session(scenario))
+
+    assert data["total_requests"] == 2 and data["failed_requests"] == 1
+    assert data["avg_latency_ms"] == 2000 and data["total_tokens_used"] == 120
+    assert data["models_used"] == {"gemini-1.5-flash": 2}
+    assert data["knowledge_base"] == {"answers": 6, "prompt_tokens": 60, "completion_tokens": 180}
+    assert data["fallback_events"] == 1
+    print(f"✅ Gemini {data['total_requests']} calls, avg {data['avg_latency_ms']} ms; "
+          f"{data['knowledge_base']['answers']} FAQ answers")
+
+if __name__ == "__main__":
+    print("Testing Gemini Usage Rollup")
+    print("=" * 50)
+    test_usage_from_response_metadata()
+    test_rollup_increments_one_row_per_hour()
+    test_analytics_keep_faq_answers_and_fallbacks_apart()
+    print("\nAll Gemini usage tests passed!")
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Test image pre-processing and the content-hash result cache used by Gemini Vision
+"""
+
+import asyncio
+import io
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from PIL import Image
+
+from app.services.image_pipeline import prepare_image
+from app.utils.cache import TTLCache, content_hash
+
+def _make_image(size, mode="RGB", fmt="PNG") -> bytes:
+    output = io.BytesIO()
+    color = (200, 30, 30, 128) if mode == "RGBA" else (200, 30, 30)
+    Image.new(mode, size, color).save(output, format=fmt)
+    return output.getvalue()
+
+def test_large_image_is_downscaled():
+    """Large screenshots are resized to the configured maximum and sent as JPEG"""
+    prepared = asyncio.run(prepare_image(_make_image((4000, 2000)), max_dimension=1000, quality=80))
+
+    assert prepared["resized"] is True
+    assert prepared["mime_type"] == "image/jpeg"
+    assert max(prepared["size"]) == 1000
+    assert prepared["original_size"] == (4000, 2000)
+    print(f"✅ Downscaled 4000x2000 -> {prepared['size']} ({len(prepared['data'])} bytes)")
+
+def test_small_image_passes_through():
+    """Images already within limits are sent untouched"""
+    original = _make_image((300, 200), fmt="JPEG")
+    prepared = asyncio.run(prepare_image(original, max_dimension=1000, quality=80))
+
+    assert prepared["resized"] is False
+    assert prepared["data"] == original
+    print("✅ Small JPEG passed through unchanged")
+
+def test_transparent_image_is_flattened():
+    """RGBA images are flattened so they can be encoded as JPEG"""
+    prepared = asyncio.run(prepare_image(_make_image((3000, 3000), mode="RGBA"), max_dimension=500))
+
+    decoded = Image.open(io.BytesIO(prepared["data"]))
+    assert decoded.mode == "RGB"
+    assert decoded.size == (500, 500)
+    print("✅ RGBA image flattened to RGB JPEG")
+
+def test_cache_hits_and_eviction():
+    """Cache returns stored values, evicts LRU entries and reports hit rate"""
+    evicted = []
+    cache = TTLCache(maxsize=2, ttl=60, on_evict=lambda k, v: evicted.append(k))
+
+    key_a = content_hash(b"image-a", "prompt")
+    key_b = content_hash(b"image-b", "prompt")
+    key_c = content_hash(b"image-c", "prompt")
+    assert key_a != content_hash(b"image-a", "other prompt")
+
+    cache.set(key_a, "A")
+    cache.set(key_b, "B")
+    assert cache.get(key_a) == "A"  # a becomes most recently used
+    cache.set(key_c, "C")           # evicts b
+
+    assert cache.get(key_b) is None
+    assert evicted == [key_b]
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+    print(f"✅ Cache stats: {cache.stats()}")
+
+def test_cache_expiry():
+    """Expired entries are treated as misses"""
+    cache = TTLCache(maxsize=4, ttl=0)
+    cache.set("key", "value")
+
+    assert cache.get("key") is None
+    assert len(cache) == 0
+    print("✅ Expired entry dropped")
+
+if __name__ == "__main__":
+    print("Testing Image Pipeline and Media Cache")
+    print("=" * 50)
+    test_large_image_is_downscaled()
+    test_small_image_passes_through()
+    test_transparent_image_is_flattened()
+    test_cache_hits_and_eviction()
+    test_cache_expiry()
+    print("\nAll image pipeline tests passed!")
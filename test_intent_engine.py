@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Test the compiled keyword intent engine
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.intent_engine import IntentEngine, KeywordAutomaton
+
+def test_matches_overlapping_keywords():
+    """Keywords that overlap or share suffixes are all reported"""
+    automaton = KeywordAutomaton({"a": ["he", "she", "his", "hers"], "b": ["ติดต่อ", "ติดต่อเจ้าหน้าที่", "เจ้าหน้าที่"]})
+
+    match = automaton.scan("ushers")
+    assert match.keywords["a"] == ["she", "he", "hers"]
+
+    match = automaton.scan("ขอติดต่อเจ้าหน้าที่หน่อย")
+    assert sorted(match.keywords["b"]) == sorted(["ติดต่อ", "ติดต่อเจ้าหน้าที่", "เจ้าหน้าที่"])
+    print(f"✅ Overlapping matches: {match.keywords}")
+
+def test_default_intents_are_case_insensitive():
+    """Built-in table detects handoff, question and help requests"""
+    engine = IntentEngine(keywords_file="/nonexistent/intent_keywords.json")
+
+    assert engine.detect("Need HELP please", "handoff")
+    assert engine.detect("ขอคุยกับคนจริงๆ", "handoff")
+    assert engine.match("ลาป่วยได้กี่วัน ต้องทำอย่างไร").intents == {"question"}
+    assert not engine.match("ขอบคุณค่ะ")
+    print("✅ Default intents detected")
+
+def test_keyword_file_hot_reload():
+    """Editing the keyword file recompiles the automaton"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "intent_keywords.json"
+        path.write_text(json.dumps({"handoff": ["ขอคุยกับพี่"]}, ensure_ascii=False), encoding="utf-8")
+        engine = IntentEngine(keywords_file=str(path))
+
+        assert engine.detect("ขอคุยกับพี่หน่อย", "handoff")
+        assert not engine.detect("admin", "handoff")  # file replaces the default list
+
+        path.write_text(json.dumps({"greeting": ["สวัสดี"]}, ensure_ascii=False), encoding="utf-8")
+        os.utime(path, (0, 12345))
+        assert engine.maybe_reload(force=True)
+        assert engine.detect("สวัสดีค่ะ", "greeting")
+        assert engine.detect("admin", "handoff")  # back to the default list
+        print(f"✅ Reloaded: {engine.get_status()['intents']}")
+
+if __name__ == "__main__":
+    print("Testing Intent Engine")
+    print("=" * 50)
+    test_matches_overlapping_keywords()
+    test_default_intents_are_case_insensitive()
+    test_keyword_file_hot_reload()
+    print("\nAll intent engine tests passed!")
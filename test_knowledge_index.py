@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Test the local HR knowledge index (BM25 search, FAQ answers, incremental rebuild)
+"""
+
+import asyncio
+import json
+import sys
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.knowledge_index import KnowledgeIndex
+
+FAQS = [
+    {"question": "ขอสำเนาทะเบียนประวัติ ก.พ.7 ได้อย่างไร", "answer": "ยื่นคำขอผ่านระบบแบบฟอร์ม ก.พ.7"},
+    {"question": "ลาพักผ่อนประจำปีได้กี่วัน", "answer": "ตามระเบียบการลาของข้าราชการ"}
+]
+
+DOCUMENT = """# การลาป่วย
+
+ข้าราชการที่ลาป่วยเกิน 30 วัน ต้องมีใบรับรองแพทย์ประกอบการลา
+
+# การขอบัตรประจำตัวเจ้าหน้าที่ของรัฐ
+
+ยื่นคำขอบัตรประจำตัวพร้อมรูปถ่ายที่กองบริหารทรัพยากรบุคคล
+"""
+
+def _make_index(tmp: Path) -> KnowledgeIndex:
+    source = tmp / "knowledge"
+    source.mkdir()
+    (source / "faq.json").write_text(json.dumps(FAQS, ensure_ascii=False), encoding="utf-8")
+    (source / "leave.md").write_text(DOCUMENT, encoding="utf-8")
+    (source / "README.md").write_text("ไม่ต้องนำไปสร้างดัชนี", encoding="utf-8")
+    return KnowledgeIndex(source_dir=str(source), index_dir=str(tmp / "index"))
+
+def test_search_ranks_relevant_passage():
+    """Document passages are ranked by BM25"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _make_index(Path(tmp))
+        stats = index.build()
+
+        assert stats["files"] == 2  # README.md is skipped
+        results = index.search("ลาป่วยต้องใช้ใบรับรองแพทย์ไหม")
+        assert results and "ใบรับรองแพทย์" in results[0]["text"]
+        print(f"✅ Top passage: {results[0]['title']} (score {results[0]['score']})")
+
+def test_faq_answer_only_when_confident():
+    """Close paraphrases are answered from the FAQ, unrelated questions are not"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _make_index(Path(tmp))
+        index.build()
+
+        match = index.answer_faq("ขอสำเนา ก.พ.7 ได้อย่างไร")
+        assert match and match["answer"] == FAQS[0]["answer"]
+        assert index.answer_faq("วันนี้อากาศดีไหม") is None
+        print(f"✅ FAQ answered with confidence {match['confidence']}")
+
+def test_incremental_rebuild_and_reload():
+    """Only changed files are re-segmented and other instances reload the new version"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _make_index(Path(tmp))
+        index.build()
+
+        (Path(tmp) / "knowledge" / "leave.md").write_text(DOCUMENT + "\n\nการลาคลอดบุตรได้ 90 วัน", encoding="utf-8")
+        stats = index.build()
+        assert stats["files_segmented"] == 1
+        assert stats["files_reused"] == 1
+
+        reader = KnowledgeIndex(source_dir=index.source_dir, index_dir=index.index_dir)
+        assert reader.maybe_reload(force=True)
+        assert reader.get_status()["version"] == stats["version"]
+        print(f"✅ Incremental rebuild: {stats}")
+
+def test_reloaded_index_closes_replaced_mapping():
+    """The background check loads new builds; the old mapping closes after its last lookup"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = _make_index(Path(tmp))
+        index.build()
+        reader = KnowledgeIndex(source_dir=index.source_dir, index_dir=index.index_dir)
+        reader.maybe_reload(force=True)
+        first = reader._index
+
+        async def scenario():
+            reader.start(interval=0.01)
+            with reader._using_index() as in_use:
+                (Path(tmp) / "knowledge" / "leave.md").write_text(DOCUMENT + "\n\nลาบวชได้ 120 วัน",
+                                                                  encoding="utf-8")
+                await asyncio.get_running_loop().run_in_executor(None, index.build)
+                await asyncio.sleep(0.2)
+                still_open = not in_use._file.closed and reader._index is not first
+            await reader.stop()
+            return still_open
+
+        assert asyncio.run(scenario())
+        assert first._file.closed and first._mmap.closed
+        assert reader.get_status()["version"] == index.get_status()["version"]
+        assert reader.search("ลาบวช")
+        print("✅ Background reload swapped the index and closed the old mapping")
+
+def test_workers_starting_together_build_once():
+    """Concurrent builds in separate instances (workers) share one version"""
+    with tempfile.TemporaryDirectory() as tmp:
+        first = _make_index(Path(tmp))
+        workers = [first] + [KnowledgeIndex(source_dir=first.source_dir, index_dir=first.index_dir)
+                             for _ in range(3)]
+        with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+            results = list(pool.map(lambda worker: worker.build(), workers))
+
+        versions = {stats["version"] for stats in results}
+        assert len(versions) == 1
+        assert sorted(p.name for p in first.index_dir.glob("v*")) == sorted(versions)
+        assert all(worker.search("ลาป่วย") for worker in workers)
+        print(f"✅ {len(workers)} concurrent builds -> version {versions.pop()}")
+
+if __name__ == "__main__":
+    print("Testing Knowledge Index")
+    print("=" * 50)
+    test_search_ranks_relevant_passage()
+    test_faq_answer_only_when_confident()
+    test_incremental_rebuild_and_reload()
+    test_reloaded_index_closes_replaced_mapping()
+    test_workers_starting_together_build_once()
+    print("\nAll knowledge index tests passed!")
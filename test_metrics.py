@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test the in-process metrics registry and multi-worker /metrics merging
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.metrics import (
+    Counter, Gauge, Histogram, MetricsRegistry, SnapshotStore, render_prometheus
+)
+
+def _registry():
+    registry = MetricsRegistry()
+    events = Counter("events_total", "Events", ["event_type"], registry=registry)
+    latency = Histogram("latency_seconds", "Latency", ["operation"], buckets=(0.1, 1.0), registry=registry)
+    connections = Gauge("connections", "Connections", registry=registry)
+    return registry, events, latency, connections
+
+def test_prometheus_text_format():
+    """Histograms are rendered with cumulative buckets, sum and count"""
+    registry, events, latency, connections = _registry()
+    events.inc(event_type="MessageEvent")
+    events.inc(2, event_type="MessageEvent")
+    for value in (0.05, 0.5, 3.0):
+        latency.observe(value, operation="text")
+    connections.set_function(lambda: 4)
+
+    text = render_prometheus(SnapshotStore(directory="", registry=registry).collect())
+
+    assert '# TYPE events_total counter' in text
+    assert 'events_total{event_type="MessageEvent"} 3' in text
+    assert 'latency_seconds_bucket{operation="text",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{operation="text",le="1"} 2' in text
+    assert 'latency_seconds_bucket{operation="text",le="+Inf"} 3' in text
+    assert 'latency_seconds_count{operation="text"} 3' in text
+    assert 'latency_seconds_sum{operation="text"} 3.55' in text
+    assert 'connections 4' in text
+    print("✅ Prometheus text format")
+
+def test_workers_are_merged():
+    """Counters add up over workers; gauges of dead workers are dropped but counters kept"""
+    with tempfile.TemporaryDirectory() as directory:
+        registry, events, latency, connections = _registry()
+        store = SnapshotStore(directory=directory, registry=registry)
+        events.inc(5, event_type="FollowEvent")
+        latency.observe(0.5, operation="text")
+        connections.set(2)
+        own = store.write()
+
+        # Another live worker (our parent process) and one that has exited
+        other = dict(own, pid=os.getppid())
+        dead = dict(own, pid=999999999)
+        store._write_json(f"worker-{other['pid']}.json", other)
+        store._write_json(f"worker-{dead['pid']}.json", dead)
+
+        merged = {name: dict((tuple(k), v) for k, v in m["samples"]) for name, m in store.collect()["metrics"].items()}
+        assert merged["events_total"][("FollowEvent",)] == 15
+        assert sum(merged["latency_seconds"][("text",)][:-1]) == 3
+        assert merged["connections"][()] == 4
+        # The exited worker was folded into the archive and keeps counting
+        assert not os.path.exists(os.path.join(directory, "worker-999999999.json"))
+        assert os.path.exists(os.path.join(directory, "archive.json"))
+        again = {name: dict((tuple(k), v) for k, v in m["samples"]) for name, m in store.collect()["metrics"].items()}
+        assert again["events_total"][("FollowEvent",)] == 15
+    print("✅ Multi-worker merge")
+
+def test_metrics_endpoint():
+    """The /metrics route serves application metrics"""
+    import httpx
+    from fastapi import FastAPI
+    from app.api.routers import metrics
+    from app.utils.metrics import WEBHOOK_EVENTS, snapshot_store
+
+    app = FastAPI()
+    app.include_router(metrics.router)
+    snapshot_store.directory = ""
+    WEBHOOK_EVENTS.inc(event_type="MessageEvent")
+
+    async def scrape():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/metrics")
+
+    response = asyncio.run(scrape())
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'line_webhook_events_total{event_type="MessageEvent"}' in response.text
+    assert "db_transaction_duration_seconds" in response.text
+    print("✅ /metrics endpoint")
+
+if __name__ == "__main__":
+    print("Testing Metrics")
+    print("=" * 50)
+    test_prometheus_text_format()
+    test_workers_are_merged()
+    test_metrics_endpoint()
+    print("\nAll metrics tests passed!")
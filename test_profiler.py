@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Test the on-demand sampling profiler
+"""
+
+import asyncio
+import sys
+import os
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.profiler import SamplingProfiler
+
+def busy_gemini_call(stop):
+    """Stands in for a Gemini call running on an executor thread"""
+    total = 0
+    while not stop.is_set():
+        total += sum(range(1000))
+    return total
+
+def blocking_handler():
+    """A synchronous call made on the event loop by mistake"""
+    time.sleep(0.25)
+
+def test_profiles_executor_threads_and_loop_blocking():
+    """Executor work shows up in the stacks and a blocked loop is flagged"""
+    async def scenario():
+        stop = threading.Event()
+        loop = asyncio.get_running_loop()
+        work = loop.run_in_executor(None, busy_gemini_call, stop)
+
+        profiler = SamplingProfiler(interval=0.005, block_threshold=0.1)
+        profiler.start(loop)
+        await asyncio.sleep(0.1)
+        blocking_handler()
+        await asyncio.sleep(0.1)
+        await loop.run_in_executor(None, profiler.stop)
+
+        stop.set()
+        await work
+        return profiler
+
+    profiler = asyncio.run(scenario())
+    summary = profiler.summary()
+    collapsed = profiler.collapsed()
+
+    assert summary["samples"] > 20
+    # Default executor threads (asyncio_0, asyncio_1, ...) are folded into one root
+    assert any(line.startswith("asyncio;") and "busy_gemini_call" in line for line in collapsed.splitlines())
+    assert len(summary["loop_blocking"]) == 1
+    blocked = summary["loop_blocking"][0]
+    assert blocked["blocked_ms"] >= 150
+    assert any("blocking_handler" in frame for frame in blocked["stack"])
+    print(f"✅ {summary['samples']} samples, blocked {blocked['blocked_ms']} ms in {blocked['stack'][-1]}")
+
+def test_idle_threads_are_skipped():
+    """Parked threads are left out unless include_idle is set"""
+    async def scenario(include_idle):
+        profiler = SamplingProfiler(interval=0.005, include_idle=include_idle)
+        await profiler.run(0.05)
+        return profiler
+
+    quiet = asyncio.run(scenario(False))
+    everything = asyncio.run(scenario(True))
+
+    assert sum(quiet.stacks.values()) < sum(everything.stacks.values())
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in everything.collapsed().strip().splitlines())
+    print(f"✅ Idle filter: {sum(quiet.stacks.values())} vs {sum(everything.stacks.values())} stack samples")
+
+def test_idle_loop_is_not_reported_as_blocked():
+    """A threshold below the sampling interval does not flag a loop that is just waiting"""
+    async def scenario():
+        profiler = SamplingProfiler(interval=0.1, block_threshold=0.02, include_idle=True)
+        await profiler.run(0.6)
+        return profiler
+
+    profiler = asyncio.run(scenario())
+
+    assert profiler.samples >= 4
+    assert profiler.summary()["loop_blocking"] == []
+    print(f"✅ Idle loop, {profiler.samples} samples at 100 ms: no blocking reported")
+
+if __name__ == "__main__":
+    print("Testing Sampling Profiler")
+    print("=" * 50)
+    test_profiles_executor_threads_and_loop_blocking()
+    test_idle_threads_are_skipped()
+    test_idle_loop_is_not_reported_as_blocked()
+    print("\nAll profiler tests passed!")
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Test per-user and global token-bucket admission control for AI generation
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import rate_limiter as rate_limiter_module
+from app.services.rate_limiter import AIRateLimiter
+
+def test_user_burst_is_limited():
+    """A single user gets their burst, then a fast rejection"""
+    async def scenario():
+        limiter = AIRateLimiter(enabled=True, user_rate_per_minute=1, user_burst=3,
+                                global_rate_per_minute=6000, global_burst=100, max_wait=1)
+        results = [await limiter.acquire("U_spammer") for _ in range(5)]
+        other = await limiter.acquire("U_other")
+        return limiter, results, other
+
+    limiter, results, other = asyncio.run(scenario())
+
+    assert [r.allowed for r in results] == [True, True, True, False, False]
+    assert results[-1].reason == "user_rate" and results[-1].retry_after > 0
+    assert other.allowed
+    assert limiter.stats()["rejected"]["user_rate"] == 2
+    print(f"✅ Spammer limited, other user admitted: {limiter.stats()['rejected']}")
+
+def test_global_queue_is_fair():
+    """When global capacity is exhausted, waiting users are served round-robin"""
+    async def scenario():
+        limiter = AIRateLimiter(enabled=True, user_rate_per_minute=600, user_burst=10,
+                                global_rate_per_minute=1200, global_burst=1, max_wait=2,
+                                user_max_queued=3)
+        order = []
+
+        async def request(user_id):
+            admission = await limiter.acquire(user_id)
+            if admission.allowed:
+                order.append(user_id)
+
+        await limiter.acquire("warmup")  # empty the global bucket
+        tasks = [asyncio.create_task(request("A")) for _ in range(3)]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(request("B")), asyncio.create_task(request("C"))]
+        await asyncio.gather(*tasks)
+        return order
+
+    order = asyncio.run(scenario())
+
+    # A queued three requests first, but B and C are served before A's second turn
+    assert order[:3] == ["A", "B", "C"]
+    assert order.count("A") == 3
+    print(f"✅ Admission order: {order}")
+
+def test_queue_timeout_rejects():
+    """Requests that cannot get global capacity in time are rejected"""
+    async def scenario():
+        limiter = AIRateLimiter(enabled=True, user_rate_per_minute=600, user_burst=10,
+                                global_rate_per_minute=1, global_burst=1, max_wait=0.05)
+        first = await limiter.acquire("A")
+        second = await limiter.acquire("B")
+        return limiter, first, second
+
+    limiter, first, second = asyncio.run(scenario())
+
+    assert first.allowed and not second.allowed
+    assert second.reason == "global_rate"
+    assert limiter.stats()["waiting_requests"] == 0
+    print(f"✅ Queue timeout: retry after {second.retry_after}s")
+
+def test_idle_users_evicted_lru_and_global_limit_split_per_worker():
+    """Past the cap, the least recently used idle buckets go; each worker gets its share of the limit"""
+    async def scenario():
+        limiter = AIRateLimiter(enabled=True, user_rate_per_minute=1, user_burst=2,
+                                global_rate_per_minute=120, global_burst=5, max_wait=0, workers=2)
+        await limiter.acquire("busy")  # not refilled - must be kept
+        for user_id in ("idle1", "idle2", "idle1", "new1", "new2"):
+            limiter._user_bucket(user_id)
+        kept = list(limiter._user_buckets)
+
+        limiter._user_buckets["busy"].tokens = limiter.user_burst
+        limiter._user_bucket("new3")
+        return limiter, kept
+
+    original = rate_limiter_module.MAX_TRACKED_USERS
+    rate_limiter_module.MAX_TRACKED_USERS = 3
+    try:
+        limiter, kept = asyncio.run(scenario())
+    finally:
+        rate_limiter_module.MAX_TRACKED_USERS = original
+    stats = limiter.stats()
+
+    # "busy" is the oldest but still limited, so eviction stops there until it refills
+    assert kept == ["busy", "idle2", "idle1", "new1", "new2"]
+    assert list(limiter._user_buckets) == ["new1", "new2", "new3"]
+    assert stats["workers"] == 2 and stats["global_rate_per_minute"] == 60 and stats["global_burst"] == 3
+    print(f"✅ LRU eviction kept {list(limiter._user_buckets)}; "
+          f"per-worker limit {stats['global_rate_per_minute']}/min")
+
+def test_faq_answers_skip_admission_and_counts_reach_metrics():
+    """Only requests that reach Gemini use tokens; limiter counters are exported to /metrics"""
+    from app.services import gemini_service as gemini_module
+    from app.services.gemini_backends import create_backend
+    from app.utils.metrics import REGISTRY, register_rate_limiter, render_prometheus
+
+    limiter = AIRateLimiter(enabled=True, user_rate_per_minute=1, user_burst=1,
+                            global_rate_per_minute=6000, global_burst=100, max_wait=1)
+    service = gemini_module.GeminiService()
+    service.backend = create_backend("fake")
+    service.backend.latency_ms = 0
+    service.backend.error_rate = service.backend.safety_rate = service.backend.recitation_rate = 0.0
+    service._initialize_service()
+    service._record_usage = lambda *args, **kwargs: None
+
+    async def answer_from_knowledge(user_id, query, use_session):
+        if "ก.พ.7" not in query:
+            return None
+        return {
+            "success": True, "response": "ยื่นคำขอผ่านระบบ", "model": "knowledge_base",
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    service._answer_from_knowledge = answer_from_knowledge
+
+    async def scenario():
+        faq = [await service.generate_response("ขอ ก.พ.7", "U1", use_session=False, rate_limit=True)
+               for _ in range(3)]
+        first = await service.generate_response("ลาได้กี่วัน", "U1", use_session=False, rate_limit=True)
+        second = await service.generate_response("ลาได้กี่วัน", "U1", use_session=False, rate_limit=True)
+        return faq, first, second
+
+    original_limiter = gemini_module.ai_rate_limiter
+    gemini_module.ai_rate_limiter = limiter
+    register_rate_limiter(limiter)
+    try:
+        faq, first, second = asyncio.run(scenario())
+        text = render_prometheus(REGISTRY.snapshot())
+    finally:
+        gemini_module.ai_rate_limiter = original_limiter
+        register_rate_limiter(original_limiter)
+
+    assert all(result["success"] and result["model"] == "knowledge_base" for result in faq)
+    assert first["success"] and second.get("rate_limited")
+    assert limiter.stats()["admitted"] == 1 and limiter.stats()["rejected"]["user_rate"] == 1
+    assert "ai_admission_admitted_total 1" in text
+    assert 'ai_admission_rejected_total{reason="user_rate"} 1' in text
+    assert "ai_admission_waiting_requests 0" in text
+    print("✅ 3 FAQ answers admitted for free; 1 Gemini call admitted, 1 limited")
+
+if __name__ == "__main__":
+    print("Testing AI Rate Limiter")
+    print("=" * 50)
+    test_user_burst_is_limited()
+    test_global_queue_is_fair()
+    test_queue_timeout_rejects()
+    test_idle_users_evicted_lru_and_global_limit_split_per_worker()
+    test_faq_answers_skip_admission_and_counts_reach_metrics()
+    print("\nAll rate limiter tests passed!")
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Test the slow-query log and its lazily captured EXPLAIN plans
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.utils.slow_queries import SlowQueryLog, normalize_statement, parameter_shape
+
+def test_statements_are_grouped_with_parameter_shape():
+    """IN lists of any length share one entry; only types of parameters are kept"""
+    assert normalize_statement("SELECT *\n  FROM t WHERE id IN (?, ?, ?)") == "SELECT * FROM t WHERE id IN (...)"
+    assert normalize_statement("SELECT * FROM t WHERE id IN ($1, $2)") == "SELECT * FROM t WHERE id IN (...)"
+    assert parameter_shape(("U1", 3)) == "(str, int)"
+    assert parameter_shape([{"id": 1}, {"id": 2}], executemany=True) == "2 x {id: int}"
+
+    log = SlowQueryLog(threshold_ms=50, max_entries=2, enabled=True)
+    log.record("SELECT * FROM t WHERE id IN (?, ?)", ("a", "b"), 80)
+    log.record("SELECT * FROM t WHERE id IN (?, ?, ?)", ("a", "b", "c"), 120)
+    log.record("SELECT 1", (), 10)  # under the threshold
+    log.record("UPDATE t SET x = ?", (1,), 60)
+    log.record("DELETE FROM t", (), 300)  # evicts the cheapest entry (UPDATE)
+
+    top = log.top()
+    assert [entry["operation"] for entry in top] == ["DELETE", "SELECT"]
+    assert top[1]["count"] == 2 and top[1]["total_ms"] == 200 and top[1]["max_ms"] == 120
+    assert "_parameters" not in top[1]
+    assert log.stats()["statements_seen"] == 5 and log.stats()["evicted"] == 1
+    print(f"✅ Grouped: {[(e['statement'], e['count']) for e in top]}")
+
+def test_engine_hooks_and_sqlite_plans():
+    """Real statements are timed and EXPLAIN QUERY PLAN is captured on demand"""
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    async def scenario(path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+        log = SlowQueryLog(threshold_ms=0, enabled=True)
+        log.instrument_engine(engine.sync_engine)
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(text("CREATE TABLE chat (id INTEGER PRIMARY KEY, user_id TEXT)"))
+                await conn.execute(text("CREATE INDEX ix_chat_user ON chat (user_id)"))
+                await conn.execute(text("INSERT INTO chat (user_id) VALUES (:u)"), [{"u": "U1"}, {"u": "U2"}])
+                await conn.execute(text("SELECT id FROM chat WHERE user_id = :u"), {"u": "U1"})
+            captured = await log.capture_plans(engine)
+            return log, captured
+        finally:
+            await engine.dispose()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log, captured = asyncio.run(scenario(os.path.join(directory, "slow.db")))
+
+    by_statement = {entry["statement"]: entry for entry in log.top(limit=50)}
+    select = by_statement["SELECT id FROM chat WHERE user_id = ?"]
+    insert = by_statement["INSERT INTO chat (user_id) VALUES (?)"]
+    assert select["param_shape"] == "(str)" and select["dialect"] == "sqlite"
+    assert any("ix_chat_user" in line for line in select["plan"])
+    assert insert["param_shape"].startswith("2 x ")
+    assert by_statement["CREATE INDEX ix_chat_user ON chat (user_id)"]["plan_error"] == "not explainable"
+    assert captured >= 2
+    print(f"✅ SQLite plan: {select['plan']}")
+
+if __name__ == "__main__":
+    print("Testing Slow-Query Log")
+    print("=" * 50)
+    test_statements_are_grouped_with_parameter_shape()
+    test_engine_hooks_and_sqlite_plans()
+    print("\nAll slow-query tests passed!")
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Test the server-side status monitor and its pushes on the status topic
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.status_monitor import StatusMonitor
+from app.services.ws_manager import ConnectionManager
+from tests.fake_websocket import FakeWebSocket
+
+class FakeDatabase:
+    def __init__(self):
+        self.down = False
+        self.queries = 0
+
+    def __call__(self):
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.queries += 1
+        if self.down:
+            raise ConnectionError("database is down")
+
+class FakeHealthMonitor(StatusMonitor):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.errors = 0
+
+    async def check_health(self):
+        return {"period_hours": 24, "error_rate": self.errors, "total_logs": 100}
+
+def _subscribe(topics):
+    return json.dumps({"action": "subscribe", "topics": topics})
+
+def test_changes_are_pushed_once_and_retained():
+    """Only changed snapshots go out; a late subscriber gets the current state at once"""
+    async def scenario():
+        manager, database = ConnectionManager(batch_window=0), FakeDatabase()
+        monitor = FakeHealthMonitor(interval=60, health_interval=60, session_factory=database,
+                                    connection_manager=manager)
+        early = FakeWebSocket()
+        await manager.connect(early)
+        await manager.handle_client_message(early, _subscribe(["status"]))
+
+        for _ in range(3):
+            await monitor.refresh_status()
+        await monitor.refresh_health()
+        database.down = True
+        await monitor.refresh_status()
+        monitor.errors = 2
+        await monitor.refresh_health()
+        await monitor.refresh_health()
+
+        late = FakeWebSocket()
+        await manager.connect(late)
+        await manager.handle_client_message(late, _subscribe(["status", "users"]))
+        await asyncio.sleep(0.05)
+        await manager.close_all()
+        return monitor, early.frames, late.frames
+
+    monitor, early, late = asyncio.run(scenario())
+    pushed = [(f["type"], f["data"].get("database_available", f["data"].get("error_rate"))) for f in early
+              if f["type"].startswith("system_")]
+    assert pushed == [("system_status", True), ("system_health", 0), ("system_status", False), ("system_health", 2)]
+    assert monitor.pushed == 4
+    assert [f["type"] for f in late] == ["hello", "subscribed", "system_status", "system_health"]
+    assert late[2]["data"]["database_available"] is False and late[3]["data"]["error_rate"] == 2
+    print(f"✅ Pushed {len(pushed)} changes out of 7 checks")
+
+def test_polling_reads_the_cached_snapshot():
+    """status() only re-checks once the snapshot is older than the interval"""
+    async def scenario():
+        database = FakeDatabase()
+        monitor = StatusMonitor(interval=60, session_factory=database, connection_manager=ConnectionManager())
+        snapshots = [await monitor.status() for _ in range(20)]
+        monitor._status_at -= 61
+        await monitor.status()
+        return database.queries, snapshots
+
+    queries, snapshots = asyncio.run(scenario())
+    assert queries == 2
+    assert set(snapshots[0]) == {"status", "ai_available", "database_available", "telegram_configured",
+                                 "line_configured", "timestamp"}
+    assert snapshots[0]["database_available"] is True
+    print(f"✅ 21 status reads, {queries} database checks")
+
+if __name__ == "__main__":
+    print("Testing Status Monitor")
+    print("=" * 50)
+    test_changes_are_pushed_once_and_retained()
+    test_polling_reads_the_cached_snapshot()
+    print("\nAll status monitor tests passed!")
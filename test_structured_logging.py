@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test the queue-based structured logger
+"""
+
+import io
+import json
+import logging
+import queue
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.core.config import settings
+from app.core.logger import (
+    JsonFormatter, NonBlockingQueueHandler, RateLimitFilter, parse_levels, setup_logging, shutdown_logging
+)
+from app.utils.timing import begin_request
+
+def test_json_records_carry_request_id_and_extras():
+    """Records are written by the listener thread with the caller's request id"""
+    stream = io.StringIO()
+    original_format = settings.LOG_FORMAT
+    settings.LOG_FORMAT = "json"
+    try:
+        setup_logging(stream=stream, force=True)
+        begin_request("req_test123")
+        logging.getLogger("app.test").info("Processing %s events", 3, extra={"user_id": "U1"})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logging.getLogger("app.test").exception("Handler failed")
+    finally:
+        shutdown_logging()
+        settings.LOG_FORMAT = original_format
+
+    lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert lines[0]["msg"] == "Processing 3 events"
+    assert lines[0]["request_id"] == "req_test123"
+    assert lines[0]["user_id"] == "U1"
+    assert lines[0]["level"] == "info"
+    assert "ValueError: boom" in lines[1]["exc"]
+    print(f"✅ JSON record: {lines[0]}")
+
+def test_rate_limit_reports_suppressed():
+    """A noisy call site is capped and the next record reports how many were dropped"""
+    limiter = RateLimitFilter(limit=2, window=0.05)
+    logger = logging.getLogger("app.noisy")
+
+    def record():
+        return logger.makeRecord(logger.name, logging.WARNING, __file__, 0, "Send failed: %s", ("x",), None)
+
+    passed = [limiter.filter(record()) for _ in range(5)]
+    assert passed == [True, True, False, False, False]
+
+    import time
+    time.sleep(0.06)
+    next_record = record()
+    assert limiter.filter(next_record)
+    assert next_record.suppressed == 3
+    print(f"✅ Rate limit: {passed}, suppressed={next_record.suppressed}")
+
+def test_full_queue_drops_instead_of_blocking():
+    """Logging never blocks the event loop when the writer falls behind"""
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=2))
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger("app.flood")
+    for i in range(5):
+        handler.handle(logger.makeRecord(logger.name, logging.INFO, __file__, 0, "event %s", (i,), None))
+
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+    print(f"✅ Full queue: dropped={handler.dropped}")
+
+def test_parse_levels():
+    """Per-module overrides ignore malformed entries"""
+    levels = parse_levels("app.services.ws_manager=warning, sqlalchemy.engine=INFO,bogus,x=NOPE")
+    assert levels == {"app.services.ws_manager": logging.WARNING, "sqlalchemy.engine": logging.INFO}
+    print(f"✅ Levels: {levels}")
+
+if __name__ == "__main__":
+    print("Testing Structured Logging")
+    print("=" * 50)
+    test_json_records_carry_request_id_and_extras()
+    test_rate_limit_reports_suppressed()
+    test_full_queue_drops_instead_of_blocking()
+    test_parse_levels()
+    print("\nAll logging tests passed!")
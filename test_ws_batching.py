@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test micro-batched WebSocket delivery and collapsing of superseded events
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.ws_manager import ConnectionManager, collapse_superseded
+from tests.fake_websocket import FakeWebSocket
+
+def _bot_reply(user_id):
+    return [
+        {"type": "new_message", "userId": user_id, "message": "วันลาเหลือกี่วัน"},
+        {"type": "bot_typing_start", "userId": user_id},
+        {"type": "bot_typing_stop", "userId": user_id},
+        {"type": "bot_auto_reply", "userId": user_id, "message": "เหลือ 6 วัน"},
+    ]
+
+def test_one_bot_reply_is_one_frame():
+    """Events within the window arrive as one batch; the superseded typing start is dropped"""
+    async def scenario():
+        manager = ConnectionManager(batch_window=0.005)
+        legacy, watching = FakeWebSocket(), FakeWebSocket()
+        await manager.connect(legacy)
+        await manager.connect(watching)
+        await manager.handle_client_message(watching, json.dumps(
+            {"action": "subscribe", "topics": ["users", "conversation:U1"]}))
+        for event in _bot_reply("U1"):
+            await manager.broadcast(event)
+        await asyncio.sleep(0.05)
+        await manager.close_all()
+        return manager, legacy, watching
+
+    manager, legacy, watching = asyncio.run(scenario())
+
+    assert [f["type"] for f in legacy.raw] == ["hello", "batch"]
+    assert [(f["type"], f["seq"]) for f in legacy.frames[1:]] == [
+        ("new_message", 1), ("bot_typing_stop", 2), ("bot_auto_reply", 3)]
+    assert [f["type"] for f in watching.raw[2:]] == ["batch"]
+    assert [f["type"] for f in watching.frames[2:]] == ["new_message", "bot_typing_stop", "bot_auto_reply"]
+    assert manager.batches == 1 and manager.seq == 3
+    print(f"✅ 4 events -> {len(legacy.raw) - 1} frame, {len(legacy.frames) - 1} events")
+
+def test_single_events_and_disabled_batching_stay_plain():
+    """A lone event is sent as is; batch_window=0 sends every event immediately"""
+    async def scenario(window):
+        manager = ConnectionManager(batch_window=window)
+        websocket = FakeWebSocket()
+        await manager.connect(websocket)
+        await manager.broadcast({"type": "new_message", "userId": "U1", "message": "hi"})
+        await asyncio.sleep(0.02)
+        for event in _bot_reply("U2"):
+            await manager.broadcast(event)
+        await asyncio.sleep(0.02)
+        await manager.close_all()
+        return websocket.raw
+
+    batched = asyncio.run(scenario(0.005))
+    assert [f["type"] for f in batched] == ["hello", "new_message", "batch"]
+    unbatched = asyncio.run(scenario(0))
+    assert [f["type"] for f in unbatched] == [
+        "hello", "new_message", "new_message", "bot_typing_start", "bot_typing_stop", "bot_auto_reply"]
+    print("✅ Lone events and batch_window=0 are sent unwrapped")
+
+def test_collapse_keeps_latest_per_user_and_topic():
+    events = [
+        (None, {"type": "bot_typing_start", "userId": "U1"}),
+        (None, {"type": "bot_typing_start", "userId": "U2"}),
+        ("status", {"type": "system_status", "data": {"ok": True}}),
+        (None, {"type": "bot_typing_stop", "userId": "U1"}),
+        ("status", {"type": "system_status", "data": {"ok": False}}),
+    ]
+    kept = collapse_superseded(events)
+    assert kept == [events[1], events[3], events[4]]
+    print(f"✅ Collapsed {len(events)} events to {len(kept)}")
+
+if __name__ == "__main__":
+    print("Testing WebSocket Micro-batching")
+    print("=" * 50)
+    test_one_bot_reply_is_one_frame()
+    test_single_events_and_disabled_batching_stay_plain()
+    test_collapse_keeps_latest_per_user_and_topic()
+    print("\nAll WebSocket batching tests passed!")
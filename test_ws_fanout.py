@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Test per-connection WebSocket send queues, slow-consumer policies and topics
+"""
+
+import asyncio
+import json
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.ws_manager import ConnectionManager
+from tests.fake_websocket import FakeWebSocket
+
+def test_broadcast_does_not_wait_for_slow_sockets():
+    """A hung socket neither delays the caller nor the other admins"""
+    async def scenario():
+        manager = ConnectionManager(queue_size=10, policy="drop_oldest", send_timeout=0.2)
+        fast, hung = FakeWebSocket(), FakeWebSocket(hang=True)
+        await manager.connect(fast)
+        await manager.connect(hung)
+
+        started = time.perf_counter()
+        for i in range(5):
+            await manager.broadcast({"type": "new_message", "i": i})
+        enqueue_ms = (time.perf_counter() - started) * 1000
+
+        await asyncio.sleep(0.05)
+        delivered_fast = [frame["i"] for frame in fast.frames if "i" in frame]
+        await asyncio.sleep(0.3)
+        return manager, fast, hung, enqueue_ms, delivered_fast
+
+    manager, fast, hung, enqueue_ms, delivered_fast = asyncio.run(scenario())
+
+    assert enqueue_ms < 50
+    assert delivered_fast == [0, 1, 2, 3, 4]
+    # The hung socket hit the send timeout and was removed
+    assert hung not in manager.active_connections and hung.closed_code == 1011
+    assert manager.active_connections == [fast]
+    print(f"✅ 5 broadcasts queued in {enqueue_ms:.2f} ms; hung socket reaped")
+
+def test_slow_consumer_policies():
+    """drop_oldest keeps the newest frames; disconnect closes the connection"""
+    async def scenario(policy):
+        # One frame per event, so the queue fills up
+        manager = ConnectionManager(queue_size=3, policy=policy, send_timeout=5, batch_window=0)
+        slow = FakeWebSocket(delay=0.05)
+        client = await manager.connect(slow)
+        for i in range(10):
+            await manager.broadcast({"type": "new_message", "i": i})
+        await asyncio.sleep(0.3)
+        connected = slow in manager.active_connections
+        await manager.close_all()
+        return client, slow, connected
+
+    client, slow, connected = asyncio.run(scenario("drop_oldest"))
+    received = [frame["i"] for frame in slow.frames if "i" in frame]
+    assert connected and received[-1] == 9 and client.dropped > 0
+    # The hello frame queued on connect counts towards the drops as well
+    assert len(slow.frames) + client.dropped == 11
+
+    _, slow, connected = asyncio.run(scenario("disconnect"))
+    assert not connected and slow.closed_code == 1011
+    print(f"✅ drop_oldest received {received}; disconnect policy closed the socket")
+
+def test_events_are_routed_by_topic():
+    """Conversation subscribers get full events, list subscribers get summaries"""
+    async def scenario():
+        manager = ConnectionManager(queue_size=50)
+        watching, listing, legacy = FakeWebSocket(), FakeWebSocket(), FakeWebSocket()
+        for websocket in (watching, listing, legacy):
+            await manager.connect(websocket)
+        await manager.handle_client_message(watching, json.dumps(
+            {"action": "subscribe", "topics": ["users", "conversation:U1", "bogus"]}))
+        await manager.handle_client_message(listing, json.dumps({"action": "subscribe", "topics": ["users"]}))
+
+        await manager.broadcast({"type": "new_message", "userId": "U1", "message": "สวัสดี" * 40,
+                                 "displayName": "Somchai", "sessionId": "s1", "senderType": "user"})
+        await manager.broadcast({"type": "bot_typing_start", "userId": "U2"})
+        await manager.broadcast({"type": "new_message", "userId": "U2", "message": "hi"})
+        await manager.publish("status", {"type": "system_status", "ok": True})
+        await asyncio.sleep(0.05)
+        await manager.close_all()
+        return watching, listing, legacy
+
+    watching, listing, legacy = asyncio.run(scenario())
+
+    assert watching.frames[0]["type"] == "hello"
+    assert watching.frames[1] == {"type": "subscribed", "topics": ["conversation:U1", "users"]}
+    assert [(f["type"], f.get("userId")) for f in watching.frames[2:]] == [
+        ("new_message", "U1"), ("user_summary", "U2")]
+    summary = listing.frames[2]
+    assert summary["type"] == "user_summary" and summary["event"] == "new_message"
+    assert len(summary["preview"]) == 80 and "sessionId" not in summary
+    assert [f["type"] for f in listing.frames[2:]] == ["user_summary", "user_summary"]
+    # Clients that never subscribed still get every full event, but no topic-only ones
+    assert [f["type"] for f in legacy.frames] == ["hello", "new_message", "bot_typing_start", "new_message"]
+    print(f"✅ Topic routing: watching={len(watching.frames)} listing={len(listing.frames)} legacy={len(legacy.frames)}")
+
+if __name__ == "__main__":
+    print("Testing WebSocket Fan-out")
+    print("=" * 50)
+    test_broadcast_does_not_wait_for_slow_sockets()
+    test_slow_consumer_policies()
+    test_events_are_routed_by_topic()
+    print("\nAll WebSocket fan-out tests passed!")
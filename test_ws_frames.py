@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Test serialize-once WebSocket frames and compact user-metadata deltas
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services import ws_frames
+from app.services.ws_frames import Frame, compact_event, dumps_json, negotiate_format
+from app.services.ws_manager import ConnectionManager
+from tests.fake_websocket import FakeWebSocket
+
+def _message(i, display_name="สมชาย ใจดี"):
+    return {
+        "type": "new_message", "userId": "U1234567890abcdef", "message": f"ข้อความ {i}",
+        "displayName": display_name, "pictureUrl": "https://profile.line-scdn.net/abcdefghijklmnop",
+        "sessionId": "session_U1234567890abcdef_20261018", "timestamp": "2026-10-18T10:00:00.123456+07:00",
+        "senderType": "user"
+    }
+
+def test_frame_is_encoded_once_per_variant():
+    """Encoding is cached; compact drops metadata and shortens the timestamp"""
+    frame = Frame(_message(1))
+    first = frame.encode()
+    assert frame.encode() is first
+    assert json.loads(first)["displayName"] == "สมชาย ใจดี"
+
+    compact = compact_event(_message(1))
+    assert "displayName" not in compact and "sessionId" not in compact
+    assert compact["ts"] == 1792292400123
+    assert negotiate_format("msgpack") == ("msgpack" if ws_frames.msgpack else "json")
+    print(f"✅ Frame: {len(first)} chars full, {len(frame.encode(compact=True))} compact")
+
+def test_int_keys_encode_like_json():
+    """Events with int keys (hourly counts) encode the same with or without orjson"""
+    event = {"type": "stats", "hourly": {9: 12, 10: 30}, "title": "สถิติรายชั่วโมง"}
+    encoded = dumps_json(event)
+    assert json.loads(encoded) == json.loads(json.dumps(event))
+    assert json.loads(Frame(event).encode())["hourly"] == {"9": 12, "10": 30}
+    print(f"✅ Int keys: {encoded}")
+
+def test_compact_connections_receive_metadata_deltas():
+    """user_meta is sent once per change; legacy connections keep full events"""
+    async def scenario():
+        manager = ConnectionManager(queue_size=100)
+        compact, legacy = FakeWebSocket("compact=1"), FakeWebSocket()
+        await manager.connect(compact)
+        await manager.connect(legacy)
+        for i in range(10):
+            await manager.broadcast(_message(i))
+        await manager.broadcast({"type": "bot_typing_start", "userId": "U1234567890abcdef",
+                                 "timestamp": "2026-10-18T10:00:01+07:00"})
+        await manager.broadcast(_message(10, display_name="สมชาย (เปลี่ยนชื่อ)"))
+
+        late = FakeWebSocket("compact=1")
+        await manager.connect(late)
+        await manager.broadcast({"type": "bot_auto_reply", "userId": "U1234567890abcdef", "message": "ok"})
+        await asyncio.sleep(0.05)
+        await manager.close_all()
+        return compact, legacy, late
+
+    compact, legacy, late = asyncio.run(scenario())
+
+    metas = [f for f in compact.frames if f["type"] == "user_meta"]
+    assert [m["displayName"] for m in metas] == ["สมชาย ใจดี", "สมชาย (เปลี่ยนชื่อ)"]
+    events = [f for f in compact.frames if f["type"] not in ("user_meta", "hello")]
+    assert len(events) == 13 and all("displayName" not in f and "timestamp" not in f for f in events)
+    assert all(f.get("displayName") for f in legacy.frames if f["type"] == "new_message")
+    # A connection that joins later gets the current metadata before its first event
+    assert [f["type"] for f in late.frames] == ["hello", "user_meta", "bot_auto_reply"]
+    assert late.frames[1]["sessionId"] == "session_U1234567890abcdef_20261018"
+    assert compact.raw_bytes < legacy.raw_bytes * 0.7
+    print(f"✅ Compact {compact.raw_bytes} bytes vs full {legacy.raw_bytes} bytes")
+
+if __name__ == "__main__":
+    print("Testing WebSocket Frames")
+    print("=" * 50)
+    test_frame_is_encoded_once_per_variant()
+    test_int_keys_encode_like_json()
+    test_compact_connections_receive_metadata_deltas()
+    print("\nAll WebSocket frame tests passed!")
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Test WebSocket heartbeat frames and idle-connection reaping
+"""
+
+import asyncio
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.ws_manager import ConnectionManager
+from app.utils.metrics import WEBSOCKET_CONNECTIONS
+from tests.fake_websocket import FakeWebSocket
+
+def test_silent_connections_are_reaped():
+    """Clients that answer pings stay; silent ones are closed and removed"""
+    async def scenario():
+        manager = ConnectionManager(ping_interval=0.05, idle_timeout=0.2)
+        alive, dead = FakeWebSocket(), FakeWebSocket(answers_pings=False)
+        for websocket in (alive, dead):
+            websocket.manager = manager
+            await manager.connect(websocket)
+        manager.start_heartbeat()
+        await asyncio.sleep(0.5)
+        connected = manager.active_connections
+        client = manager.connections[alive]
+        await manager.close_all()
+        return manager, alive, dead, connected, client
+
+    manager, alive, dead, connected, client = asyncio.run(scenario())
+
+    assert connected == [alive]
+    assert dead.closed_code == 1001 and manager.reaped == 1
+    assert sum(1 for f in alive.frames if f["type"] == "ping") >= 5
+    assert client.rtt_ms is not None and client.rtt_ms < 100
+    assert alive.frames[0]["ping_interval"] == 0.05
+    print(f"✅ Reaped {manager.reaped} silent socket; rtt {client.rtt_ms:.1f} ms")
+
+def test_connection_gauge_counts_live_clients():
+    """The websocket_connections gauge follows reaping"""
+    from app.services import ws_manager
+
+    async def scenario():
+        original = ws_manager.manager
+        manager = ws_manager.manager = ConnectionManager(ping_interval=10, idle_timeout=0.05)
+        try:
+            await manager.connect(FakeWebSocket())
+            before = WEBSOCKET_CONNECTIONS.samples()[()]
+            await asyncio.sleep(0.1)
+            await manager.reap_idle()
+            return before, WEBSOCKET_CONNECTIONS.samples()[()]
+        finally:
+            await manager.close_all()
+            ws_manager.manager = original
+
+    before, after = asyncio.run(scenario())
+    assert (before, after) == (1, 0)
+    print(f"✅ Gauge {before} -> {after}")
+
+if __name__ == "__main__":
+    print("Testing WebSocket Heartbeat")
+    print("=" * 50)
+    test_silent_connections_are_reaped()
+    test_connection_gauge_counts_live_clients()
+    print("\nAll WebSocket heartbeat tests passed!")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test sequenced WebSocket events and resume-on-reconnect
+"""
+
+import asyncio
+import json
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.ws_manager import ConnectionManager
+from tests.fake_websocket import FakeWebSocket
+
+def _subscribe(topics, epoch=None, last_seq=None):
+    request = {"action": "subscribe", "topics": topics}
+    if epoch is not None:
+        request["resume"] = {"epoch": epoch, "last_seq": last_seq}
+    return json.dumps(request)
+
+def test_reconnect_receives_only_missed_events():
+    """Events carry seq; a resume replays what was missed with the client's routing"""
+    async def scenario():
+        manager = ConnectionManager(resume_buffer=50)
+        first = FakeWebSocket()
+        await manager.connect(first)
+        await manager.handle_client_message(first, _subscribe(["users", "conversation:U1"]))
+        await manager.broadcast({"type": "new_message", "userId": "U1", "message": "one"})
+        await asyncio.sleep(0.01)
+        epoch = first.frames[0]["epoch"]
+        last_seq = max(f.get("seq", 0) for f in first.frames)
+        manager.disconnect(first)
+
+        # Missed while disconnected
+        await manager.broadcast({"type": "new_message", "userId": "U1", "message": "two"})
+        await manager.broadcast({"type": "bot_typing_start", "userId": "U2"})
+        await manager.broadcast({"type": "new_message", "userId": "U2", "message": "three"})
+        await manager.publish("status", {"type": "system_status"})
+
+        second = FakeWebSocket()
+        await manager.connect(second)
+        await manager.handle_client_message(second, _subscribe(["users", "conversation:U1"], epoch, last_seq))
+        await asyncio.sleep(0.01)
+        await manager.close_all()
+        return last_seq, second.frames
+
+    last_seq, frames = asyncio.run(scenario())
+    replayed = [(f["type"], f.get("message") or f.get("preview"), f["seq"]) for f in frames if "seq" in f and f["type"] != "hello"]
+    assert last_seq == 1
+    assert replayed == [("new_message", "two", 2), ("user_summary", "three", 4)]
+    assert frames[-1] == {"type": "resumed", "epoch": frames[0]["epoch"], "from": 1, "to": 5, "replayed": 2}
+    print(f"✅ Resumed: {replayed}")
+
+def test_gap_outside_buffer_requires_resync():
+    """A stale position or another worker's epoch asks the client to reload"""
+    async def scenario():
+        manager = ConnectionManager(resume_buffer=3)
+        for i in range(10):
+            await manager.broadcast({"type": "new_message", "userId": "U1", "message": str(i)})
+        outcomes = []
+        for epoch, last_seq in ((manager.epoch, 2), ("other-worker", 9), (manager.epoch, 7)):
+            websocket = FakeWebSocket()
+            await manager.connect(websocket)
+            await manager.handle_client_message(websocket, _subscribe(["users"], epoch, last_seq))
+            await asyncio.sleep(0.01)
+            outcomes.append(websocket.frames[-1]["type"])
+        await manager.close_all()
+        return outcomes
+
+    outcomes = asyncio.run(scenario())
+    assert outcomes == ["resync_required", "resync_required", "resumed"]
+    print(f"✅ Resync decisions: {outcomes}")
+
+if __name__ == "__main__":
+    print("Testing WebSocket Resume")
+    print("=" * 50)
+    test_reconnect_receives_only_missed_events()
+    test_gap_outside_buffer_requires_resync()
+    print("\nAll WebSocket resume tests passed!")
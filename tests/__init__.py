@@ -0,0 +1,3 @@
+"""
+Helpers shared by the root-level ``test_*.py`` files
+"""
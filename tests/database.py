@@ -0,0 +1,33 @@
+"""
+Throwaway SQLite databases for the async CRUD / service tests
+"""
+
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.db.models import Base
+
+@asynccontextmanager
+async def temp_database(path: Optional[str] = None):
+    """
+    Yield a session factory over a fresh schema
+
+    The database lives in memory unless ``path`` is given (needed when several
+    sessions must see each other's commits). The engine is ``Session.kw["bind"]``.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path or ':memory:'}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    try:
+        yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    finally:
+        await engine.dispose()
+
+async def with_session(callback):
+    """Run ``callback(db)`` on one session of an in-memory database"""
+    async with temp_database() as Session:
+        async with Session() as db:
+            return await callback(db)
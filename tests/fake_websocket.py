@@ -0,0 +1,49 @@
+"""
+In-memory WebSocket double shared by the admin WebSocket tests
+"""
+
+import asyncio
+import json
+
+class FakeWebSocket:
+    """
+    Records what ConnectionManager sends
+
+    ``raw`` holds every frame as sent; ``frames`` holds the events with
+    micro-batches unpacked. ``delay`` simulates a slow browser, ``hang`` a dead
+    one, and with ``manager`` set, ``ping`` frames are answered with a pong
+    unless ``answers_pings`` is False.
+    """
+
+    def __init__(self, query: str = "", delay: float = 0, hang: bool = False, answers_pings: bool = True):
+        self.query_params = dict(part.split("=", 1) for part in query.split("&") if "=" in part)
+        self.delay = delay
+        self.hang = hang
+        self.answers_pings = answers_pings
+        self.manager = None
+        self.raw = []
+        self.frames = []
+        self.raw_bytes = 0
+        self.closed_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, message):
+        if self.hang:
+            await asyncio.Event().wait()
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.raw_bytes += len(message.encode("utf-8"))
+        frame = json.loads(message)
+        self.raw.append(frame)
+        events = frame["events"] if frame["type"] == "batch" else [frame]
+        self.frames.extend(events)
+        for event in events:
+            if event["type"] == "ping" and self.answers_pings and self.manager is not None:
+                # The browser answers on its own receive path
+                asyncio.ensure_future(self.manager.handle_client_message(
+                    self, json.dumps({"action": "pong", "t": event["t"]})))
+
+    async def close(self, code=1000):
+        self.closed_code = code